@@ -2,24 +2,10 @@
 Insight Generator — Groq LLM (llama3-70b-8192) with template fallback
 """
 
-import os
-from typing import Dict, Optional
-from openai import OpenAI
-from dotenv import load_dotenv
+import json
+from typing import Dict, List
 
-load_dotenv()
-
-
-def _make_client() -> Optional[OpenAI]:
-    key = os.getenv("GROQ_API_KEY")
-    base = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
-    if not key:
-        return None
-    return OpenAI(api_key=key, base_url=base)
-
-
-_client = _make_client()
-_MODEL  = os.getenv("LLM_MODEL", "llama3-70b-8192")
+from .llm import get_client, model_name
 
 
 # ── Template fallback ──────────────────────────────────────────────────────────
@@ -60,12 +46,13 @@ def _template(region: str, parameter: str, stats: Dict, trend: Dict) -> str:
 
 
 # ── LLM insight ────────────────────────────────────────────────────────────────
-def generate_insight(region: str, parameter: str, stats: Dict, trend: Dict) -> Dict:
+def generate_insight(region: str, parameter: str, stats: Dict, trend: Dict, llm: bool = True) -> Dict:
     """
-    Generate a scientific 2–3 sentence insight.
+    Generate a scientific 2–3 sentence insight (llm=False: template only, e.g. under load).
     Returns {"text": str, "source": "llm"|"template"}
     """
-    if not _client:
+    client = get_client() if llm else None
+    if not client:
         return {"text": _template(region, parameter, stats, trend), "source": "template"}
 
     unit      = "°C" if parameter == "temperature" else "PSU"
@@ -86,8 +73,8 @@ def generate_insight(region: str, parameter: str, stats: Dict, trend: Dict) -> D
     )
 
     try:
-        resp = _client.chat.completions.create(
-            model=_MODEL,
+        resp = client.chat.completions.create(
+            model=model_name(),
             messages=[
                 {"role": "system", "content": "You are an expert oceanographer and climate scientist."},
                 {"role": "user",   "content": prompt},
@@ -124,12 +111,14 @@ def generate_answer(
     trend: Dict,
     risk: Dict,
     question: str,
+    llm: bool = True,
 ) -> Dict:
     """
-    Generate a chat-style response grounded in database stats.
+    Generate a chat-style response grounded in database stats (llm=False: template only).
     Returns {"text": str, "source": "llm"|"template"}
     """
-    if not _client:
+    client = get_client() if llm else None
+    if not client:
         return {"text": _answer_template(region, parameter, stats, trend, risk), "source": "template"}
 
     unit = "°C" if parameter == "temperature" else "PSU"
@@ -152,8 +141,8 @@ def generate_answer(
     )
 
     try:
-        resp = _client.chat.completions.create(
-            model=_MODEL,
+        resp = client.chat.completions.create(
+            model=model_name(),
             messages=[
                 {"role": "system", "content": "You are an expert ocean data assistant."},
                 {"role": "user", "content": prompt},
@@ -166,3 +155,80 @@ def generate_answer(
     except Exception as e:
         print(f"[InsightGenerator] Answer LLM failed ({e}), using template fallback")
         return {"text": _answer_template(region, parameter, stats, trend, risk), "source": "template"}
+
+
+# ── Batch narration ────────────────────────────────────────────────────────────
+def _years(item: Dict) -> str:
+    start, end = item.get("start_year"), item.get("end_year")
+    return str(start) if start == end else f"{start}–{end}"
+
+
+def _batch_template(items: List[Dict]) -> Dict:
+    insights = [
+        {"text": _template(item["region"], item["parameter"], item["stats"], item["trend"]), "source": "template"}
+        for item in items
+    ]
+    lines = []
+    for item in items:
+        unit = "°C" if item["parameter"] == "temperature" else " PSU"
+        lines.append(
+            f"• {item['region']} {item['parameter']} ({_years(item)}): mean {item['stats'].get('mean', 'N/A')}{unit}, "
+            f"{item['trend'].get('direction', 'stable')}, {item.get('risk', {}).get('level', 'Unknown')}"
+        )
+    return {"summary": {"text": "\n".join(lines), "source": "template"}, "items": insights}
+
+
+def generate_batch_narration(items: List[Dict], llm: bool = True) -> Dict:
+    """
+    Narrate a whole /query/batch result in one LLM call.
+    items: [{region, parameter, start_year, end_year, stats, trend, risk}]
+    Returns {"summary": {text, source}, "items": [{text, source}, ...]} in item order.
+    """
+    if not items:
+        return {"summary": None, "items": []}
+
+    client = get_client() if llm else None
+    if not client:
+        return _batch_template(items)
+
+    lines = []
+    for i, item in enumerate(items):
+        unit = "°C" if item["parameter"] == "temperature" else "PSU"
+        stats, trend = item["stats"], item["trend"]
+        lines.append(
+            f"{i}. {item['region']} / {item['parameter']} / {_years(item)}: mean {stats.get('mean')}{unit}, "
+            f"range {stats.get('min')}–{stats.get('max')}{unit}, "
+            f"trend {trend.get('direction', 'stable')} at {abs(trend.get('per_year', 0))}{unit}/year, "
+            f"risk {item.get('risk', {}).get('level', 'Unknown')}"
+        )
+
+    prompt = (
+        "You are an expert oceanographer comparing several ocean data summaries.\n\n"
+        + "\n".join(lines) + "\n\n"
+        "Return JSON only, shaped as "
+        '{"summary": "<2-3 sentence comparison>", "items": ["<1-2 sentence insight for 0>", ...]} '
+        f"with exactly {len(items)} items in the same order. Cite the numbers; do not invent any."
+    )
+
+    try:
+        resp = client.chat.completions.create(
+            model=model_name(),
+            messages=[
+                {"role": "system", "content": "You are an expert oceanographer and climate scientist."},
+                {"role": "user",   "content": prompt},
+            ],
+            temperature=0.3,
+            max_tokens=120 + 90 * len(items),
+            response_format={"type": "json_object"},
+        )
+        parsed = json.loads(resp.choices[0].message.content)
+        texts = parsed.get("items", [])
+        if len(texts) != len(items):
+            raise ValueError(f"expected {len(items)} items, got {len(texts)}")
+        return {
+            "summary": {"text": str(parsed.get("summary", "")).strip(), "source": "llm"},
+            "items": [{"text": str(text).strip(), "source": "llm"} for text in texts],
+        }
+    except Exception as e:
+        print(f"[InsightGenerator] Batch LLM failed ({e}), using template fallback")
+        return _batch_template(items)
@@ -0,0 +1,39 @@
+"""
+Shared Groq LLM client — built on first use
+
+The OpenAI SDK is slow to import, so neither the SDK nor the client is
+touched until a request actually needs the LLM.
+"""
+
+import os
+import threading
+
+_lock = threading.Lock()
+_client = None
+_initialised = False
+
+
+def get_client():
+    """Return the shared OpenAI-compatible client, or None when no key is configured"""
+    global _client, _initialised
+    if _initialised:
+        return _client
+
+    with _lock:
+        if not _initialised:
+            key = os.getenv("GROQ_API_KEY")
+            base = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+            if key:
+                from openai import OpenAI
+                _client = OpenAI(api_key=key, base_url=base)
+            _initialised = True
+    return _client
+
+
+def llm_enabled() -> bool:
+    """Cheap check that does not import the SDK"""
+    return bool(os.getenv("GROQ_API_KEY"))
+
+
+def model_name() -> str:
+    return os.getenv("LLM_MODEL", "llama3-70b-8192")
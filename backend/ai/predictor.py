@@ -1,68 +1,65 @@
 """
 Predictor module
 Performs time series prediction on ocean data
+
+Trend fitting is plain NumPy least squares so the API does not have to import
+pandas or scikit-learn; the DataFrame helpers keep working for offline scripts.
 """
 
-import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from typing import Dict, List, Optional
+from typing import Dict, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class OceanPredictor:
-    def __init__(self):
-        self.model = LinearRegression()
-    
-    def predict_trend(self, data: pd.DataFrame, parameter: str, future_years: int = 5) -> Dict:
+    def predict_series(self, years, values, future_years: int = 5) -> Dict:
         """
-        Predict future trends based on historical data
+        Predict future trends from aligned year/value arrays
         
         Args:
-            data: DataFrame with time series data
-            parameter: Parameter to predict (temperature, salinity, etc.)
+            years: Sequence of years (ascending)
+            values: Sequence of values for those years (NaN entries are ignored)
             future_years: Number of years to predict into the future
             
         Returns:
             Dictionary with predictions and trend analysis
         """
         
-        if data.empty or parameter not in data.columns:
-            return {
-                "success": False,
-                "message": "Insufficient data for prediction"
-            }
-        
-        # Prepare data
-        data = data.dropna(subset=[parameter])
+        x = np.asarray(years, dtype=float)
+        y = np.asarray(values, dtype=float)
+        keep = ~np.isnan(y)
+        x, y = x[keep], y[keep]
         
-        if len(data) < 2:
+        if len(x) < 2:
             return {
                 "success": False,
                 "message": "Need at least 2 data points for prediction"
             }
         
-        # Extract years and values
-        X = data['year'].values.reshape(-1, 1)
-        y = data[parameter].values
-        
-        # Fit model
-        self.model.fit(X, y)
+        # Fit model (ordinary least squares, same as LinearRegression)
+        slope, intercept = np.polyfit(x, y, 1)
         
         # Make predictions
-        last_year = int(X[-1][0])
-        future_years_array = np.array(range(last_year + 1, last_year + future_years + 1)).reshape(-1, 1)
-        predictions = self.model.predict(future_years_array)
+        last_year = int(x[-1])
+        future_years_array = np.arange(last_year + 1, last_year + future_years + 1)
+        predictions = slope * future_years_array + intercept
         
         # Calculate trend
-        slope = self.model.coef_[0]
         trend = "increasing" if slope > 0 else "decreasing"
         
-        # Calculate confidence
-        r_squared = self.model.score(X, y)
+        # Calculate confidence (coefficient of determination)
+        ss_res = float(np.sum((y - (slope * x + intercept)) ** 2))
+        ss_tot = float(np.sum((y - y.mean()) ** 2))
+        if ss_tot > 0:
+            r_squared = 1.0 - ss_res / ss_tot
+        else:
+            r_squared = 1.0 if ss_res == 0 else 0.0
         
         return {
             "success": True,
             "predictions": [
-                {"year": int(year[0]), "value": float(pred)}
+                {"year": int(year), "value": float(pred)}
                 for year, pred in zip(future_years_array, predictions)
             ],
             "trend": trend,
@@ -71,7 +68,28 @@ class OceanPredictor:
             "confidence": "high" if r_squared > 0.8 else "medium" if r_squared > 0.5 else "low"
         }
     
-    def detect_anomalies(self, data: pd.DataFrame, parameter: str) -> List[Dict]:
+    def predict_trend(self, data: "pd.DataFrame", parameter: str, future_years: int = 5) -> Dict:
+        """
+        Predict future trends based on historical data
+        
+        Args:
+            data: DataFrame with time series data
+            parameter: Parameter to predict (temperature, salinity, etc.)
+            future_years: Number of years to predict into the future
+            
+        Returns:
+            Dictionary with predictions and trend analysis
+        """
+        
+        if data.empty or parameter not in data.columns:
+            return {
+                "success": False,
+                "message": "Insufficient data for prediction"
+            }
+        
+        return self.predict_series(data['year'].values, data[parameter].values, future_years)
+    
+    def detect_anomalies(self, data: "pd.DataFrame", parameter: str) -> List[Dict]:
         """
         Detect anomalies in the data using statistical methods
         
@@ -98,7 +116,9 @@ class OceanPredictor:
         anomalies = []
         
         for idx, row in data.iterrows():
-            if pd.notna(row[parameter]):
+            value = row[parameter]
+            # None-safe (object columns hold None, not NaN); NaN != NaN
+            if value is not None and value == value:
                 z_score = abs((row[parameter] - mean) / std) if std > 0 else 0
                 
                 if z_score > 2.5:  # 2.5 standard deviations
@@ -111,7 +131,7 @@ class OceanPredictor:
         
         return anomalies
     
-    def calculate_statistics(self, data: pd.DataFrame, parameter: str) -> Dict:
+    def calculate_statistics(self, data: "pd.DataFrame", parameter: str) -> Dict:
         """
         Calculate basic statistics for the parameter
         """
@@ -2,26 +2,11 @@
 Query Parser — Groq LLM (llama3-70b-8192) with rule-based fallback
 """
 
-import os
 import re
 import json
 from typing import Dict, Optional
-from openai import OpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
-
-
-def _make_client() -> Optional[OpenAI]:
-    key = os.getenv("GROQ_API_KEY")
-    base = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
-    if not key:
-        return None
-    return OpenAI(api_key=key, base_url=base)
-
-
-_client = _make_client()
-_MODEL  = os.getenv("LLM_MODEL", "llama3-70b-8192")
+from .llm import get_client, model_name
 
 REGION_ALIASES = {
     "Indian Ocean":   ["indian", "india", "arabian", "bay of bengal"],
@@ -52,13 +37,66 @@ def _rule_based(question: str) -> Dict:
             "source": "rule-based"}
 
 
+# ── Follow-ups ─────────────────────────────────────────────────────────────────
+# A question opening with one of these refines the previous one, even if it names a region
+FOLLOW_UP_OPENERS = ("now", "what about", "how about", "and", "also", "same", "just", "only", "then", "instead")
+FOLLOW_UP_CUES = ("instead", "same region", "same period", "same years")
+
+
+def resolve_follow_up(question: str, previous: Optional[Dict]) -> Optional[Dict]:
+    """
+    Resolve a refinement ("now just 2022-2024", "what about salinity?")
+    against the previous parsed query of the conversation: whatever the
+    question names replaces the previous value, the rest is kept. None when
+    there is no previous query or the question stands on its own.
+    """
+    if not previous or not previous.get("region"):
+        return None
+    q = " ".join(question.lower().split())
+    region = next((r for r, aliases in REGION_ALIASES.items() if any(a in q for a in aliases)), None)
+    years = sorted({int(y) for y in re.findall(r"\b(20\d{2})\b", q)})
+    refines = (any(re.match(rf"{re.escape(word)}\b", q) for word in FOLLOW_UP_OPENERS)
+               or any(cue in q for cue in FOLLOW_UP_CUES))
+    if region and not refines:
+        return None
+    if not region and not refines and not years and not any(word in q for word in ("salin", "temp", "warm")):
+        # Nothing to refine with (e.g. a greeting)
+        return None
+
+    if "salin" in q:
+        parameter = "salinity"
+    elif "temp" in q or "warm" in q:
+        parameter = "temperature"
+    else:
+        parameter = previous.get("parameter") or "temperature"
+
+    start_year, end_year = previous.get("start_year"), previous.get("end_year")
+    if len(years) >= 2:
+        start_year, end_year = years[0], years[-1]
+    elif years and re.search(rf"\b(since|from|after)\s+{years[0]}", q):
+        start_year = years[0]
+    elif years:
+        # "just 2023" narrows to that year
+        start_year = end_year = years[0]
+
+    return {"region": region or previous["region"], "parameter": parameter,
+            "start_year": start_year, "end_year": end_year,
+            "source": "follow-up"}
+
+
 # ── LLM parser ─────────────────────────────────────────────────────────────────
-def parse_query(question: str) -> Dict:
+def parse_query(question: str, llm: bool = True, previous: Optional[Dict] = None) -> Dict:
     """
     Parse a natural language ocean query.
-    Uses Groq LLaMA-3 if available, falls back to rule-based.
+    Follow-ups to the previous query of a conversation are resolved against
+    it without an LLM call; otherwise uses Groq LLaMA-3 if available (and llm
+    is set), falls back to rule-based.
     """
-    if not _client:
+    follow_up = resolve_follow_up(question, previous)
+    if follow_up:
+        return follow_up
+    client = get_client() if llm else None
+    if not client:
         return _rule_based(question)
 
     system = (
@@ -73,8 +111,8 @@ def parse_query(question: str) -> Dict:
     )
 
     try:
-        resp = _client.chat.completions.create(
-            model=_MODEL,
+        resp = client.chat.completions.create(
+            model=model_name(),
             messages=[
                 {"role": "system", "content": system},
                 {"role": "user",   "content": question},
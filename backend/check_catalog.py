@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Verify the metadata catalog against argo_data (full scan).
+Pass --fix to rebuild the catalog when it is out of date.
+"""
+
+import sqlite3
+import sys
+
+from storage.catalog import read_catalog, refresh_catalog, verify_catalog
+from storage.snapshots import SNAPSHOTS
+
+DB_PATH = SNAPSHOTS.live_path()  # data/argo.db unless a snapshot was published
+
+def check_catalog(fix: bool = False):
+    conn = sqlite3.connect(DB_PATH)
+    
+    catalog = read_catalog(conn)
+    if catalog:
+        print(f"Catalog version {catalog['data_version']}, build {catalog['build_id']} "
+              f"({catalog['total_rows']:,} rows, last ingest {catalog['last_ingest']})")
+    
+    print("Scanning argo_data...")
+    problems = verify_catalog(conn)
+    
+    if not problems:
+        print("✅ Catalog is consistent with argo_data")
+    else:
+        print(f"❌ {len(problems)} mismatch(es):")
+        for problem in problems:
+            print(f"   - {problem}")
+        if fix:
+            version = refresh_catalog(conn, source="check_catalog")
+            print(f"✅ Catalog rebuilt (data version {version})")
+    
+    conn.close()
+    return not problems
+
+if __name__ == "__main__":
+    ok = check_catalog(fix="--fix" in sys.argv)
+    sys.exit(0 if ok or "--fix" in sys.argv else 1)
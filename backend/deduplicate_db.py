@@ -4,15 +4,25 @@ Deduplicate ARGO database by removing:
 1. Exact duplicates
 2. Records with same location + time (keep one representative)
 3. Very similar records within 5 minutes at same location
+
+Runs on a new snapshot of the live database (published when done, so the
+VACUUM never blocks the server); --in-place works on data/argo.db directly.
 """
 
 import sqlite3
+import sys
 from datetime import datetime
 
+from storage.catalog import refresh_catalog
+from storage.derived import rebuild_derived
+from storage.shards import rebuild_shard_catalog, shard_path, shard_years
+from storage.snapshots import run_on_snapshot
+
 DB_PATH = "data/argo.db"
+SHARD_DIR = "data/shards"
 
-def deduplicate_database():
-    conn = sqlite3.connect(DB_PATH)
+def deduplicate_database(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     
     print("Starting deduplication process...")
@@ -57,12 +67,18 @@ def deduplicate_database():
     after_temporal = cur.fetchone()[0]
     print(f"   After temporal dedup: {after_temporal:,} (removed {after_exact - after_temporal:,})")
     
-    # Step 3: Vacuum to reclaim space
-    print("\n3. Vacuuming database to reclaim space...")
+    # Step 3: Refresh the metadata catalog
+    print("\n3. Refreshing metadata catalog...")
+    version = refresh_catalog(conn, source="deduplicate_db")
+    print(f"   Data version: {version}")
+    print(f"   Rebuilt derived tables: {', '.join(rebuild_derived(conn))}")
+    
+    # Step 4: Vacuum to reclaim space
+    print("\n4. Vacuuming database to reclaim space...")
     cur.execute("VACUUM")
     
-    # Step 4: Rebuild indexes
-    print("4. Rebuilding indexes...")
+    # Step 5: Rebuild indexes
+    print("5. Rebuilding indexes...")
     cur.execute("REINDEX")
     
     conn.commit()
@@ -74,5 +90,18 @@ def deduplicate_database():
     print(f"   Removed: {initial_count - after_temporal:,} records ({((initial_count - after_temporal) / initial_count * 100):.1f}%)")
     print(f"   Database optimized!")
 
+def deduplicate_shards():
+    """Deduplicate each yearly shard in turn so a VACUUM only locks one year"""
+    for year in shard_years(SHARD_DIR):
+        print(f"\n===== Shard {year} =====")
+        deduplicate_database(shard_path(year, SHARD_DIR))
+    version = rebuild_shard_catalog(SHARD_DIR, source="deduplicate_db")
+    print(f"\n✅ Shard catalog updated (data version {version})")
+
 if __name__ == "__main__":
-    deduplicate_database()
+    if "--shards" in sys.argv:
+        deduplicate_shards()
+    elif "--in-place" in sys.argv:
+        deduplicate_database()
+    else:
+        run_on_snapshot("dedup", deduplicate_database)
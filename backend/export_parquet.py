@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+"""
+Export the live database (data/argo.db or its published snapshot) to
+year-partitioned Parquet files for the DuckDB engine
+(data/parquet/year=<year>/data.parquet). Requires: pip install duckdb
+
+Serve it with VELORA_ENGINE=duckdb.
+"""
+
+import os
+from datetime import datetime
+
+from storage.parquet import export_parquet
+from storage.snapshots import SNAPSHOTS
+
+DB_PATH = SNAPSHOTS.live_path()  # data/argo.db unless a snapshot was published
+PARQUET_DIR = "data/parquet"
+
+if __name__ == "__main__":
+    print(f"Exporting {DB_PATH} to Parquet... {datetime.now().strftime('%H:%M:%S')}")
+
+    def progress(year, rows):
+        print(f"  {year}: {rows:,} rows")
+
+    result = export_parquet(DB_PATH, PARQUET_DIR, progress=progress)
+    print(f"\n✅ Export complete!")
+    print(f"   Total records: {result['rows']:,}")
+    print(f"   Location: {os.path.abspath(PARQUET_DIR)}")
@@ -1,111 +1,211 @@
 """
 ArgoFloats CSV to SQLite Converter
 Converts the large ARGO CSV into an indexed SQLite database for efficient querying
+
+Usage:
+  python load_argo_db.py                 # single database, built as a new snapshot and published
+  python load_argo_db.py --in-place      # rebuild data/argo.db itself (the server loses it meanwhile)
+  python load_argo_db.py --partition     # per-year shards in data/shards/
+  python load_argo_db.py --partition --csv data/new_year.csv
+      (only the shards for years present in the CSV are replaced)
+  python load_argo_db.py --columnar      # also write data/columnar/*.npy
 """
 
 import sqlite3
 import pandas as pd
 import os
+import sys
 from datetime import datetime
 
+from storage.catalog import empty_summary, accumulate_chunk, write_catalog
+from storage.columnar import build_columnar_store
+from storage.db import ARGO_SCHEMA
+from storage.derived import chunk_from_frame, default_builders, feed, write_derived
+from storage.shards import rebuild_shard_catalog
+from storage.snapshots import run_on_snapshot
+
 DB_PATH = 'data/argo.db'
 CSV_PATH = 'data/ArgoFloats_6d62_a128_cc74.csv'
+SHARD_DIR = 'data/shards'
+COLUMNAR_DIR = 'data/columnar'
+
+def read_chunks(csv_path, chunk_size=50000):
+    """Yield cleaned DataFrame chunks from the ARGO CSV"""
+    # Read CSV with correct headers (row 0 is header, row 1 is units, data starts at row 2)
+    for chunk in pd.read_csv(
+        csv_path,
+        skiprows=1,  # Skip units row
+        chunksize=chunk_size,
+        dtype={
+            'time': str,
+            'latitude': float,
+            'longitude': float,
+            'pres': float,
+            'temp': float,
+            'psal': float,
+            'platform_number': str
+        }
+    ):
+        # Rename columns to match table schema
+        chunk.columns = ['time', 'latitude', 'longitude', 'pressure',
+                       'temperature', 'salinity', 'platform_number']
+
+        # Drop rows with NaN in critical columns
+        yield chunk.dropna(subset=['time', 'latitude', 'longitude'])
+
+def create_indexes(cursor):
+    """Create indexes for faster queries"""
+    cursor.execute("CREATE INDEX idx_latitude ON argo_data(latitude)")
+    cursor.execute("CREATE INDEX idx_longitude ON argo_data(longitude)")
+    cursor.execute("CREATE INDEX idx_time ON argo_data(time)")
+    cursor.execute("CREATE INDEX idx_platform ON argo_data(platform_number)")
+    cursor.execute("CREATE INDEX idx_temp ON argo_data(temperature)")
+    cursor.execute("CREATE INDEX idx_sal ON argo_data(salinity)")
 
-def create_database():
+def add_to_summary(summary, chunk):
+    accumulate_chunk(summary, chunk['time'].to_numpy(), chunk['latitude'].to_numpy(),
+                     chunk['longitude'].to_numpy())
+
+def create_database(db_path=DB_PATH):
     """Create SQLite database from CSV in chunks"""
-    
+
     print(f"Starting conversion... {datetime.now().strftime('%H:%M:%S')}")
-    
+
     # Remove existing database
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    if os.path.exists(db_path):
+        os.remove(db_path)
         print(f"Removed existing database")
-    
-    conn = sqlite3.connect(DB_PATH)
+
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    
+
     # Create table with proper schema
-    cursor.execute("""
-        CREATE TABLE argo_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            time TEXT NOT NULL,
-            latitude REAL NOT NULL,
-            longitude REAL NOT NULL,
-            pressure REAL,
-            temperature REAL,
-            salinity REAL,
-            platform_number TEXT
-        )
-    """)
-    
+    cursor.execute(ARGO_SCHEMA)
+
     # Read and insert in chunks
-    chunk_size = 50000
     total_rows = 0
-    
+    summary = empty_summary()
+    builders = default_builders()
+
     print(f"Reading CSV and loading into database...")
     print(f"File: {CSV_PATH}")
-    
+
     try:
-        # Read CSV with correct headers (row 0 is header, row 1 is units, data starts at row 2)
-        for chunk_idx, chunk in enumerate(pd.read_csv(
-            CSV_PATH, 
-            skiprows=1,  # Skip units row
-            chunksize=chunk_size,
-            dtype={
-                'time': str,
-                'latitude': float,
-                'longitude': float,
-                'pres': float,
-                'temp': float,
-                'psal': float,
-                'platform_number': str
-            }
-        )):
-            # Rename columns to match table schema
-            chunk.columns = ['time', 'latitude', 'longitude', 'pressure', 
-                           'temperature', 'salinity', 'platform_number']
-            
-            # Drop rows with NaN in critical columns
-            chunk = chunk.dropna(subset=['time', 'latitude', 'longitude'])
-            
+        for chunk_idx, chunk in enumerate(read_chunks(CSV_PATH)):
             # Insert into database
             chunk.to_sql('argo_data', conn, if_exists='append', index=False)
-            
+            add_to_summary(summary, chunk)
+            feed(builders, chunk_from_frame(chunk))
+
             total_rows += len(chunk)
-            
+
             if (chunk_idx + 1) % 10 == 0:
                 print(f"  Processed {total_rows:,} rows... ({datetime.now().strftime('%H:%M:%S')})")
-        
+
         # Create indexes for faster queries
         print(f"\nCreating indexes...")
-        cursor.execute("CREATE INDEX idx_latitude ON argo_data(latitude)")
-        cursor.execute("CREATE INDEX idx_longitude ON argo_data(longitude)")
-        cursor.execute("CREATE INDEX idx_time ON argo_data(time)")
-        cursor.execute("CREATE INDEX idx_platform ON argo_data(platform_number)")
-        cursor.execute("CREATE INDEX idx_temp ON argo_data(temperature)")
-        cursor.execute("CREATE INDEX idx_sal ON argo_data(salinity)")
-        
+        create_indexes(cursor)
+
         conn.commit()
-        
+
+        # Metadata catalog (row counts, time range, data version)
+        print(f"Writing metadata catalog...")
+        version = write_catalog(conn, summary, source="load_argo_db", ingested=True)
+
+        # Derived tables (map tile pyramid) from the same pass
+        print(f"Writing derived tables ({', '.join(builder.name for builder in builders)})...")
+        write_derived(conn, builders)
+
         # Get statistics
-        stats = cursor.execute("SELECT COUNT(*) FROM argo_data").fetchone()[0]
+        stats = summary["total_rows"]
         print(f"\n✅ Database created successfully!")
         print(f"   Total records: {stats:,}")
-        print(f"   Database size: {os.path.getsize(DB_PATH) / 1024 / 1024 / 1024:.2f} GB")
-        print(f"   Location: {os.path.abspath(DB_PATH)}")
-        
+        print(f"   Data version: {version}")
+        print(f"   Database size: {os.path.getsize(db_path) / 1024 / 1024 / 1024:.2f} GB")
+        print(f"   Location: {os.path.abspath(db_path)}")
+
         # Sample query
         sample = cursor.execute(
             "SELECT COUNT(*) FROM argo_data WHERE temperature > 20 AND salinity > 34"
         ).fetchone()[0]
         print(f"   Sample query: {sample:,} records with temp > 20°C and salinity > 34")
-        
+
     except Exception as e:
         print(f"❌ Error during conversion: {e}")
         raise
     finally:
         conn.close()
 
+def create_partitioned_database(csv_path=CSV_PATH):
+    """
+    Load the CSV into one SQLite file per year (data/shards/argo_<year>.db).
+    Shards for years that appear in the CSV are replaced; all others are untouched.
+    """
+
+    print(f"Starting partitioned load... {datetime.now().strftime('%H:%M:%S')}")
+    print(f"File: {csv_path}")
+    os.makedirs(SHARD_DIR, exist_ok=True)
+
+    shards = {}  # year -> (conn, summary, derived builders)
+    total_rows = 0
+
+    try:
+        for chunk_idx, chunk in enumerate(read_chunks(csv_path)):
+            years = chunk['time'].str[:4]
+            for year, part in chunk.groupby(years):
+                if year not in shards:
+                    path = os.path.join(SHARD_DIR, f"argo_{year}.db")
+                    if os.path.exists(path):
+                        os.remove(path)
+                        print(f"  Replacing shard {year}")
+                    shard_conn = sqlite3.connect(path)
+                    shard_conn.execute(ARGO_SCHEMA)
+                    shards[year] = (shard_conn, empty_summary(), default_builders())
+
+                shard_conn, summary, builders = shards[year]
+                part.to_sql('argo_data', shard_conn, if_exists='append', index=False)
+                add_to_summary(summary, part)
+                feed(builders, chunk_from_frame(part))
+
+            total_rows += len(chunk)
+            if (chunk_idx + 1) % 10 == 0:
+                print(f"  Processed {total_rows:,} rows... ({datetime.now().strftime('%H:%M:%S')})")
+
+        print(f"\nIndexing {len(shards)} shard(s)...")
+        for year, (shard_conn, summary, builders) in sorted(shards.items()):
+            create_indexes(shard_conn.cursor())
+            shard_conn.execute("CREATE INDEX idx_geo_time ON argo_data(longitude, latitude, time)")
+            shard_conn.commit()
+            write_catalog(shard_conn, summary, source="load_argo_db", ingested=True)
+            write_derived(shard_conn, builders)
+            print(f"  {year}: {summary['total_rows']:,} rows")
+
+    except Exception as e:
+        print(f"❌ Error during partitioned load: {e}")
+        raise
+    finally:
+        for shard_conn, _, _ in shards.values():
+            shard_conn.close()
+
+    version = rebuild_shard_catalog(SHARD_DIR, source="load_argo_db", ingested=True)
+    print(f"\n✅ Shards updated successfully!")
+    print(f"   Records loaded: {total_rows:,}")
+    print(f"   Shards touched: {', '.join(sorted(shards)) or 'none'}")
+    print(f"   Data version: {version}")
+    print(f"   Location: {os.path.abspath(SHARD_DIR)}")
+
 if __name__ == '__main__':
-    create_database()
+    args = sys.argv[1:]
+    if '--partition' in args:
+        csv_path = args[args.index('--csv') + 1] if '--csv' in args else CSV_PATH
+        create_partitioned_database(csv_path)
+    elif '--in-place' in args:
+        db_path = DB_PATH
+        create_database(db_path)
+    else:
+        db_path = run_on_snapshot("load", create_database, copy=False)
+    if '--columnar' in args and '--partition' not in args:
+        print(f"\nWriting columnar store...")
+        rows = build_columnar_store(db_path, COLUMNAR_DIR)
+        print(f"   {rows:,} rows → {os.path.abspath(COLUMNAR_DIR)}")
     print(f"\nDone! {datetime.now().strftime('%H:%M:%S')}")
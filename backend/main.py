@@ -1,20 +1,63 @@
-from fastapi import FastAPI, Query as QParam
+from fastapi import FastAPI, Query as QParam, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
 import numpy as np
 from typing import Optional
 import os
+import json
 import sqlite3
+import threading
 from dotenv import load_dotenv
 
 # Load env before importing AI modules
 load_dotenv()
 
 from ai.query_parser import parse_query
-from ai.insight_generator import generate_insight, generate_answer
+from ai.insight_generator import generate_insight, generate_answer, generate_batch_narration
 from ai.predictor import OceanPredictor
+from ai.llm import llm_enabled
+from storage.regions import REGION_BOUNDS
+from storage.geometry import Region, region_contains, resolve_region
+from storage.representatives import spread_preview
+from storage.samples import approximate_monthly, confidence_intervals
+from storage.sketches import QUANTILES, region_quantiles, shared_region_points
+from storage.tsdiagram import region_histogram
+from storage.profiles import bin_range, depth_bins, depth_monthly, depth_profile
+from storage.floats import active_floats, coverage_confidence
+from storage.cube import cube_monthly
+from storage.climatology import departs_from_normal, region_anomalies, summarize_anomalies
+from storage.platforms import series as platform_series, trajectory as platform_trajectory
+from storage.catalog import catalog_token, load_catalog
+from storage.db import connect
+from storage.engines import get_engine, monthly_and_latest
+from storage.tiles import MAX_ZOOM, get_tile
+from storage.export import FORMATS, stream_export
+from storage.aggregates import PARAMETERS, filter_years, summarize, yearly_means, group_means
+from storage.cache import LRUCache
+from storage.snapshots import SNAPSHOTS
+from serving import (METRICS, AdmissionController, AdmissionMiddleware, CacheWarmer, CompressionMiddleware,
+                     QueryLog, SessionStore, SingleFlight, SnapshotLeaseMiddleware, conditional)
 
-app = FastAPI(title="Velora AI Backend", version="2.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional prewarm runs in the background so the server accepts traffic immediately
+    if os.getenv("VELORA_PREWARM", "").lower() in ("1", "true", "yes"):
+        threading.Thread(target=prewarm, name="velora-prewarm", daemon=True).start()
+    # Cache warmer: every region at startup and after each data-version change
+    if os.getenv("VELORA_WARM", "1").lower() not in ("0", "false", "no"):
+        warmer.start()
+    # Retired database snapshots are removed once no request reads them
+    stop_collector = threading.Event()
+    threading.Thread(target=SNAPSHOTS.run_collector, args=(stop_collector,), name="velora-snapshots",
+                     daemon=True).start()
+    yield
+    stop_collector.set()
+    warmer.stop()
+
+
+app = FastAPI(title="Velora AI Backend", version="2.0.0", lifespan=lifespan)
 
 default_cors = [
     "http://localhost:5173", "http://127.0.0.1:5173",
@@ -33,35 +76,59 @@ if cors_env.strip():
 else:
     allow_origins = default_cors
 
+# Middleware added last runs first: CORS, then load shedding (before a
+# request takes a snapshot lease or a thread), leases, compression
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("VELORA_COMPRESS_MIN", "1024")))
+app.add_middleware(SnapshotLeaseMiddleware)
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allow_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Retry-After"],
 )
 
 # ── Database connection ──────────────────────────────────────────────────────────
-DB_PATH = os.path.join(os.path.dirname(__file__), "data", "argo.db")
 RAW_PREVIEW_LIMIT = 100
+PREVIEW_MODES = ("latest", "spread")
+MAX_BATCH_QUERIES = int(os.getenv("VELORA_MAX_BATCH", "32"))
+EXPORT_PAGE_ROWS = int(os.getenv("VELORA_EXPORT_PAGE", "10000"))
 
 def get_db_connection():
-    """Get SQLite connection with row factory for dict-like access"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA temp_store = MEMORY")
-    conn.execute("PRAGMA cache_size = -64000")
-    return conn
+    """Get SQLite connection (to this request's database snapshot) with row factory for dict-like access"""
+    return connect(SNAPSHOTS.current())
+
+def catalog():
+    """Metadata catalog of the active query engine (None for legacy databases)"""
+    return load_catalog(get_engine().catalog_path)
 
 predictor = OceanPredictor()
+flights = SingleFlight()
+# Computed /query figures (everything but the narration) and the monthly
+# aggregates they were built from, keyed by data version
+response_cache = LRUCache(int(os.getenv("VELORA_RESPONSE_CACHE", "512")))
+query_log = QueryLog(int(os.getenv("VELORA_QUERY_LOG", "2000")))
+# Per-conversation parsed questions and aggregates for follow-ups
+sessions = SessionStore(int(os.getenv("VELORA_SESSIONS", "1000")), float(os.getenv("VELORA_SESSION_TTL", "1800")))
+
 
-# Region geographic bounds (lon_min, lon_max, lat_min, lat_max)
-REGION_BOUNDS = {
-    "Indian Ocean": (20, 120, -60, 23),
-    "Pacific Ocean": (120, 180, -60, 60),
-    "Atlantic Ocean": (-100, 0, -60, 60),
-    "Arctic Ocean": (-180, 180, 60, 90),
-}
+def prewarm():
+    """Open the DB, load the catalog, touch the hot indexes and build the LLM client"""
+    try:
+        info = catalog()
+        engine = get_engine()
+        latest = info["end_year"] if info else None
+        engine.preview(REGION_BOUNDS["Indian Ocean"], latest, latest, limit=1)
+
+        from ai.llm import get_client
+        get_client()
+        records = info["total_rows"] if info else "unknown"
+        print(f"[Prewarm] Ready ({records} records)")
+    except Exception as e:
+        print(f"[Prewarm] Skipped ({e})")
 
 def clean_nans(obj):
     """Recursively replace NaN/Inf values with None or 0"""
@@ -76,118 +143,301 @@ def clean_nans(obj):
     return obj
 
 # ── Shared filter + response builder ──────────────────────────────────────────
+def valid_parameter(parameter: str) -> str:
+    return parameter if parameter in ["temperature", "salinity"] else "temperature"
+
+def empty_response(region: str, col: str, start_year, end_year, question: str,
+                   parsed_source: str, message: str):
+    return {
+        "region": region, "parameter": col, "question": question,
+        "parsed": {"region": region, "parameter": col,
+                   "start_year": start_year, "end_year": end_year,
+                   "source": parsed_source},
+        "data": [], "stats": {}, "trend": None, "prediction": [],
+        "insight": None,
+        "message": message,
+    }
+
+def fetch_preview(engine, area, start_year, end_year, mode: str = "latest", latest_rows=None):
+    """
+    (rows, mode) for the map/table preview. "latest" is the newest rows in the
+    region; "spread" is one precomputed representative per occupied grid cell
+    and falls back to "latest" when the representatives table is missing.
+    """
+    if mode == "spread":
+        contains = None if area.is_box else (lambda lons, lats: region_contains(area, lons, lats))
+        rows = spread_preview(engine.catalog_path, area.bounds, start_year, end_year, RAW_PREVIEW_LIMIT, contains)
+        if rows is not None:
+            return rows, "spread"
+    if latest_rows is None:
+        latest_rows = engine.preview(area.bounds, start_year, end_year, RAW_PREVIEW_LIMIT)
+    return latest_rows, "latest"
+
 def build_response(region: str, parameter: str, start_year, end_year,
-                   question: str = "", parsed_source: str = "rule-based"):
+                   question: str = "", parsed_source: str = "rule-based",
+                   bbox=None, geometry=None, preview_mode: str = "latest",
+                   approximate: bool = False, pressure_min=None, pressure_max=None, level: str = None,
+                   conversation: str = None):
+    """
+    The /query response. Concurrent requests for the same normalized query
+    share one computation; narration is coalesced separately, since the
+    answer also depends on the wording of the question. Under load (see
+    serving.admission) narration uses templates, and at "approximate" the
+    figures are cached or estimated from samples. Within a conversation, a
+    follow-up over the same area is assembled from the aggregates, edge rows
+    and preview of the earlier answer (see serving.sessions).
+    """
+    level = level or admission.start()
+    spec = {
+        "region": region, "parameter": valid_parameter(parameter), "start_year": start_year,
+        "end_year": end_year, "bbox": bbox, "geometry": geometry, "preview_mode": preview_mode,
+        "approximate": bool(approximate), "pressure_min": pressure_min, "pressure_max": pressure_max,
+    }
+    query_log.record(spec)
+    version = data_version() if conversation else None
+    # Legacy databases have no data version to tell whether the session's aggregates are current
+    narrowed = sessions.narrowed(conversation, spec, version) if version else None
+    kept = {}
+    shared = None
+    if narrowed is not None:
+        shared = query_figures(spec, inputs=narrowed)
+    elif level == "approximate" and not spec["approximate"]:
+        shared = query_figures(spec, cached_only=True, keep=kept) or query_figures({**spec, "approximate": True})
+    shared = shared or query_figures(spec, keep=kept)
+    if version and shared.get("stats"):
+        sessions.remember_figures(conversation, spec, kept, version)
+    response = {**shared, "question": question, "parsed": {**shared["parsed"], "source": parsed_source},
+                "degradation": level}
+    if conversation:
+        response["session"] = {"conversation_id": conversation, "derived": narrowed is not None}
+    if response.get("stats"):
+        response["insight"], response["answer"] = narrate(response, question, llm=level == "full")
+    return response
+
+def query_figures(spec, cached_only: bool = False, inputs=None, keep=None):
+    """
+    compute_response(**spec), served from the response cache while the
+    catalog token (data version and build) is unchanged. Legacy databases have no version and are not cached.
+    cached_only returns None instead of computing on a miss. inputs (a
+    dict) is passed on to compute_response; figures built from them are
+    not cached, as a conversation's preview rows may be fewer than a fresh
+    query's. keep (a dict) receives the inputs the figures were built from.
+    """
+    def compute():
+        used = {}
+        return compute_response(**spec, **(inputs or {}), keep=used), used
+
+    info = catalog()
+    if not info:
+        if cached_only:
+            return None
+        response, used = flights.do("query", json.dumps(spec, sort_keys=True, default=str), compute)
+    else:
+        engine = get_engine()
+        key = json.dumps([engine.name, engine.catalog_path, catalog_token(info), spec], sort_keys=True, default=str)
+        cached = response_cache.get(key)
+        if cached is not None:
+            METRICS.inc("response_cache_hits_total")
+            response, used = cached
+        else:
+            METRICS.inc("response_cache_misses_total")
+            if cached_only:
+                return None
+            # A conversation's figures are its own: fresh queries do not wait on them
+            response, used = compute() if inputs else flights.do("query", key, compute)
+            # Empty or failed queries are cheap; only data responses are kept
+            if response.get("stats") and not inputs:
+                response_cache.put(key, (response, used))
+    if keep is not None:
+        keep.update(used)
+    return response
+
+def data_version():
+    # A fresh load restarts the version count: the catalog token carries the
+    # build id, and the snapshot file tells engines and snapshots apart
+    engine = get_engine()
+    info = catalog()
+    return (engine.name, engine.catalog_path, catalog_token(info)) if info else None
+
+def warm_query(spec):
+    with SNAPSHOTS.lease():
+        return query_figures(spec)
+
+WARM_PARAMETERS = ("temperature", "salinity")
+
+def warm_specs():
+    """Every named region x parameter over the whole range, the latest year and the latest five years"""
+    info = catalog()
+    if not info:
+        return []
+    latest = info["end_year"]
+    ranges = [(None, None), (latest, latest), (max(info["start_year"], latest - 4), latest)]
+    return [
+        {"region": region, "parameter": parameter, "start_year": start, "end_year": end, "bbox": None,
+         "geometry": None, "preview_mode": "latest", "approximate": False,
+         "pressure_min": None, "pressure_max": None}
+        for region in REGION_BOUNDS for parameter in WARM_PARAMETERS for start, end in ranges
+    ]
+
+warmer = CacheWarmer(
+    warm_query, data_version, warm_specs, query_log,
+    workers=int(os.getenv("VELORA_WARM_WORKERS", "2")),
+    interval=float(os.getenv("VELORA_WARM_INTERVAL", "15")),
+    refresh=float(os.getenv("VELORA_WARM_REFRESH", "300")),
+    top=int(os.getenv("VELORA_WARM_TOP", "20")),
+)
+
+def narrate(response, question: str, llm: bool = True):
+    """(insight, answer) for a data response, each generated once per identical concurrent input"""
+    region, col = response["region"], response["parameter"]
+    stats, trend, risk = response["stats"], response["trend"], response["risk"]
+    if not llm:
+        # Templates are cheap; nothing to coalesce
+        return (generate_insight(region, col, stats, trend, llm=False),
+                generate_answer(region, col, stats, trend, risk, question, llm=False))
+    facts = json.dumps([region, col, stats, trend], sort_keys=True)
+    insight = flights.do("insight", facts, lambda: generate_insight(region, col, stats, trend))
+    answer = flights.do("answer", json.dumps([facts, risk, " ".join(question.lower().split())], sort_keys=True),
+                        lambda: generate_answer(region, col, stats, trend, risk, question))
+    return insight, answer
+
+def compute_response(region: str, parameter: str, start_year, end_year,
+                     bbox=None, geometry=None, preview_mode: str = "latest",
+                     approximate: bool = False, pressure_min=None, pressure_max=None,
+                     monthly=None, region_rows=None, latest_rows=None, keep=None):
+    """
+    Figures of a /query response, without question-specific narration.
+    Inputs already at hand (e.g. a conversation's) replace the engine reads:
+    monthly the aggregate query, region_rows the edge or polygon rows of
+    storage.sketches.region_points, latest_rows the "latest" preview query.
+    keep (a dict) receives the exact inputs the figures were built from
+    under the same names.
+    """
 
     # Ensure parameter is valid
-    col = parameter if parameter in ["temperature", "salinity"] else "temperature"
+    col = valid_parameter(parameter)
     
-    # Check region validity
-    if region not in REGION_BOUNDS:
-        return {
-            "region": region, "parameter": col, "question": question,
-            "parsed": {"region": region, "parameter": col,
-                       "start_year": start_year, "end_year": end_year,
-                       "source": parsed_source},
-            "data": [], "stats": {}, "trend": None, "prediction": [],
-            "insight": None,
-            "message": f"Region not recognized: {region}",
-        }
-    
-    # Query database
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Build SQL query with filters
-    where_clauses = []
-    params = []
-    
-    # Add region filter (geographic bounds)
-    lon_min, lon_max, lat_min, lat_max = REGION_BOUNDS[region]
-    where_clauses.append("longitude >= ? AND longitude <= ? AND latitude >= ? AND latitude <= ?")
-    params.extend([lon_min, lon_max, lat_min, lat_max])
-    
-    # Add year filters
-    if start_year:
-        where_clauses.append("substr(time, 1, 4) >= ?")
-        params.append(str(start_year))
-    if end_year:
-        where_clauses.append("substr(time, 1, 4) <= ?")
-        params.append(str(end_year))
-    
-    # Build the WHERE clause
-    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    # Resolve the region: a named box, a custom bbox or a GeoJSON polygon
+    try:
+        area = resolve_region(region, bbox, geometry)
+    except ValueError as e:
+        return empty_response(region, col, start_year, end_year, "", "rule-based", str(e))
+    depth = pressure_min is not None or pressure_max is not None
+    if depth:
+        try:
+            bins = depth_bins(pressure_min, pressure_max)
+        except ValueError as e:
+            return empty_response(region, col, start_year, end_year, "", "rule-based", str(e))
     
-    # Get column name to query
-    col_name = "temperature" if col == "temperature" else "salinity"
-
-    def calc_stats(target_col):
-        stats_query = f"""
-            SELECT
-                COUNT({target_col}) AS count,
-                MIN({target_col}) AS min_val,
-                MAX({target_col}) AS max_val,
-                AVG({target_col}) AS mean_val,
-                (AVG({target_col} * {target_col}) - AVG({target_col}) * AVG({target_col})) AS variance
-            FROM argo_data
-            WHERE {where_sql} AND {target_col} IS NOT NULL
-        """
-        cur.execute(stats_query, params)
-        row = cur.fetchone()
+    # One grouped pass returns monthly partial aggregates for both parameters;
+    # every statistic below is derived from them without rescanning argo_data
+    engine = get_engine()
+    # The box edges (or polygon rows) are read once and shared by the cube,
+    # polygon figures, anomalies and quantiles below
+    read = {} if region_rows is None else {"region_rows": region_rows}
+    area_points = shared_region_points(engine, area, start_year, end_year, read)
+    estimates, sample_info = None, None
+    if monthly is not None:
+        # Aggregates at hand (a conversation's follow-up): nothing to query
+        pass
+    elif depth:
+        # Depth-filtered figures come from the per-pressure-bin rollup
+        monthly = depth_monthly(engine, area, start_year, end_year, bins)
+        if monthly is None:
+            return empty_response(region, col, start_year, end_year, "", "rule-based",
+                                  "Depth rollup not built yet (run optimize_db.py, or migrate_compact.py for the compact engine).")
+    elif approximate:
+        # Stratified samples answer from a few thousand rows; too few sampled
+        # readings in the area falls through to the exact query below
+        estimates, sample_info = approximate_monthly(engine.catalog_path, area, col, start_year, end_year)
+        if estimates is not None:
+            monthly = estimates[0]
+            if not area.is_box and preview_mode == "latest":
+                latest_rows = sample_preview(sample_info["sample"])
+    if monthly is None and area.is_box:
+        # Whole cells from the memory-mapped cube, only the box edges from the engine
+        monthly = cube_monthly(engine, area, start_year, end_year, area_points)
+    if monthly is None:
+        if area.is_box:
+            monthly = engine.monthly_aggregates(area.bounds, start_year, end_year)
+        else:
+            monthly, latest_rows = monthly_and_latest(area_points()[1], RAW_PREVIEW_LIMIT)
 
-        count = int(row["count"] or 0)
-        min_val = float(row["min_val"]) if row["min_val"] is not None else 0.0
-        max_val = float(row["max_val"]) if row["max_val"] is not None else 0.0
-        mean_val = float(row["mean_val"]) if row["mean_val"] is not None else 0.0
-        variance = float(row["variance"]) if row["variance"] is not None else 0.0
-        std_val = float(np.sqrt(max(variance, 0.0)))
+    def preview():
+        rows, mode = fetch_preview(engine, area, start_year, end_year, preview_mode, latest_rows)
+        if mode == "latest":
+            read["latest_rows"] = rows
+        return rows, mode
 
-        return {
-            "count": count,
-            "min": min_val,
-            "max": max_val,
-            "mean": mean_val,
-            "std": std_val,
-        }
+    response = assemble_response(
+        area.name, col, start_year, end_year, monthly,
+        preview=preview,
+        narrate=False,
+        # The normals span every depth, so depth-filtered figures keep the range-based risk factors
+        climatology=None if depth else region_anomalies(engine, area, start_year, end_year, area_points),
+    )
+    if response.get("stats") and not depth:
+        # Percentiles come from merged per-cell sketches (plus the rows along the box edges)
+        quantiles = region_quantiles(engine, area, col, start_year, end_year, area_points)
+        if quantiles:
+            response["stats"].update({name: round(quantiles[name], 2) for name in QUANTILES})
+    if keep is not None and estimates is None:
+        keep.update(read, monthly=monthly)
+    if response.get("stats"):
+        # Distinct floats from merged per-cell HyperLogLog sketches; a trend
+        # resting on a handful of floats gets a lower confidence
+        floats = active_floats(engine.catalog_path, area, start_year, end_year)
+        if floats is not None:
+            response["active_floats"] = floats
+            accuracy = response["prediction_accuracy"]
+            accuracy["confidence"] = coverage_confidence(accuracy["confidence"], floats)
+    if bbox is not None or geometry is not None:
+        response["area"] = area.describe()
+    if depth:
+        response["depth"] = bin_range(*bins)
+    if approximate:
+        response["approximate"] = (
+            {"used": False, "reason": sample_info or "depth filter"} if estimates is None else {
+                "used": True,
+                "sample_rate": sample_info["rate"],
+                "sample_rows": sample_info["sample_rows"],
+                "confidence": 0.95,
+                "intervals": confidence_intervals(estimates, col),
+            }
+        )
+    return response
 
-    def calc_yearly_avg(target_col):
-        yearly_query = f"""
-            SELECT CAST(substr(time, 1, 4) AS INTEGER) AS year, AVG({target_col}) AS avg_value
-            FROM argo_data
-            WHERE {where_sql} AND {target_col} IS NOT NULL
-            GROUP BY CAST(substr(time, 1, 4) AS INTEGER)
-            ORDER BY year ASC
-        """
-        cur.execute(yearly_query, params)
-        rows = cur.fetchall()
+def sample_preview(sample):
+    """Newest sampled rows, the "latest" preview of an approximate polygon query"""
+    newest = np.argsort(sample["time"], kind="stable")[::-1][:RAW_PREVIEW_LIMIT]
+    return [
+        {name: str(sample[name][i]) if name == "time"
+         else None if np.isnan(sample[name][i]) else float(sample[name][i])
+         for name in ("time", "latitude", "longitude", "temperature", "salinity")}
+        for i in newest
+    ]
 
-        years = np.array([int(row["year"]) for row in rows], dtype=float)
-        values = np.array([float(row["avg_value"]) for row in rows], dtype=float)
-        return years, values
+def assemble_response(region: str, col: str, start_year, end_year, monthly,
+                      question: str = "", parsed_source: str = "rule-based",
+                      preview=None, narrate: bool = True, climatology=None):
+    """
+    Build the /query response from monthly partial aggregates.
+    preview is a callable returning (raw rows, preview mode), skipped when
+    None; with narrate=False the insight/answer are left for the caller.
+    climatology is the region's per-cell anomaly series (storage.climatology):
+    with it the risk factors compare each month with its calendar-month
+    normals, without it the mean is placed within the period's own min/max
+    range.
+    """
+    col_name = "temperature" if col == "temperature" else "salinity"
 
-    stats_raw = calc_stats(col_name)
+    stats_raw = summarize(monthly, col_name)
     total_count = stats_raw["count"]
     if total_count == 0:
-        conn.close()
-        return {
-            "region": region, "parameter": col, "question": question,
-            "parsed": {"region": region, "parameter": col,
-                       "start_year": start_year, "end_year": end_year,
-                       "source": parsed_source},
-            "data": [], "stats": {}, "trend": None, "prediction": [],
-            "insight": None,
-            "message": f"No data found for region: {region}",
-        }
+        return empty_response(region, col, start_year, end_year, question, parsed_source,
+                              f"No data found for region: {region}")
 
-    preview_query = f"""
-        SELECT time, latitude, longitude, temperature, salinity
-        FROM argo_data
-        WHERE {where_sql}
-        ORDER BY time DESC
-        LIMIT {RAW_PREVIEW_LIMIT}
-    """
-    cur.execute(preview_query, params)
-    preview_rows = cur.fetchall()
+    preview_rows, preview_mode = preview() if preview else ([], None)
 
     records = [
         {
@@ -195,8 +445,8 @@ def build_response(region: str, parameter: str, start_year, end_year,
             "year": int(str(row["time"])[:4]) if row["time"] else None,
             "latitude": float(row["latitude"]),
             "longitude": float(row["longitude"]),
-            "temperature": float(row["temperature"]) if pd.notna(row["temperature"]) else None,
-            "salinity": float(row["salinity"]) if pd.notna(row["salinity"]) else None,
+            "temperature": float(row["temperature"]) if row["temperature"] is not None else None,
+            "salinity": float(row["salinity"]) if row["salinity"] is not None else None,
         }
         for row in preview_rows
     ]
@@ -206,10 +456,10 @@ def build_response(region: str, parameter: str, start_year, end_year,
         "max": round(stats_raw["max"], 2),
         "mean": round(stats_raw["mean"], 2),
         "std": round(stats_raw["std"], 2),
-        "count": total_count,
+        "count": int(round(total_count)),
     }
 
-    years_arr, yearly_values = calc_yearly_avg(col_name)
+    years_arr, yearly_values = yearly_means(monthly, col_name)
     yearly_data = [
         {"year": int(year), "value": round(float(value), 2)}
         for year, value in zip(years_arr, yearly_values)
@@ -231,9 +481,9 @@ def build_response(region: str, parameter: str, start_year, end_year,
         "direction": "rising" if trend_per_year > 0 else "falling" if trend_per_year < 0 else "stable",
     }
 
-    temp_stats_raw = stats_raw if col_name == "temperature" else calc_stats("temperature")
-    sal_stats_raw = stats_raw if col_name == "salinity" else calc_stats("salinity")
-    temp_years, temp_values = (years_arr, yearly_values) if col_name == "temperature" else calc_yearly_avg("temperature")
+    temp_stats_raw = stats_raw if col_name == "temperature" else summarize(monthly, "temperature")
+    sal_stats_raw = stats_raw if col_name == "salinity" else summarize(monthly, "salinity")
+    temp_years, temp_values = (years_arr, yearly_values) if col_name == "temperature" else yearly_means(monthly, "temperature")
 
     temp_trend_per_year = 0.0
     if len(temp_years) > 1:
@@ -254,8 +504,32 @@ def build_response(region: str, parameter: str, start_year, end_year,
         normalized = (stats_blob["mean"] - stats_blob["min"]) / value_range
         return normalized <= low_thresh or normalized >= high_thresh
 
-    temp_anomaly = is_anomalous(temp_stats_raw)
-    salinity_imbalance = is_anomalous(sal_stats_raw)
+    anomalies = None
+    if climatology:
+        series = {parameter: climatology[parameter] for parameter in PARAMETERS}
+        summaries = {parameter: summarize_anomalies(series[parameter]) for parameter in PARAMETERS}
+        if summaries["temperature"] and summaries["salinity"]:
+            anomalies = {
+                "baseline": {"start_year": climatology["start_year"], "end_year": climatology["end_year"]},
+                **{
+                    parameter: {"mean": round(summary["anomaly"], 3), "sigma": round(summary["sigma"], 3),
+                                "months": summary["months"]}
+                    for parameter, summary in summaries.items()
+                },
+                "series": [
+                    {"label": f"{month['year']}-{month['month']:02d}", "year": month["year"], "month": month["month"],
+                     "value": round(month["value"], 3), "normal": round(month["normal"], 3),
+                     "anomaly": round(month["anomaly"], 3)}
+                    for month in series[col_name]
+                ],
+            }
+
+    if anomalies:
+        temp_anomaly = departs_from_normal(summaries["temperature"], "temperature")
+        salinity_imbalance = departs_from_normal(summaries["salinity"], "salinity")
+    else:
+        temp_anomaly = is_anomalous(temp_stats_raw)
+        salinity_imbalance = is_anomalous(sal_stats_raw)
     rapid_warming = abs(temp_trend_per_year) >= 0.05
 
     risk_score = 0
@@ -286,6 +560,7 @@ def build_response(region: str, parameter: str, start_year, end_year,
             "salinity_imbalance": salinity_imbalance,
         },
         "temp_trend_per_year": temp_trend_per_year,
+        "basis": "climatology" if anomalies else "range",
     }
 
     range_start = int(years_arr.min()) if len(years_arr) > 0 else start_year
@@ -299,78 +574,34 @@ def build_response(region: str, parameter: str, start_year, end_year,
     else:
         granularity = "year"
 
-    if granularity == "month":
-        timeseries_query = f"""
-            SELECT
-                strftime('%Y-%m', time) AS period,
-                CAST(substr(time, 1, 4) AS INTEGER) AS year,
-                CAST(strftime('%m', time) AS INTEGER) AS month,
-                AVG({col_name}) AS avg_value
-            FROM argo_data
-            WHERE {where_sql} AND {col_name} IS NOT NULL
-            GROUP BY strftime('%Y-%m', time)
-            ORDER BY period ASC
-        """
-    elif granularity == "quarter":
-        timeseries_query = f"""
-            SELECT
-                CAST(substr(time, 1, 4) AS INTEGER) AS year,
-                CAST(((CAST(strftime('%m', time) AS INTEGER) - 1) / 3) + 1 AS INTEGER) AS quarter,
-                AVG({col_name}) AS avg_value
-            FROM argo_data
-            WHERE {where_sql} AND {col_name} IS NOT NULL
-            GROUP BY CAST(substr(time, 1, 4) AS INTEGER), quarter
-            ORDER BY year ASC, quarter ASC
-        """
-    else:
-        timeseries_query = f"""
-            SELECT
-                CAST(substr(time, 1, 4) AS INTEGER) AS year,
-                AVG({col_name}) AS avg_value
-            FROM argo_data
-            WHERE {where_sql} AND {col_name} IS NOT NULL
-            GROUP BY CAST(substr(time, 1, 4) AS INTEGER)
-            ORDER BY year ASC
-        """
-
-    cur.execute(timeseries_query, params)
-    series_rows = cur.fetchall()
-
     timeseries = []
-    if granularity == "month":
-        for row in series_rows:
-            label = row["period"]
+    for group in group_means(monthly, col_name, granularity):
+        if granularity == "month":
+            year_val, month_val = group["key"]
             timeseries.append({
-                "label": label,
-                "year": int(row["year"]),
-                "month": int(row["month"]),
-                "value": round(float(row["avg_value"]), 2),
+                "label": f"{year_val}-{month_val:02d}",
+                "year": year_val,
+                "month": month_val,
+                "value": round(float(group["mean"]), 2),
             })
-    elif granularity == "quarter":
-        for row in series_rows:
-            year_val = int(row["year"])
-            quarter_val = int(row["quarter"])
+        elif granularity == "quarter":
+            year_val, quarter_val = group["key"]
             timeseries.append({
                 "label": f"{year_val}-Q{quarter_val}",
                 "year": year_val,
                 "quarter": quarter_val,
-                "value": round(float(row["avg_value"]), 2),
+                "value": round(float(group["mean"]), 2),
             })
-    else:
-        for row in series_rows:
-            year_val = int(row["year"])
+        else:
+            year_val = group["key"][0]
             timeseries.append({
                 "label": str(year_val),
                 "year": year_val,
-                "value": round(float(row["avg_value"]), 2),
+                "value": round(float(group["mean"]), 2),
             })
 
     # Prediction (5 years ahead)
-    prediction_df = pd.DataFrame({
-        "year": years_arr.astype(int),
-        col_name: yearly_values,
-    })
-    pred_result = predictor.predict_trend(prediction_df, col_name, future_years=5)
+    pred_result = predictor.predict_series(years_arr.astype(int), yearly_values, future_years=5)
     prediction_points = pred_result.get("predictions", []) if pred_result.get("success") else []
     
     # Extract prediction accuracy metrics
@@ -381,11 +612,11 @@ def build_response(region: str, parameter: str, start_year, end_year,
     }
 
     # AI Insight
-    insight = generate_insight(region, col_name, stats, trend)
-
-    answer = generate_answer(region, col_name, stats, trend, risk, question)
-    
-    conn.close()
+    if narrate:
+        insight = generate_insight(region, col_name, stats, trend)
+        answer = generate_answer(region, col_name, stats, trend, risk, question)
+    else:
+        insight = answer = None
 
     response = {
         "region":    region,
@@ -400,6 +631,7 @@ def build_response(region: str, parameter: str, start_year, end_year,
         "start_year": int(years_arr.min()),
         "end_year":   int(years_arr.max()),
         "raw_limit":  RAW_PREVIEW_LIMIT,
+        "preview_mode": preview_mode,
         "data":       records,
         "timeseries": timeseries,
         "granularity": granularity,
@@ -412,6 +644,8 @@ def build_response(region: str, parameter: str, start_year, end_year,
         "risk":       risk,
         "answer":     answer,
     }
+    if anomalies:
+        response["anomaly"] = anomalies   # against the calendar-month normals
     
     return clean_nans(response)
 
@@ -420,7 +654,7 @@ def build_response(region: str, parameter: str, start_year, end_year,
 
 @app.get("/")
 def home():
-    groq_enabled = bool(os.getenv("GROQ_API_KEY"))
+    groq_enabled = llm_enabled()
     return {
         "message": "Velora AI backend running",
         "version": "2.0.0",
@@ -431,6 +665,16 @@ def home():
 
 @app.get("/health")
 def health():
+    info = catalog()
+    if info:
+        return {
+            "status": "healthy",
+            "records": info["total_rows"],
+            "data_version": info["data_version"],
+            "last_ingest": info["last_ingest"],
+        }
+
+    # Legacy database without a catalog (run optimize_db.py to create one)
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT COUNT(*) FROM argo_data")
@@ -439,13 +683,52 @@ def health():
     return {"status": "healthy", "records": count}
 
 
+@app.get("/metrics")
+def metrics():
+    """GET /metrics — counters of this worker process (e.g. coalesced requests, 304s, bytes saved)"""
+    conditional_requests = METRICS.total("http_conditional_total")
+    return {
+        "counters": METRICS.snapshot(),
+        "in_flight": flights.in_flight(),
+        "admission": admission.state(),
+        "sessions": len(sessions),
+        "http": {
+            "not_modified_rate": round(METRICS.total("http_not_modified_total") / conditional_requests, 4)
+            if conditional_requests else None,
+            "bytes_saved": METRICS.total("http_bytes_saved_total"),
+        },
+    }
+
+
+def cache_validators(request: Request, response: Response, route: str, info):
+    """Set ETag/Last-Modified/Cache-Control on response; returns a 304 to send instead, if any"""
+    engine = get_engine()
+    headers, not_modified = conditional(request, route, f"{engine.name}:{engine.catalog_path}", info)
+    response.headers.update(headers)
+    return not_modified
+
+
 @app.get("/regions")
-def regions():
-    return {"regions": list(REGION_BOUNDS.keys())}
+def regions(request: Request, response: Response):
+    info = catalog()
+    not_modified = cache_validators(request, response, "regions", info)
+    if not_modified:
+        return not_modified
+    payload = {"regions": list(REGION_BOUNDS.keys())}
+    if info:
+        payload["counts"] = {name: info["regions"].get(name, 0) for name in REGION_BOUNDS}
+    return payload
 
 
 @app.get("/year-range")
-def year_range():
+def year_range(request: Request, response: Response):
+    info = catalog()
+    not_modified = cache_validators(request, response, "year-range", info)
+    if not_modified:
+        return not_modified
+    if info:
+        return {"start_year": info["start_year"], "end_year": info["end_year"]}
+
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
@@ -465,15 +748,134 @@ def year_range():
     return {"start_year": start_year, "end_year": end_year}
 
 
+@app.get("/tiles/{z}/{x}/{y}")
+def tiles(
+    z: int, x: int, y: int,
+    start_year: Optional[int] = QParam(None),
+    end_year:   Optional[int] = QParam(None),
+):
+    """
+    GET /tiles/{z}/{x}/{y} — heatmap cells (count, mean temperature/salinity)
+    for one Web Mercator tile, served from the precomputed tile pyramid.
+    """
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return {"error": f"Tile {z}/{x}/{y} is out of range.", "cells": []}
+
+    info = catalog()
+    try:
+        return get_tile(get_engine().catalog_path, catalog_token(info),
+                        z, x, y, start_year, end_year)
+    except sqlite3.OperationalError:
+        return {"error": "Tile pyramid not built yet (run optimize_db.py, or migrate_compact.py for the compact engine).", "cells": []}
+
+
+@app.get("/ts-diagram")
+def ts_diagram(
+    region: Optional[str] = QParam(None),
+    start_year: Optional[int] = QParam(None),
+    end_year:   Optional[int] = QParam(None),
+    bbox:       Optional[str] = QParam(None, description="lon_min,lat_min,lon_max,lat_max"),
+    geometry:   Optional[str] = QParam(None, description="GeoJSON Polygon/MultiPolygon"),
+    pressure:   bool = QParam(False, description="add the mean pressure of every bin"),
+):
+    """
+    GET /ts-diagram — temperature/salinity 2D histogram for a region and year
+    range, as sparse [tbin, sbin, count(, mean_pressure)] cells.
+    """
+    try:
+        area = resolve_region(region, bbox, geometry)
+    except ValueError as e:
+        return {"error": str(e), "cells": []}
+    result = region_histogram(get_engine(), area, start_year, end_year, pressure)
+    if result is None:
+        return {"error": "T-S histograms not built yet (run optimize_db.py, or migrate_compact.py for the compact engine).", "cells": []}
+    return {"region": area.name, "start_year": start_year, "end_year": end_year, **clean_nans(result)}
+
+
+@app.get("/profile")
+def profile(
+    region: Optional[str] = QParam(None),
+    start_year: Optional[int] = QParam(None),
+    end_year:   Optional[int] = QParam(None),
+    bbox:       Optional[str] = QParam(None, description="lon_min,lat_min,lon_max,lat_max"),
+    geometry:   Optional[str] = QParam(None, description="GeoJSON Polygon/MultiPolygon"),
+    pressure_min: Optional[float] = QParam(None),
+    pressure_max: Optional[float] = QParam(None),
+):
+    """
+    GET /profile — vertical mean profile: temperature and salinity
+    count/mean/std per standard pressure bin, surface first.
+    """
+    try:
+        area = resolve_region(region, bbox, geometry)
+        bins = depth_bins(pressure_min, pressure_max)
+    except ValueError as e:
+        return {"error": str(e), "levels": []}
+    levels = depth_profile(get_engine(), area, start_year, end_year, bins)
+    if levels is None:
+        return {"error": "Depth rollup not built yet (run optimize_db.py, or migrate_compact.py for the compact engine).", "levels": []}
+    return {"region": area.name, "start_year": start_year, "end_year": end_year,
+            "depth": bin_range(*bins), "levels": clean_nans(levels)}
+
+
+STATIONS_MISSING = "Float stations not built yet (run optimize_db.py, or migrate_compact.py for the compact engine)."
+
+
+@app.get("/platforms/{platform}/trajectory")
+def trajectory(
+    platform: str,
+    start_year: Optional[int] = QParam(None),
+    end_year:   Optional[int] = QParam(None),
+    simplify:   float = QParam(0.0, ge=0, description="Douglas-Peucker tolerance in degrees (0 = every station)"),
+):
+    """GET /platforms/{platform}/trajectory — station positions of one float in time order."""
+    result = platform_trajectory(get_engine().catalog_path, platform, start_year, end_year, simplify)
+    if result is None:
+        return {"error": STATIONS_MISSING, "points": []}
+    if not result["count"]:
+        return {"error": f"No stations found for platform {platform}.", "points": []}
+    return {"platform": platform, "start_year": start_year, "end_year": end_year, **result}
+
+
+@app.get("/platforms/{platform}/series")
+def series(
+    platform: str,
+    start_year: Optional[int] = QParam(None),
+    end_year:   Optional[int] = QParam(None),
+):
+    """
+    GET /platforms/{platform}/series — one row per station of a float:
+    position, levels, pressure range and temperature/salinity summaries.
+    """
+    result = platform_series(get_engine().catalog_path, platform, start_year, end_year)
+    if result is None:
+        return {"error": STATIONS_MISSING, "stations": []}
+    if not result["count"]:
+        return {"error": f"No stations found for platform {platform}.", "stations": []}
+    return {"platform": platform, "start_year": start_year, "end_year": end_year, **clean_nans(result)}
+
+
 @app.post("/query")
 def query_nl(data: dict):
     """
     POST /query
     Body: { "question": "Show salinity in Atlantic Ocean from 2018 to 2021" }
+    Optional "bbox" ([lon_min, lat_min, lon_max, lat_max]) or GeoJSON "geometry"
+    replaces the named region, e.g. for the Bay of Bengal. "preview": "spread"
+    spreads the raw preview rows over the region instead of the latest 100.
+    "approximate": true estimates the figures from stratified samples.
+    "pressure_min"/"pressure_max" (dbar) restrict the figures to a depth range.
+    "conversation_id" (any client-chosen string) resolves follow-ups such as
+    "what about salinity?" against the previous question of the conversation.
     """
     question = data.get("question", "").strip()
     if not question:
         return {"error": "Please provide a question."}
+    bbox, geometry = data.get("bbox"), data.get("geometry")
+    custom_area = bbox is not None or geometry is not None
+    preview_mode = data.get("preview", "latest")
+    if preview_mode not in PREVIEW_MODES:
+        return {"error": f"preview must be one of {', '.join(PREVIEW_MODES)}."}
 
     lower_q = question.lower()
     chart_keywords = (
@@ -482,10 +884,18 @@ def query_nl(data: dict):
     )
     render_chart = any(keyword in lower_q for keyword in chart_keywords)
 
-    # LLM (or rule-based) parsing
-    parsed = parse_query(question)
+    # LLM (or rule-based) parsing; rule-based only once the server is shedding load.
+    # Follow-ups are resolved against the conversation's previous question without the LLM.
+    level = admission.start()
+    use_llm = level == "full"
+    conversation = data.get("conversation_id") or None
+    previous = sessions.parsed(conversation)
+    parsed = flights.do("parse", json.dumps([" ".join(lower_q.split()), use_llm, previous], sort_keys=True),
+                        lambda: parse_query(question, llm=use_llm, previous=previous))
+    if parsed.get("region"):
+        sessions.remember_parsed(conversation, parsed)
 
-    if not parsed.get("region"):
+    if not parsed.get("region") and not custom_area:
         greetings = ("hello", "hi", "hey", "good morning", "good afternoon", "good evening")
         if any(greet in lower_q for greet in greetings) or len(lower_q.split()) <= 2:
             return {
@@ -513,21 +923,201 @@ def query_nl(data: dict):
         }
 
     return build_response(
-        region=parsed["region"],
+        region=None if custom_area else parsed["region"],
         parameter=parsed.get("parameter", "temperature"),
         start_year=parsed.get("start_year"),
         end_year=parsed.get("end_year"),
         question=question,
         parsed_source=parsed.get("source", "rule-based"),
+        bbox=bbox,
+        geometry=geometry,
+        preview_mode=preview_mode,
+        approximate=bool(data.get("approximate", False)),
+        pressure_min=data.get("pressure_min"),
+        pressure_max=data.get("pressure_max"),
+        level=level,
+        conversation=conversation,
     ) | {"render_chart": render_chart}
 
 
 @app.get("/query")
 def query_get(
-    region: str = QParam(...),
+    request: Request,
+    response: Response,
+    region: Optional[str] = QParam(None),
     start_year: Optional[int] = QParam(None),
     end_year:   Optional[int] = QParam(None),
     parameter:  Optional[str] = QParam("temperature"),
+    bbox:       Optional[str] = QParam(None, description="lon_min,lat_min,lon_max,lat_max"),
+    geometry:   Optional[str] = QParam(None, description="GeoJSON Polygon/MultiPolygon"),
+    preview:    Optional[str] = QParam("latest", description="latest | spread"),
+    approximate: bool = QParam(False, description="estimate from stratified samples, with 95% intervals"),
+    pressure_min: Optional[float] = QParam(None, description="dbar; widened to standard pressure bins"),
+    pressure_max: Optional[float] = QParam(None, description="dbar; widened to standard pressure bins"),
+):
+    """GET /query — for direct URL testing; revalidates with ETag / If-None-Match."""
+    not_modified = cache_validators(request, response, "query", catalog())
+    if not_modified:
+        return not_modified
+    if preview not in PREVIEW_MODES:
+        return {"error": f"preview must be one of {', '.join(PREVIEW_MODES)}."}
+    result = build_response(region, parameter, start_year, end_year, bbox=bbox, geometry=geometry,
+                            preview_mode=preview, approximate=approximate,
+                            pressure_min=pressure_min, pressure_max=pressure_max)
+    if result.get("degradation", "full") != "full":
+        # A degraded answer must not be revalidated as the full one
+        for header in ("ETag", "Last-Modified"):
+            if header in response.headers:
+                del response.headers[header]
+        response.headers["Cache-Control"] = "no-store"
+    return result
+
+
+def approximate_figures(spec, preview_mode: str, include_preview: bool):
+    """A batch result at the "approximate" level, from the cache or the samples as in build_response"""
+    spec = {**spec, "preview_mode": preview_mode, "approximate": False, "pressure_min": None, "pressure_max": None}
+    figures = query_figures(spec, cached_only=True) or query_figures({**spec, "approximate": True})
+    result = {**figures, "parsed": {**figures["parsed"], "source": "batch"}}
+    if not include_preview and figures.get("stats"):
+        result.update(data=[], preview_mode=None)
+    return result
+
+
+@app.post("/query/batch")
+def query_batch(data: dict):
+    """
+    POST /query/batch
+    Body: {
+      "queries": [{"region": "Indian Ocean", "parameter": "salinity", "start_year": 2019, "end_year": 2021}, ...],
+                 # a spec may use "bbox" or a GeoJSON "geometry" instead of a named region
+      "narrate": false,          # one LLM call (or template) for the whole batch
+      "include_preview": false,  # raw preview rows per spec (one extra query each)
+      "preview": "latest"        # or "spread" (see fetch_preview)
+    }
+    All regions are aggregated in one shared scan; results keep the order of "queries".
+    Under load the narration falls back to templates (see "degradation"), and
+    at "approximate" each spec is answered as /query would: cached exact
+    figures, else estimates from the stratified samples.
+    """
+    level = admission.start()
+    specs = data.get("queries") or []
+    if not isinstance(specs, list) or not specs:
+        return {"error": "Please provide a non-empty 'queries' list."}
+    if len(specs) > MAX_BATCH_QUERIES:
+        return {"error": f"At most {MAX_BATCH_QUERIES} queries per batch."}
+
+    narrate = bool(data.get("narrate", False))
+    include_preview = bool(data.get("include_preview", False))
+    preview_mode = data.get("preview", "latest")
+    if preview_mode not in PREVIEW_MODES:
+        return {"error": f"preview must be one of {', '.join(PREVIEW_MODES)}."}
+
+    given = specs
+    specs = [
+        {
+            "region": spec.get("region"),
+            "parameter": valid_parameter(spec.get("parameter", "temperature")),
+            "start_year": spec.get("start_year"),
+            "end_year": spec.get("end_year"),
+            "bbox": spec.get("bbox"),
+            "geometry": spec.get("geometry"),
+        }
+        for spec in (spec if isinstance(spec, dict) else {} for spec in given)
+    ]
+    areas = []
+    for spec, raw in zip(specs, given):
+        if not isinstance(raw, dict):
+            # Reported in its slot like an unknown region, not as a failed batch
+            areas.append(ValueError("Each query must be an object with a region, bbox or geometry."))
+            continue
+        try:
+            areas.append(resolve_region(spec["region"], spec["bbox"], spec["geometry"]))
+        except ValueError as e:
+            areas.append(e)
+
+    # Boxes share one scan over the union of their year ranges; each spec is
+    # trimmed afterwards. Polygons need row-level refinement and run on their own.
+    engine = get_engine()
+    approximate = level == "approximate"
+    boxed = [(spec, area) for spec, area in zip(specs, areas)
+             if isinstance(area, Region) and area.is_box and not approximate]
+    boxes = {area.key: area.bounds for _, area in boxed}
+    monthly_by_box = {}
+    if boxes:
+        starts = [spec["start_year"] for spec, _ in boxed]
+        ends = [spec["end_year"] for spec, _ in boxed]
+        scan_start = min(starts) if all(starts) else None
+        scan_end = max(ends) if all(ends) else None
+        monthly_lists = engine.monthly_aggregates_multi(list(boxes.values()), scan_start, scan_end)
+        monthly_by_box = dict(zip(boxes, monthly_lists))
+
+    results = []
+    for spec, area in zip(specs, areas):
+        col = spec["parameter"]
+        start_year, end_year = spec["start_year"], spec["end_year"]
+        if not isinstance(area, Region):
+            results.append(empty_response(spec["region"], col, start_year, end_year, "", "batch", str(area)))
+            continue
+        if approximate:
+            results.append(approximate_figures(spec, preview_mode, include_preview))
+            continue
+        latest_rows = None
+        area_points = shared_region_points(engine, area, start_year, end_year)
+        if area.is_box:
+            monthly = filter_years(monthly_by_box[area.key], start_year, end_year)
+        else:
+            monthly, latest_rows = monthly_and_latest(area_points()[1], RAW_PREVIEW_LIMIT)
+        preview = (lambda a=area, s=start_year, e=end_year, rows=latest_rows:
+                   fetch_preview(engine, a, s, e, preview_mode, rows))
+        result = assemble_response(
+            area.name, col, start_year, end_year, monthly,
+            parsed_source="batch",
+            preview=preview if include_preview else None,
+            narrate=False,
+            climatology=region_anomalies(engine, area, start_year, end_year, area_points),
+        )
+        if spec["bbox"] is not None or spec["geometry"] is not None:
+            result["area"] = area.describe()
+        results.append(result)
+
+    response = {"results": results, "count": len(results), "degradation": level}
+    if narrate:
+        narrated = [result for result in results if result.get("stats")]
+        narration = generate_batch_narration([
+            {"region": result["region"], "parameter": result["parameter"],
+             "start_year": result["start_year"], "end_year": result["end_year"],
+             "stats": result["stats"], "trend": result["trend"], "risk": result["risk"]}
+            for result in narrated
+        ], llm=level == "full")
+        for result, insight in zip(narrated, narration["items"]):
+            result["insight"] = insight
+        response["summary"] = narration["summary"]
+    return response
+
+
+@app.get("/export")
+def export(
+    region: Optional[str] = QParam(None),
+    start_year: Optional[int] = QParam(None),
+    end_year:   Optional[int] = QParam(None),
+    bbox:       Optional[str] = QParam(None, description="lon_min,lat_min,lon_max,lat_max"),
+    geometry:   Optional[str] = QParam(None, description="GeoJSON Polygon/MultiPolygon"),
+    format:     Optional[str] = QParam("csv", description="csv | ndjson | parquet"),
+    after:      Optional[str] = QParam(None, description="cursor of the last row received, to resume"),
 ):
-    """GET /query — for direct URL testing."""
-    return build_response(region, parameter, start_year, end_year)
+    """
+    GET /export — raw observations for the same region/year filters as /query,
+    streamed in time order. Every row has a "cursor" column; pass the last one
+    received as ?after= to resume an interrupted download.
+    """
+    try:
+        area = resolve_region(region, bbox, geometry)
+        chunks = stream_export(get_engine(), area, start_year, end_year, format, after, EXPORT_PAGE_ROWS)
+    except (ValueError, RuntimeError) as e:
+        return {"error": str(e)}
+
+    slug = "".join(c if c.isalnum() else "_" for c in area.name.lower()).strip("_")
+    years = f"_{start_year or 'all'}-{end_year or 'all'}"
+    filename = f"argo_{slug}{years}.{format}"
+    return StreamingResponse(chunks, media_type=FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
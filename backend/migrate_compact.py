@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Migrate the live database (data/argo.db or its published snapshot) into the
+compact schema (data/argo_compact.db) and report size and query latency before/after.
+
+Serve it with VELORA_ENGINE=compact.
+"""
+
+import os
+import statistics
+import time
+from datetime import datetime
+
+from storage.compact import CompactSQLiteEngine, migrate_to_compact
+from storage.engines import SQLiteEngine
+from storage.regions import REGION_BOUNDS
+from storage.snapshots import SNAPSHOTS
+
+DB_PATH = SNAPSHOTS.live_path()  # data/argo.db unless a snapshot was published
+COMPACT_PATH = "data/argo_compact.db"
+
+def measure(engine, repeat=3):
+    """Median latency (ms) of the build_response queries per region"""
+    timings = []
+    for bounds in REGION_BOUNDS.values():
+        for start_year, end_year in ((None, None), (2020, 2024)):
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                engine.monthly_aggregates(bounds, start_year, end_year)
+                engine.preview(bounds, start_year, end_year, 100)
+                samples.append((time.perf_counter() - start) * 1000)
+            timings.append(statistics.median(samples))
+    return statistics.median(timings), max(timings)
+
+def migrate():
+    print(f"Starting compact migration... {datetime.now().strftime('%H:%M:%S')}")
+    before_size = os.path.getsize(DB_PATH)
+
+    def progress(rows):
+        if rows % 1000000 < 200000:
+            print(f"  Copied {rows:,} rows... ({datetime.now().strftime('%H:%M:%S')})")
+
+    result = migrate_to_compact(DB_PATH, COMPACT_PATH, progress=progress)
+    after_size = os.path.getsize(COMPACT_PATH)
+
+    print("\nMeasuring query latency...")
+    before_median, before_max = measure(SQLiteEngine(os.path.abspath(DB_PATH)))
+    after_median, after_max = measure(CompactSQLiteEngine(os.path.abspath(COMPACT_PATH)))
+
+    print(f"\n✅ Compact database created!")
+    print(f"   Rows: {result['rows_written']:,}")
+    print(f"   Platforms: {result['platforms']:,}")
+    print(f"   Size:    {before_size / 1024 / 1024:,.1f} MB → {after_size / 1024 / 1024:,.1f} MB "
+          f"({(1 - after_size / before_size) * 100:.0f}% smaller)")
+    print(f"   Latency: median {before_median:.1f} ms → {after_median:.1f} ms, "
+          f"worst {before_max:.1f} ms → {after_max:.1f} ms")
+    print(f"   Location: {os.path.abspath(COMPACT_PATH)}")
+    print(f"   Serve with: VELORA_ENGINE=compact")
+
+if __name__ == "__main__":
+    migrate()
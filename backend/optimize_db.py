@@ -1,14 +1,26 @@
 #!/usr/bin/env python
 """
 Quick database optimization - add indexes for faster queries
+
+Usage:
+  python optimize_db.py              # on a new snapshot of the live database, then published
+  python optimize_db.py --in-place   # directly on data/argo.db (blocks readers meanwhile)
+  python optimize_db.py --shards
 """
 
 import sqlite3
+import sys
+
+from storage.catalog import refresh_catalog
+from storage.derived import rebuild_derived
+from storage.shards import rebuild_shard_catalog, shard_path, shard_years
+from storage.snapshots import run_on_snapshot
 
 DB_PATH = "data/argo.db"
+SHARD_DIR = "data/shards"
 
-def optimize_database():
-    conn = sqlite3.connect(DB_PATH)
+def optimize_database(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     
     print("Optimizing database for faster queries...")
@@ -53,8 +65,15 @@ def optimize_database():
     print("3. Analyzing tables for query optimizer...")
     cur.execute("ANALYZE")
     
+    # Catalog is rebuilt without bumping the data version (rows are unchanged)
+    print("4. Refreshing metadata catalog...")
+    refresh_catalog(conn, source="optimize_db", bump_version=False)
+    built = rebuild_derived(conn, missing_only=True)
+    if built:
+        print(f"   - Built missing derived tables: {', '.join(built)}")
+    
     # Set pragmas for faster queries
-    print("4. Setting performance pragmas...")
+    print("5. Setting performance pragmas...")
     cur.execute("PRAGMA cache_size = -64000")  # 64MB cache
     cur.execute("PRAGMA temp_store = MEMORY")   # Use memory for temp storage
     cur.execute("PRAGMA mmap_size = 268435456") # 256MB memory-mapped I/O
@@ -63,8 +82,8 @@ def optimize_database():
     conn.commit()
     
     # Get stats
-    cur.execute("SELECT COUNT(*) FROM argo_data")
-    total = cur.fetchone()[0]
+    cur.execute("SELECT value FROM argo_catalog WHERE key = 'total_rows'")
+    total = int(cur.fetchone()[0])
     
     conn.close()
     
@@ -73,5 +92,16 @@ def optimize_database():
     print(f"   Indexes: Created")
     print(f"   Query performance: Improved")
 
+def optimize_shards():
+    for year in shard_years(SHARD_DIR):
+        print(f"\n===== Shard {year} =====")
+        optimize_database(shard_path(year, SHARD_DIR))
+    rebuild_shard_catalog(SHARD_DIR, source="optimize_db")
+
 if __name__ == "__main__":
-    optimize_database()
+    if "--shards" in sys.argv:
+        optimize_shards()
+    elif "--in-place" in sys.argv:
+        optimize_database()
+    else:
+        run_on_snapshot("optimize", optimize_database)
@@ -0,0 +1,20 @@
+"""
+Serving Module — request-level plumbing shared by the API routes
+(request coalescing, process metrics, query log and cache warming,
+HTTP revalidation and compression, snapshot leases, load shedding,
+conversation sessions)
+"""
+
+from .admission import AdmissionController, AdmissionMiddleware
+from .compression import CompressionMiddleware
+from .conditional import conditional
+from .leases import SnapshotLeaseMiddleware
+from .metrics import METRICS
+from .querylog import QueryLog
+from .sessions import SessionStore
+from .singleflight import SingleFlight
+from .warmer import CacheWarmer
+
+__all__ = ['METRICS', 'QueryLog', 'SingleFlight', 'CacheWarmer', 'CompressionMiddleware', 'conditional',
+           'SnapshotLeaseMiddleware', 'AdmissionController', 'AdmissionMiddleware',
+           'SessionStore']
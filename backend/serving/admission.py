@@ -0,0 +1,145 @@
+"""
+Admission control and load shedding
+
+Tracks the /query requests in flight (queued in the threadpool or running)
+and how long they waited before a worker thread picked them up, and maps
+both to a degradation level:
+
+  full         the whole pipeline
+  no_llm       insight and answer from templates, no LLM calls
+  approximate  also no LLM, and figures from the response cache or the
+               stratified samples instead of an exact scan
+  reject       503 with Retry-After, before the request reaches the threadpool
+
+Each level is entered when either signal crosses its threshold. The queue
+delay is an exponentially weighted average that also decays with time, so
+an idle server recovers even when nothing is admitted to measure.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .metrics import METRICS
+
+LEVELS = ("full", "no_llm", "approximate", "reject")
+
+# When the current request was accepted by the middleware (see AdmissionController.start)
+_arrived = contextvars.ContextVar("velora_arrived", default=None)
+
+
+def _thresholds(name: str, default: str, scale: float = 1.0) -> Tuple[float, ...]:
+    """Three comma-separated thresholds (no_llm, approximate, reject) from the environment"""
+    values = tuple(float(value) * scale for value in os.getenv(name, default).split(","))
+    if len(values) != 3:
+        raise ValueError(f"{name} needs three comma-separated values")
+    return values
+
+
+class AdmissionController:
+    def __init__(self, in_flight_limits=None, delay_limits=None, retry_after: int = None,
+                 half_life: float = 5.0, metrics=METRICS):
+        """
+        in_flight_limits / delay_limits (seconds) are the (no_llm, approximate,
+        reject) thresholds for requests in flight and the average queue delay.
+        """
+        self.in_flight_limits = in_flight_limits or _thresholds("VELORA_SHED_INFLIGHT", "16,32,64")
+        self.delay_limits = delay_limits or _thresholds("VELORA_SHED_DELAY_MS", "250,1000,3000", 0.001)
+        self.retry_after = retry_after or int(os.getenv("VELORA_RETRY_AFTER", "2"))
+        self.half_life = half_life
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._delay = 0.0
+        self._delay_at = time.monotonic()
+
+    # ── Signals ────────────────────────────────────────────────────────────────
+    def _decayed_delay(self, now: float) -> float:
+        return self._delay * 0.5 ** (max(now - self._delay_at, 0.0) / self.half_life)
+
+    def observe_delay(self, delay: float, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Weighted 1/4 towards each new sample, on top of the time decay
+            self._delay = 0.75 * self._decayed_delay(now) + 0.25 * delay
+            self._delay_at = now
+
+    def level(self, now: Optional[float] = None) -> str:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            in_flight, delay = self._in_flight, self._decayed_delay(now)
+        level = 0
+        for i, (count_limit, delay_limit) in enumerate(zip(self.in_flight_limits, self.delay_limits), start=1):
+            if in_flight >= count_limit or delay >= delay_limit:
+                level = i
+        return LEVELS[level]
+
+    def state(self) -> Dict:
+        with self._lock:
+            in_flight, delay = self._in_flight, self._decayed_delay(time.monotonic())
+        return {"level": self.level(), "in_flight": in_flight, "queue_delay_ms": round(delay * 1000, 1)}
+
+    # ── Request lifecycle ──────────────────────────────────────────────────────
+    def enter(self) -> bool:
+        """Admit a request (False: shed it); admitted requests must call leave()"""
+        if self.level() == "reject":
+            self.metrics.inc("admission_rejected_total")
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def start(self) -> str:
+        """
+        Called once a worker thread runs the request: records its queue delay
+        and returns the level it should be served at.
+        """
+        arrived = _arrived.get()
+        if arrived is not None:
+            now = time.monotonic()
+            self.observe_delay(now - arrived, now)
+        level = self.level()
+        if level == "reject":
+            # Admitted before the spike peaked; it has already waited, so serve it cheaply
+            level = "approximate"
+        self.metrics.inc("admission_requests_total", level=level)
+        return level
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to the given paths"""
+
+    def __init__(self, app, controller: AdmissionController, paths=("/query", "/query/batch")):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        if not self.controller.enter():
+            body = json.dumps({
+                "error": "The server is overloaded, please retry shortly.",
+                "degradation": "reject",
+            }).encode()
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.controller.retry_after).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        token = _arrived.set(time.monotonic())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _arrived.reset(token)
+            self.controller.leave()
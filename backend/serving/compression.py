@@ -0,0 +1,110 @@
+"""
+Response compression
+
+ASGI middleware compressing JSON responses with brotli (when the optional
+brotli package is installed and the client accepts it) or gzip. Only
+complete bodies are compressed; a response that streams (export) passes
+through untouched, as does anything below `minimum_size`.
+
+It also accounts for bytes saved: the difference compression made, and
+for each 304 the size of the 200 last sent with that ETag.
+"""
+
+import gzip
+from typing import Optional
+
+from storage.cache import LRUCache
+
+from .metrics import METRICS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ("application/json",)
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding we can produce that the client accepts, or None"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5,
+                 metrics=METRICS):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level, self.brotli_quality = gzip_level, brotli_quality
+        self.metrics = metrics
+        # ETag -> bytes of the last 200 sent with it, to value a later 304
+        self.sizes = LRUCache(4096)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        encoding = accepted_encoding(request_headers.get("accept-encoding", ""))
+        state = {"start": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in message["headers"]}
+                tag = headers.get("etag")
+                if message["status"] == 304 and tag:
+                    self.metrics.inc("http_bytes_saved_total", self.sizes.get(tag, 0), reason="not_modified")
+                eligible = (encoding is not None and message["status"] == 200 and "content-encoding" not in headers
+                            and headers.get("content-type", "").split(";")[0].strip() in COMPRESSIBLE)
+                if not eligible:
+                    state["passthrough"] = True
+                    if tag and "content-length" in headers:
+                        self.sizes.put(tag, int(headers["content-length"]))
+                    await send(message)
+                    return
+                state["start"] = message
+                return
+            if state["passthrough"] or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            start, body = state["start"], message.get("body", b"")
+            if message.get("more_body", False):
+                # Streaming body: send it as it comes
+                state["passthrough"] = True
+                await send(start)
+                await send(message)
+                return
+            headers = [(key, value) for key, value in start["headers"] if key.lower() != b"content-length"]
+            tag = dict((key.lower(), value) for key, value in start["headers"]).get(b"etag")
+            if len(body) >= self.minimum_size:
+                compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                self.metrics.inc("http_compressed_total", encoding=encoding)
+                self.metrics.inc("http_bytes_saved_total", len(body) - len(compressed), reason="compression")
+                body = compressed
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+            if tag:
+                self.sizes.put(tag.decode("latin-1"), len(body))
+            await send({**start, "headers": headers + [(b"content-length", str(len(body)).encode())]})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
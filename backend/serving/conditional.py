@@ -0,0 +1,88 @@
+"""
+HTTP conditional requests
+
+Catalog-backed responses only change when the data does, so their
+validators come from the catalog: the ETag hashes the engine, catalog token
+(storage.catalog.catalog_token: the data version and build id, since a
+rebuilt database starts again at version 1), route and normalized query
+string, and Last-Modified is the catalog's
+updated_at. conditional() runs before the route does any work and answers a
+matching If-None-Match (or, without one, If-Modified-Since) with an empty
+304, so a revalidation costs the catalog lookup and nothing else.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from storage.catalog import catalog_token
+
+from .metrics import METRICS
+
+MAX_AGE = int(os.getenv("VELORA_HTTP_MAX_AGE", "60"))
+
+
+def etag(engine: str, info: Dict, route: str, request: Request) -> str:
+    query = sorted(request.query_params.multi_items())
+    key = (engine, catalog_token(info), route, query)
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+    return f'W/"{info["data_version"]}-{digest}"'
+
+
+def last_modified(updated_at: Optional[str]) -> Optional[datetime]:
+    """Catalog updated_at (ISO, UTC) -> whole-second datetime"""
+    if not updated_at:
+        return None
+    try:
+        return datetime.strptime(updated_at, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _matches(if_none_match: str, tag: str) -> bool:
+    # Weak comparison: W/"x" and "x" are the same validator
+    wanted = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in wanted or tag.removeprefix("W/") in wanted
+
+
+def _not_modified_since(if_modified_since: str, modified: Optional[datetime]) -> bool:
+    if modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and modified <= since
+
+
+def conditional(request: Request, route: str, engine: str, info: Optional[Dict],
+                metrics=METRICS) -> Tuple[Dict[str, str], Optional[Response]]:
+    """
+    (validator headers, 304 response or None). Without a catalog (legacy
+    database) there is no version to key on: no headers, never a 304.
+    """
+    if not info:
+        return {}, None
+    headers = {
+        "ETag": etag(engine, info, route, request),
+        "Cache-Control": f"public, max-age={MAX_AGE}, must-revalidate",
+    }
+    modified = last_modified(info.get("updated_at"))
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+
+    metrics.inc("http_conditional_total", route=route)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _matches(if_none_match, headers["ETag"])
+    else:
+        fresh = _not_modified_since(request.headers.get("if-modified-since", ""), modified)
+    if not fresh:
+        return headers, None
+    metrics.inc("http_not_modified_total", route=route)
+    return headers, Response(status_code=304, headers=headers)
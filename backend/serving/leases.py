@@ -0,0 +1,23 @@
+"""
+Snapshot leases per request
+
+ASGI middleware that leases the live database snapshot (storage.snapshots)
+for the whole request, streamed bodies included, so every query a request
+makes runs on one file even if a new snapshot is published meanwhile, and
+the old file is not collected while the request still reads it.
+"""
+
+from storage.snapshots import SNAPSHOTS
+
+
+class SnapshotLeaseMiddleware:
+    def __init__(self, app, store=SNAPSHOTS):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with self.store.lease():
+            await self.app(scope, receive, send)
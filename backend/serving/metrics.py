@@ -0,0 +1,41 @@
+"""
+In-process metrics
+
+Monotonic counters keyed by name and labels, readable as one snapshot for
+GET /metrics. Counters are per worker process.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    def __init__(self):
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def value(self, name: str, **labels) -> int:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def total(self, name: str) -> int:
+        """Sum over every label combination of one counter"""
+        with self._lock:
+            return sum(count for (counter, _), count in self._counters.items() if counter == name)
+
+    def snapshot(self) -> Dict[str, int]:
+        """{"name{label=value,...}": count} in name order"""
+        with self._lock:
+            items = sorted(self._counters.items())
+        return {
+            name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""): count
+            for (name, labels), count in items
+        }
+
+
+METRICS = Metrics()
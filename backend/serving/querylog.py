@@ -0,0 +1,37 @@
+"""
+Rolling query log
+
+Remembers the normalized specs of recent queries (the last `maxlen`, no
+older than `window` seconds) so the cache warmer can re-warm the most
+frequent ones.
+"""
+
+import json
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List
+
+
+class QueryLog:
+    def __init__(self, maxlen: int = 2000, window: float = 3600.0):
+        self.window = window
+        self._entries = deque(maxlen=maxlen)   # (timestamp, spec key)
+        self._lock = threading.Lock()
+
+    def record(self, spec: Dict):
+        key = json.dumps(spec, sort_keys=True, default=str)
+        with self._lock:
+            self._entries.append((time.monotonic(), key))
+
+    def top(self, n: int) -> List[Dict]:
+        """The n most frequent specs inside the window, most frequent first"""
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._entries and self._entries[0][0] < cutoff:
+                self._entries.popleft()
+            counts = Counter(key for _, key in self._entries)
+        return [json.loads(key) for key, _ in counts.most_common(n)]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,136 @@
+"""
+Per-conversation query state
+
+Chat users refine the question they just asked ("now just 2022-2024",
+"what about salinity?"). A session, keyed by the client's conversation id,
+remembers the last parsed query (follow-ups are resolved against it without
+an LLM call, see ai.query_parser) and the engine inputs of the broadest
+query answered so far: its monthly partial aggregates (both parameters),
+the raw rows along its box edges (for quantiles and anomalies) and its
+"latest" preview rows. A follow-up on the same area over a narrower or
+equal year range is assembled from them without querying the engine again,
+as long as the data version is unchanged. Its preview is the earlier
+preview's rows within the narrower years, so it may hold fewer rows than a
+fresh query's (none when the follow-up ends before the earlier newest rows).
+
+Polygon regions and approximate (sampled) figures are not derived: the
+former need row-level previews, the latter their confidence intervals.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from storage.aggregates import filter_years
+
+from .metrics import METRICS
+
+# Spec fields that must match for a session's aggregates to be reused
+AREA_FIELDS = ("region", "bbox", "geometry", "pressure_min", "pressure_max")
+
+
+def covers(base_start, base_end, start_year, end_year) -> bool:
+    """Whether the base year range (None: open-ended) contains the requested one"""
+    return ((not base_start or bool(start_year) and int(start_year) >= int(base_start))
+            and (not base_end or bool(end_year) and int(end_year) <= int(base_end)))
+
+
+def in_years(years, start_year, end_year):
+    """Mask of the years (an int array) within the requested range (None: open-ended)"""
+    return (years >= int(start_year or 0)) & (years <= int(end_year or 9999))
+
+
+def narrow_inputs(inputs: Dict, start_year, end_year) -> Dict:
+    """The engine inputs of a query (see main.compute_response) restricted to a narrower year range"""
+    narrowed = {"monthly": filter_years(inputs["monthly"], start_year, end_year)}
+    if "region_rows" in inputs:
+        inner, points = inputs["region_rows"]
+        keep = in_years(np.asarray(points["time"]).astype("U4").astype(np.int64), start_year, end_year)
+        narrowed["region_rows"] = inner, {name: values[keep] for name, values in points.items()}
+    if "latest_rows" in inputs:
+        rows = inputs["latest_rows"]
+        years = np.array([int(row["time"][:4]) for row in rows], dtype=np.int64)
+        narrowed["latest_rows"] = [row for row, inside in zip(rows, in_years(years, start_year, end_year)) if inside]
+    return narrowed
+
+
+class Session:
+    __slots__ = ("parsed", "spec", "version", "inputs", "touched")
+
+    def __init__(self):
+        self.parsed = None    # last parsed question
+        self.spec = None      # broadest query answered, with its data version and engine inputs
+        self.version = None
+        self.inputs = None
+        self.touched = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self, maxsize: int = 1000, ttl: float = 1800.0, metrics=METRICS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.metrics = metrics
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, conversation: str, create: bool = False) -> Optional[Session]:
+        """The live session of a conversation (caller holds the lock); expired ones are dropped"""
+        now = time.monotonic()
+        session = self._sessions.get(conversation)
+        if session is not None and now - session.touched > self.ttl:
+            del self._sessions[conversation]
+            session = None
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[conversation] = Session()
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+        session.touched = now
+        self._sessions.move_to_end(conversation)
+        return session
+
+    # ── Parsed questions ───────────────────────────────────────────────────────
+    def parsed(self, conversation: Optional[str]) -> Optional[Dict]:
+        if not conversation:
+            return None
+        with self._lock:
+            session = self._session(conversation)
+            return dict(session.parsed) if session and session.parsed else None
+
+    def remember_parsed(self, conversation: Optional[str], parsed: Dict):
+        if conversation:
+            with self._lock:
+                self._session(conversation, create=True).parsed = dict(parsed)
+
+    # ── Aggregates ─────────────────────────────────────────────────────────────
+    def narrowed(self, conversation: Optional[str], spec: Dict, version=None) -> Optional[Dict]:
+        """Engine inputs of spec derived from the session's, or None when they do not cover it"""
+        if not conversation or spec.get("approximate") or spec.get("geometry") is not None:
+            return None
+        with self._lock:
+            session = self._session(conversation)
+            if session is None or session.version != version:
+                return None
+            base, inputs = session.spec, session.inputs
+        if base is None or any(base.get(field) != spec.get(field) for field in AREA_FIELDS):
+            return None
+        if not covers(base["start_year"], base["end_year"], spec["start_year"], spec["end_year"]):
+            return None
+        self.metrics.inc("session_derived_total")
+        return narrow_inputs(inputs, spec["start_year"], spec["end_year"])
+
+    def remember_figures(self, conversation: Optional[str], spec: Dict, inputs: Dict, version=None):
+        """Keep the engine inputs of an answered query as the base for the conversation's follow-ups"""
+        if (not conversation or inputs.get("monthly") is None or spec.get("approximate")
+                or spec.get("geometry") is not None):
+            return
+        with self._lock:
+            session = self._session(conversation, create=True)
+            session.spec, session.version, session.inputs = dict(spec), version, dict(inputs)
+
+    def __len__(self):
+        return len(self._sessions)
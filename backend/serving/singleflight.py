@@ -0,0 +1,62 @@
+"""
+Request coalescing (single flight)
+
+When identical work is requested while the same work is already running,
+the later callers wait for the running call and share its result (or its
+exception) instead of repeating it. Nothing is kept once the call returns:
+this only merges concurrent duplicates, it is not a cache.
+
+Shared results are handed to every waiter as the same object, so callers
+must copy before modifying them.
+"""
+
+import threading
+from typing import Any, Callable, Hashable
+
+from .metrics import METRICS
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, kind: str, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn() unless an identical (kind, key) call is in flight; then wait for its result"""
+        with self._lock:
+            call = self._calls.get((kind, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(kind, key)] = _Call()
+        self.metrics.inc("singleflight_calls_total", kind=kind)
+
+        if not leader:
+            self.metrics.inc("singleflight_coalesced_total", kind=kind)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(kind, key)]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,89 @@
+"""
+Background cache warmer
+
+A daemon thread that fills the response cache before users ask: once at
+startup, again whenever the data version changes (a reload or ingest makes
+every cached figure stale), and every `refresh` seconds for the most
+frequent recent queries from the rolling log, which may have been evicted.
+
+Warming runs on a small pool of its own (`workers` threads) so live
+requests never queue behind it.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from .metrics import METRICS
+from .querylog import QueryLog
+
+
+class CacheWarmer:
+    def __init__(self, warm: Callable[[Dict], Any], version: Callable[[], Any],
+                 base_specs: Callable[[], List[Dict]], log: QueryLog,
+                 workers: int = 2, interval: float = 15.0, refresh: float = 300.0, top: int = 20,
+                 metrics=METRICS):
+        """
+        warm(spec) computes (and caches) one query; version() returns the
+        current data version; base_specs() lists the queries warmed on every
+        version change.
+        """
+        self.warm, self.version, self.base_specs, self.log = warm, version, base_specs, log
+        self.workers, self.interval, self.refresh, self.top = workers, interval, refresh, top
+        self.metrics = metrics
+        self.warmed_version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, specs: List[Dict]) -> int:
+        """Warm specs with bounded concurrency; returns how many succeeded"""
+        unique = list({repr(sorted(spec.items())): spec for spec in specs}.values())
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="velora-warm") as pool:
+            for future in [pool.submit(self.warm, spec) for spec in unique]:
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    self.metrics.inc("warm_errors_total")
+                    print(f"[Warmer] Query failed ({e})")
+        self.metrics.inc("warm_queries_total", done)
+        return done
+
+    def tick(self, refresh_due: bool = False) -> int:
+        """One scheduler step: full warm on a new data version, else the hot queries when due"""
+        version = self.version()
+        if version != self.warmed_version:
+            done = self.run_once(self.base_specs() + self.log.top(self.top))
+            self.warmed_version = version
+            self.metrics.inc("warm_runs_total", reason="version")
+            print(f"[Warmer] Warmed {done} queries for data version {version}")
+            return done
+        if refresh_due:
+            self.metrics.inc("warm_runs_total", reason="refresh")
+            return self.run_once(self.log.top(self.top))
+        return 0
+
+    def _loop(self):
+        since_refresh = 0.0
+        while not self._stop.is_set():
+            try:
+                refresh_due = since_refresh >= self.refresh
+                self.tick(refresh_due)
+                if refresh_due:
+                    since_refresh = 0.0
+            except Exception as e:
+                print(f"[Warmer] Skipped ({e})")
+            self._stop.wait(self.interval)
+            since_refresh += self.interval
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="velora-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,10 @@
+"""
+Storage Module — database helpers shared by the API and maintenance scripts
+"""
+
+from .regions import REGION_BOUNDS
+from .catalog import refresh_catalog, read_catalog, load_catalog, verify_catalog
+from .engines import get_engine
+
+__all__ = ['REGION_BOUNDS', 'refresh_catalog', 'read_catalog', 'load_catalog', 'verify_catalog',
+           'get_engine']
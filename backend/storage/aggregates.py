@@ -0,0 +1,214 @@
+"""
+Mergeable aggregates
+
+Every query engine answers build_response with the same shape: one row per
+(year, month) holding a partial aggregate per parameter. A partial keeps
+count, sum, min/max and m2, the sum of squared deviations from its own mean;
+partials merge with the pairwise (Chan et al.) update, so shards, workers and
+cached results can be combined without touching raw rows again and without
+the cancellation of E[x^2] - E[x]^2 (salinity sits around 35 with a spread
+of a few tenths). Stats, yearly means and monthly/quarterly/yearly series
+are all derived from these rows.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+PARAMETERS = ("temperature", "salinity")
+
+# Typical values SQL squares are taken around (see shifted_m2)
+MOMENT_SHIFT = {"temperature": 15.0, "salinity": 35.0}
+
+
+# ── Partials ───────────────────────────────────────────────────────────────────
+def empty_partial() -> Dict:
+    return {"count": 0, "sum": 0.0, "m2": 0.0, "min": None, "max": None}
+
+
+def make_partial(count, total, m2, min_val, max_val) -> Dict:
+    """Build a partial from raw SQL/NumPy aggregates (None-safe)"""
+    count = int(count or 0)
+    if count == 0:
+        return empty_partial()
+    return {
+        "count": count,
+        "sum": float(total),
+        "m2": max(float(m2), 0.0),
+        "min": float(min_val),
+        "max": float(max_val),
+    }
+
+
+def shifted_m2(count, total, shifted_sumsq, shift: float) -> float:
+    """
+    m2 from SUM((x - shift)^2): squares taken around a typical value keep
+    the subtraction small, which is as close to Welford as one SQL pass gets
+    """
+    if not count:
+        return 0.0
+    offset = total - count * shift
+    return shifted_sumsq - offset * offset / count
+
+
+def merge_partial(into: Dict, other: Dict) -> Dict:
+    """Merge `other` into `into` in place and return it"""
+    if other["count"] == 0:
+        return into
+    if into["count"] == 0:
+        into.update(other)
+        return into
+    count = into["count"] + other["count"]
+    delta = other["sum"] / other["count"] - into["sum"] / into["count"]
+    into["m2"] += other["m2"] + delta * delta * into["count"] * other["count"] / count
+    into["count"] = count
+    into["sum"] += other["sum"]
+    into["min"] = min(into["min"], other["min"])
+    into["max"] = max(into["max"], other["max"])
+    return into
+
+
+def reduce_partials(keys, counts, sums, m2s, mins, maxs):
+    """
+    Vectorized merge_partial: combine the partials sharing a key. A raw
+    reading is the partial (1, x, 0, x, x) and a missing one (0, 0, 0, inf,
+    -inf), so the same call folds rows and stored partials alike. Returns
+    (unique keys, counts, sums, m2s, mins, maxs) sorted by key.
+    """
+    unique, index = np.unique(np.asarray(keys, dtype=np.int64), return_inverse=True)
+    counts, sums, m2s = (np.asarray(v, dtype=np.float64) for v in (counts, sums, m2s))
+    total_counts = np.bincount(index, weights=counts, minlength=len(unique))
+    total_sums = np.bincount(index, weights=sums, minlength=len(unique))
+    # Spread of the group means around the merged mean (Chan et al.)
+    means = sums / np.maximum(counts, 1)
+    offsets = means - (total_sums / np.maximum(total_counts, 1))[index]
+    total_m2s = np.bincount(index, weights=m2s + counts * offsets * offsets, minlength=len(unique))
+    lows = np.full(len(unique), np.inf)
+    highs = np.full(len(unique), -np.inf)
+    np.minimum.at(lows, index, np.asarray(mins, dtype=np.float64))
+    np.maximum.at(highs, index, np.asarray(maxs, dtype=np.float64))
+    return unique, total_counts, total_sums, total_m2s, lows, highs
+
+
+def finalize(partial: Dict) -> Dict:
+    """Turn a partial into {count, min, max, mean, std}"""
+    count = partial["count"]
+    if count == 0:
+        return {"count": 0, "min": 0.0, "max": 0.0, "mean": 0.0, "std": 0.0}
+    mean = partial["sum"] / count
+    variance = partial["m2"] / count
+    return {
+        "count": count,
+        "min": partial["min"],
+        "max": partial["max"],
+        "mean": mean,
+        "std": float(np.sqrt(max(variance, 0.0))),
+    }
+
+
+# ── Monthly rows ───────────────────────────────────────────────────────────────
+def monthly_row(year: int, month: int, partials: Optional[Dict] = None) -> Dict:
+    row = {"year": int(year), "month": int(month)}
+    for parameter in PARAMETERS:
+        row[parameter] = (partials or {}).get(parameter) or empty_partial()
+    return row
+
+
+def merge_monthly(groups: Iterable[List[Dict]]) -> List[Dict]:
+    """Merge several lists of monthly rows (e.g. one per shard) into one sorted list"""
+    merged = {}
+    for rows in groups:
+        for row in rows:
+            key = (row["year"], row["month"])
+            if key not in merged:
+                merged[key] = monthly_row(*key)
+            for parameter in PARAMETERS:
+                merge_partial(merged[key][parameter], row[parameter])
+    return [merged[key] for key in sorted(merged)]
+
+
+def monthly_from_points(year_months: np.ndarray, values: Dict[str, np.ndarray]) -> List[Dict]:
+    """
+    Monthly rows from raw points: year_months is YYYYMM per point and values
+    maps each parameter to a float array with NaN for missing readings.
+    """
+    keys, index = np.unique(np.asarray(year_months, dtype=np.int64), return_inverse=True)
+    reductions = {}
+    for parameter in PARAMETERS:
+        column = np.asarray(values[parameter], dtype=np.float64)
+        valid = ~np.isnan(column)
+        filled = np.where(valid, column, 0.0)
+        lows = np.full(len(keys), np.inf)
+        highs = np.full(len(keys), -np.inf)
+        np.minimum.at(lows, index[valid], column[valid])
+        np.maximum.at(highs, index[valid], column[valid])
+        counts = np.bincount(index, weights=valid, minlength=len(keys))
+        sums = np.bincount(index, weights=filled, minlength=len(keys))
+        # Two passes: deviations from each month's own mean
+        means = sums / np.maximum(counts, 1)
+        deviations = np.where(valid, column - means[index], 0.0)
+        reductions[parameter] = (
+            counts,
+            sums,
+            np.bincount(index, weights=deviations * deviations, minlength=len(keys)),
+            lows,
+            highs,
+        )
+
+    monthly = []
+    for i, key in enumerate(keys):
+        partials = {
+            parameter: make_partial(*(series[i] for series in reductions[parameter]))
+            for parameter in PARAMETERS
+        }
+        monthly.append(monthly_row(key // 100, key % 100, partials))
+    return monthly
+
+
+def filter_years(monthly: List[Dict], start_year=None, end_year=None) -> List[Dict]:
+    return [
+        row for row in monthly
+        if (not start_year or row["year"] >= int(start_year))
+        and (not end_year or row["year"] <= int(end_year))
+    ]
+
+
+def summarize(monthly: List[Dict], parameter: str) -> Dict:
+    """Overall stats for one parameter"""
+    total = empty_partial()
+    for row in monthly:
+        merge_partial(total, row[parameter])
+    return finalize(total)
+
+
+def group_means(monthly: List[Dict], parameter: str, granularity: str) -> List[Dict]:
+    """
+    Mean value per period. granularity is "month", "quarter" or "year".
+    Periods with no observations of `parameter` are omitted.
+    """
+    groups = {}
+    for row in monthly:
+        partial = row[parameter]
+        if partial["count"] == 0:
+            continue
+        if granularity == "month":
+            key = (row["year"], row["month"])
+        elif granularity == "quarter":
+            key = (row["year"], (row["month"] - 1) // 3 + 1)
+        else:
+            key = (row["year"],)
+        count, total = groups.get(key, (0, 0.0))
+        groups[key] = (count + partial["count"], total + partial["sum"])
+
+    return [
+        {"key": key, "count": count, "mean": total / count}
+        for key, (count, total) in sorted(groups.items())
+    ]
+
+
+def yearly_means(monthly: List[Dict], parameter: str):
+    """(years, values) NumPy arrays of yearly means for trend fitting"""
+    groups = group_means(monthly, parameter, "year")
+    years = np.array([group["key"][0] for group in groups], dtype=float)
+    values = np.array([group["mean"] for group in groups], dtype=float)
+    return years, values
@@ -0,0 +1,302 @@
+"""
+Metadata catalog for argo_data
+
+Keeps total rows, per-region and per-year counts, time range, data version,
+build id and last ingest time in two small tables so the API never has to scan argo_data
+to answer /health or /year-range. The ingest, dedup and optimize scripts keep
+the catalog up to date; verify_catalog() checks it against the raw table.
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .regions import REGION_BOUNDS
+
+CATALOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS argo_catalog (
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS argo_catalog_counts (
+        dimension TEXT NOT NULL,
+        key       TEXT NOT NULL,
+        count     INTEGER NOT NULL,
+        PRIMARY KEY (dimension, key)
+    );
+"""
+
+
+def ensure_catalog(conn: sqlite3.Connection):
+    """Create the catalog tables if they do not exist yet"""
+    conn.executescript(CATALOG_SCHEMA)
+
+
+# ── Summaries ──────────────────────────────────────────────────────────────────
+def empty_summary() -> Dict:
+    return {
+        "total_rows": 0,
+        "min_time": None,
+        "max_time": None,
+        "years": {},
+        "regions": {name: 0 for name in REGION_BOUNDS},
+    }
+
+
+def accumulate_chunk(summary: Dict, times, latitudes, longitudes) -> Dict:
+    """
+    Fold one ingest chunk into a running summary.
+    Lets the loader maintain the catalog without a second pass over argo_data.
+    """
+    times = np.asarray(times, dtype=str)
+    if len(times) == 0:
+        return summary
+    lats = np.asarray(latitudes, dtype=float)
+    lons = np.asarray(longitudes, dtype=float)
+
+    summary["total_rows"] += len(times)
+
+    ordered = np.sort(times)
+    chunk_min, chunk_max = ordered[0], ordered[-1]
+    if summary["min_time"] is None or chunk_min < summary["min_time"]:
+        summary["min_time"] = str(chunk_min)
+    if summary["max_time"] is None or chunk_max > summary["max_time"]:
+        summary["max_time"] = str(chunk_max)
+
+    years, counts = np.unique(times.astype("U4"), return_counts=True)
+    for year, count in zip(years, counts):
+        summary["years"][str(year)] = summary["years"].get(str(year), 0) + int(count)
+
+    for name, (lon_min, lon_max, lat_min, lat_max) in REGION_BOUNDS.items():
+        mask = (lons >= lon_min) & (lons <= lon_max) & (lats >= lat_min) & (lats <= lat_max)
+        summary["regions"][name] = summary["regions"].get(name, 0) + int(mask.sum())
+
+    return summary
+
+
+def summary_from_catalog(catalog: Dict) -> Dict:
+    """Convert a read_catalog() result back into a summary"""
+    return {
+        "total_rows": catalog["total_rows"],
+        "min_time": catalog["min_time"],
+        "max_time": catalog["max_time"],
+        "years": {str(year): count for year, count in catalog["years"].items()},
+        "regions": dict(catalog["regions"]),
+    }
+
+
+def merge_summaries(summaries: List[Dict]) -> Dict:
+    """Combine summaries of disjoint row sets (e.g. one per shard)"""
+    merged = empty_summary()
+    for summary in summaries:
+        merged["total_rows"] += summary["total_rows"]
+        for field, pick in (("min_time", min), ("max_time", max)):
+            if summary[field] is not None:
+                current = merged[field]
+                merged[field] = summary[field] if current is None else pick(current, summary[field])
+        for year, count in summary["years"].items():
+            merged["years"][year] = merged["years"].get(year, 0) + count
+        for name, count in summary["regions"].items():
+            merged["regions"][name] = merged["regions"].get(name, 0) + count
+    return merged
+
+
+def scan_summary(conn: sqlite3.Connection) -> Dict:
+    """Compute the catalog summary from argo_data (one pass per query below)"""
+    cur = conn.cursor()
+    summary = empty_summary()
+
+    cur.execute("SELECT COUNT(*), MIN(time), MAX(time) FROM argo_data")
+    total, min_time, max_time = cur.fetchone()
+    summary["total_rows"] = int(total or 0)
+    summary["min_time"] = min_time
+    summary["max_time"] = max_time
+
+    cur.execute("""
+        SELECT substr(time, 1, 4) AS year, COUNT(*)
+        FROM argo_data
+        GROUP BY substr(time, 1, 4)
+    """)
+    summary["years"] = {str(year): int(count) for year, count in cur.fetchall()}
+
+    region_sums = []
+    params = []
+    for lon_min, lon_max, lat_min, lat_max in REGION_BOUNDS.values():
+        region_sums.append(
+            "SUM(CASE WHEN longitude >= ? AND longitude <= ? "
+            "AND latitude >= ? AND latitude <= ? THEN 1 ELSE 0 END)"
+        )
+        params.extend([lon_min, lon_max, lat_min, lat_max])
+    cur.execute(f"SELECT {', '.join(region_sums)} FROM argo_data", params)
+    row = cur.fetchone()
+    summary["regions"] = {name: int(value or 0) for name, value in zip(REGION_BOUNDS, row)}
+
+    return summary
+
+
+# ── Read / write ───────────────────────────────────────────────────────────────
+def write_catalog(conn: sqlite3.Connection, summary: Dict, source: str,
+                  bump_version: bool = True, ingested: bool = False):
+    """
+    Replace the catalog contents with `summary`.
+    bump_version increments data_version (use it whenever rows changed);
+    ingested stamps last_ingest with the current UTC time.
+
+    data_version restarts at 1 in a database file built from scratch (a
+    reload, a compact migration), so build_id, new whenever the version is
+    set, tells builds apart; key caches on catalog_token(), not the version.
+    """
+    ensure_catalog(conn)
+    previous = _read_values(conn)
+    version = int(previous.get("data_version") or 0)
+    build_id = previous.get("build_id")
+    if bump_version or version == 0:
+        version += 1
+        build_id = None
+    build_id = build_id or uuid.uuid4().hex[:16]
+
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    values = {
+        "total_rows": str(summary["total_rows"]),
+        "min_time": summary["min_time"],
+        "max_time": summary["max_time"],
+        "data_version": str(version),
+        "build_id": build_id,
+        "last_ingest": now if ingested else previous.get("last_ingest"),
+        "updated_at": now,
+        "updated_by": source,
+    }
+
+    cur = conn.cursor()
+    cur.execute("DELETE FROM argo_catalog")
+    cur.executemany("INSERT INTO argo_catalog (key, value) VALUES (?, ?)", values.items())
+    cur.execute("DELETE FROM argo_catalog_counts")
+    cur.executemany(
+        "INSERT INTO argo_catalog_counts (dimension, key, count) VALUES (?, ?, ?)",
+        [("year", year, count) for year, count in sorted(summary["years"].items())]
+        + [("region", name, count) for name, count in summary["regions"].items()],
+    )
+    conn.commit()
+    return version
+
+
+def refresh_catalog(conn: sqlite3.Connection, source: str, bump_version: bool = True) -> int:
+    """Rebuild the catalog from a scan of argo_data. Returns the new data version."""
+    return write_catalog(conn, scan_summary(conn), source, bump_version=bump_version)
+
+
+def _read_values(conn: sqlite3.Connection) -> Dict:
+    try:
+        rows = conn.execute("SELECT key, value FROM argo_catalog").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {row[0]: row[1] for row in rows}
+
+
+def read_catalog(conn: sqlite3.Connection) -> Optional[Dict]:
+    """Return the catalog as a dict, or None if this database has no catalog"""
+    values = _read_values(conn)
+    if not values:
+        return None
+
+    counts = conn.execute("SELECT dimension, key, count FROM argo_catalog_counts").fetchall()
+    min_time, max_time = values.get("min_time"), values.get("max_time")
+    return {
+        "total_rows": int(values.get("total_rows") or 0),
+        "min_time": min_time,
+        "max_time": max_time,
+        "start_year": int(min_time[:4]) if min_time else None,
+        "end_year": int(max_time[:4]) if max_time else None,
+        "data_version": int(values.get("data_version") or 0),
+        "build_id": values.get("build_id"),
+        "last_ingest": values.get("last_ingest"),
+        "updated_at": values.get("updated_at"),
+        "years": {int(row[1]): row[2] for row in counts if row[0] == "year" and row[1].isdigit()},
+        "regions": {row[1]: row[2] for row in counts if row[0] == "region"},
+    }
+
+
+def catalog_token(catalog: Optional[Dict]) -> Optional[str]:
+    """
+    Identifies the data a catalog describes: changes with every build or
+    version bump, even when a rebuilt file starts again at data_version 1.
+    Catalogs written before build ids fall back to their updated_at stamp.
+    """
+    if not catalog:
+        return None
+    return f"{catalog['data_version']}:{catalog.get('build_id') or catalog.get('updated_at') or ''}"
+
+
+# ── Cached reads for the API ───────────────────────────────────────────────────
+_cache_lock = threading.Lock()
+_cache: Dict = {"key": None, "catalog": None}
+
+
+def _file_signature(db_path: str):
+    sig = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def load_catalog(db_path: str) -> Optional[Dict]:
+    """
+    Catalog for the database at db_path, cached in-process.
+    The cache is keyed on the file's mtime/size so a reload or dedup run is
+    picked up on the next call without re-reading on every request.
+    """
+    key = (db_path, _file_signature(db_path))
+    with _cache_lock:
+        if _cache["key"] == key:
+            return _cache["catalog"]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        catalog = read_catalog(conn)
+    finally:
+        conn.close()
+
+    with _cache_lock:
+        _cache["key"] = key
+        _cache["catalog"] = catalog
+    return catalog
+
+
+# ── Consistency check ──────────────────────────────────────────────────────────
+def verify_catalog(conn: sqlite3.Connection) -> List[str]:
+    """
+    Compare the stored catalog with a fresh scan of argo_data.
+    Returns a list of human-readable mismatches (empty when consistent).
+    """
+    catalog = read_catalog(conn)
+    if catalog is None:
+        return ["catalog tables are missing"]
+
+    actual = scan_summary(conn)
+    problems = []
+
+    for field in ("total_rows", "min_time", "max_time"):
+        if catalog[field] != actual[field]:
+            problems.append(f"{field}: catalog={catalog[field]} actual={actual[field]}")
+
+    stored_years = {str(year): count for year, count in catalog["years"].items()}
+    for year in sorted(set(stored_years) | set(actual["years"])):
+        stored, real = stored_years.get(year, 0), actual["years"].get(year, 0)
+        if stored != real:
+            problems.append(f"year {year}: catalog={stored} actual={real}")
+
+    for name in REGION_BOUNDS:
+        stored, real = catalog["regions"].get(name, 0), actual["regions"].get(name, 0)
+        if stored != real:
+            problems.append(f"region {name}: catalog={stored} actual={real}")
+
+    return problems
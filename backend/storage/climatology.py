@@ -0,0 +1,265 @@
+"""
+Climatology baseline
+
+The "normal" of every SKETCH_DEG grid cell and calendar month: count, mean
+and m2 of the readings over a baseline period, as a derived table built at
+ingest. The period is VELORA_CLIMATOLOGY_YEARS ("1991-2020"; every year
+when unset) at build time and is recorded next to the table.
+
+A region's anomaly is taken cell by cell: each cell's monthly mean over the
+region's exact footprint (whole cells from the cube, edge rows from the
+engine) minus that cell's normal for the calendar month, weighted by its
+readings into one figure per month. Comparing a cell only with itself keeps
+a period sampled mostly in summer, or mostly in the warmer part of the
+region, from being mistaken for a warm one. The table is small and read
+once per snapshot.
+
+The spread of single readings (all depths mixed) is several degrees, so a
+region-wide mean is flagged by its anomaly in physical units
+(ANOMALY_THRESHOLDS); the standardized anomaly is reported alongside.
+
+The table is not keyed by year, so shards cannot be concatenated: copy()
+merges the partials of the source databases instead.
+"""
+
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .aggregates import PARAMETERS, reduce_partials
+from .cache import LRUCache
+from .cube import MONTH_BITS, cell_monthly
+from .engines import year_months
+from .sketches import sketch_cells
+
+CELL_BITS = 7
+# Mean anomaly (degC, PSU) at which a region counts as anomalous
+ANOMALY_THRESHOLDS = {
+    "temperature": float(os.getenv("VELORA_ANOMALY_TEMP", "0.15")),
+    "salinity": float(os.getenv("VELORA_ANOMALY_SAL", "0.05")),
+}
+
+CLIMATOLOGY_SCHEMA = """
+    CREATE TABLE argo_climatology (
+        cy         INTEGER NOT NULL,
+        cx         INTEGER NOT NULL,
+        month      INTEGER NOT NULL,
+        temp_count INTEGER NOT NULL,
+        temp_mean  REAL NOT NULL,
+        temp_m2    REAL NOT NULL,
+        sal_count  INTEGER NOT NULL,
+        sal_mean   REAL NOT NULL,
+        sal_m2     REAL NOT NULL,
+        PRIMARY KEY (cy, cx, month)
+    ) WITHOUT ROWID;
+    CREATE TABLE argo_climatology_baseline (
+        start_year INTEGER,
+        end_year   INTEGER
+    )
+"""
+
+
+def baseline_years() -> Tuple[Optional[int], Optional[int]]:
+    """The configured baseline period; (None, None) for every year"""
+    value = os.getenv("VELORA_CLIMATOLOGY_YEARS", "").strip()
+    if not value:
+        return None, None
+    start, _, end = value.partition("-")
+    return int(start), int(end or start)
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class ClimatologyBuilder:
+    """Derived-table builder (see storage.derived) for per-cell, per-calendar-month normals"""
+
+    name = "climatology"
+    tables = ("argo_climatology", "argo_climatology_baseline")
+    schema = CLIMATOLOGY_SCHEMA
+
+    def __init__(self, start_year: int = None, end_year: int = None):
+        if start_year is None and end_year is None:
+            start_year, end_year = baseline_years()
+        self.start_year, self.end_year = start_year, end_year
+        self.seen = (None, None)   # first and last year actually folded in
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.partials = {parameter: (np.zeros(0),) * 3 for parameter in PARAMETERS}
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        times = np.asarray(chunk["time"], dtype=str)
+        if len(times) == 0:
+            return
+        year_month = year_months(times)
+        years = year_month // 100
+        keep = np.ones(len(years), dtype=bool)
+        if self.start_year:
+            keep &= years >= self.start_year
+        if self.end_year:
+            keep &= years <= self.end_year
+        if not keep.any():
+            return
+        self._seen(int(years[keep].min()), int(years[keep].max()))
+        cx, cy = sketch_cells(np.asarray(chunk["longitude"])[keep], np.asarray(chunk["latitude"])[keep])
+        keys = ((cy << CELL_BITS) | cx) * 12 + year_month[keep] % 100 - 1
+        part = {}
+        for parameter in PARAMETERS:
+            values = np.asarray(chunk[parameter], dtype=np.float64)[keep]
+            valid = ~np.isnan(values)
+            part[parameter] = (valid.astype(np.float64), np.where(valid, values, 0.0), np.zeros(len(values)))
+        self.add_partials(keys, part)
+
+    def _seen(self, first: int, last: int):
+        low, high = self.seen
+        self.seen = (first if low is None else min(low, first), last if high is None else max(high, last))
+
+    def add_partials(self, keys: np.ndarray, partials: Dict):
+        """Fold (count, sum, m2) partials per key into the state (keys may repeat)"""
+        keys = np.concatenate([self.keys, keys])
+        reduced = {}
+        for parameter in PARAMETERS:
+            columns = [np.concatenate([old, new]) for old, new in zip(self.partials[parameter], partials[parameter])]
+            unused = np.zeros(len(keys))
+            self.keys, *reduced[parameter] = reduce_partials(keys, *columns, unused, unused)
+            reduced[parameter] = tuple(reduced[parameter][:3])
+        self.partials = reduced
+
+    def write(self, conn: sqlite3.Connection):
+        rows = []
+        temp, sal = self.partials["temperature"], self.partials["salinity"]
+        for i, key in enumerate(self.keys.tolist()):
+            cell, month = divmod(key, 12)
+            row = [cell >> CELL_BITS, cell & ((1 << CELL_BITS) - 1), month + 1]
+            for count, total, m2 in (temp, sal):
+                n = float(count[i])
+                row += [int(n), float(total[i]) / n if n else 0.0, float(m2[i])]
+            rows.append(tuple(row))
+        conn.executemany("INSERT INTO argo_climatology VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT INTO argo_climatology_baseline VALUES (?, ?)", self.seen)
+
+    def copy(self, target: sqlite3.Connection, source_paths: List[str]) -> bool:
+        """Merge the normals of source_paths (e.g. yearly shards) into the target's tables"""
+        from .derived import write_derived
+        for path in source_paths:
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                rows = source.execute("SELECT * FROM argo_climatology").fetchall()
+                first, last = source.execute("SELECT start_year, end_year FROM argo_climatology_baseline").fetchone()
+            finally:
+                source.close()
+            if first is not None:
+                self._seen(first, last)
+            if not rows:
+                continue
+            table = np.array(rows, dtype=np.float64)
+            keys = ((table[:, 0].astype(np.int64) << CELL_BITS) | table[:, 1].astype(np.int64)) * 12 \
+                + table[:, 2].astype(np.int64) - 1
+            self.add_partials(keys, {
+                parameter: (table[:, column], table[:, column] * table[:, column + 1], table[:, column + 2])
+                for parameter, column in (("temperature", 3), ("salinity", 6))
+            })
+        write_derived(target, [self])
+        return True
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+_normals = LRUCache(16)
+
+
+def load_normals(db_path: str) -> Optional[Dict]:
+    """
+    The whole table as {"start_year", "end_year", "keys", parameter: (count,
+    mean, std)} arrays sorted by key, or None when it has not been built (or
+    the baseline period had no readings).
+    """
+    # Keyed by the file's mtime as well, for databases rebuilt in place
+    try:
+        key = (db_path, os.path.getmtime(db_path))
+    except OSError:
+        return None
+    cached = _normals.get(key)
+    if cached is not None:
+        return cached
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        period = conn.execute("SELECT start_year, end_year FROM argo_climatology_baseline").fetchone()
+        rows = conn.execute("""
+            SELECT cy, cx, month, temp_count, temp_mean, temp_m2, sal_count, sal_mean, sal_m2
+            FROM argo_climatology ORDER BY cy, cx, month
+        """).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    if not rows:
+        return None
+
+    table = np.array(rows, dtype=np.float64).reshape(-1, 9)
+    cells = (table[:, 0].astype(np.int64) << CELL_BITS) | table[:, 1].astype(np.int64)
+    normals = {
+        "start_year": period[0] if period else None,
+        "end_year": period[1] if period else None,
+        "keys": cells * 12 + table[:, 2].astype(np.int64) - 1,
+    }
+    for parameter, column in (("temperature", 3), ("salinity", 6)):
+        counts, means, m2s = table[:, column], table[:, column + 1], table[:, column + 2]
+        normals[parameter] = (counts, means, np.sqrt(np.maximum(m2s / np.maximum(counts, 1), 0.0)))
+    return _normals.put(key, normals)
+
+
+def region_anomalies(engine, area, start_year=None, end_year=None, area_points=None) -> Optional[Dict]:
+    """
+    {"start_year", "end_year", parameter: [month, ...]} for a region: every
+    cell's monthly mean (storage.cube.cell_monthly, over the region's exact
+    footprint) minus that cell's normal for the calendar month, weighted by
+    its readings into one figure per month. None when the climatology or the
+    cube has not been built. area_points as for storage.cube.cube_monthly().
+    """
+    normals = load_normals(engine.catalog_path)
+    if normals is None:
+        return None
+    cells = cell_monthly(engine, area, start_year, end_year, area_points)
+    if cells is None:
+        return None
+    keys, partials = cells
+    months = keys & ((1 << MONTH_BITS) - 1)
+    normal_keys = (keys >> MONTH_BITS) * 12 + months % 12
+    index = np.minimum(np.searchsorted(normals["keys"], normal_keys), len(normals["keys"]) - 1)
+    found = normals["keys"][index] == normal_keys
+
+    result = {"start_year": normals["start_year"], "end_year": normals["end_year"]}
+    for parameter in PARAMETERS:
+        count, total = partials[parameter]
+        normal_count, normal_mean, normal_std = (column[index] for column in normals[parameter])
+        # Cell-months without readings or without a normal are left out
+        keep = found & (count > 0) & (normal_count > 0)
+        n, mean, std = count[keep], normal_mean[keep], normal_std[keep]
+        sigma = (total[keep] / n - mean) / np.where(std > 0, std, np.inf)
+        unique, group = np.unique(months[keep], return_inverse=True)
+        weights = np.bincount(group, weights=n, minlength=len(unique))
+        values = np.bincount(group, weights=total[keep], minlength=len(unique)) / weights
+        normal = np.bincount(group, weights=n * mean, minlength=len(unique)) / weights
+        sigmas = np.bincount(group, weights=n * sigma, minlength=len(unique)) / weights
+        result[parameter] = [
+            {"year": month // 12, "month": month % 12 + 1, "count": int(weight), "value": value,
+             "normal": expected, "anomaly": value - expected, "sigma": z}
+            for month, weight, value, expected, z in zip(
+                unique.tolist(), weights.tolist(), values.tolist(), normal.tolist(), sigmas.tolist())
+        ]
+    return result
+
+
+def summarize_anomalies(series: List[Dict]) -> Optional[Dict]:
+    """Reading-weighted mean anomaly and standardized anomaly of a series; None when empty"""
+    weights = np.array([month["count"] for month in series], dtype=np.float64)
+    if not weights.sum():
+        return None
+    return {
+        "anomaly": float(np.average([month["anomaly"] for month in series], weights=weights)),
+        "sigma": float(np.average([month["sigma"] for month in series], weights=weights)),
+        "months": len(series),
+    }
+
+
+def departs_from_normal(summary: Optional[Dict], parameter: str) -> bool:
+    return summary is not None and abs(summary["anomaly"]) >= ANOMALY_THRESHOLDS[parameter]
@@ -0,0 +1,309 @@
+"""
+In-memory columnar store (NumPy)
+
+argo_data is held as compact column arrays sorted by time:
+  time         int32   seconds since 1970-01-01 (UTC)
+  month        int16   months since 1970-01 (group key for reductions)
+  lat / lon    int32   degrees * 1e5 (fixed point)
+  temperature, salinity, pressure   float32 (NaN = missing)
+The arrays are either memory-mapped from .npy files written at ingest
+(`python load_argo_db.py --columnar`) or, when no store exists or it was
+built from other data than the catalog now describes (meta.json records the
+catalog_token, which changes with every load), read from argo.db on first
+use. A year range becomes a binary search on `time`, the region a vectorized
+mask, and the per-month partials np.*.reduceat calls over contiguous month
+runs.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import numpy as np
+
+from .aggregates import PARAMETERS, make_partial, monthly_row
+from .catalog import catalog_token, load_catalog, read_catalog
+from .db import DATA_DIR, DB_PATH
+from .engines import QueryEngine, keyset_pages
+
+COLUMNAR_DIR = os.path.join(DATA_DIR, "columnar")
+COORD_SCALE = 100000
+COLUMNS = {
+    "time": np.int32,
+    "month": np.int16,
+    "lat": np.int32,
+    "lon": np.int32,
+    "temperature": np.float32,
+    "salinity": np.float32,
+    "pressure": np.float32,
+}
+PREVIEW_BLOCK = 65536
+
+
+# ── Conversion ─────────────────────────────────────────────────────────────────
+def parse_times(times):
+    """ISO time strings -> (epoch seconds, months since 1970-01) as int64 arrays"""
+    # Strings look like 2021-03-04T05:06:07Z; drop the zone suffix before parsing
+    stamps = np.array([t[:19] for t in times], dtype="datetime64[s]")
+    return stamps.astype(np.int64), stamps.astype("datetime64[M]").astype(np.int64)
+
+
+def encode_rows(rows) -> Dict[str, np.ndarray]:
+    """Convert (time, latitude, longitude, pressure, temperature, salinity) rows to columns"""
+    if not rows:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    times, lats, lons, pres, temps, sals = zip(*rows)
+    epochs, months = parse_times(times)
+
+    def floats(values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+
+    return {
+        "time": epochs.astype(np.int32),
+        "month": months.astype(np.int16),
+        "lat": np.round(np.array(lats, dtype=np.float64) * COORD_SCALE).astype(np.int32),
+        "lon": np.round(np.array(lons, dtype=np.float64) * COORD_SCALE).astype(np.int32),
+        "temperature": floats(temps),
+        "salinity": floats(sals),
+        "pressure": floats(pres),
+    }
+
+
+def _iter_sorted_rows(db_path: str, chunk_rows: int):
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.execute("""
+            SELECT time, latitude, longitude, pressure, temperature, salinity
+            FROM argo_data
+            ORDER BY time ASC
+        """)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield encode_rows(rows)
+    finally:
+        conn.close()
+
+
+def load_from_sqlite(db_path: str = DB_PATH, chunk_rows: int = 200000) -> Dict[str, np.ndarray]:
+    """Read argo_data into sorted in-memory column arrays"""
+    parts = list(_iter_sorted_rows(db_path, chunk_rows))
+    if not parts:
+        return encode_rows([])
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+def build_columnar_store(db_path: str = DB_PATH, out_dir: str = COLUMNAR_DIR,
+                         chunk_rows: int = 200000) -> int:
+    """
+    Write argo_data as memory-mappable .npy column files (streamed, constant memory).
+    Returns the number of rows written.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM argo_data").fetchone()[0]
+        catalog = read_catalog(conn)
+    finally:
+        conn.close()
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(out_dir, f"{name}.npy.tmp"), mode="w+", dtype=dtype, shape=(total,)
+        )
+        for name, dtype in COLUMNS.items()
+    }
+
+    offset = 0
+    for part in _iter_sorted_rows(db_path, chunk_rows):
+        n = len(part["time"])
+        for name in COLUMNS:
+            arrays[name][offset:offset + n] = part[name]
+        offset += n
+
+    for name, array in arrays.items():
+        array.flush()
+        del array
+    arrays.clear()
+    for name in COLUMNS:
+        os.replace(os.path.join(out_dir, f"{name}.npy.tmp"), os.path.join(out_dir, f"{name}.npy"))
+
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({
+            "rows": offset,
+            "coord_scale": COORD_SCALE,
+            "data_version": catalog["data_version"] if catalog else None,
+            "catalog_token": catalog_token(catalog),
+            "built_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }, f, indent=2)
+    return offset
+
+
+def load_store(store_dir: str = COLUMNAR_DIR, mmap: bool = True) -> Dict[str, np.ndarray]:
+    mode = "r" if mmap else None
+    return {name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode=mode) for name in COLUMNS}
+
+
+def store_exists(store_dir: str = COLUMNAR_DIR) -> bool:
+    return os.path.exists(os.path.join(store_dir, "meta.json"))
+
+
+def store_is_current(store_dir: str, db_path: str) -> bool:
+    """Whether the store (columnar or Parquet) was built from the data db_path's catalog describes"""
+    try:
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            built = json.load(f).get("catalog_token")
+    except OSError:
+        return False
+    return built is not None and built == catalog_token(load_catalog(db_path))
+
+
+def year_epoch(year: int) -> int:
+    return int(np.datetime64(f"{int(year):04d}-01-01", "s").astype(np.int64))
+
+
+# ── Engine ─────────────────────────────────────────────────────────────────────
+class ColumnarEngine(QueryEngine):
+    """Vectorized NumPy implementation of the query engine interface"""
+
+    name = "columnar"
+    # Already memory-mapped and vectorized; the cube saves nothing here
+    uses_cube = False
+
+    def __init__(self, store_dir: str = COLUMNAR_DIR, db_path: str = DB_PATH, mmap: bool = None):
+        self.store_dir = store_dir
+        self.db_path = db_path
+        self.catalog_path = db_path
+        if mmap is None:
+            mmap = os.getenv("VELORA_COLUMNAR_MMAP", "1").lower() not in ("0", "false", "no")
+        self.mmap = mmap
+        self._columns = None
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        if self._columns is None:
+            with self._lock:
+                if self._columns is None:
+                    if store_exists(self.store_dir) and store_is_current(self.store_dir, self.catalog_path):
+                        self._columns = load_store(self.store_dir, self.mmap)
+                    else:
+                        if store_exists(self.store_dir):
+                            print(f"[Columnar] {self.store_dir} is older than {self.catalog_path}; "
+                                  "loading from SQLite (rebuild with load_argo_db.py --columnar)")
+                        self._columns = load_from_sqlite(self.db_path)
+        return self._columns
+
+    def _time_slice(self, start_year=None, end_year=None) -> slice:
+        times = self.columns["time"]
+        lo = np.searchsorted(times, year_epoch(start_year), "left") if start_year else 0
+        hi = np.searchsorted(times, year_epoch(int(end_year) + 1), "left") if end_year else len(times)
+        return slice(int(lo), int(hi))
+
+    def _box_mask(self, window: slice, bounds) -> np.ndarray:
+        lon_min, lon_max, lat_min, lat_max = (int(round(v * COORD_SCALE)) for v in bounds)
+        lon = self.columns["lon"][window]
+        lat = self.columns["lat"][window]
+        return (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+
+    def monthly_aggregates(self, bounds, start_year=None, end_year=None) -> List[Dict]:
+        return self.monthly_aggregates_multi([bounds], start_year, end_year)[0]
+
+    def monthly_aggregates_multi(self, bounds_list, start_year=None, end_year=None) -> List[List[Dict]]:
+        window = self._time_slice(start_year, end_year)
+        if window.stop <= window.start:
+            return [[] for _ in bounds_list]
+        months = np.asarray(self.columns["month"][window])
+        # Rows are sorted by time, so each month is one contiguous run
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(months)) + 1))
+        # Parameter columns are read once and shared by every box
+        values = {
+            parameter: np.asarray(self.columns[parameter][window], dtype=np.float64)
+            for parameter in PARAMETERS
+        }
+        present = {parameter: ~np.isnan(column) for parameter, column in values.items()}
+        return [
+            self._reduce_months(self._box_mask(window, bounds), months, starts, values, present)
+            for bounds in bounds_list
+        ]
+
+    def _reduce_months(self, mask, months, starts, values, present) -> List[Dict]:
+        matched = np.add.reduceat(mask.astype(np.int64), starts)
+
+        reductions = {}
+        for parameter in PARAMETERS:
+            column = values[parameter]
+            valid = mask & present[parameter]
+            filled = np.where(valid, column, 0.0)
+            counts = np.add.reduceat(valid.astype(np.int64), starts)
+            sums = np.add.reduceat(filled, starts)
+            # Second pass over the same runs: deviations from each month's mean
+            means = np.repeat(sums / np.maximum(counts, 1), np.diff(np.append(starts, len(column))))
+            deviations = np.where(valid, column - means, 0.0)
+            reductions[parameter] = (
+                counts,
+                sums,
+                np.add.reduceat(deviations * deviations, starts),
+                np.minimum.reduceat(np.where(valid, column, np.inf), starts),
+                np.maximum.reduceat(np.where(valid, column, -np.inf), starts),
+            )
+
+        monthly = []
+        for i in np.flatnonzero(matched):
+            month_index = int(months[starts[i]])
+            partials = {
+                parameter: make_partial(*(float(series[i]) for series in reductions[parameter]))
+                for parameter in PARAMETERS
+            }
+            monthly.append(monthly_row(1970 + month_index // 12, month_index % 12 + 1, partials))
+        return monthly
+
+    def points(self, bounds, start_year=None, end_year=None) -> Dict[str, np.ndarray]:
+        window = self._time_slice(start_year, end_year)
+        hits = np.flatnonzero(self._box_mask(window, bounds)) + window.start
+        cols = self.columns
+        stamps = np.asarray(cols["time"][hits], dtype=np.int64).astype("datetime64[s]")
+        return {
+            "time": np.char.add(np.datetime_as_string(stamps, unit="s"), "Z").astype("U20"),
+            "latitude": np.asarray(cols["lat"][hits], dtype=np.float64) / COORD_SCALE,
+            "longitude": np.asarray(cols["lon"][hits], dtype=np.float64) / COORD_SCALE,
+            # float32 storage: round away the widening noise (ARGO reports <= 4 decimals)
+            "temperature": np.round(np.asarray(cols["temperature"][hits], dtype=np.float64), 4),
+            "salinity": np.round(np.asarray(cols["salinity"][hits], dtype=np.float64), 4),
+            "pressure": np.round(np.asarray(cols["pressure"][hits], dtype=np.float64), 4),
+        }
+
+    def export_pages(self, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+        # Exports come from the row store, which keeps every column at full precision
+        return keyset_pages(self.db_path, bounds, start_year, end_year, after, page_rows)
+
+    def preview(self, bounds, start_year=None, end_year=None, limit: int = 100) -> List[Dict]:
+        window = self._time_slice(start_year, end_year)
+        picked = []
+        # Walk backwards from the newest rows in blocks until enough rows match
+        hi = window.stop
+        while hi > window.start and len(picked) < limit:
+            lo = max(window.start, hi - PREVIEW_BLOCK)
+            block = slice(lo, hi)
+            hits = np.flatnonzero(self._box_mask(block, bounds))[::-1] + lo
+            picked.extend(hits[:limit - len(picked)].tolist())
+            hi = lo
+
+        cols = self.columns
+        records = []
+        for i in picked:
+            stamp = datetime.fromtimestamp(int(cols["time"][i]), tz=timezone.utc)
+            temperature, salinity = float(cols["temperature"][i]), float(cols["salinity"][i])
+            records.append({
+                "time": stamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "latitude": int(cols["lat"][i]) / COORD_SCALE,
+                "longitude": int(cols["lon"][i]) / COORD_SCALE,
+                # float32 storage: round away the widening noise (ARGO reports <= 4 decimals)
+                "temperature": None if np.isnan(temperature) else round(temperature, 4),
+                "salinity": None if np.isnan(salinity) else round(salinity, 4),
+            })
+        return records
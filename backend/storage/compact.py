@@ -0,0 +1,288 @@
+"""
+Compact storage schema
+
+argo_data spends most of its bytes on ISO time strings, repeated platform
+numbers, an AUTOINCREMENT id and six single-column indexes. The compact
+layout (data/argo_compact.db) stores the same observations as:
+
+  platforms(platform_id INTEGER PRIMARY KEY, platform_number TEXT UNIQUE)
+  argo_obs(
+      time    INTEGER  seconds since 1970-01-01 UTC
+      month   INTEGER  months since 1970-01 (GROUP BY key)
+      lon/lat INTEGER  degrees * 1e5
+      pres10  INTEGER  decibars * 10, -1 when missing
+      seq     INTEGER  0, 1, ... among rows sharing (time, lon, lat, pres10)
+      temperature, salinity REAL, platform_id INTEGER
+      PRIMARY KEY (time, lon, lat, pres10, seq)
+  ) WITHOUT ROWID
+
+so rows are clustered by time: a year range is a primary-key range scan and
+"latest N" is a backwards walk of the same b-tree. Only one secondary index
+(platform_id, time) is kept. Distinct readings can share a (time, position,
+pressure) key (a missing pressure, or levels within 0.05 dbar of each other),
+so seq numbers them and every argo_data row is copied; deduplicate_db.py is
+the place to drop true duplicates, before migrating.
+"""
+
+import os
+import sqlite3
+from typing import Dict, List
+
+import numpy as np
+
+from .catalog import empty_summary, write_catalog
+from .columnar import COORD_SCALE, parse_times, year_epoch
+from .db import DATA_DIR, DB_PATH, connect
+from .derived import copy_derived
+from .engines import QueryEngine, aggregate_columns_sql, points_from_rows, rows_to_monthly
+from .regions import REGION_BOUNDS
+
+COMPACT_DB_PATH = os.path.join(DATA_DIR, "argo_compact.db")
+PRESSURE_SCALE = 10
+
+COMPACT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS platforms (
+        platform_id     INTEGER PRIMARY KEY,
+        platform_number TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS argo_obs (
+        time        INTEGER NOT NULL,
+        month       INTEGER NOT NULL,
+        lon         INTEGER NOT NULL,
+        lat         INTEGER NOT NULL,
+        pres10      INTEGER NOT NULL,
+        seq         INTEGER NOT NULL,
+        temperature REAL,
+        salinity    REAL,
+        platform_id INTEGER,
+        PRIMARY KEY (time, lon, lat, pres10, seq)
+    ) WITHOUT ROWID;
+"""
+
+COMPACT_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_obs_platform ON argo_obs(platform_id, time);
+"""
+
+
+# ── Migration ──────────────────────────────────────────────────────────────────
+def migrate_to_compact(source_path: str = DB_PATH, target_path: str = COMPACT_DB_PATH,
+                       chunk_rows: int = 200000, progress=None) -> Dict:
+    """
+    Copy argo_data from source_path into the compact layout at target_path.
+    Returns {"rows_read", "rows_written", "platforms"}; raises RuntimeError
+    if any row was not written (the copied derived tables count every row).
+    """
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    target.executescript(COMPACT_SCHEMA)
+
+    platform_ids = {}
+    rows_read = 0
+    # seq per key among the rows of the current timestamp (rows arrive time-ordered)
+    seen, seen_time = {}, None
+    try:
+        cur = source.execute("""
+            SELECT time, latitude, longitude, pressure, temperature, salinity, platform_number
+            FROM argo_data
+            ORDER BY time ASC
+        """)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            times, lats, lons, pres, temps, sals, platforms = zip(*rows)
+            epochs, months = parse_times(times)
+            lat_fixed = np.round(np.array(lats, dtype=np.float64) * COORD_SCALE).astype(np.int64)
+            lon_fixed = np.round(np.array(lons, dtype=np.float64) * COORD_SCALE).astype(np.int64)
+            pres_fixed = [-1 if p is None else int(round(p * PRESSURE_SCALE)) for p in pres]
+
+            seqs = []
+            for key in zip(epochs.tolist(), lon_fixed.tolist(), lat_fixed.tolist(), pres_fixed):
+                if key[0] != seen_time:
+                    seen, seen_time = {}, key[0]
+                seqs.append(seen.get(key, 0))
+                seen[key] = seqs[-1] + 1
+
+            ids = []
+            for platform in platforms:
+                if platform is None:
+                    ids.append(None)
+                    continue
+                if platform not in platform_ids:
+                    platform_ids[platform] = len(platform_ids) + 1
+                ids.append(platform_ids[platform])
+
+            target.executemany(
+                "INSERT INTO argo_obs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(epochs.tolist(), months.tolist(), lon_fixed.tolist(), lat_fixed.tolist(),
+                    pres_fixed, seqs, temps, sals, ids),
+            )
+            rows_read += len(rows)
+            if progress:
+                progress(rows_read)
+
+        target.executemany(
+            "INSERT INTO platforms (platform_id, platform_number) VALUES (?, ?)",
+            ((pid, number) for number, pid in platform_ids.items()),
+        )
+        target.executescript(COMPACT_INDEXES)
+        target.commit()
+        rows_written = target.execute("SELECT COUNT(*) FROM argo_obs").fetchone()[0]
+        if rows_written != rows_read:
+            raise RuntimeError(f"Compact migration wrote {rows_written:,} of {rows_read:,} rows")
+
+        # Derived tables depend only on the observations, so they are copied as-is
+        copy_derived(target, [source_path])
+        write_catalog(target, compact_summary(target), source="migrate_compact", ingested=True)
+        target.execute("ANALYZE")
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+
+    return {"rows_read": rows_read, "rows_written": rows_written, "platforms": len(platform_ids)}
+
+
+def compact_summary(conn: sqlite3.Connection) -> Dict:
+    """Catalog summary computed from argo_obs"""
+    summary = empty_summary()
+    total, min_time, max_time = conn.execute("""
+        SELECT COUNT(*),
+               strftime('%Y-%m-%dT%H:%M:%SZ', MIN(time), 'unixepoch'),
+               strftime('%Y-%m-%dT%H:%M:%SZ', MAX(time), 'unixepoch')
+        FROM argo_obs
+    """).fetchone()
+    summary["total_rows"] = int(total or 0)
+    summary["min_time"], summary["max_time"] = min_time, max_time
+
+    rows = conn.execute("SELECT month / 12 + 1970, COUNT(*) FROM argo_obs GROUP BY month / 12").fetchall()
+    summary["years"] = {str(year): int(count) for year, count in rows}
+
+    for name, bounds in REGION_BOUNDS.items():
+        where_sql, params = compact_filter(bounds)
+        summary["regions"][name] = conn.execute(
+            f"SELECT COUNT(*) FROM argo_obs WHERE {where_sql}", params
+        ).fetchone()[0]
+    return summary
+
+
+# ── Engine ─────────────────────────────────────────────────────────────────────
+def compact_filter(bounds, start_year=None, end_year=None):
+    lon_min, lon_max, lat_min, lat_max = (int(round(v * COORD_SCALE)) for v in bounds)
+    where_sql = "lon >= ? AND lon <= ? AND lat >= ? AND lat <= ?"
+    params = [lon_min, lon_max, lat_min, lat_max]
+    if start_year:
+        where_sql += " AND time >= ?"
+        params.append(year_epoch(start_year))
+    if end_year:
+        where_sql += " AND time < ?"
+        params.append(year_epoch(int(end_year) + 1))
+    return where_sql, params
+
+
+class CompactSQLiteEngine(QueryEngine):
+    """Query engine over the compact WITHOUT ROWID schema"""
+
+    name = "compact"
+    # The clustered primary key already makes box aggregates cheaper than the cube's edge strips
+    uses_cube = False
+
+    def __init__(self, db_path: str = COMPACT_DB_PATH):
+        self.db_path = db_path
+        self.catalog_path = db_path
+
+    def monthly_aggregates(self, bounds, start_year=None, end_year=None) -> List[Dict]:
+        where_sql, params = compact_filter(bounds, start_year, end_year)
+        sql = f"""
+            SELECT month / 12 + 1970 AS year, month % 12 + 1 AS month_of_year, {aggregate_columns_sql()}
+            FROM argo_obs
+            WHERE {where_sql}
+            GROUP BY month
+            ORDER BY month ASC
+        """
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return rows_to_monthly(rows)
+
+    def points(self, bounds, start_year=None, end_year=None):
+        where_sql, params = compact_filter(bounds, start_year, end_year)
+        sql = f"""
+            SELECT strftime('%Y-%m-%dT%H:%M:%SZ', time, 'unixepoch'),
+                   lat * 1.0 / {COORD_SCALE}, lon * 1.0 / {COORD_SCALE}, temperature, salinity,
+                   CASE WHEN pres10 < 0 THEN NULL ELSE pres10 * 1.0 / {PRESSURE_SCALE} END
+            FROM argo_obs
+            WHERE {where_sql}
+        """
+        conn = connect(self.db_path)
+        try:
+            return points_from_rows(conn.execute(sql, params).fetchall())
+        finally:
+            conn.close()
+
+    def export_pages(self, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+        """Keyset pages over the (time, lon, lat, pres10, seq) primary key"""
+        where_sql, params = compact_filter(bounds, start_year, end_year)
+        last = None
+        if after:
+            try:
+                last = [int(part) for part in after.split("|")]
+            except ValueError:
+                last = []
+            if len(last) != 5:
+                raise ValueError(f"Invalid export cursor: {after}")
+
+        while True:
+            keyset = " AND (o.time, o.lon, o.lat, o.pres10, o.seq) > (?, ?, ?, ?, ?)" if last else ""
+            conn = connect(self.db_path)
+            try:
+                rows = conn.execute(f"""
+                    SELECT o.time AS t, o.lon, o.lat, o.pres10, o.seq,
+                           strftime('%Y-%m-%dT%H:%M:%SZ', o.time, 'unixepoch') AS time,
+                           o.temperature, o.salinity, p.platform_number
+                    FROM argo_obs o LEFT JOIN platforms p ON p.platform_id = o.platform_id
+                    WHERE {where_sql}{keyset}
+                    ORDER BY o.time, o.lon, o.lat, o.pres10, o.seq
+                    LIMIT ?
+                """, params + (last or []) + [page_rows]).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                return
+            yield [{
+                "cursor": f"{row['t']}|{row['lon']}|{row['lat']}|{row['pres10']}|{row['seq']}",
+                "time": row["time"],
+                "latitude": row["lat"] / COORD_SCALE,
+                "longitude": row["lon"] / COORD_SCALE,
+                "pressure": None if row["pres10"] < 0 else row["pres10"] / PRESSURE_SCALE,
+                "temperature": row["temperature"],
+                "salinity": row["salinity"],
+                "platform_number": row["platform_number"],
+            } for row in rows]
+            if len(rows) < page_rows:
+                return
+            last = [rows[-1][name] for name in ("t", "lon", "lat", "pres10", "seq")]
+
+    def preview(self, bounds, start_year=None, end_year=None, limit: int = 100) -> List[Dict]:
+        where_sql, params = compact_filter(bounds, start_year, end_year)
+        sql = f"""
+            SELECT strftime('%Y-%m-%dT%H:%M:%SZ', time, 'unixepoch') AS time,
+                   lat * 1.0 / {COORD_SCALE} AS latitude,
+                   lon * 1.0 / {COORD_SCALE} AS longitude,
+                   temperature, salinity
+            FROM argo_obs
+            WHERE {where_sql}
+            ORDER BY time DESC
+            LIMIT {int(limit)}
+        """
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
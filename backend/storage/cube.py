@@ -0,0 +1,269 @@
+"""
+Memory-mapped aggregate cube
+
+The monthly partials (count, sum, m2, min, max per parameter) of every
+SKETCH_DEG grid cell are written at ingest to a read-only binary file next
+to the database (<db>.cube, a .npy structured array sorted by cell then
+month). Every worker maps it with np.load(mmap_mode="r"): the pages live
+once in the OS page cache however many uvicorn workers there are, and
+nothing is parsed or copied into Python objects.
+
+A box query reads the rows of the whole cells inside it as NumPy views —
+one searchsorted per cell for its month range — and reduces them together
+with the raw rows along the box edges (see sketches.region_points), so it
+answers exactly what engine.monthly_aggregates() would, without a GROUP BY
+over the box.
+
+The cube is a derived builder (see storage.derived) that owns a file
+instead of a table: write() saves it beside the connection's database,
+missing() reports whether it exists and copy() merges the cubes of other
+databases (shards, or the row store a compact copy was made from).
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .aggregates import PARAMETERS, make_partial, monthly_row, reduce_partials
+from .engines import year_months
+from .sketches import SKETCH_DEG, shared_region_points, sketch_cells
+
+CUBE_SUFFIX = ".cube"
+PREFIXES = {"temperature": "temp", "salinity": "sal"}
+FIELDS = ("count", "sum", "m2", "min", "max")
+CUBE_DTYPE = np.dtype([("key", "<i8")] + [
+    (f"{PREFIXES[parameter]}_{field}", "<f8") for parameter in PARAMETERS for field in FIELDS
+])
+
+# Key layout, low to high bits: year*12+month-1, cx, cy
+MONTH_BITS = 16
+CELL_BITS = 7
+
+
+def cube_path(db_path: str) -> str:
+    return f"{db_path}{CUBE_SUFFIX}"
+
+
+def database_file(conn: sqlite3.Connection) -> str:
+    """Path of the main database of a connection ("" for in-memory ones)"""
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def month_index(year, month):
+    return np.asarray(year, dtype=np.int64) * 12 + np.asarray(month, dtype=np.int64) - 1
+
+
+def save_cube(path: str, keys: np.ndarray, partials: Dict) -> int:
+    """Write a cube file atomically (readers keep the mapping of the old one); returns its rows"""
+    cube = np.zeros(len(keys), dtype=CUBE_DTYPE)
+    cube["key"] = keys
+    for parameter in PARAMETERS:
+        for field, values in zip(FIELDS, partials[parameter]):
+            cube[f"{PREFIXES[parameter]}_{field}"] = values
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        np.save(f, cube, allow_pickle=False)
+    os.replace(temporary, path)
+    return len(cube)
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class CubeBuilder:
+    """Derived builder for the per-cell monthly partials file"""
+
+    name = "cube"
+    tables = ()
+    schema = ""
+    # Partials are re-reduced once this many un-merged keys pile up
+    COMPACT_AT = 1 << 20
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.partials = {parameter: tuple(np.zeros(0) for _ in FIELDS) for parameter in PARAMETERS}
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        times = np.asarray(chunk["time"], dtype=str)
+        if len(times) == 0:
+            return
+        year_month = year_months(times)
+        cx, cy = sketch_cells(chunk["longitude"], chunk["latitude"])
+        keys = (((cy << CELL_BITS) | cx) << MONTH_BITS) | month_index(year_month // 100, year_month % 100)
+        part = {}
+        for parameter in PARAMETERS:
+            values = np.asarray(chunk[parameter], dtype=np.float64)
+            valid = ~np.isnan(values)
+            part[parameter] = (valid.astype(np.float64), np.where(valid, values, 0.0), np.zeros(len(values)),
+                               np.where(valid, values, np.inf), np.where(valid, values, -np.inf))
+        self.add_partials(keys, part)
+
+    def add_partials(self, keys: np.ndarray, partials: Dict):
+        self._pending.append(self._reduce(keys, partials))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    @staticmethod
+    def _reduce(keys, partials):
+        reduced = {parameter: reduce_partials(keys, *partials[parameter]) for parameter in PARAMETERS}
+        return reduced[PARAMETERS[0]][0], {parameter: reduced[parameter][1:] for parameter in PARAMETERS}
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = [(self.keys, self.partials)] + self._pending
+        keys = np.concatenate([part[0] for part in parts])
+        partials = {
+            parameter: tuple(np.concatenate([part[1][parameter][i] for part in parts]) for i in range(len(FIELDS)))
+            for parameter in PARAMETERS
+        }
+        self.keys, self.partials = self._reduce(keys, partials)
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, conn: sqlite3.Connection):
+        path = database_file(conn)
+        if not path:
+            return
+        self._compact()
+        # reduce_partials returns keys sorted, which is the file's lookup order
+        save_cube(cube_path(path), self.keys, self.partials)
+
+    def missing(self, conn: sqlite3.Connection) -> bool:
+        path = database_file(conn)
+        return bool(path) and not os.path.exists(cube_path(path))
+
+    def copy(self, target: sqlite3.Connection, source_paths: List[str]) -> bool:
+        """Merge the cubes of source_paths into the target's; False if any source has none"""
+        sources = [cube_path(path) for path in source_paths]
+        if not all(os.path.exists(path) for path in sources) or not database_file(target):
+            return False
+        for path in sources:
+            cube = np.load(path, mmap_mode="r")
+            self.add_partials(np.asarray(cube["key"]), {
+                parameter: tuple(np.asarray(cube[f"{PREFIXES[parameter]}_{field}"]) for field in FIELDS)
+                for parameter in PARAMETERS
+            })
+        self.write(target)
+        return True
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+_maps_lock = threading.Lock()
+_maps: Dict = {}   # path -> ((mtime_ns, size), mapped array)
+
+
+def open_cube(db_path: str) -> Optional[np.ndarray]:
+    """The read-only mapping of a database's cube (re-mapped when the file is replaced); None if absent"""
+    path = cube_path(db_path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size)
+    with _maps_lock:
+        cached = _maps.get(path)
+        if cached is None or cached[0] != signature:
+            # Unmap the cubes of collected snapshots so their disk space is freed
+            for stale in [other for other in _maps if not os.path.exists(other)]:
+                del _maps[stale]
+            cached = _maps[path] = (signature, np.load(path, mmap_mode="r"))
+        return cached[1]
+
+
+def cell_rows(cube: np.ndarray, inner, start_year=None, end_year=None) -> np.ndarray:
+    """Indexes of the cube rows for the cells of the inner box and the year range (vectorized)"""
+    lon_lo, lon_hi, lat_lo, lat_hi = inner
+    cx = np.arange(round((lon_lo + 180.0) / SKETCH_DEG), round((lon_hi + 180.0) / SKETCH_DEG), dtype=np.int64)
+    cy = np.arange(round((lat_lo + 90.0) / SKETCH_DEG), round((lat_hi + 90.0) / SKETCH_DEG), dtype=np.int64)
+    cells = ((cy[:, None] << CELL_BITS) | cx[None, :]).ravel() << MONTH_BITS
+    first = int(month_index(int(start_year), 1)) if start_year else 0
+    last = int(month_index(int(end_year), 12)) if end_year else (1 << MONTH_BITS) - 1
+    keys = cube["key"]
+    starts = np.searchsorted(keys, cells | first, side="left")
+    ends = np.searchsorted(keys, cells | last, side="right")
+    sizes = ends - starts
+    # Concatenated ranges [start, end) without a Python loop
+    offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+    return offsets + np.arange(int(sizes.sum()))
+
+
+def cube_monthly(engine, area, start_year=None, end_year=None, area_points=None) -> Optional[List[Dict]]:
+    """
+    Monthly rows of a box from the cube plus its edge rows; None when there
+    is no cube, the engine opts out, or the region is a polygon / smaller
+    than a cell (the engine query is used instead). area_points is a
+    sketches.shared_region_points() callable (read here when not given).
+    """
+    if not area.is_box or not engine.uses_cube:
+        return None
+    cube = open_cube(engine.catalog_path)
+    if cube is None:
+        return None
+    inner, points = (area_points or shared_region_points(engine, area, start_year, end_year))()
+    if inner is None:
+        return None
+
+    rows = cube[cell_rows(cube, inner, start_year, end_year)]
+    point_keys = year_months(points["time"])
+    stored_keys = (rows["key"] & ((1 << MONTH_BITS) - 1))
+    keys = np.concatenate([point_keys, stored_keys // 12 * 100 + stored_keys % 12 + 1])
+    reduced = {}
+    for parameter in PARAMETERS:
+        values = np.asarray(points[parameter], dtype=np.float64)
+        valid = ~np.isnan(values)
+        prefix = PREFIXES[parameter]
+        columns = (
+            np.concatenate([valid.astype(np.float64), rows[f"{prefix}_count"]]),
+            np.concatenate([np.where(valid, values, 0.0), rows[f"{prefix}_sum"]]),
+            np.concatenate([np.zeros(len(values)), rows[f"{prefix}_m2"]]),
+            np.concatenate([np.where(valid, values, np.inf), rows[f"{prefix}_min"]]),
+            np.concatenate([np.where(valid, values, -np.inf), rows[f"{prefix}_max"]]),
+        )
+        unique, *reduced[parameter] = reduce_partials(keys, *columns)
+
+    monthly = []
+    for i, key in enumerate(unique.tolist()):
+        partials = {
+            parameter: make_partial(*(float(series[i]) for series in reduced[parameter]))
+            for parameter in PARAMETERS
+        }
+        monthly.append(monthly_row(key // 100, key % 100, partials))
+    return monthly
+
+
+def cell_monthly(engine, area, start_year=None, end_year=None, area_points=None):
+    """
+    (keys, {parameter: (count, sum)}) per cell and month of a region, in
+    the cube's key layout: whole cells from the cube, the rest from the rows
+    inside the region. Used whatever engine.uses_cube says, since no engine
+    query groups by cell; None when there is no cube. area_points as for
+    cube_monthly().
+    """
+    cube = open_cube(engine.catalog_path)
+    if cube is None:
+        return None
+    inner, points = (area_points or shared_region_points(engine, area, start_year, end_year))()
+    rows = cube[cell_rows(cube, inner, start_year, end_year)] if inner is not None else cube[:0]
+
+    year_month = year_months(points["time"])
+    cx, cy = sketch_cells(points["longitude"], points["latitude"])
+    point_keys = (((cy << CELL_BITS) | cx) << MONTH_BITS) | month_index(year_month // 100, year_month % 100)
+    keys = np.concatenate([point_keys, rows["key"]])
+    reduced = {}
+    for parameter in PARAMETERS:
+        values = np.asarray(points[parameter], dtype=np.float64)
+        valid = ~np.isnan(values)
+        prefix = PREFIXES[parameter]
+        unused = np.zeros(len(keys))
+        unique, count, total, _, _, _ = reduce_partials(
+            keys,
+            np.concatenate([valid.astype(np.float64), rows[f"{prefix}_count"]]),
+            np.concatenate([np.where(valid, values, 0.0), rows[f"{prefix}_sum"]]),
+            unused, unused, unused,
+        )
+        reduced[parameter] = (count, total)
+    return unique, reduced
@@ -0,0 +1,33 @@
+"""
+Database locations and connection setup
+"""
+
+import os
+import sqlite3
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+DB_PATH = os.path.join(DATA_DIR, "argo.db")
+SHARD_DIR = os.path.join(DATA_DIR, "shards")
+
+ARGO_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS argo_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        time TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        pressure REAL,
+        temperature REAL,
+        salinity REAL,
+        platform_number TEXT
+    )
+"""
+
+
+def connect(path: str = DB_PATH) -> sqlite3.Connection:
+    """Get SQLite connection with row factory for dict-like access"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -64000")
+    return conn
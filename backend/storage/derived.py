@@ -0,0 +1,162 @@
+"""
+Derived tables built at ingest
+
+Precomputed tables (map tile pyramid, preview representatives, samples, quantile
+sketches, T-S histograms, depth rollup, float stations, float counts, climatology, ...) are produced by builders that see
+every ingest chunk once, next to the catalog summary, so no second pass over
+argo_data is needed. rebuild_derived() replays argo_data through the same
+builders for databases that were loaded before a builder existed or whose
+rows were changed in place (dedup).
+
+A builder has a name, the tables it owns, their schema and
+  add(chunk)      fold a chunk of column arrays into in-memory state
+  write(conn)     insert its rows into the freshly created tables
+Most derived tables are keyed by year, so the tables of per-year shards can
+be concatenated into the shard catalog without recomputation.
+
+A builder whose output cannot be concatenated (the climatology, folded over
+years) has
+  copy(target, source_paths)  merge the sources' tables or files into the target's
+and one that owns a file beside the database instead of tables (the
+aggregate cube) also has
+  missing(conn)               whether its file is absent
+"""
+
+import sqlite3
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+CHUNK_COLUMNS = ("time", "latitude", "longitude", "pressure", "temperature", "salinity", "platform_number")
+
+
+def default_builders() -> List:
+    from .climatology import ClimatologyBuilder
+    from .cube import CubeBuilder
+    from .floats import FloatSketchBuilder
+    from .platforms import StationBuilder
+    from .profiles import DepthRollupBuilder
+    from .representatives import RepresentativeBuilder
+    from .samples import SampleBuilder
+    from .sketches import SketchBuilder
+    from .tiles import TilePyramidBuilder
+    from .tsdiagram import TSHistogramBuilder
+    return [TilePyramidBuilder(), RepresentativeBuilder(), SampleBuilder(), SketchBuilder(), TSHistogramBuilder(),
+            DepthRollupBuilder(), StationBuilder(), FloatSketchBuilder(), CubeBuilder(), ClimatologyBuilder()]
+
+
+# ── Chunks ─────────────────────────────────────────────────────────────────────
+def chunk_from_frame(frame) -> Dict[str, np.ndarray]:
+    """Ingest DataFrame chunk -> column arrays (floats with NaN for missing)"""
+    chunk = {"time": frame["time"].to_numpy(dtype=str), "platform_number": frame["platform_number"].to_numpy()}
+    for name in ("latitude", "longitude", "pressure", "temperature", "salinity"):
+        chunk[name] = frame[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    return chunk
+
+
+def chunk_from_rows(rows) -> Dict[str, np.ndarray]:
+    """Rows in CHUNK_COLUMNS order -> column arrays"""
+    columns = list(zip(*rows))
+    chunk = {"time": np.array(columns[0], dtype=str), "platform_number": np.array(columns[6], dtype=object)}
+    for index, name in enumerate(CHUNK_COLUMNS[1:6], start=1):
+        chunk[name] = np.array(columns[index], dtype=np.float64)  # None -> NaN
+    return chunk
+
+
+def iter_table_chunks(conn: sqlite3.Connection, chunk_rows: int = 200000) -> Iterable[Dict[str, np.ndarray]]:
+    cur = conn.execute(f"SELECT {', '.join(CHUNK_COLUMNS)} FROM argo_data WHERE time IS NOT NULL")
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield chunk_from_rows(rows)
+
+
+def feed(builders: List, chunk: Dict[str, np.ndarray]):
+    for builder in builders:
+        builder.add(chunk)
+
+
+# ── Writing ────────────────────────────────────────────────────────────────────
+def _replace_tables(conn: sqlite3.Connection, builder):
+    for table in builder.tables:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    for statement in builder.schema.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def write_derived(conn: sqlite3.Connection, builders: List):
+    """Replace each builder's tables in one transaction (readers see old or new, never half)"""
+    conn.commit()
+    with conn:
+        conn.execute("BEGIN")
+        for builder in builders:
+            _replace_tables(conn, builder)
+            builder.write(conn)
+
+
+def missing_builders(conn: sqlite3.Connection, builders: List = None) -> List:
+    builders = default_builders() if builders is None else builders
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [
+        builder for builder in builders
+        if not set(builder.tables) <= existing or (hasattr(builder, "missing") and builder.missing(conn))
+    ]
+
+
+def rebuild_derived(conn: sqlite3.Connection, builders: List = None, missing_only: bool = False,
+                    chunk_rows: int = 200000) -> List[str]:
+    """Recompute derived tables from argo_data; returns the names of the builders that ran"""
+    builders = default_builders() if builders is None else builders
+    if missing_only:
+        builders = missing_builders(conn, builders)
+    if not builders:
+        return []
+    for chunk in iter_table_chunks(conn, chunk_rows):
+        feed(builders, chunk)
+    write_derived(conn, builders)
+    return [builder.name for builder in builders]
+
+
+def copy_derived(target: sqlite3.Connection, source_paths: List[str], builders: List = None) -> List[str]:
+    """
+    Concatenate derived tables from other databases (per-year shards, or the
+    row store a compact copy was made from) into target. Tables missing from
+    any source are skipped, since a partial copy would be wrong.
+    """
+    builders = default_builders() if builders is None else builders
+    copied = []
+    target.commit()
+    for builder in builders:
+        complete = True
+        for path in source_paths:
+            source = sqlite3.connect(path)
+            try:
+                complete = complete and not missing_builders(source, [builder])
+            finally:
+                source.close()
+        if not complete:
+            continue
+        if hasattr(builder, "copy"):
+            if builder.copy(target, source_paths):
+                copied.append(builder.name)
+            continue
+        with target:
+            target.execute("BEGIN")
+            _replace_tables(target, builder)
+            for path in source_paths:
+                source = sqlite3.connect(path)
+                try:
+                    for table in builder.tables:
+                        cur = source.execute(f"SELECT * FROM {table}")
+                        marks = ", ".join("?" * len(cur.description))
+                        while True:
+                            rows = cur.fetchmany(50000)
+                            if not rows:
+                                break
+                            target.executemany(f"INSERT INTO {table} VALUES ({marks})", rows)
+                finally:
+                    source.close()
+        copied.append(builder.name)
+    return copied
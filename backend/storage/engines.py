@@ -0,0 +1,363 @@
+"""
+Query engines behind build_response
+
+An engine answers two logical queries for a (bounds, start_year, end_year)
+filter:
+  monthly_aggregates() -> [{year, month, temperature: partial, salinity: partial}]
+  preview()            -> latest raw rows for the map/table preview
+plus monthly_aggregates_multi(), which answers several boxes at once and
+defaults to one query per box. The engine is chosen with VELORA_ENGINE:
+"sqlite" (default), "sharded", "columnar", "compact" or "duckdb"; new engines
+subclass QueryEngine and register in create_engine().
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from .aggregates import (
+    MOMENT_SHIFT, PARAMETERS, make_partial, merge_monthly, monthly_from_points, monthly_row, shifted_m2,
+)
+from .db import DB_PATH, connect
+from .regions import bounds_sql
+
+
+def filter_sql(bounds, start_year=None, end_year=None):
+    """WHERE clause + params for a region box (None = anywhere) and optional year range"""
+    where_sql, params = bounds_sql(bounds) if bounds is not None else ("1=1", [])
+    if start_year:
+        where_sql += " AND substr(time, 1, 4) >= ?"
+        params.append(str(start_year))
+    if end_year:
+        where_sql += " AND substr(time, 1, 4) <= ?"
+        params.append(str(end_year))
+    return where_sql, params
+
+
+def aggregate_columns_sql() -> str:
+    """count/sum/shifted sum of squares/min/max select list for both parameters (10 columns)"""
+    columns = []
+    for parameter in PARAMETERS:
+        shift = MOMENT_SHIFT[parameter]
+        columns.append(
+            f"COUNT({parameter}), SUM({parameter}), SUM(({parameter} - {shift}) * ({parameter} - {shift})), "
+            f"MIN({parameter}), MAX({parameter})"
+        )
+    return ", ".join(columns)
+
+
+def monthly_sql(where_sql: str, table: str = "argo_data") -> str:
+    """One grouped scan returning partial aggregates for both parameters"""
+    return f"""
+        SELECT
+            CAST(substr(time, 1, 4) AS INTEGER) AS year,
+            CAST(substr(time, 6, 2) AS INTEGER) AS month,
+            {aggregate_columns_sql()}
+        FROM {table}
+        WHERE {where_sql}
+        GROUP BY substr(time, 1, 7)
+        ORDER BY year ASC, month ASC
+    """
+
+
+def rows_to_monthly(rows, offset: int = 2) -> List[Dict]:
+    """Rows of (year, month, [...flags], 10 aggregate columns) -> monthly rows"""
+    monthly = []
+    for row in rows:
+        values = tuple(row)
+        partials = {}
+        for i, parameter in enumerate(PARAMETERS):
+            count, total, shifted_sumsq, low, high = values[offset + 5 * i:offset + 5 * i + 5]
+            m2 = shifted_m2(count, total, shifted_sumsq, MOMENT_SHIFT[parameter])
+            partials[parameter] = make_partial(count, total, m2, low, high)
+        monthly.append(monthly_row(values[0], values[1], partials))
+    return monthly
+
+
+# ── Shared scans for several regions ───────────────────────────────────────────
+def region_flags_sql(bounds_list, box_sql=bounds_sql):
+    """
+    CASE-based region tags: one 0/1 column per box. Grouping on the flags as
+    well as the month keeps overlapping regions exact (a row on a shared
+    border is counted for every region that contains it).
+    """
+    flags, where, flag_params, where_params = [], [], [], []
+    for i, bounds in enumerate(bounds_list):
+        sql, params = box_sql(bounds)
+        flags.append(f"CASE WHEN {sql} THEN 1 ELSE 0 END AS r{i}")
+        flag_params.extend(params)
+        where.append(f"({sql})")
+        where_params.extend(params)
+    return ", ".join(flags), flag_params, " OR ".join(where), where_params
+
+
+def monthly_multi_sql(flags_sql: str, where_sql: str, count: int, table: str = "argo_data") -> str:
+    flag_names = ", ".join(f"r{i}" for i in range(count))
+    return f"""
+        SELECT
+            CAST(substr(time, 1, 4) AS INTEGER) AS year,
+            CAST(substr(time, 6, 2) AS INTEGER) AS month,
+            {flags_sql},
+            {aggregate_columns_sql()}
+        FROM {table}
+        WHERE {where_sql}
+        GROUP BY substr(time, 1, 7), {flag_names}
+    """
+
+
+def split_multi(rows, count: int) -> List[List[Dict]]:
+    """Split flag-tagged monthly rows into one monthly list per region"""
+    tagged = [tuple(row) for row in rows]
+    monthly = rows_to_monthly(tagged, offset=2 + count)
+    per_region = [[] for _ in range(count)]
+    for values, row in zip(tagged, monthly):
+        for i in range(count):
+            if values[2 + i]:
+                per_region[i].append(row)
+    return [merge_monthly([rows_for_region]) for rows_for_region in per_region]
+
+
+# ── Raw points (polygon refinement) ────────────────────────────────────────────
+POINT_COLUMNS = ("time", "latitude", "longitude", "temperature", "salinity", "pressure")
+PREVIEW_COLUMNS = POINT_COLUMNS[:5]
+
+
+def points_sql(where_sql: str, table: str = "argo_data") -> str:
+    return f"SELECT {', '.join(POINT_COLUMNS)} FROM {table} WHERE {where_sql}"
+
+
+def points_from_rows(rows) -> Dict[str, np.ndarray]:
+    """Rows in POINT_COLUMNS order -> column arrays"""
+    columns = list(zip(*rows)) if rows else [()] * len(POINT_COLUMNS)
+    points = {"time": np.array(columns[0], dtype="U20")}
+    for name, values in zip(POINT_COLUMNS[1:], columns[1:]):
+        points[name] = np.array(values, dtype=np.float64)  # None -> NaN
+    return points
+
+
+def concat_points(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    parts = list(parts)
+    if not parts:
+        return points_from_rows([])
+    return {name: np.concatenate([part[name] for part in parts]) for name in POINT_COLUMNS}
+
+
+def year_months(times: np.ndarray) -> np.ndarray:
+    """ISO time strings -> YYYYMM integers"""
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.char.replace(np.asarray(times).astype("U7"), "-", "").astype(np.int64)
+
+
+# ── Export (keyset pagination) ─────────────────────────────────────────────────
+EXPORT_COLUMNS = ("time", "latitude", "longitude", "pressure", "temperature", "salinity", "platform_number")
+
+
+def keyset_pages(db_path: str, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+    """
+    Yield pages of argo_data rows ordered by (time, id). The whole export is
+    one ordered query read page by page, so SQLite sorts (or walks an index
+    on time, when the database has one) once instead of once per page; a
+    resumed export seeks past the cursor with a (time, id) > (last) keyset.
+    Each row carries a "cursor" ("<time>|<id>") to resume after it.
+    """
+    where_sql, params = bounds_sql(bounds)
+    # Plain range predicates (not substr) so a time index can bound the scan
+    if start_year:
+        where_sql += " AND time >= ?"
+        params.append(str(int(start_year)))
+    if end_year:
+        where_sql += " AND time < ?"
+        params.append(str(int(end_year) + 1))
+    if after:
+        time, _, row_id = after.rpartition("|")
+        if not time or not row_id.isdigit():
+            raise ValueError(f"Invalid export cursor: {after}")
+        where_sql += " AND (time, id) > (?, ?)"
+        params.extend([time, int(row_id)])
+
+    # A streaming response may pull pages from different threads, one at a
+    # time; the sort of a large export spills to a temp file, not memory
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA temp_store = FILE")
+        cursor = conn.execute(
+            f"SELECT id, {', '.join(EXPORT_COLUMNS)} FROM argo_data WHERE {where_sql} ORDER BY time, id",
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(page_rows)
+            if not rows:
+                return
+            yield [{"cursor": f"{row['time']}|{row['id']}", **{name: row[name] for name in EXPORT_COLUMNS}}
+                   for row in rows]
+            if len(rows) < page_rows:
+                return
+    finally:
+        conn.close()
+
+
+class QueryEngine:
+    """Base class for query engines"""
+
+    name = "base"
+    catalog_path = DB_PATH
+    # Answer box aggregates from the memory-mapped cube (storage.cube) when one exists
+    uses_cube = True
+
+    def monthly_aggregates(self, bounds, start_year=None, end_year=None) -> List[Dict]:
+        raise NotImplementedError
+
+    def preview(self, bounds, start_year=None, end_year=None, limit: int = 100) -> List[Dict]:
+        raise NotImplementedError
+
+    def monthly_aggregates_multi(self, bounds_list, start_year=None, end_year=None) -> List[List[Dict]]:
+        """Monthly aggregates for several boxes; engines that can share one scan override this"""
+        return [self.monthly_aggregates(bounds, start_year, end_year) for bounds in bounds_list]
+
+    def points(self, bounds, start_year=None, end_year=None) -> Dict[str, np.ndarray]:
+        """Raw rows inside a box as column arrays (see POINT_COLUMNS)"""
+        raise NotImplementedError
+
+    def export_pages(self, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+        """Pages of raw rows (EXPORT_COLUMNS + "cursor") in a stable order; resume with after=cursor"""
+        raise NotImplementedError
+
+    def region_query(self, region, start_year=None, end_year=None, limit: int = 100):
+        """
+        (monthly, preview) for a storage.geometry.Region. Boxes use the normal
+        grouped queries; polygons fetch the rows inside their bounding box
+        (index-backed prefilter) and refine them with region_contains().
+        """
+        if region.is_box:
+            return (self.monthly_aggregates(region.bounds, start_year, end_year),
+                    self.preview(region.bounds, start_year, end_year, limit))
+
+        from .geometry import region_contains
+        points = self.points(region.bounds, start_year, end_year)
+        keep = region_contains(region, points["longitude"], points["latitude"])
+        return monthly_and_latest({name: values[keep] for name, values in points.items()}, limit)
+
+
+def monthly_and_latest(points: Dict[str, np.ndarray], limit: int = 100):
+    """(monthly, preview) of the raw rows of a region: their aggregates and the newest `limit` rows"""
+    monthly = monthly_from_points(year_months(points["time"]), points)
+    newest = np.argsort(points["time"], kind="stable")[::-1][:limit]
+    preview = [
+        {
+            name: str(points[name][i]) if name == "time"
+            else None if np.isnan(points[name][i]) else float(points[name][i])
+            for name in PREVIEW_COLUMNS
+        }
+        for i in newest
+    ]
+    return monthly, preview
+
+
+def preview_sql(where_sql: str, limit: int, table: str = "argo_data") -> str:
+    return f"""
+        SELECT time, latitude, longitude, temperature, salinity
+        FROM {table}
+        WHERE {where_sql}
+        ORDER BY time DESC
+        LIMIT {int(limit)}
+    """
+
+
+class SQLiteEngine(QueryEngine):
+    """The original single-file row store (data/argo.db)"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.catalog_path = db_path
+
+    def monthly_aggregates(self, bounds, start_year=None, end_year=None) -> List[Dict]:
+        where_sql, params = filter_sql(bounds, start_year, end_year)
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(monthly_sql(where_sql), params).fetchall()
+        finally:
+            conn.close()
+        return rows_to_monthly(rows)
+
+    def monthly_aggregates_multi(self, bounds_list, start_year=None, end_year=None) -> List[List[Dict]]:
+        flags_sql, flag_params, boxes_sql, box_params = region_flags_sql(bounds_list)
+        where_sql, year_params = filter_sql(None, start_year, end_year)
+        sql = monthly_multi_sql(flags_sql, f"({boxes_sql}) AND {where_sql}", len(bounds_list))
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(sql, flag_params + box_params + year_params).fetchall()
+        finally:
+            conn.close()
+        return split_multi(rows, len(bounds_list))
+
+    def export_pages(self, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+        return keyset_pages(self.db_path, bounds, start_year, end_year, after, page_rows)
+
+    def points(self, bounds, start_year=None, end_year=None) -> Dict[str, np.ndarray]:
+        where_sql, params = filter_sql(bounds, start_year, end_year)
+        conn = connect(self.db_path)
+        try:
+            return points_from_rows(conn.execute(points_sql(where_sql), params).fetchall())
+        finally:
+            conn.close()
+
+    def preview(self, bounds, start_year=None, end_year=None, limit: int = 100) -> List[Dict]:
+        where_sql, params = filter_sql(bounds, start_year, end_year)
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(preview_sql(where_sql, limit), params).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+
+# ── Engine selection ───────────────────────────────────────────────────────────
+_engine_lock = threading.Lock()
+_engines: Dict = {}   # (name, snapshot path) -> engine
+
+
+def create_engine(name: str, db_path: str = DB_PATH):
+    """Engine `name`; db_path is the row store (and catalog) for the engines that read it"""
+    if name == "sqlite":
+        return SQLiteEngine(db_path)
+    if name == "sharded":
+        from .shards import ShardedEngine
+        return ShardedEngine()
+    if name == "columnar":
+        from .columnar import ColumnarEngine
+        return ColumnarEngine(db_path=db_path)
+    if name == "compact":
+        from .compact import CompactSQLiteEngine
+        return CompactSQLiteEngine()
+    if name == "duckdb":
+        from .parquet import DuckDBEngine
+        return DuckDBEngine(db_path=db_path)
+    raise ValueError(f"Unknown query engine: {name}")
+
+
+def get_engine(name: str = None):
+    """
+    Shared engine instance for `name` (defaults to VELORA_ENGINE) on the
+    current database snapshot. After a swap the next call builds a new
+    engine while requests leased on the old snapshot keep sharing theirs;
+    engines of snapshots that are neither live nor leased, or whose file is
+    gone, are dropped when another engine is built.
+    """
+    from .snapshots import SNAPSHOTS
+    name = (name or os.getenv("VELORA_ENGINE", "sqlite")).strip().lower()
+    path = SNAPSHOTS.current()
+    with _engine_lock:
+        engine = _engines.get((name, path))
+        if engine is None:
+            serving = {path, SNAPSHOTS.live_path(), *SNAPSHOTS.leased()}
+            for stale in [key for key in _engines if key[1] not in serving or not os.path.exists(key[1])]:
+                del _engines[stale]
+            engine = _engines[name, path] = create_engine(name, path)
+        return engine
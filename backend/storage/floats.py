@@ -0,0 +1,221 @@
+"""
+Distinct active floats (HyperLogLog)
+
+COUNT(DISTINCT platform_number) cannot be merged from partials, so every
+FLOAT_DEG grid cell and month keeps a HyperLogLog sketch of the platforms
+seen there, as a derived table. A sketch is HLL_REGISTERS one-byte registers
+holding the longest run of leading zero bits seen among the hashes routed to
+each register; sketches merge by taking the register-wise maximum, so any set
+of cells and months merges into one estimate with a relative standard error
+of about 1.04 / sqrt(HLL_REGISTERS).
+
+Most cell-months see a handful of floats, so a sketch is stored sparse (one
+uint16 per non-zero register: index << 6 | rank) and dense (the raw
+registers) only once that is smaller.
+
+A region is the set of cells whose centre lies inside it; with 1 degree
+cells the boundary error is small next to the sketch error.
+"""
+
+import hashlib
+import sqlite3
+from typing import Dict, Optional
+
+import numpy as np
+
+from .engines import year_months
+
+FLOAT_DEG = 1.0
+HLL_BITS = 10
+HLL_REGISTERS = 1 << HLL_BITS
+RANK_BITS = 6
+SPARSE_LIMIT = HLL_REGISTERS // 2 - 1   # beyond this a sparse blob is no smaller
+RELATIVE_ERROR = 1.04 / np.sqrt(HLL_REGISTERS)
+
+FLOATS_SCHEMA = """
+    CREATE TABLE argo_floats_hll (
+        cy        INTEGER NOT NULL,
+        cx        INTEGER NOT NULL,
+        year      INTEGER NOT NULL,
+        month     INTEGER NOT NULL,
+        registers BLOB NOT NULL,
+        PRIMARY KEY (cy, cx, year, month)
+    ) WITHOUT ROWID
+"""
+
+
+def float_cells(lons, lats):
+    cx = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / FLOAT_DEG)
+    cy = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / FLOAT_DEG)
+    return cx.astype(np.int64), cy.astype(np.int64)
+
+
+# ── HyperLogLog ────────────────────────────────────────────────────────────────
+def platform_hashes(platforms) -> tuple:
+    """(register index, rank) per platform; stable across processes, unlike hash()"""
+    unique, inverse = np.unique(np.asarray(platforms).astype(str), return_inverse=True)
+    index, rank = np.zeros(len(unique), dtype=np.int64), np.zeros(len(unique), dtype=np.int64)
+    rest_bits = 64 - HLL_BITS
+    for i, platform in enumerate(unique.tolist()):
+        h = int.from_bytes(hashlib.blake2b(platform.encode(), digest_size=8).digest(), "big")
+        rest = h & ((1 << rest_bits) - 1)
+        index[i], rank[i] = h >> rest_bits, rest_bits - rest.bit_length() + 1
+    return index[inverse], rank[inverse]
+
+
+def estimate(registers: np.ndarray) -> float:
+    """Cardinality estimate of one dense register array (with the small-range correction)"""
+    m = HLL_REGISTERS
+    raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * m and zeros:
+        return m * np.log(m / zeros)
+    return float(raw)
+
+
+def encode_registers(index: np.ndarray, rank: np.ndarray) -> bytes:
+    """Registers given as non-zero (index, rank) pairs -> sparse or dense blob"""
+    if len(index) <= SPARSE_LIMIT:
+        return ((index << RANK_BITS) | rank).astype(np.uint16).tobytes()
+    dense = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+    dense[index] = rank
+    return dense.tobytes()
+
+
+def merge_blobs(blobs, groups=None, group_count: int = 1) -> np.ndarray:
+    """Register-wise maximum of many blobs -> (group_count, HLL_REGISTERS) uint8 registers"""
+    registers = np.zeros((group_count, HLL_REGISTERS), dtype=np.uint8)
+    groups = np.zeros(len(blobs), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    lengths = np.array([len(blob) for blob in blobs], dtype=np.int64)
+    dense = lengths == HLL_REGISTERS
+    if dense.any():
+        stacked = np.frombuffer(b"".join(blob for blob, flag in zip(blobs, dense) if flag), dtype=np.uint8)
+        np.maximum.at(registers, groups[dense], stacked.reshape(-1, HLL_REGISTERS))
+    if (~dense).any():
+        # All sparse blobs decode in one frombuffer call
+        pairs = np.frombuffer(b"".join(blob for blob, flag in zip(blobs, dense) if not flag), dtype=np.uint16)
+        owners = np.repeat(groups[~dense], lengths[~dense] // 2)
+        pairs = pairs.astype(np.int64)
+        np.maximum.at(registers, (owners, pairs >> RANK_BITS), (pairs & ((1 << RANK_BITS) - 1)).astype(np.uint8))
+    return registers
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class FloatSketchBuilder:
+    """Derived-table builder (see storage.derived) for per-cell, per-month HyperLogLog sketches"""
+
+    name = "floats_hll"
+    tables = ("argo_floats_hll",)
+    schema = FLOATS_SCHEMA
+    # Register maxima are re-reduced once this many un-merged ones pile up
+    COMPACT_AT = 1 << 21
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.ranks = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        platforms = np.asarray(chunk["platform_number"])
+        known = np.array([platform is not None and platform == platform for platform in platforms], dtype=bool)
+        if not known.any():
+            return
+        year_month = year_months(np.asarray(chunk["time"], dtype=str)[known])
+        months = year_month // 100 * 12 + year_month % 100 - 1
+        cx, cy = float_cells(np.asarray(chunk["longitude"])[known], np.asarray(chunk["latitude"])[known])
+        index, rank = platform_hashes(platforms[known])
+        # Key layout, low to high bits: register, cx (9 bits), cy (8 bits), year*12+month
+        keys = ((((months << 8) | cy) << 9 | cx) << HLL_BITS) | index
+        self._pending.append(self._reduce(keys, rank))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    @staticmethod
+    def _reduce(keys, ranks):
+        unique, index = np.unique(keys, return_inverse=True)
+        reduced = np.zeros(len(unique), dtype=np.int64)
+        np.maximum.at(reduced, index, ranks)
+        return unique, reduced
+
+    def _compact(self):
+        if not self._pending:
+            return
+        self.keys, self.ranks = self._reduce(
+            np.concatenate([self.keys] + [part[0] for part in self._pending]),
+            np.concatenate([self.ranks] + [part[1] for part in self._pending]),
+        )
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        sketches = self.keys >> HLL_BITS
+        index = self.keys & (HLL_REGISTERS - 1)
+        starts = np.flatnonzero(np.append(True, sketches[1:] != sketches[:-1])) if len(sketches) else sketches
+        ends = np.append(starts[1:], len(sketches))
+        rows = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            sketch = int(sketches[start])
+            cx, cy, months = sketch & 0x1FF, (sketch >> 9) & 0xFF, sketch >> 17
+            rows.append((cy, cx, months // 12, months % 12 + 1,
+                         encode_registers(index[start:end], self.ranks[start:end])))
+        rows.sort(key=lambda row: row[:4])
+        conn.executemany("INSERT INTO argo_floats_hll VALUES (?, ?, ?, ?, ?)", rows)
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def active_floats(db_path: str, area, start_year=None, end_year=None) -> Optional[Dict]:
+    """
+    Estimated distinct floats in a region over the whole range and per year,
+    or None when the sketch table has not been built.
+    """
+    lon_min, lon_max, lat_min, lat_max = area.bounds
+    # Cells whose centre lies in the bounding box
+    cx_lo, cx_hi = int(np.ceil((lon_min + 180.0) / FLOAT_DEG - 0.5)), int(np.floor((lon_max + 180.0) / FLOAT_DEG - 0.5))
+    cy_lo, cy_hi = int(np.ceil((lat_min + 90.0) / FLOAT_DEG - 0.5)), int(np.floor((lat_max + 90.0) / FLOAT_DEG - 0.5))
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("""
+            SELECT year, cy, cx, registers FROM argo_floats_hll
+            WHERE cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ?
+        """, (cy_lo, cy_hi, cx_lo, cx_hi, int(start_year or 0), int(end_year or 9999))).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+    if rows and not area.is_box:
+        from .geometry import region_contains
+        cy = np.array([row[1] for row in rows], dtype=np.float64)
+        cx = np.array([row[2] for row in rows], dtype=np.float64)
+        keep = region_contains(area, (cx + 0.5) * FLOAT_DEG - 180.0, (cy + 0.5) * FLOAT_DEG - 90.0)
+        rows = [row for row, inside in zip(rows, keep) if inside]
+    if not rows:
+        return {"estimate": 0, "relative_error": round(float(RELATIVE_ERROR), 3), "per_year": []}
+
+    years, groups = np.unique([row[0] for row in rows], return_inverse=True)
+    per_year = merge_blobs([row[3] for row in rows], groups, len(years))
+    return {
+        "estimate": int(round(estimate(per_year.max(axis=0)))),
+        "relative_error": round(float(RELATIVE_ERROR), 3),
+        "per_year": [{"year": int(year), "estimate": int(round(estimate(registers)))}
+                     for year, registers in zip(years.tolist(), per_year)],
+    }
+
+
+CONFIDENCE_LEVELS = ("low", "medium", "high")
+SPARSE_FLOATS = 5     # fewer floats than this in a year: a trend is anecdotal
+THIN_FLOATS = 20      # fewer than this: one confidence level down
+
+
+def coverage_confidence(confidence: str, floats: Dict) -> str:
+    """Trend-fit confidence lowered when the thinnest year had few distinct floats"""
+    if confidence not in CONFIDENCE_LEVELS or not floats["per_year"]:
+        return confidence
+    fewest = min(year["estimate"] for year in floats["per_year"])
+    if fewest < SPARSE_FLOATS:
+        return "low"
+    if fewest < THIN_FLOATS:
+        return CONFIDENCE_LEVELS[max(CONFIDENCE_LEVELS.index(confidence) - 1, 0)]
+    return confidence
@@ -0,0 +1,248 @@
+"""
+Custom query regions: bounding boxes and GeoJSON polygons
+
+A query region is either one of the named REGION_BOUNDS boxes, a custom
+bounding box or a (Multi)Polygon. Boxes go straight to the engines' box
+filter. Polygons use the box around them as an index-backed prefilter and
+are then refined with a vectorized even-odd point-in-polygon test.
+
+For every polygon a coverage mask over a CELL_DEG grid is cached: cells
+entirely inside or outside the polygon are decided by a lookup, and only
+points in cells crossed by an edge go through the exact test.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .cache import LRUCache
+from .regions import REGION_BOUNDS
+
+CELL_DEG = 0.25
+MASK_CACHE_SIZE = int(os.getenv("VELORA_POLYGON_CACHE", "64"))
+MAX_VERTICES = 10000
+
+OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+
+
+class Region:
+    """A resolved query region: label, bounding box and optional polygons"""
+
+    def __init__(self, name: str, bounds, polygons: Optional[List[List[np.ndarray]]] = None):
+        self.name = name
+        self.bounds = tuple(float(v) for v in bounds)  # (lon_min, lon_max, lat_min, lat_max)
+        self.polygons = polygons                       # [[exterior, *holes], ...] of (n, 2) lon/lat arrays
+
+    @property
+    def is_box(self) -> bool:
+        return self.polygons is None
+
+    @property
+    def key(self) -> str:
+        """Stable identity used by caches"""
+        if self.is_box:
+            return "bbox:" + ",".join(f"{v:g}" for v in self.bounds)
+        digest = hashlib.sha1()
+        for polygon in self.polygons:
+            for ring in polygon:
+                digest.update(np.ascontiguousarray(ring, dtype=np.float64).tobytes())
+                digest.update(b"|")
+            digest.update(b"#")
+        return "poly:" + digest.hexdigest()
+
+    def describe(self) -> Dict:
+        info = {"name": self.name, "bbox": [self.bounds[0], self.bounds[2], self.bounds[1], self.bounds[3]]}
+        if not self.is_box:
+            info["polygons"] = len(self.polygons)
+        return info
+
+
+# ── Parsing ────────────────────────────────────────────────────────────────────
+def parse_bbox(bbox) -> tuple:
+    """GeoJSON order [lon_min, lat_min, lon_max, lat_max] (list or "a,b,c,d") -> bounds"""
+    if isinstance(bbox, str):
+        bbox = bbox.split(",")
+    try:
+        lon_min, lat_min, lon_max, lat_max = (float(v) for v in bbox)
+    except (TypeError, ValueError):
+        raise ValueError("bbox must be [lon_min, lat_min, lon_max, lat_max]")
+    if not (-180 <= lon_min <= lon_max <= 180 and -90 <= lat_min <= lat_max <= 90):
+        raise ValueError("bbox is outside -180..180 / -90..90 or has min > max")
+    return lon_min, lon_max, lat_min, lat_max
+
+
+def _ring(coords) -> np.ndarray:
+    ring = np.asarray(coords, dtype=np.float64)
+    if ring.ndim != 2 or ring.shape[1] < 2 or len(ring) < 3:
+        raise ValueError("polygon rings need at least 3 [lon, lat] positions")
+    ring = ring[:, :2]
+    if not np.isfinite(ring).all():
+        raise ValueError("polygon coordinates must be finite numbers")
+    if (ring[:, 0].min() < -180 or ring[:, 0].max() > 180
+            or ring[:, 1].min() < -90 or ring[:, 1].max() > 90):
+        raise ValueError("polygon coordinates are outside -180..180 / -90..90")
+    if np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    return ring
+
+
+def parse_geometry(geometry) -> List[List[np.ndarray]]:
+    """GeoJSON Polygon / MultiPolygon (or a Feature wrapping one) -> polygons"""
+    if isinstance(geometry, str):
+        try:
+            geometry = json.loads(geometry)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"geometry is not valid JSON ({e})")
+    if not isinstance(geometry, dict):
+        raise ValueError("geometry must be a GeoJSON object")
+    if geometry.get("type") == "Feature":
+        geometry = geometry.get("geometry") or {}
+
+    kind = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    if kind == "Polygon":
+        raw = [coordinates]
+    elif kind == "MultiPolygon":
+        raw = coordinates
+    else:
+        raise ValueError("geometry must be a GeoJSON Polygon or MultiPolygon")
+
+    try:
+        polygons = [[_ring(ring) for ring in polygon] for polygon in raw or []]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid polygon: {e}")
+    polygons = [polygon for polygon in polygons if polygon]
+    if not polygons:
+        raise ValueError("geometry has no polygon rings")
+    if sum(len(ring) for polygon in polygons for ring in polygon) > MAX_VERTICES:
+        raise ValueError(f"geometry has more than {MAX_VERTICES} vertices")
+    return polygons
+
+
+def resolve_region(region=None, bbox=None, geometry=None) -> Region:
+    """
+    Resolve a region name, a bbox or a GeoJSON geometry into a Region.
+    Raises ValueError for anything that cannot be used as a query filter.
+    """
+    if geometry is not None:
+        polygons = parse_geometry(geometry)
+        points = np.concatenate([polygon[0] for polygon in polygons])
+        bounds = (points[:, 0].min(), points[:, 0].max(), points[:, 1].min(), points[:, 1].max())
+        return Region(region or "Custom polygon", bounds, polygons)
+    if bbox is not None:
+        return Region(region or "Custom area", parse_bbox(bbox))
+    if region in REGION_BOUNDS:
+        return Region(region, REGION_BOUNDS[region])
+    raise ValueError(f"Region not recognized: {region}")
+
+
+# ── Point in polygon ───────────────────────────────────────────────────────────
+def points_in_ring(lons: np.ndarray, lats: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    """Even-odd ray casting, vectorized over points (loops over edges)"""
+    inside = np.zeros(len(lons), dtype=bool)
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if y1 != y2:
+            crosses = (y1 > lats) != (y2 > lats)
+            x_at = x1 + (lats - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (lons < x_at)
+        x1, y1 = x2, y2
+    return inside
+
+
+def points_in_polygons(lons: np.ndarray, lats: np.ndarray, polygons) -> np.ndarray:
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    result = np.zeros(len(lons), dtype=bool)
+    for polygon in polygons:
+        inside = points_in_ring(lons, lats, polygon[0])
+        for hole in polygon[1:]:
+            inside &= ~points_in_ring(lons, lats, hole)
+        result |= inside
+    return result
+
+
+# ── Cell coverage masks ────────────────────────────────────────────────────────
+class CoverageMask:
+    """Per-cell OUTSIDE / INSIDE / BOUNDARY states over a polygon's bounding box"""
+
+    def __init__(self, region: Region, cell_deg: float = CELL_DEG):
+        lon_min, lon_max, lat_min, lat_max = region.bounds
+        self.cell_deg = cell_deg
+        self.lon0 = np.floor(lon_min / cell_deg) * cell_deg
+        self.lat0 = np.floor(lat_min / cell_deg) * cell_deg
+        self.nx = int(np.floor((lon_max - self.lon0) / cell_deg)) + 1
+        self.ny = int(np.floor((lat_max - self.lat0) / cell_deg)) + 1
+        self.states = self._classify(region.polygons)
+
+    def cells(self, lons: np.ndarray, lats: np.ndarray):
+        ix = np.clip(((lons - self.lon0) / self.cell_deg).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((lats - self.lat0) / self.cell_deg).astype(np.int64), 0, self.ny - 1)
+        return iy, ix
+
+    def _classify(self, polygons) -> np.ndarray:
+        # Cells touched by an edge: sample every edge at quarter-cell steps, then
+        # dilate by one cell so an edge clipping a cell corner is never missed
+        touched = np.zeros((self.ny, self.nx), dtype=bool)
+        for polygon in polygons:
+            for ring in polygon:
+                closed = np.vstack([ring, ring[:1]])
+                for (x1, y1), (x2, y2) in zip(closed[:-1], closed[1:]):
+                    steps = int(max(abs(x2 - x1), abs(y2 - y1)) / (self.cell_deg / 4)) + 2
+                    t = np.linspace(0.0, 1.0, steps)
+                    iy, ix = self.cells(x1 + (x2 - x1) * t, y1 + (y2 - y1) * t)
+                    touched[iy, ix] = True
+        boundary = touched.copy()
+        boundary[1:, :] |= touched[:-1, :]
+        boundary[:-1, :] |= touched[1:, :]
+        boundary[:, 1:] |= boundary[:, :-1].copy()
+        boundary[:, :-1] |= boundary[:, 1:].copy()
+
+        # No edge crosses the remaining cells, so their centre decides the whole cell
+        cy, cx = np.mgrid[0:self.ny, 0:self.nx]
+        centre_lons = (self.lon0 + (cx + 0.5) * self.cell_deg).ravel()
+        centre_lats = (self.lat0 + (cy + 0.5) * self.cell_deg).ravel()
+        inside = points_in_polygons(centre_lons, centre_lats, polygons).reshape(self.ny, self.nx)
+
+        states = np.where(inside, INSIDE, OUTSIDE).astype(np.int8)
+        states[boundary] = BOUNDARY
+        return states
+
+    def contains(self, lons: np.ndarray, lats: np.ndarray, polygons) -> np.ndarray:
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        states = self.states[self.cells(lons, lats)]
+        result = states == INSIDE
+        edge = np.flatnonzero(states == BOUNDARY)
+        if len(edge):
+            result[edge] = points_in_polygons(lons[edge], lats[edge], polygons)
+        return result
+
+
+_masks = LRUCache(MASK_CACHE_SIZE)
+
+
+def coverage_mask(region: Region) -> CoverageMask:
+    """LRU-cached coverage mask for a polygon region"""
+    mask = _masks.get(region.key)
+    if mask is None:
+        mask = _masks.put(region.key, CoverageMask(region))
+    return mask
+
+
+def region_contains(region: Region, lons, lats) -> np.ndarray:
+    """Boolean mask of points inside the region (refines the bbox prefilter)"""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    lon_min, lon_max, lat_min, lat_max = region.bounds
+    in_box = (lons >= lon_min) & (lons <= lon_max) & (lats >= lat_min) & (lats <= lat_max)
+    if region.is_box:
+        return in_box
+    result = np.zeros(len(lons), dtype=bool)
+    candidates = np.flatnonzero(in_box)
+    if len(candidates):
+        result[candidates] = coverage_mask(region).contains(lons[candidates], lats[candidates], region.polygons)
+    return result
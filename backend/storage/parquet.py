@@ -0,0 +1,227 @@
+"""
+Columnar analytical engine: DuckDB over Parquet
+
+argo.db is exported to hive-partitioned Parquet files
+(data/parquet/year=<year>/data.parquet, sorted by time) by export_parquet.py.
+DuckDBEngine runs the same logical queries as SQLiteEngine on those files,
+pruning year partitions and using all cores for the GROUP BY.
+DuckDB is an optional dependency and is only imported when this engine is used.
+
+meta.json records the catalog_token of the database the files were exported
+from; once a reload, dedup or snapshot publish changes it, the engine answers
+from the row store (SQLiteEngine) until export_parquet.py is run again.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from .catalog import catalog_token, read_catalog
+from .db import DATA_DIR, DB_PATH
+from .engines import (
+    QueryEngine, SQLiteEngine, aggregate_columns_sql, keyset_pages, points_from_rows, points_sql, region_flags_sql, rows_to_monthly, split_multi,
+)
+
+PARQUET_DIR = os.path.join(DATA_DIR, "parquet")
+ROW_GROUP_SIZE = 122880
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise RuntimeError("The duckdb engine needs the duckdb package (pip install duckdb)") from e
+    return duckdb
+
+
+# ── Export ─────────────────────────────────────────────────────────────────────
+def export_parquet(db_path: str = DB_PATH, out_dir: str = PARQUET_DIR, progress=None) -> Dict:
+    """
+    Write argo_data as one Parquet file per year. Each year is read with an
+    index range scan on time, so memory is bounded by the largest year.
+    Returns {"rows": int, "years": [..]}.
+    """
+    import pandas as pd
+    duckdb = _duckdb()
+
+    source = sqlite3.connect(db_path)
+    con = duckdb.connect()
+    total = 0
+    try:
+        years = [row[0] for row in source.execute(
+            "SELECT DISTINCT substr(time, 1, 4) FROM argo_data ORDER BY 1"
+        ).fetchall() if row[0] and row[0].isdigit()]
+
+        for year in years:
+            rows = source.execute("""
+                SELECT time, latitude, longitude, pressure, temperature, salinity, platform_number
+                FROM argo_data
+                WHERE time >= ? AND time < ?
+                ORDER BY time ASC
+            """, (year, str(int(year) + 1))).fetchall()
+            frame = pd.DataFrame.from_records(rows, columns=[
+                "time", "latitude", "longitude", "pressure", "temperature", "salinity", "platform_number",
+            ]).astype({"pressure": "float64", "temperature": "float64", "salinity": "float64"})
+            frame["month"] = frame["time"].str[5:7].astype("int32")
+
+            year_dir = os.path.join(out_dir, f"year={year}")
+            os.makedirs(year_dir, exist_ok=True)
+            target = os.path.join(year_dir, "data.parquet")
+            con.register("chunk", frame)
+            con.execute(
+                f"COPY chunk TO '{target}.tmp' (FORMAT PARQUET, ROW_GROUP_SIZE {ROW_GROUP_SIZE})"
+            )
+            con.unregister("chunk")
+            os.replace(f"{target}.tmp", target)
+
+            total += len(frame)
+            if progress:
+                progress(year, len(frame))
+
+        catalog = read_catalog(source)
+    finally:
+        source.close()
+        con.close()
+
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({
+            "rows": total,
+            "years": [int(year) for year in years],
+            "data_version": catalog["data_version"] if catalog else None,
+            "catalog_token": catalog_token(catalog),
+            "exported_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }, f, indent=2)
+    return {"rows": total, "years": years}
+
+
+# ── Engine ─────────────────────────────────────────────────────────────────────
+class DuckDBEngine(QueryEngine):
+    """Query engine running on DuckDB over the exported Parquet files"""
+
+    name = "duckdb"
+
+    def __init__(self, parquet_dir: str = PARQUET_DIR, db_path: str = DB_PATH, threads: int = None):
+        self.parquet_dir = parquet_dir
+        self.catalog_path = db_path
+        self.threads = threads or int(os.getenv("VELORA_DUCKDB_THREADS", str(os.cpu_count() or 1)))
+        self._con = None
+        self._lock = threading.Lock()
+        self._fallback = None
+
+    def _stale(self):
+        """The row-store engine to answer from while the Parquet files predate the catalog, else None"""
+        from .columnar import store_is_current
+        if store_is_current(self.parquet_dir, self.catalog_path):
+            return None
+        if self._fallback is None:
+            print(f"[DuckDB] {self.parquet_dir} was exported from other data than {self.catalog_path}; "
+                  "answering from SQLite (re-run export_parquet.py)")
+            self._fallback = SQLiteEngine(self.catalog_path)
+        return self._fallback
+
+    def _cursor(self):
+        # One shared database; each call gets its own cursor so threads don't share state
+        if self._con is None:
+            with self._lock:
+                if self._con is None:
+                    con = _duckdb().connect()
+                    con.execute(f"SET threads = {int(self.threads)}")
+                    self._con = con
+        return self._con.cursor()
+
+    def _source(self) -> str:
+        pattern = os.path.join(self.parquet_dir, "*", "*.parquet").replace("'", "''")
+        return f"read_parquet('{pattern}', hive_partitioning = true)"
+
+    def _filter(self, bounds, start_year=None, end_year=None):
+        if bounds is None:
+            where_sql, params = "TRUE", []
+        else:
+            lon_min, lon_max, lat_min, lat_max = bounds
+            where_sql = "longitude >= ? AND longitude <= ? AND latitude >= ? AND latitude <= ?"
+            params = [lon_min, lon_max, lat_min, lat_max]
+        # Filters on the hive partition column prune whole files
+        if start_year:
+            where_sql += " AND year >= ?"
+            params.append(int(start_year))
+        if end_year:
+            where_sql += " AND year <= ?"
+            params.append(int(end_year))
+        return where_sql, params
+
+    def monthly_aggregates(self, bounds, start_year=None, end_year=None) -> List[Dict]:
+        stale = self._stale()
+        if stale:
+            return stale.monthly_aggregates(bounds, start_year, end_year)
+        where_sql, params = self._filter(bounds, start_year, end_year)
+        sql = f"""
+            SELECT CAST(year AS INTEGER) AS year, month, {aggregate_columns_sql()}
+            FROM {self._source()}
+            WHERE {where_sql}
+            GROUP BY year, month
+            ORDER BY year ASC, month ASC
+        """
+        cur = self._cursor()
+        try:
+            rows = cur.execute(sql, params).fetchall()
+        finally:
+            cur.close()
+        return rows_to_monthly(rows)
+
+    def monthly_aggregates_multi(self, bounds_list, start_year=None, end_year=None) -> List[List[Dict]]:
+        stale = self._stale()
+        if stale:
+            return stale.monthly_aggregates_multi(bounds_list, start_year, end_year)
+        flags_sql, flag_params, boxes_sql, box_params = region_flags_sql(bounds_list)
+        where_sql, year_params = self._filter(None, start_year, end_year)
+        flag_names = ", ".join(f"r{i}" for i in range(len(bounds_list)))
+        sql = f"""
+            SELECT CAST(year AS INTEGER) AS year, month, {flags_sql}, {aggregate_columns_sql()}
+            FROM {self._source()}
+            WHERE ({boxes_sql}) AND {where_sql}
+            GROUP BY year, month, {flag_names}
+        """
+        cur = self._cursor()
+        try:
+            rows = cur.execute(sql, flag_params + box_params + year_params).fetchall()
+        finally:
+            cur.close()
+        return split_multi(rows, len(bounds_list))
+
+    def points(self, bounds, start_year=None, end_year=None):
+        stale = self._stale()
+        if stale:
+            return stale.points(bounds, start_year, end_year)
+        where_sql, params = self._filter(bounds, start_year, end_year)
+        cur = self._cursor()
+        try:
+            return points_from_rows(cur.execute(points_sql(where_sql, self._source()), params).fetchall())
+        finally:
+            cur.close()
+
+    def export_pages(self, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+        # Keyset pagination needs the row store's (time, id) index
+        return keyset_pages(self.catalog_path, bounds, start_year, end_year, after, page_rows)
+
+    def preview(self, bounds, start_year=None, end_year=None, limit: int = 100) -> List[Dict]:
+        stale = self._stale()
+        if stale:
+            return stale.preview(bounds, start_year, end_year, limit)
+        where_sql, params = self._filter(bounds, start_year, end_year)
+        sql = f"""
+            SELECT time, latitude, longitude, temperature, salinity
+            FROM {self._source()}
+            WHERE {where_sql}
+            ORDER BY time DESC
+            LIMIT {int(limit)}
+        """
+        cur = self._cursor()
+        try:
+            rows = cur.execute(sql, params).fetchall()
+            names = [column[0] for column in cur.description]
+        finally:
+            cur.close()
+        return [dict(zip(names, row)) for row in rows]
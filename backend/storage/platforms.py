@@ -0,0 +1,208 @@
+"""
+Per-float trajectories and station histories
+
+A float surfaces at one position and time and reports a profile of readings
+below it; that (platform_number, time) group is a station. Stations are
+summarized at ingest into argo_platform_stations, clustered on
+(platform_number, time), so a float's whole history is one contiguous range
+read instead of an idx_platform lookup per row.
+
+  trajectory   station positions in time order, optionally simplified with
+               Douglas-Peucker (tolerance in degrees; longitudes are unwrapped
+               first so a float crossing the antimeridian is not cut short)
+  series       per-station levels, pressure range and temperature/salinity
+               mean/min/max
+"""
+
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .aggregates import PARAMETERS
+
+PREFIXES = {"temperature": "temp", "salinity": "sal"}
+
+STATIONS_SCHEMA = """
+    CREATE TABLE argo_platform_stations (
+        platform_number TEXT NOT NULL,
+        time            TEXT NOT NULL,
+        latitude        REAL NOT NULL,
+        longitude       REAL NOT NULL,
+        levels          INTEGER NOT NULL,
+        pres_min        REAL,
+        pres_max        REAL,
+        temp_count      INTEGER NOT NULL,
+        temp_mean       REAL,
+        temp_min        REAL,
+        temp_max        REAL,
+        sal_count       INTEGER NOT NULL,
+        sal_mean        REAL,
+        sal_min         REAL,
+        sal_max         REAL,
+        PRIMARY KEY (platform_number, time)
+    ) WITHOUT ROWID
+"""
+
+# Per-station state while building: sums of levels, latitude, longitude and a
+# (count, sum) pair per value column, plus a (min, max) pair per value column
+VALUE_COLUMNS = ("pressure",) + PARAMETERS
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class StationBuilder:
+    """Derived-table builder (see storage.derived) for argo_platform_stations"""
+
+    name = "platform_stations"
+    tables = ("argo_platform_stations",)
+    schema = STATIONS_SCHEMA
+    # Station partials are re-reduced once this many un-merged ones pile up
+    COMPACT_AT = 1 << 20
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=str)
+        self.sums = np.zeros((0, 3 + 2 * len(VALUE_COLUMNS)))
+        self.extremes = np.zeros((0, 2 * len(VALUE_COLUMNS)))
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        platforms = np.asarray(chunk["platform_number"])
+        known = np.array([platform is not None and platform == platform for platform in platforms], dtype=bool)
+        if not known.any():
+            return
+        keys = np.char.add(np.char.add(platforms[known].astype(str), "|"), np.asarray(chunk["time"], dtype=str)[known])
+        sums = [np.ones(int(known.sum())), np.asarray(chunk["latitude"])[known], np.asarray(chunk["longitude"])[known]]
+        extremes = []
+        for name in VALUE_COLUMNS:
+            values = np.asarray(chunk[name], dtype=np.float64)[known]
+            valid = ~np.isnan(values)
+            sums += [valid.astype(np.float64), np.where(valid, values, 0.0)]
+            extremes += [np.where(valid, values, np.inf), np.where(valid, values, -np.inf)]
+        self._pending.append(self._reduce(keys, np.column_stack(sums), np.column_stack(extremes)))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    @staticmethod
+    def _reduce(keys, sums, extremes):
+        unique, index = np.unique(keys, return_inverse=True)
+        reduced = np.column_stack([
+            np.bincount(index, weights=sums[:, column], minlength=len(unique)) for column in range(sums.shape[1])
+        ])
+        lows = np.full((len(unique), extremes.shape[1] // 2), np.inf)
+        highs = np.full((len(unique), extremes.shape[1] // 2), -np.inf)
+        np.minimum.at(lows, index, extremes[:, 0::2])
+        np.maximum.at(highs, index, extremes[:, 1::2])
+        interleaved = np.empty((len(unique), extremes.shape[1]))
+        interleaved[:, 0::2], interleaved[:, 1::2] = lows, highs
+        return unique, reduced, interleaved
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = [(self.keys, self.sums, self.extremes)] + self._pending
+        self.keys, self.sums, self.extremes = self._reduce(
+            *(np.concatenate([part[i] for part in parts]) for i in range(3))
+        )
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        levels = self.sums[:, 0]
+        columns = [self.sums[:, 1] / levels, self.sums[:, 2] / levels, levels.astype(np.int64)]
+        for i, name in enumerate(VALUE_COLUMNS):
+            counts, totals = self.sums[:, 3 + 2 * i], self.sums[:, 4 + 2 * i]
+            present = counts > 0
+            lows = np.where(present, self.extremes[:, 2 * i], np.nan)
+            highs = np.where(present, self.extremes[:, 2 * i + 1], np.nan)
+            if name == "pressure":
+                columns += [lows, highs]
+            else:
+                columns += [counts.astype(np.int64), np.where(present, totals / np.maximum(counts, 1), np.nan),
+                            lows, highs]
+        rows = sorted(
+            key.split("|", 1) + [None if value != value else value for value in values]
+            for key, values in zip(self.keys.tolist(), zip(*(column.tolist() for column in columns)))
+        )
+        conn.executemany(f"INSERT INTO argo_platform_stations VALUES ({', '.join('?' * 15)})", rows)
+
+
+# ── Path simplification ────────────────────────────────────────────────────────
+def unwrap_longitudes(lons: np.ndarray) -> np.ndarray:
+    """Continuous longitudes: jumps over the antimeridian become steps past +-180"""
+    return np.degrees(np.unwrap(np.radians(lons)))
+
+
+def douglas_peucker(xs: np.ndarray, ys: np.ndarray, tolerance: float) -> np.ndarray:
+    """Indexes of the points kept by Douglas-Peucker simplification (iterative, vectorized per segment)"""
+    n = len(xs)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        px, py = xs[first + 1:last] - xs[first], ys[first + 1:last] - ys[first]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(px * dy - py * dx) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def read_stations(db_path: str, platform: str, columns: str, start_year=None, end_year=None) -> Optional[List[tuple]]:
+    """One range read of a platform's stations in time order; None if the table is missing"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return conn.execute(f"""
+            SELECT {columns} FROM argo_platform_stations
+            WHERE platform_number = ? AND time >= ? AND time < ?
+            ORDER BY time
+        """, (platform, f"{int(start_year or 0):04d}", f"{int(end_year or 9998) + 1:04d}")).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def trajectory(db_path: str, platform: str, start_year=None, end_year=None, tolerance: float = 0.0) -> Optional[Dict]:
+    """Station positions as [time, latitude, longitude] rows; None if the table is missing"""
+    rows = read_stations(db_path, platform, "time, latitude, longitude", start_year, end_year)
+    if rows is None:
+        return None
+    if not rows:
+        return {"points": [], "count": 0}
+    times, lats, lons = zip(*rows)
+    lats, lons = np.array(lats), np.array(lons)
+    kept = douglas_peucker(unwrap_longitudes(lons), lats, tolerance)
+    return {
+        "points": [[times[i], lats[i], lons[i]] for i in kept.tolist()],
+        "count": len(rows),
+        "simplified": len(kept) < len(rows),
+    }
+
+
+SERIES_FIELDS = ("time", "latitude", "longitude", "levels", "pres_min", "pres_max") + tuple(
+    f"{PREFIXES[parameter]}_{field}" for parameter in PARAMETERS for field in ("count", "mean", "min", "max")
+)
+
+
+def series(db_path: str, platform: str, start_year=None, end_year=None) -> Optional[Dict]:
+    """Per-station summary rows in time order; None if the table is missing"""
+    rows = read_stations(db_path, platform, ", ".join(SERIES_FIELDS), start_year, end_year)
+    if rows is None:
+        return None
+    return {"fields": list(SERIES_FIELDS), "stations": [list(row) for row in rows], "count": len(rows)}
@@ -0,0 +1,242 @@
+"""
+Depth-resolved aggregates
+
+Readings are assigned to standard pressure bins at ingest (PRESSURE_LEVELS,
+dbar; the last bin is open-ended, readings without a pressure have no bin)
+and rolled up per sketch-grid cell, month and bin into argo_depth_rollup,
+one partial (count, sum, m2, min, max) per parameter, so surface and
+2000 dbar readings are never averaged together unless asked for.
+
+A depth filter selects whole bins: it is widened to the edges of the bins
+it overlaps, and the response reports the range actually used. Queries sum
+the rollup rows of the cells entirely inside a box and reduce the edge-strip
+rows on the fly (see sketches.region_points); polygons reduce all region rows.
+
+  depth_monthly()   monthly rows, as QueryEngine.monthly_aggregates
+  depth_profile()   one row per pressure bin: the vertical mean profile
+"""
+
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .aggregates import PARAMETERS, finalize, make_partial, monthly_row, reduce_partials
+from .engines import year_months
+from .sketches import read_cells, region_points, sketch_cells
+
+PRESSURE_LEVELS = (0, 10, 20, 30, 50, 75, 100, 125, 150, 200, 250, 300, 400, 500,
+                   600, 700, 800, 900, 1000, 1200, 1400, 1600, 1800, 2000)
+
+PREFIXES = {"temperature": "temp", "salinity": "sal"}
+
+ROLLUP_SCHEMA = """
+    CREATE TABLE argo_depth_rollup (
+        cy         INTEGER NOT NULL,
+        cx         INTEGER NOT NULL,
+        year       INTEGER NOT NULL,
+        month      INTEGER NOT NULL,
+        pbin       INTEGER NOT NULL,
+        temp_count INTEGER NOT NULL,
+        temp_sum   REAL NOT NULL,
+        temp_m2    REAL NOT NULL,
+        temp_min   REAL,
+        temp_max   REAL,
+        sal_count  INTEGER NOT NULL,
+        sal_sum    REAL NOT NULL,
+        sal_m2     REAL NOT NULL,
+        sal_min    REAL,
+        sal_max    REAL,
+        PRIMARY KEY (cy, cx, year, month, pbin)
+    ) WITHOUT ROWID
+"""
+PARTIAL_COLUMNS = ", ".join(
+    f"{PREFIXES[parameter]}_{field}" for parameter in PARAMETERS for field in ("count", "sum", "m2", "min", "max")
+)
+
+# Key layout, low to high bits: pbin, cx, cy, year*12+month
+BIN_BITS = 5
+CELL_BITS = 7
+
+
+def pressure_bin(pressure) -> np.ndarray:
+    """Standard-level bin per reading; -1 where the pressure is missing"""
+    pressure = np.asarray(pressure, dtype=np.float64)
+    bins = np.searchsorted(PRESSURE_LEVELS, np.maximum(pressure, 0.0), side="right") - 1
+    return np.where(np.isnan(pressure), -1, bins).astype(np.int64)
+
+
+def depth_bins(pressure_min=None, pressure_max=None) -> Tuple[int, int]:
+    """Inclusive (first, last) bins overlapping [pressure_min, pressure_max]"""
+    first = int(pressure_bin([pressure_min or 0.0])[0])
+    if pressure_max is None:
+        return first, len(PRESSURE_LEVELS) - 1
+    if pressure_min is not None and float(pressure_max) < float(pressure_min):
+        raise ValueError("pressure_max must not be below pressure_min")
+    # A maximum on a level edge does not reach into the bin starting there
+    last = int(np.searchsorted(PRESSURE_LEVELS, float(pressure_max), side="left")) - 1
+    return first, max(first, last)
+
+
+def bin_range(first: int, last: int) -> Dict:
+    top = PRESSURE_LEVELS[last + 1] if last + 1 < len(PRESSURE_LEVELS) else None
+    return {"pressure_min": PRESSURE_LEVELS[first], "pressure_max": top}
+
+
+def point_partials(values: np.ndarray):
+    """Per-reading partials (count, sum, m2, min, max) for reduce_partials"""
+    valid = ~np.isnan(values)
+    return (valid.astype(np.float64), np.where(valid, values, 0.0), np.zeros(len(values)),
+            np.where(valid, values, np.inf), np.where(valid, values, -np.inf))
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class DepthRollupBuilder:
+    """Derived-table builder (see storage.derived) for per-cell, per-month, per-pressure-bin partials"""
+
+    name = "depth_rollup"
+    tables = ("argo_depth_rollup",)
+    schema = ROLLUP_SCHEMA
+    # Partials are re-reduced once this many un-merged keys pile up
+    COMPACT_AT = 1 << 20
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.partials = {parameter: tuple(np.zeros(0) for _ in range(5)) for parameter in PARAMETERS}
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        bins = pressure_bin(chunk["pressure"])
+        binned = bins >= 0
+        if not binned.any():
+            return
+        year_month = year_months(np.asarray(chunk["time"], dtype=str)[binned])
+        months = year_month // 100 * 12 + year_month % 100 - 1
+        cx, cy = sketch_cells(np.asarray(chunk["longitude"])[binned], np.asarray(chunk["latitude"])[binned])
+        keys = (((months << CELL_BITS | cy) << CELL_BITS | cx) << BIN_BITS) | bins[binned]
+        part = {
+            parameter: point_partials(np.asarray(chunk[parameter], dtype=np.float64)[binned])
+            for parameter in PARAMETERS
+        }
+        self._pending.append(self._reduce(keys, part))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    @staticmethod
+    def _reduce(keys, partials):
+        reduced = {parameter: reduce_partials(keys, *partials[parameter]) for parameter in PARAMETERS}
+        return reduced[PARAMETERS[0]][0], {parameter: reduced[parameter][1:] for parameter in PARAMETERS}
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = [(self.keys, self.partials)] + self._pending
+        keys = np.concatenate([part[0] for part in parts])
+        partials = {
+            parameter: tuple(np.concatenate([part[1][parameter][i] for part in parts]) for i in range(5))
+            for parameter in PARAMETERS
+        }
+        self.keys, self.partials = self._reduce(keys, partials)
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        keys = self.keys
+        bins = keys & ((1 << BIN_BITS) - 1)
+        cx = (keys >> BIN_BITS) & ((1 << CELL_BITS) - 1)
+        cy = (keys >> (BIN_BITS + CELL_BITS)) & ((1 << CELL_BITS) - 1)
+        months = keys >> (BIN_BITS + 2 * CELL_BITS)
+        # Keys sort month-major; primary-key order keeps inserts append-only
+        order = np.lexsort((bins, months, cx, cy))
+        columns = [cy, cx, months // 12, months % 12 + 1, bins]
+        for parameter in PARAMETERS:
+            counts, sums, m2s, lows, highs = self.partials[parameter]
+            present = counts > 0
+            columns += [counts.astype(np.int64), sums, m2s,
+                        np.where(present, lows, np.nan), np.where(present, highs, np.nan)]
+        rows = zip(*(column[order].tolist() for column in columns))
+        # NaN min/max (no reading of that parameter) are stored as NULL
+        conn.executemany(
+            f"INSERT INTO argo_depth_rollup VALUES ({', '.join('?' * len(columns))})",
+            ([None if value != value else value for value in row] for row in rows),
+        )
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def _region_partials(engine, area, start_year, end_year, bins, by_level: bool):
+    """
+    Merged partials of a region keyed by YYYYMM (or by pressure bin), as
+    (keys, {parameter: (counts, sums, m2s, mins, maxs)}); None when the
+    rollup table has not been built.
+    """
+    first, last = bins
+    inner, points = region_points(engine, area, start_year, end_year)
+    point_bins = pressure_bin(points["pressure"])
+    keep = (point_bins >= first) & (point_bins <= last)
+    point_keys = point_bins[keep] if by_level else year_months(points["time"][keep])
+    keys = [point_keys]
+    parts = {parameter: [point_partials(points[parameter][keep])] for parameter in PARAMETERS}
+
+    if inner is not None:
+        key = "pbin" if by_level else "year * 100 + month"
+        rows = read_cells(engine.catalog_path, f"""
+            SELECT {key}, {PARTIAL_COLUMNS} FROM argo_depth_rollup
+            WHERE pbin BETWEEN ? AND ? AND cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ?
+        """, inner, start_year, end_year, (first, last))
+        if rows is None:
+            return None
+        stored = np.array(rows, dtype=np.float64).reshape(-1, 1 + 5 * len(PARAMETERS))
+        keys.append(stored[:, 0].astype(np.int64))
+        for i, parameter in enumerate(PARAMETERS):
+            counts, sums, m2s, lows, highs = (stored[:, 1 + 5 * i + j] for j in range(5))
+            present = counts > 0
+            parts[parameter].append((counts, sums, m2s, np.where(present, lows, np.inf),
+                                     np.where(present, highs, -np.inf)))
+
+    keys = np.concatenate(keys)
+    reduced = {}
+    for parameter in PARAMETERS:
+        columns = [np.concatenate([part[i] for part in parts[parameter]]) for i in range(5)]
+        unique, *reduced[parameter] = reduce_partials(keys, *columns)
+    return unique, reduced
+
+
+def _partial(reduced, parameter: str, i: int) -> Dict:
+    return make_partial(*(float(series[i]) for series in reduced[parameter]))
+
+
+def depth_monthly(engine, area, start_year=None, end_year=None, bins=None) -> Optional[List[Dict]]:
+    """Monthly rows restricted to pressure bins (first, last); None if the rollup is missing"""
+    result = _region_partials(engine, area, start_year, end_year, bins or depth_bins(), by_level=False)
+    if result is None:
+        return None
+    keys, reduced = result
+    monthly = []
+    for i, key in enumerate(keys.tolist()):
+        partials = {parameter: _partial(reduced, parameter, i) for parameter in PARAMETERS}
+        if any(partial["count"] for partial in partials.values()):
+            monthly.append(monthly_row(key // 100, key % 100, partials))
+    return monthly
+
+
+def depth_profile(engine, area, start_year=None, end_year=None, bins=None) -> Optional[List[Dict]]:
+    """One row per occupied pressure bin, top to bottom; None if the rollup is missing"""
+    result = _region_partials(engine, area, start_year, end_year, bins or depth_bins(), by_level=True)
+    if result is None:
+        return None
+    keys, reduced = result
+    levels = []
+    for i, level in enumerate(keys.tolist()):
+        row = bin_range(level, level)
+        for parameter in PARAMETERS:
+            stats = finalize(_partial(reduced, parameter, i))
+            row[parameter] = {
+                "count": stats["count"],
+                "mean": round(stats["mean"], 3) if stats["count"] else None,
+                "std": round(stats["std"], 3) if stats["count"] else None,
+            }
+        if any(row[parameter]["count"] for parameter in PARAMETERS):
+            levels.append(row)
+    return levels
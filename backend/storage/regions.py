@@ -0,0 +1,22 @@
+"""
+Region definitions shared by the API, ingest scripts and catalog
+"""
+
+# Region geographic bounds (lon_min, lon_max, lat_min, lat_max)
+REGION_BOUNDS = {
+    "Indian Ocean": (20, 120, -60, 23),
+    "Pacific Ocean": (120, 180, -60, 60),
+    "Atlantic Ocean": (-100, 0, -60, 60),
+    "Arctic Ocean": (-180, 180, 60, 90),
+}
+
+
+def bounds_sql(bounds) -> tuple:
+    """Return (sql, params) for a (lon_min, lon_max, lat_min, lat_max) box filter"""
+    lon_min, lon_max, lat_min, lat_max = bounds
+    # SQLite keeps no range statistics for idx_longitude/idx_latitude and always
+    # walks longitude; for boxes narrower in latitude (a polar cap, an edge
+    # strip) a unary + takes longitude out of the running so latitude is used
+    lon = "+longitude" if (lat_max - lat_min) / 180.0 < (lon_max - lon_min) / 360.0 else "longitude"
+    sql = f"{lon} >= ? AND {lon} <= ? AND latitude >= ? AND latitude <= ?"
+    return sql, [lon_min, lon_max, lat_min, lat_max]
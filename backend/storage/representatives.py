@@ -0,0 +1,174 @@
+"""
+Spatially representative preview
+
+The default preview is the latest rows in the region, which needs a sort
+over the whole filtered set and clusters on whichever floats reported last.
+Here each grid cell keeps one representative observation per year (its
+latest), at several resolutions, maintained at ingest as a derived table.
+
+spread_preview() picks the coarsest resolution that fills the requested
+number of points, takes the newest representative per occupied cell and,
+if there are still too many cells, keeps an evenly spaced subset - one
+indexed lookup on a small table instead of a sort over millions of rows.
+"""
+
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Cell sizes in degrees, coarse to fine; the level is the index in this tuple
+REP_CELL_DEG = (8.0, 4.0, 2.0, 1.0, 0.5)
+
+REPS_SCHEMA = """
+    CREATE TABLE argo_cell_reps (
+        level       INTEGER NOT NULL,
+        cy          INTEGER NOT NULL,
+        cx          INTEGER NOT NULL,
+        year        INTEGER NOT NULL,
+        time        TEXT NOT NULL,
+        latitude    REAL NOT NULL,
+        longitude   REAL NOT NULL,
+        temperature REAL,
+        salinity    REAL,
+        PRIMARY KEY (level, cy, cx, year)
+    ) WITHOUT ROWID
+"""
+
+FIELDS = ("time", "latitude", "longitude", "temperature", "salinity")
+
+
+def rep_cells(lons, lats, level: int):
+    deg = REP_CELL_DEG[level]
+    cx = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / deg).astype(np.int64)
+    cy = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / deg).astype(np.int64)
+    return cx, cy
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class RepresentativeBuilder:
+    """Derived-table builder (see storage.derived) keeping the latest row per cell and year"""
+
+    name = "representatives"
+    tables = ("argo_cell_reps",)
+    schema = REPS_SCHEMA
+    COMPACT_AT = 1 << 20
+
+    def __init__(self):
+        self.levels = [None] * len(REP_CELL_DEG)   # per level: (keys, {field: array})
+        self._pending = [[] for _ in REP_CELL_DEG]
+        self._pending_rows = 0
+
+    @staticmethod
+    def _latest(keys, fields):
+        """Keep the newest row for every key"""
+        order = np.lexsort((fields["time"], keys))
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        picked = order[last]
+        return keys[last], {name: values[picked] for name, values in fields.items()}
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        times = np.asarray(chunk["time"], dtype="U20")
+        if len(times) == 0:
+            return
+        years = times.astype("U4").astype(np.int64)
+        fields = {
+            "time": times,
+            "latitude": np.asarray(chunk["latitude"], dtype=np.float64),
+            "longitude": np.asarray(chunk["longitude"], dtype=np.float64),
+            "temperature": np.asarray(chunk["temperature"], dtype=np.float64),
+            "salinity": np.asarray(chunk["salinity"], dtype=np.float64),
+        }
+        for level in range(len(REP_CELL_DEG)):
+            cx, cy = rep_cells(fields["longitude"], fields["latitude"], level)
+            keys = (years << 32) | (cy << 16) | cx
+            self._pending[level].append(self._latest(keys, fields))
+        self._pending_rows += len(times)
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    def _compact(self):
+        for level, parts in enumerate(self._pending):
+            if self.levels[level] is not None:
+                parts = [self.levels[level]] + parts
+            if not parts:
+                continue
+            keys = np.concatenate([part[0] for part in parts])
+            fields = {name: np.concatenate([part[1][name] for part in parts]) for name in FIELDS}
+            self.levels[level] = self._latest(keys, fields)
+        self._pending = [[] for _ in REP_CELL_DEG]
+        self._pending_rows = 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        for level, state in enumerate(self.levels):
+            if state is None:
+                continue
+            keys, fields = state
+            nullable = lambda values: [None if np.isnan(v) else v for v in values.tolist()]
+            conn.executemany(
+                "INSERT INTO argo_cell_reps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip([level] * len(keys), ((keys >> 16) & 0xFFFF).tolist(), (keys & 0xFFFF).tolist(),
+                    (keys >> 32).tolist(), fields["time"].tolist(), fields["latitude"].tolist(),
+                    fields["longitude"].tolist(), nullable(fields["temperature"]), nullable(fields["salinity"])),
+            )
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def cell_range(bounds, level: int):
+    lon_min, lon_max, lat_min, lat_max = bounds
+    cx_lo, cy_lo = (int(v[0]) for v in rep_cells([lon_min], [lat_min], level))
+    cx_hi, cy_hi = (int(v[0]) for v in rep_cells([lon_max], [lat_max], level))
+    return cx_lo, cx_hi, cy_lo, cy_hi
+
+
+def _cells(conn: sqlite3.Connection, level: int, bounds, start_year, end_year) -> List[tuple]:
+    lon_min, lon_max, lat_min, lat_max = bounds
+    cx_lo, cx_hi, cy_lo, cy_hi = cell_range(bounds, level)
+    sql = """
+        SELECT cy, cx, MAX(time), latitude, longitude, temperature, salinity
+        FROM argo_cell_reps
+        WHERE level = ? AND cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ?
+          AND longitude >= ? AND longitude <= ? AND latitude >= ? AND latitude <= ?
+        GROUP BY cy, cx
+        ORDER BY cy, cx
+    """
+    # SQLite returns the other bare columns from the row holding MAX(time)
+    return conn.execute(sql, (
+        level, cy_lo, cy_hi, cx_lo, cx_hi, int(start_year or 0), int(end_year or 9999),
+        lon_min, lon_max, lat_min, lat_max,
+    )).fetchall()
+
+
+def spread_preview(db_path: str, bounds, start_year=None, end_year=None, limit: int = 100,
+                   contains=None) -> Optional[List[Dict]]:
+    """
+    Up to `limit` rows spread over the region, one per occupied cell, newest
+    first. `contains(lons, lats)` optionally refines a polygon region.
+    Returns None when the representatives table has not been built.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cells = []
+        finest = len(REP_CELL_DEG) - 1
+        for level in range(len(REP_CELL_DEG)):
+            cx_lo, cx_hi, cy_lo, cy_hi = cell_range(bounds, level)
+            if level < finest and (cx_hi - cx_lo + 1) * (cy_hi - cy_lo + 1) < limit:
+                continue  # too few cells at this size to ever fill the preview
+            cells = _cells(conn, level, bounds, start_year, end_year)
+            if contains is not None and cells:
+                keep = contains(np.array([row[4] for row in cells]), np.array([row[3] for row in cells]))
+                cells = [row for row, inside in zip(cells, keep) if inside]
+            if len(cells) >= limit:
+                break
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+    if len(cells) > limit:
+        cells = [cells[i] for i in np.linspace(0, len(cells) - 1, limit).round().astype(int)]
+    records = [dict(zip(FIELDS, row[2:])) for row in cells]
+    records.sort(key=lambda record: record["time"], reverse=True)
+    return records
@@ -0,0 +1,308 @@
+"""
+Stratified samples for approximate queries
+
+Strata are STRATUM_DEG grid cells x year, so any region (named box, custom
+bbox or polygon) is a union of whole or partial strata. Every row draws a
+uniform key at ingest; the sample of a stratum at a given rate is its rows
+with the smallest keys - at least MIN_PER_STRATUM of them, so sparse strata
+(polar cells, early years) stay represented. Given its size, that is a
+simple random sample of the stratum, and each sampled row stands for
+rows / sampled rows of its stratum.
+
+Rates are nested: a row in the 0.1% tier is also in the 1% tier, so one
+table holds both and `tier` records the sparsest tier a row belongs to.
+
+Confidence intervals use a delete-a-group jackknife: rows are spread over
+GROUPS random groups, every figure is recomputed with each group left out
+and the spread of those replicates gives its standard error. Sample
+min/max are reported as-is; extremes cannot be bounded from a sample.
+"""
+
+import os
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .aggregates import MOMENT_SHIFT, PARAMETERS, filter_years, monthly_row, shifted_m2, summarize, yearly_means
+from .engines import year_months
+
+SAMPLE_RATES = (0.01, 0.001)   # tier 0, tier 1
+STRATUM_DEG = 20.0
+MIN_PER_STRATUM = 10
+GROUPS = 20
+Z_95 = 1.96
+MIN_SAMPLE_ROWS = int(os.getenv("VELORA_APPROX_MIN_ROWS", "400"))
+
+SAMPLES_SCHEMA = """
+    CREATE TABLE argo_sample_strata (
+        tier    INTEGER NOT NULL,
+        cy      INTEGER NOT NULL,
+        cx      INTEGER NOT NULL,
+        year    INTEGER NOT NULL,
+        rows    INTEGER NOT NULL,
+        sampled INTEGER NOT NULL,
+        PRIMARY KEY (tier, cy, cx, year)
+    ) WITHOUT ROWID;
+    CREATE TABLE argo_samples (
+        cy          INTEGER NOT NULL,
+        cx          INTEGER NOT NULL,
+        year        INTEGER NOT NULL,
+        tier        INTEGER NOT NULL,
+        grp         INTEGER NOT NULL,
+        time        TEXT NOT NULL,
+        latitude    REAL NOT NULL,
+        longitude   REAL NOT NULL,
+        pressure    REAL,
+        temperature REAL,
+        salinity    REAL
+    );
+    CREATE INDEX idx_samples_cell ON argo_samples(cy, cx, year, tier)
+"""
+
+FIELDS = ("time", "latitude", "longitude", "pressure", "temperature", "salinity")
+
+
+def stratum_cells(lons, lats):
+    cx = np.floor((np.clip(np.asarray(lons, dtype=np.float64), -180.0, 179.999) + 180.0) / STRATUM_DEG)
+    cy = np.floor((np.clip(np.asarray(lats, dtype=np.float64), -90.0, 89.999) + 90.0) / STRATUM_DEG)
+    return cx.astype(np.int64), cy.astype(np.int64)
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class SampleBuilder:
+    """Derived-table builder (see storage.derived) for the stratified sample tiers"""
+
+    name = "samples"
+    tables = ("argo_sample_strata", "argo_samples")
+    schema = SAMPLES_SCHEMA
+    COMPACT_AT = 1 << 20
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+        self.counts: Dict[int, int] = {}
+        self.candidates = None            # (keys, draws, {field: array})
+        self._pending = []
+        self._pending_rows = 0
+
+    @staticmethod
+    def _ranks(keys, draws):
+        """Order by (key, draw) and the rank of every row inside its key"""
+        order = np.lexsort((draws, keys))
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.append(True, sorted_keys[1:] != sorted_keys[:-1]))
+        sizes = np.diff(np.append(starts, len(keys)))
+        return order, np.arange(len(keys)) - np.repeat(starts, sizes)
+
+    def _keep(self, keys, draws, fields):
+        # A row can only end up in a sample if its draw is under the densest
+        # rate or it is among the MIN_PER_STRATUM smallest draws seen so far
+        order, ranks = self._ranks(keys, draws)
+        keep = order[(draws[order] < SAMPLE_RATES[0]) | (ranks < MIN_PER_STRATUM)]
+        return keys[keep], draws[keep], {name: values[keep] for name, values in fields.items()}
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        times = np.asarray(chunk["time"], dtype="U20")
+        if len(times) == 0:
+            return
+        years = times.astype("U4").astype(np.int64)
+        cx, cy = stratum_cells(chunk["longitude"], chunk["latitude"])
+        keys = (years << 16) | (cy << 8) | cx
+        unique, counts = np.unique(keys, return_counts=True)
+        for key, count in zip(unique.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+
+        fields = {"time": times}
+        for name in FIELDS[1:]:
+            fields[name] = np.asarray(chunk[name], dtype=np.float64)
+        self._pending.append(self._keep(keys, self.rng.random(len(keys)), fields))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    def _compact(self):
+        parts = ([self.candidates] if self.candidates is not None else []) + self._pending
+        if parts:
+            self.candidates = self._keep(
+                np.concatenate([part[0] for part in parts]),
+                np.concatenate([part[1] for part in parts]),
+                {name: np.concatenate([part[2][name] for part in parts]) for name in FIELDS},
+            )
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        if self.candidates is None:
+            return
+        keys, draws, fields = self.candidates
+        order, ranks = self._ranks(keys, draws)
+        keys, draws = keys[order], draws[order]
+        fields = {name: values[order] for name, values in fields.items()}
+
+        tiers = np.zeros(len(keys), dtype=np.int64)
+        for tier, rate in enumerate(SAMPLE_RATES[1:], start=1):
+            tiers[(draws < rate) | (ranks < MIN_PER_STRATUM)] = tier
+        groups = (draws * (1 << 32)).astype(np.int64) % GROUPS
+
+        strata = []
+        for tier in range(len(SAMPLE_RATES)):
+            unique, sampled = np.unique(keys[tiers >= tier], return_counts=True)
+            strata.extend(
+                (tier, (key >> 8) & 0xFF, key & 0xFF, key >> 16, self.counts[key], n)
+                for key, n in zip(unique.tolist(), sampled.tolist())
+            )
+        conn.executemany("INSERT INTO argo_sample_strata VALUES (?, ?, ?, ?, ?, ?)", strata)
+
+        nullable = lambda values: [None if np.isnan(v) else v for v in values.tolist()]
+        conn.executemany(
+            "INSERT INTO argo_samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(((keys >> 8) & 0xFF).tolist(), (keys & 0xFF).tolist(), (keys >> 16).tolist(),
+                tiers.tolist(), groups.tolist(), fields["time"].tolist(), fields["latitude"].tolist(),
+                fields["longitude"].tolist(), nullable(fields["pressure"]),
+                nullable(fields["temperature"]), nullable(fields["salinity"])),
+        )
+
+
+# ── Estimation ─────────────────────────────────────────────────────────────────
+def read_sample(db_path: str, bounds, start_year=None, end_year=None, tier: int = 0) -> Optional[Dict]:
+    """Sampled rows in the box with their weights; None when the tables are missing"""
+    lon_min, lon_max, lat_min, lat_max = bounds
+    cx_lo, cy_lo = (int(v[0]) for v in stratum_cells([lon_min], [lat_min]))
+    cx_hi, cy_hi = (int(v[0]) for v in stratum_cells([lon_max], [lat_max]))
+    cells = (cy_lo, cy_hi, cx_lo, cx_hi, int(start_year or 0), int(end_year or 9999))
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # Read separately and joined below: as a SQL join every stratum would
+        # rescan its whole row of cells in the samples index
+        strata = conn.execute("""
+            SELECT cy, cx, year, CAST(rows AS REAL) / sampled FROM argo_sample_strata
+            WHERE tier = ? AND cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ?
+        """, (tier,) + cells).fetchall()
+        rows = conn.execute("""
+            SELECT time, latitude, longitude, temperature, salinity, grp, cy, cx, year FROM argo_samples
+            WHERE cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ? AND tier >= ?
+              AND longitude >= ? AND longitude <= ? AND latitude >= ? AND latitude <= ?
+        """, cells + (tier, lon_min, lon_max, lat_min, lat_max)).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+    weights = {(cy, cx, year): weight for cy, cx, year, weight in strata}
+    columns = list(zip(*rows)) or [[]] * 9
+    sample = {"time": np.array(columns[0], dtype="U20")}
+    for index, name in enumerate(("latitude", "longitude", "temperature", "salinity"), start=1):
+        sample[name] = np.array(columns[index], dtype=np.float64)
+    sample["group"] = np.array(columns[5], dtype=np.int64)
+    sample["weight"] = np.array([weights[key] for key in zip(*columns[6:9])], dtype=np.float64)
+    return sample
+
+
+def weighted_monthly(sample: Dict) -> List[List[Dict]]:
+    """
+    Monthly partials estimated from weighted sample rows: the full estimate
+    followed by one jackknife replicate per group (that group left out).
+    Counts, sums and (shifted) sums of squares are weighted totals, so every figure
+    derived from monthly rows works unchanged on the estimates.
+    """
+    keys, index = np.unique(year_months(sample["time"]), return_inverse=True)
+    cells = index * GROUPS + sample["group"]
+    size = len(keys) * GROUPS
+    weights = sample["weight"]
+
+    totals, extremes = {}, {}
+    for parameter in PARAMETERS:
+        values = sample[parameter]
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        shifted = np.where(valid, values - MOMENT_SHIFT[parameter], 0.0)
+        per_group = np.stack([
+            np.bincount(cells, weights=weights * valid, minlength=size),
+            np.bincount(cells, weights=weights * filled, minlength=size),
+            np.bincount(cells, weights=weights * shifted * shifted, minlength=size),
+        ]).reshape(3, len(keys), GROUPS)
+        full = per_group.sum(axis=2)
+        # Leaving group g out: rescale the remaining groups to the full total
+        replicates = (full[:, :, None] - per_group) * (GROUPS / (GROUPS - 1))
+        totals[parameter] = np.concatenate([full[:, :, None], replicates], axis=2)
+        lows, highs = np.full(len(keys), np.inf), np.full(len(keys), -np.inf)
+        np.minimum.at(lows, index[valid], values[valid])
+        np.maximum.at(highs, index[valid], values[valid])
+        extremes[parameter] = (lows, highs)
+
+    estimates = []
+    for replicate in range(GROUPS + 1):
+        monthly = []
+        for i, key in enumerate(keys.tolist()):
+            partials = {}
+            for parameter in PARAMETERS:
+                count, total, shifted_sumsq = totals[parameter][:, i, replicate]
+                low, high = extremes[parameter][0][i], extremes[parameter][1][i]
+                m2 = shifted_m2(count, total, shifted_sumsq, MOMENT_SHIFT[parameter])
+                partials[parameter] = (
+                    {"count": float(count), "sum": float(total), "m2": max(float(m2), 0.0),
+                     "min": float(low), "max": float(high)}
+                    if count > 0 else None
+                )
+            monthly.append(monthly_row(key // 100, key % 100, partials))
+        estimates.append(monthly)
+    return estimates
+
+
+def figures(monthly: List[Dict], parameter: str) -> Dict:
+    """The estimated figures an interval is reported for"""
+    stats = summarize(monthly, parameter)
+    years, values = yearly_means(monthly, parameter)
+    slope = float(np.polyfit(years, values, 1)[0]) if len(years) > 1 else 0.0
+    return {
+        "count": stats["count"], "mean": stats["mean"], "std": stats["std"], "trend_per_year": slope,
+        "yearly": dict(zip(years.astype(int).tolist(), values.tolist())),
+    }
+
+
+def jackknife_interval(estimate: float, replicates: List[float], digits: int = 2) -> Optional[List[float]]:
+    if len(replicates) < 2:
+        return None
+    replicates = np.asarray(replicates, dtype=np.float64)
+    n = len(replicates)
+    se = float(np.sqrt((n - 1) / n * np.sum((replicates - replicates.mean()) ** 2)))
+    return [round(estimate - Z_95 * se, digits), round(estimate + Z_95 * se, digits)]
+
+
+def confidence_intervals(estimates: List[List[Dict]], parameter: str) -> Dict:
+    full, replicates = figures(estimates[0], parameter), [figures(m, parameter) for m in estimates[1:]]
+    intervals = {
+        name: jackknife_interval(full[name], [rep[name] for rep in replicates], digits)
+        for name, digits in (("count", 0), ("mean", 2), ("std", 2), ("trend_per_year", 4))
+    }
+    intervals["yearly"] = [
+        {"year": year, "interval": jackknife_interval(
+            value, [rep["yearly"][year] for rep in replicates if year in rep["yearly"]])}
+        for year, value in full["yearly"].items()
+    ]
+    return intervals
+
+
+def approximate_monthly(db_path: str, area, parameter: str, start_year=None, end_year=None,
+                        min_rows: int = MIN_SAMPLE_ROWS):
+    """
+    (estimates, info) from the sparsest tier holding at least `min_rows`
+    sampled readings of `parameter` inside the area, or (None, reason) when
+    no tier does (the caller then runs the exact query).
+    """
+    from .geometry import region_contains
+
+    for tier in reversed(range(len(SAMPLE_RATES))):
+        sample = read_sample(db_path, area.bounds, start_year, end_year, tier)
+        if sample is None:
+            return None, "sample tables not built"
+        if not area.is_box:
+            keep = region_contains(area, sample["longitude"], sample["latitude"])
+            sample = {name: values[keep] for name, values in sample.items()}
+        readings = int((~np.isnan(sample[parameter])).sum())
+        if readings >= min_rows:
+            estimates = weighted_monthly(sample)
+            return [filter_years(monthly, start_year, end_year) for monthly in estimates], {
+                "tier": tier, "rate": SAMPLE_RATES[tier], "sample_rows": readings, "sample": sample,
+            }
+    return None, f"fewer than {min_rows} sampled readings"
@@ -0,0 +1,146 @@
+"""
+Time-partitioned storage: one SQLite file per year
+
+data/shards/argo_<year>.db each hold an argo_data table for a single year, and
+data/shards/catalog.db holds the merged metadata catalog. Queries prune shards
+by year range and fan the per-shard aggregates out across a thread pool
+(sqlite3 releases the GIL while a statement runs), then merge the partials.
+Loading a new year's data only creates or replaces that year's file.
+"""
+
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .aggregates import merge_monthly
+from .catalog import empty_summary, merge_summaries, read_catalog, summary_from_catalog, write_catalog
+from .db import SHARD_DIR, connect
+from .derived import copy_derived
+from .engines import (
+    QueryEngine, concat_points, filter_sql, keyset_pages, monthly_multi_sql, monthly_sql, points_from_rows, points_sql,
+    preview_sql, region_flags_sql, rows_to_monthly, split_multi,
+)
+
+SHARD_PATTERN = re.compile(r"^argo_(\d{4})\.db$")
+CATALOG_NAME = "catalog.db"
+
+
+def shard_path(year: int, shard_dir: str = SHARD_DIR) -> str:
+    return os.path.join(shard_dir, f"argo_{int(year)}.db")
+
+
+def shard_years(shard_dir: str = SHARD_DIR) -> List[int]:
+    """Years that have a shard file, ascending"""
+    if not os.path.isdir(shard_dir):
+        return []
+    years = []
+    for name in os.listdir(shard_dir):
+        match = SHARD_PATTERN.match(name)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def prune_years(years: List[int], start_year=None, end_year=None) -> List[int]:
+    return [
+        year for year in years
+        if (not start_year or year >= int(start_year))
+        and (not end_year or year <= int(end_year))
+    ]
+
+
+def rebuild_shard_catalog(shard_dir: str = SHARD_DIR, source: str = "shards", ingested: bool = False) -> int:
+    """
+    Merge the per-shard catalogs and derived tables into shards/catalog.db.
+    Returns the new data version.
+    """
+    summaries = []
+    for year in shard_years(shard_dir):
+        conn = sqlite3.connect(shard_path(year, shard_dir))
+        try:
+            catalog = read_catalog(conn)
+        finally:
+            conn.close()
+        summaries.append(summary_from_catalog(catalog) if catalog else empty_summary())
+
+    conn = sqlite3.connect(os.path.join(shard_dir, CATALOG_NAME))
+    try:
+        copy_derived(conn, [shard_path(year, shard_dir) for year in shard_years(shard_dir)])
+        return write_catalog(conn, merge_summaries(summaries), source, ingested=ingested)
+    finally:
+        conn.close()
+
+
+class ShardedEngine(QueryEngine):
+    """Per-year SQLite shards queried in parallel"""
+
+    name = "sharded"
+
+    def __init__(self, shard_dir: str = SHARD_DIR, max_workers: int = None):
+        self.shard_dir = shard_dir
+        self.catalog_path = os.path.join(shard_dir, CATALOG_NAME)
+        self.max_workers = max_workers or int(
+            os.getenv("VELORA_SHARD_WORKERS", str(min(8, os.cpu_count() or 1)))
+        )
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="velora-shard")
+
+    def shards_for(self, start_year=None, end_year=None) -> List[int]:
+        """Years whose shard overlaps the requested range (partition pruning)"""
+        return prune_years(shard_years(self.shard_dir), start_year, end_year)
+
+    def _query_shard(self, year: int, sql: str, params: List):
+        # Shards are opened on demand; each worker uses its own connection
+        conn = connect(shard_path(year, self.shard_dir))
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def monthly_aggregates(self, bounds, start_year=None, end_year=None) -> List[Dict]:
+        # Every row in a pruned shard is inside the year range, so only the box is filtered
+        where_sql, params = filter_sql(bounds)
+        sql = monthly_sql(where_sql)
+        years = self.shards_for(start_year, end_year)
+        partials = self._pool.map(lambda year: rows_to_monthly(self._query_shard(year, sql, params)), years)
+        return merge_monthly(partials)
+
+    def monthly_aggregates_multi(self, bounds_list, start_year=None, end_year=None) -> List[List[Dict]]:
+        flags_sql, flag_params, boxes_sql, box_params = region_flags_sql(bounds_list)
+        sql = monthly_multi_sql(flags_sql, boxes_sql, len(bounds_list))
+        params = flag_params + box_params
+        years = self.shards_for(start_year, end_year)
+        per_shard = list(self._pool.map(
+            lambda year: split_multi(self._query_shard(year, sql, params), len(bounds_list)), years
+        ))
+        return [merge_monthly(shard[i] for shard in per_shard) for i in range(len(bounds_list))]
+
+    def points(self, bounds, start_year=None, end_year=None):
+        where_sql, params = filter_sql(bounds)
+        sql = points_sql(where_sql)
+        years = self.shards_for(start_year, end_year)
+        return concat_points(self._pool.map(lambda year: points_from_rows(self._query_shard(year, sql, params)), years))
+
+    def export_pages(self, bounds, start_year=None, end_year=None, after=None, page_rows: int = 10000):
+        # Shards are year-disjoint and pages are time-ordered, so the cursor's
+        # year says which shard to resume in; later shards start from the top
+        if after and not after[:4].isdigit():
+            raise ValueError(f"Invalid export cursor: {after}")
+        resume_year = int(after[:4]) if after else None
+        for year in self.shards_for(start_year, end_year):
+            if resume_year and year < resume_year:
+                continue
+            yield from keyset_pages(shard_path(year, self.shard_dir), bounds, start_year, end_year,
+                                    after if year == resume_year else None, page_rows)
+
+    def preview(self, bounds, start_year=None, end_year=None, limit: int = 100) -> List[Dict]:
+        # Latest rows live in the newest shards, so walk backwards until the limit is met
+        where_sql, params = filter_sql(bounds)
+        records = []
+        for year in reversed(self.shards_for(start_year, end_year)):
+            rows = self._query_shard(year, preview_sql(where_sql, limit - len(records)), params)
+            records.extend(dict(row) for row in rows)
+            if len(records) >= limit:
+                break
+        return records
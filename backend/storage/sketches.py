@@ -0,0 +1,337 @@
+"""
+Mergeable quantile sketches
+
+Percentiles cannot be merged from monthly partials, and an exact median
+needs every value of the range sorted. Instead a t-digest per parameter is
+kept for every SKETCH_DEG grid cell and year, next to Welford moments
+(count, mean, m2, min, max) for the same bucket, as a derived table.
+
+A digest is a list of centroids (mean, weight) sorted by mean. Merging is
+concatenating centroids and compressing them again: centroids are grouped
+on the arcsine scale k(q) = COMPRESSION / (2 pi) * asin(2q - 1), which
+keeps centroids small near the tails, so p5/p95 stay as accurate as the
+median. Compression is vectorized over all buckets at once.
+
+region_quantiles() merges the digests of the cells entirely inside a box
+with the raw values of the partial cells along its edges (fetched from the
+engine as thin strips), so the answer covers exactly the requested box.
+Polygons use all rows of the region.
+"""
+
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .aggregates import PARAMETERS
+
+SKETCH_DEG = 5.0
+COMPRESSION = 200
+QUANTILES = {"p5": 0.05, "p25": 0.25, "median": 0.5, "p75": 0.75, "p95": 0.95}
+
+SKETCHES_SCHEMA = """
+    CREATE TABLE argo_sketches (
+        parameter TEXT NOT NULL,
+        cy        INTEGER NOT NULL,
+        cx        INTEGER NOT NULL,
+        year      INTEGER NOT NULL,
+        count     INTEGER NOT NULL,
+        mean      REAL NOT NULL,
+        m2        REAL NOT NULL,
+        min       REAL NOT NULL,
+        max       REAL NOT NULL,
+        centroids BLOB NOT NULL,
+        PRIMARY KEY (parameter, cy, cx, year)
+    ) WITHOUT ROWID
+"""
+
+
+def sketch_cells(lons, lats):
+    # Not clipped: points on lon 180 / lat 90 get a cell of their own, which
+    # no inner box covers, so region_quantiles() reads them as edge values
+    cx = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / SKETCH_DEG)
+    cy = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / SKETCH_DEG)
+    return cx.astype(np.int64), cy.astype(np.int64)
+
+
+# ── Digests ────────────────────────────────────────────────────────────────────
+def compress(keys: np.ndarray, means: np.ndarray, weights: np.ndarray, compression: int = COMPRESSION):
+    """
+    Re-compress the centroids of many digests at once; `keys` names the digest
+    each centroid belongs to. Returns (keys, means, weights) sorted by key
+    then mean.
+    """
+    if len(keys) == 0:
+        return keys, means, weights
+    order = np.lexsort((means, keys))
+    keys, means, weights = keys[order], means[order], weights[order]
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    sizes = np.diff(np.append(starts, len(keys)))
+    cumulative = np.cumsum(weights)
+    before = cumulative - weights - np.repeat(cumulative[starts] - weights[starts], sizes)
+    totals = np.repeat(np.add.reduceat(weights, starts), sizes)
+    # Centre of each centroid on the quantile axis, mapped to the k scale
+    q = np.clip((before + weights / 2) / totals, 0.0, 1.0)
+    k = np.floor(compression / (2 * np.pi) * (np.arcsin(2 * q - 1) + np.pi / 2)).astype(np.int64)
+    groups = np.append(True, (keys[1:] != keys[:-1]) | (k[1:] != k[:-1]))
+    index = np.cumsum(groups) - 1
+    merged_weights = np.bincount(index, weights=weights)
+    merged_means = np.bincount(index, weights=means * weights) / merged_weights
+    return keys[groups], merged_means, merged_weights
+
+
+def digest_quantiles(means: np.ndarray, weights: np.ndarray, low: float, high: float,
+                     quantiles=QUANTILES) -> Dict[str, float]:
+    """Quantiles of one digest by interpolating between centroid centres"""
+    total = float(weights.sum())
+    centres = np.cumsum(weights) - weights / 2
+    # The extremes anchor both ends so tail quantiles never leave [min, max]
+    xs = np.concatenate(([0.0], centres, [total]))
+    ys = np.concatenate(([low], means, [high]))
+    return {name: float(np.interp(q * total, xs, ys)) for name, q in quantiles.items()}
+
+
+def encode_centroids(means: np.ndarray, weights: np.ndarray) -> bytes:
+    return np.column_stack([means, weights]).astype(np.float32).tobytes()
+
+
+def decode_centroids(blob: bytes):
+    pairs = np.frombuffer(blob, dtype=np.float32).reshape(-1, 2).astype(np.float64)
+    return pairs[:, 0], pairs[:, 1]
+
+
+# ── Moments ────────────────────────────────────────────────────────────────────
+def merge_moments(counts, means, m2s):
+    """Pairwise (Chan et al.) merge of Welford moments -> (count, mean, m2)"""
+    counts, means, m2s = (np.asarray(v, dtype=np.float64) for v in (counts, means, m2s))
+    count = counts.sum()
+    if count == 0:
+        return 0, 0.0, 0.0
+    mean = float((counts * means).sum() / count)
+    return int(count), mean, float(m2s.sum() + (counts * (means - mean) ** 2).sum())
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class SketchBuilder:
+    """Derived-table builder (see storage.derived) for per-cell, per-year digests and moments"""
+
+    name = "sketches"
+    tables = ("argo_sketches",)
+    schema = SKETCHES_SCHEMA
+    # Centroids are re-compressed once this many un-merged ones pile up
+    COMPACT_AT = 1 << 21
+
+    def __init__(self):
+        self.state = {parameter: None for parameter in PARAMETERS}   # (keys, means, weights)
+        self.moments = {parameter: {} for parameter in PARAMETERS}   # key -> (count, mean, m2, min, max)
+        self._pending = {parameter: [] for parameter in PARAMETERS}
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        times = np.asarray(chunk["time"], dtype="U20")
+        if len(times) == 0:
+            return
+        years = times.astype("U4").astype(np.int64)
+        cx, cy = sketch_cells(chunk["longitude"], chunk["latitude"])
+        all_keys = (years << 16) | (cy << 8) | cx
+        for parameter in PARAMETERS:
+            values = np.asarray(chunk[parameter], dtype=np.float64)
+            valid = ~np.isnan(values)
+            keys, values = all_keys[valid], values[valid]
+            if len(keys) == 0:
+                continue
+            self._add_moments(parameter, keys, values)
+            self._pending[parameter].append(compress(keys, values, np.ones(len(values))))
+            self._pending_rows += len(self._pending[parameter][-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    def _add_moments(self, parameter: str, keys, values):
+        unique, index = np.unique(keys, return_inverse=True)
+        counts = np.bincount(index, minlength=len(unique))
+        means = np.bincount(index, weights=values, minlength=len(unique)) / counts
+        deviations = values - means[index]
+        m2s = np.bincount(index, weights=deviations * deviations, minlength=len(unique))
+        lows = np.full(len(unique), np.inf)
+        highs = np.full(len(unique), -np.inf)
+        np.minimum.at(lows, index, values)
+        np.maximum.at(highs, index, values)
+        moments = self.moments[parameter]
+        for key, count, mean, m2, low, high in zip(unique.tolist(), counts.tolist(), means.tolist(),
+                                                   m2s.tolist(), lows.tolist(), highs.tolist()):
+            if key in moments:
+                old = moments[key]
+                merged = merge_moments((old[0], count), (old[1], mean), (old[2], m2))
+                moments[key] = merged + (min(old[3], low), max(old[4], high))
+            else:
+                moments[key] = (count, mean, m2, low, high)
+
+    def _compact(self):
+        for parameter, parts in self._pending.items():
+            if self.state[parameter] is not None:
+                parts = [self.state[parameter]] + parts
+            if parts:
+                self.state[parameter] = compress(*(np.concatenate([part[i] for part in parts]) for i in range(3)))
+            self._pending[parameter] = []
+        self._pending_rows = 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        for parameter in PARAMETERS:
+            if self.state[parameter] is None:
+                continue
+            keys, means, weights = self.state[parameter]
+            starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+            ends = np.append(starts[1:], len(keys))
+            rows = []
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                key = int(keys[start])
+                count, mean, m2, low, high = self.moments[parameter][key]
+                rows.append((parameter, (key >> 8) & 0xFF, key & 0xFF, key >> 16, count, mean, m2, low, high,
+                             encode_centroids(means[start:end], weights[start:end])))
+            rows.sort(key=lambda row: row[1:4])
+            conn.executemany("INSERT INTO argo_sketches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def inner_box(bounds):
+    """The part of a box made of whole sketch cells, as (lon_lo, lon_hi, lat_lo, lat_hi) or None"""
+    lon_min, lon_max, lat_min, lat_max = bounds
+    lon_lo, lon_hi = np.ceil(lon_min / SKETCH_DEG) * SKETCH_DEG, np.floor(lon_max / SKETCH_DEG) * SKETCH_DEG
+    lat_lo, lat_hi = np.ceil(lat_min / SKETCH_DEG) * SKETCH_DEG, np.floor(lat_max / SKETCH_DEG) * SKETCH_DEG
+    if lon_lo >= lon_hi or lat_lo >= lat_hi:
+        return None
+    return float(lon_lo), float(lon_hi), float(lat_lo), float(lat_hi)
+
+
+def read_cells(db_path: str, sql: str, inner, start_year=None, end_year=None, params=()) -> Optional[List[tuple]]:
+    """
+    Run a query on a per-cell table whose placeholders are `params` followed by
+    the cy, cx and year ranges covering `inner`; None if the table is missing.
+    """
+    lon_lo, lon_hi, lat_lo, lat_hi = inner
+    cx_lo, cx_hi = round((lon_lo + 180.0) / SKETCH_DEG), round((lon_hi + 180.0) / SKETCH_DEG) - 1
+    cy_lo, cy_hi = round((lat_lo + 90.0) / SKETCH_DEG), round((lat_hi + 90.0) / SKETCH_DEG) - 1
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return conn.execute(sql, tuple(params) + (cy_lo, cy_hi, cx_lo, cx_hi, int(start_year or 0), int(end_year or 9999))).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def sketches_built(db_path: str) -> bool:
+    """Whether the database has an argo_sketches table"""
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return False
+    try:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'argo_sketches'"
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def read_sketches(db_path: str, parameter: str, inner, start_year=None, end_year=None) -> Optional[List[tuple]]:
+    """(count, mean, m2, min, max, centroids) of every cell inside `inner`; None if the table is missing"""
+    return read_cells(db_path, """
+        SELECT count, mean, m2, min, max, centroids FROM argo_sketches
+        WHERE parameter = ? AND cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ?
+    """, inner, start_year, end_year, (parameter,))
+
+
+def edge_points(engine, bounds, inner, start_year=None, end_year=None) -> Dict[str, np.ndarray]:
+    """Points in `bounds` outside the half-open inner box, read as four strips"""
+    from .engines import concat_points
+
+    lon_min, lon_max, lat_min, lat_max = bounds
+    lon_lo, lon_hi, lat_lo, lat_hi = inner
+    strips = [
+        ((lon_min, lon_lo, lat_min, lat_max), lambda lon, lat: lon < lon_lo),
+        ((lon_hi, lon_max, lat_min, lat_max), lambda lon, lat: lon >= lon_hi),
+        ((lon_lo, lon_hi, lat_min, lat_lo), lambda lon, lat: (lon >= lon_lo) & (lon < lon_hi) & (lat < lat_lo)),
+        ((lon_lo, lon_hi, lat_hi, lat_max), lambda lon, lat: (lon >= lon_lo) & (lon < lon_hi) & (lat >= lat_hi)),
+    ]
+    parts = []
+    for strip, keep in strips:
+        points = engine.points(strip, start_year, end_year)
+        mask = keep(points["longitude"], points["latitude"])
+        parts.append({name: values[mask] for name, values in points.items()})
+    return concat_points(parts)
+
+
+def region_points(engine, area, start_year=None, end_year=None):
+    """
+    (inner box, points) for a region: for boxes the points are only those
+    outside the whole cells of the inner box, which the caller reads from
+    its per-cell table; for polygons (or boxes smaller than a cell) the inner
+    box is None and the points are every row in the region.
+    """
+    inner = inner_box(area.bounds) if area.is_box else None
+    if inner is not None:
+        return inner, edge_points(engine, area.bounds, inner, start_year, end_year)
+    from .geometry import region_contains
+    points = engine.points(area.bounds, start_year, end_year)
+    keep = region_contains(area, points["longitude"], points["latitude"])
+    return None, {name: values[keep] for name, values in points.items()}
+
+
+def shared_region_points(engine, area, start_year=None, end_year=None, memo=None):
+    """
+    region_points() as a zero-argument callable that reads the rows on its
+    first call only, so the consumers of one query (cube, quantiles,
+    anomalies, polygon figures) share a single read of the edges or polygon.
+    memo (a dict) holds them under "region_rows" once read; one that already
+    holds them skips the read.
+    """
+    memo = {} if memo is None else memo
+
+    def get():
+        if "region_rows" not in memo:
+            memo["region_rows"] = region_points(engine, area, start_year, end_year)
+        return memo["region_rows"]
+    return get
+
+
+def region_quantiles(engine, area, parameter: str, start_year=None, end_year=None,
+                     area_points=None) -> Optional[Dict]:
+    """
+    p5/p25/median/p75/p95 plus merged moments for a region, or None when the
+    sketch table has not been built. area_points is a shared_region_points()
+    callable (read here when not given).
+    """
+    # Checked before any row is read: polygons would otherwise fetch their
+    # rows only to have no sketch table to answer from
+    if not sketches_built(engine.catalog_path):
+        return None
+    sketches = []
+    inner, points = (area_points or shared_region_points(engine, area, start_year, end_year))()
+    if inner is not None:
+        sketches = read_sketches(engine.catalog_path, parameter, inner, start_year, end_year)
+        if sketches is None:
+            return None
+    values = points[parameter][~np.isnan(points[parameter])]
+
+    decoded = [decode_centroids(row[5]) for row in sketches]
+    means = np.concatenate([values] + [pair[0] for pair in decoded])
+    weights = np.concatenate([np.ones(len(values))] + [pair[1] for pair in decoded])
+    if len(means) == 0:
+        return None
+    _, means, weights = compress(np.zeros(len(means), dtype=np.int64), means, weights)
+
+    deviations = values - values.mean() if len(values) else values
+    count, mean, m2 = merge_moments(
+        [row[0] for row in sketches] + [len(values)],
+        [row[1] for row in sketches] + [values.mean() if len(values) else 0.0],
+        [row[2] for row in sketches] + [float((deviations * deviations).sum())],
+    )
+    low = min([row[3] for row in sketches] + ([float(values.min())] if len(values) else []))
+    high = max([row[4] for row in sketches] + ([float(values.max())] if len(values) else []))
+    return {
+        **digest_quantiles(means, weights, low, high),
+        "count": count, "mean": mean, "std": float(np.sqrt(m2 / count)) if count else 0.0,
+        "sketched": int(sum(row[0] for row in sketches)),
+    }
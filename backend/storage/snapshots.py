@@ -0,0 +1,216 @@
+"""
+Immutable database snapshots
+
+The row store is served from snapshot files that are never modified once
+published. Maintenance (load, dedup, optimize) stages a new file in
+data/snapshots/ — a backup-API copy of the live database, or an empty file
+for a full load — works on it while the server keeps reading the old one,
+then publishes it by atomically replacing the data/argo.current pointer.
+
+The server resolves the pointer per request (one stat), so new requests
+open the new snapshot while requests already running finish on the one
+they leased. Retired snapshots are deleted by collect_garbage() once no
+lease in this process holds them and they have been retired for `grace`
+seconds (other worker processes keep their own leases, so the grace period
+covers their in-flight queries); the `keep` most recently retired ones are
+kept for a quick rollback by re-pointing.
+
+Files beside a snapshot that belong to it (<snapshot>.<suffix>, e.g. the
+aggregate cube) travel with it: they are linked into a clone and removed
+with it.
+
+Without a pointer file data/argo.db is live, as before snapshots existed.
+"""
+
+import contextvars
+import glob
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+from .db import DATA_DIR, DB_PATH
+
+POINTER_NAME = "argo.current"
+SNAPSHOT_GRACE = float(os.getenv("VELORA_SNAPSHOT_GRACE", "60"))
+SNAPSHOT_KEEP = int(os.getenv("VELORA_SNAPSHOT_KEEP", "1"))
+
+# Snapshot leased by the current request (see SnapshotStore.lease)
+_leased = contextvars.ContextVar("velora_snapshot", default=None)
+
+
+class SnapshotStore:
+    def __init__(self, data_dir: str = DATA_DIR, legacy_path: str = None):
+        self.snapshot_dir = os.path.join(data_dir, "snapshots")
+        self.pointer_path = os.path.join(data_dir, POINTER_NAME)
+        self.legacy_path = legacy_path or (DB_PATH if data_dir == DATA_DIR else os.path.join(data_dir, "argo.db"))
+        self._lock = threading.Lock()
+        self._leases = Counter()
+        self._pointer = (None, None)  # (pointer file signature, resolved path)
+
+    # ── Resolving ──────────────────────────────────────────────────────────────
+    def live_path(self) -> str:
+        """The published snapshot, or data/argo.db when nothing was published"""
+        try:
+            st = os.stat(self.pointer_path)
+        except FileNotFoundError:
+            return self.legacy_path
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if self._pointer[0] == signature:
+                return self._pointer[1]
+        with open(self.pointer_path) as f:
+            name = f.read().strip()
+        path = os.path.join(self.snapshot_dir, name)
+        if not name or not os.path.exists(path):
+            return self.legacy_path
+        with self._lock:
+            self._pointer = (signature, path)
+        return path
+
+    def current(self) -> str:
+        """The snapshot leased by this request, else the live one"""
+        return _leased.get() or self.live_path()
+
+    @contextmanager
+    def lease(self) -> Iterator[str]:
+        """Pin the live snapshot for the duration of a request (or any unit of work)"""
+        outer = _leased.get()
+        if outer is not None:
+            yield outer
+            return
+        path = self.live_path()
+        with self._lock:
+            self._leases[path] += 1
+        token = _leased.set(path)
+        try:
+            yield path
+        finally:
+            _leased.reset(token)
+            with self._lock:
+                self._leases[path] -= 1
+                if not self._leases[path]:
+                    del self._leases[path]
+
+    def leased(self) -> dict:
+        with self._lock:
+            return dict(self._leases)
+
+    # ── Staging and publishing ─────────────────────────────────────────────────
+    def snapshots(self) -> List[str]:
+        """Snapshot files, oldest first (names sort by staging time)"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        return [os.path.join(self.snapshot_dir, name) for name in sorted(os.listdir(self.snapshot_dir))
+                if name.startswith("argo-") and name.endswith(".db")]
+
+    def stage_path(self, label: str) -> str:
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        return os.path.join(self.snapshot_dir, f"argo-{stamp}-{label}.db")
+
+    def clone(self, target: str, source: str = None):
+        """Consistent copy of the live database via the SQLite backup API (readers are not blocked)"""
+        source = source or self.live_path()
+        source_conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+        target_conn = sqlite3.connect(target)
+        try:
+            source_conn.backup(target_conn, pages=4096)
+        finally:
+            target_conn.close()
+            source_conn.close()
+        # Side files are only ever replaced, never changed in place, so sharing the inode is safe
+        for side in sidecars(source):
+            copy = target + side[len(source):]
+            try:
+                os.link(side, copy)
+            except OSError:
+                shutil.copyfile(side, copy)
+
+    def publish(self, path: str):
+        """Atomically make `path` (a file in the snapshot directory) the live database"""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.snapshot_dir):
+            raise ValueError(f"{path} is not in {self.snapshot_dir}")
+        temporary = f"{self.pointer_path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(os.path.basename(path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.pointer_path)
+
+    @contextmanager
+    def staged(self, label: str, copy: bool = True) -> Iterator[str]:
+        """
+        Path of a new snapshot to work on (a copy of the live database unless
+        copy=False); published when the block succeeds, removed if it raises.
+        """
+        path = self.stage_path(label)
+        if copy:
+            self.clone(path)
+        try:
+            yield path
+        except BaseException:
+            for leftover in [path, f"{path}-journal", f"{path}-wal", f"{path}-shm"] + sidecars(path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        self.publish(path)
+
+    # ── Garbage collection ─────────────────────────────────────────────────────
+    def collect_garbage(self, keep: int = SNAPSHOT_KEEP, grace: float = SNAPSHOT_GRACE,
+                        now: Optional[float] = None) -> List[str]:
+        """
+        Delete retired snapshots; returns the removed paths. A snapshot is
+        retired once a newer one was published (its retirement time is the
+        newer file's last write); files newer than the live one are still
+        being staged and are never touched.
+        """
+        live = self.live_path()
+        files = self.snapshots()
+        if live not in files:
+            return []
+        now = time.time() if now is None else now
+        retired = files[:files.index(live)]
+        leased = self.leased()
+        removed = []
+        for i, path in enumerate(retired[:max(len(retired) - keep, 0)]):
+            successor = files[i + 1]
+            if path in leased or now - os.path.getmtime(successor) < grace:
+                continue
+            for side in sidecars(path):
+                os.remove(side)
+            os.remove(path)
+            removed.append(path)
+        return removed
+
+    def run_collector(self, stop: threading.Event, interval: float = 30.0):
+        """collect_garbage() every `interval` seconds until `stop` is set (server background thread)"""
+        while not stop.wait(interval):
+            try:
+                for path in self.collect_garbage():
+                    print(f"[Snapshots] Removed {os.path.basename(path)}")
+            except OSError as e:
+                print(f"[Snapshots] Collection skipped ({e})")
+
+
+def sidecars(path: str) -> List[str]:
+    """Files belonging to a database file: <path>.<suffix>"""
+    return [side for side in glob.glob(glob.escape(path) + ".*") if not side.endswith(".tmp")]
+
+
+SNAPSHOTS = SnapshotStore()
+
+
+def run_on_snapshot(label: str, work, copy: bool = True, store: SnapshotStore = SNAPSHOTS) -> str:
+    """Maintenance entry point: work(path) on a staged snapshot, publish it, collect old ones"""
+    with store.staged(label, copy) as path:
+        work(path)
+    print(f"\nPublished snapshot {os.path.basename(path)}")
+    for removed in store.collect_garbage():
+        print(f"   Removed retired snapshot {os.path.basename(removed)}")
+    return path
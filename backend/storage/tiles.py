@@ -0,0 +1,204 @@
+"""
+Heatmap tile pyramid
+
+Observations are binned into Web Mercator grid cells at FINE_LEVEL (a
+2^12 x 2^12 grid, ~10 km at the equator) per year. Coarser levels are
+derived from the level below by merging 2x2 cells, down to TILE_BITS, so
+every level is a reduction of the one underneath rather than a raw scan.
+
+A slippy-map tile z/x/y is served from level z + TILE_BITS (16x16 cells per
+tile); zooms past FINE_LEVEL - TILE_BITS reuse the finest cells. Tiles are
+cached per (database, catalog token, tile, years) so pans and zooms over
+already-seen tiles never touch SQLite.
+"""
+
+import math
+import os
+import sqlite3
+from typing import Dict, Optional
+
+import numpy as np
+
+from .cache import LRUCache
+
+TILE_BITS = 4
+FINE_LEVEL = 12
+MAX_ZOOM = 22
+MAX_LATITUDE = 85.0511287798
+
+TILES_SCHEMA = """
+    CREATE TABLE argo_tiles (
+        level      INTEGER NOT NULL,
+        cy         INTEGER NOT NULL,
+        cx         INTEGER NOT NULL,
+        year       INTEGER NOT NULL,
+        obs_count  INTEGER NOT NULL,
+        temp_count INTEGER NOT NULL,
+        temp_sum   REAL NOT NULL,
+        sal_count  INTEGER NOT NULL,
+        sal_sum    REAL NOT NULL,
+        PRIMARY KEY (level, cy, cx, year)
+    ) WITHOUT ROWID
+"""
+
+_tile_cache = LRUCache(int(os.getenv("VELORA_TILE_CACHE", "4096")))
+
+
+# ── Web Mercator cells ─────────────────────────────────────────────────────────
+def cell_index(lons, lats, level: int):
+    """(cx, cy) integer cells at `level` for lon/lat arrays"""
+    n = 1 << level
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    x = (lons + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lats))) / math.pi) / 2.0 * n
+    cx = np.clip(np.floor(x), 0, n - 1).astype(np.int64)
+    cy = np.clip(np.floor(y), 0, n - 1).astype(np.int64)
+    return cx, cy
+
+
+def cell_bounds(cx: int, cy: int, level: int) -> Dict:
+    n = 1 << level
+    lat = lambda row: math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return {
+        "lon_min": cx / n * 360.0 - 180.0,
+        "lon_max": (cx + 1) / n * 360.0 - 180.0,
+        "lat_min": lat(cy + 1),
+        "lat_max": lat(cy),
+    }
+
+
+def tile_level(z: int) -> int:
+    return min(z + TILE_BITS, FINE_LEVEL)
+
+
+def tile_cells(z: int, x: int, y: int):
+    """Inclusive (cx_lo, cx_hi, cy_lo, cy_hi) range of level cells covering tile z/x/y"""
+    level = tile_level(z)
+    if level >= z:
+        shift = level - z
+        return level, x << shift, ((x + 1) << shift) - 1, y << shift, ((y + 1) << shift) - 1
+    shift = z - level
+    return level, x >> shift, x >> shift, y >> shift, y >> shift
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class TilePyramidBuilder:
+    """Derived-table builder (see storage.derived) for argo_tiles"""
+
+    name = "tiles"
+    tables = ("argo_tiles",)
+    schema = TILES_SCHEMA
+    # Partial sums are re-reduced once this many un-merged keys pile up
+    COMPACT_AT = 1 << 21
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, 5), dtype=np.float64)
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        times = np.asarray(chunk["time"], dtype=str)
+        if len(times) == 0:
+            return
+        years = times.astype("U4").astype(np.int64)
+        cx, cy = cell_index(chunk["longitude"], chunk["latitude"], FINE_LEVEL)
+        keys = (years << (2 * FINE_LEVEL)) | (cy << FINE_LEVEL) | cx
+
+        temps = np.asarray(chunk["temperature"], dtype=np.float64)
+        sals = np.asarray(chunk["salinity"], dtype=np.float64)
+        temp_ok, sal_ok = ~np.isnan(temps), ~np.isnan(sals)
+        values = np.column_stack([
+            np.ones(len(keys)), temp_ok, np.where(temp_ok, temps, 0.0), sal_ok, np.where(sal_ok, sals, 0.0),
+        ])
+        self._pending.append(self._reduce(keys, values))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    @staticmethod
+    def _reduce(keys, values):
+        unique, index = np.unique(keys, return_inverse=True)
+        sums = np.column_stack([
+            np.bincount(index, weights=values[:, column], minlength=len(unique))
+            for column in range(values.shape[1])
+        ])
+        return unique, sums
+
+    def _compact(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self.keys] + [part[0] for part in self._pending])
+        sums = np.concatenate([self.sums] + [part[1] for part in self._pending])
+        self.keys, self.sums = self._reduce(keys, sums)
+        self._pending, self._pending_rows = [], 0
+
+    def levels(self):
+        """Yield (level, years, cy, cx, sums) from FINE_LEVEL down to TILE_BITS"""
+        self._compact()
+        mask = (1 << FINE_LEVEL) - 1
+        years = self.keys >> (2 * FINE_LEVEL)
+        cy = (self.keys >> FINE_LEVEL) & mask
+        cx = self.keys & mask
+        sums = self.sums
+        for level in range(FINE_LEVEL, TILE_BITS - 1, -1):
+            yield level, years, cy, cx, sums
+            # Each coarser level is the 2x2 merge of the level below it
+            keys, sums = self._reduce((years << (2 * FINE_LEVEL)) | ((cy >> 1) << FINE_LEVEL) | (cx >> 1), sums)
+            years = keys >> (2 * FINE_LEVEL)
+            cy = (keys >> FINE_LEVEL) & mask
+            cx = keys & mask
+
+    def write(self, conn: sqlite3.Connection):
+        for level, years, cy, cx, sums in self.levels():
+            order = np.lexsort((years, cx, cy))  # primary-key order keeps inserts append-only
+            conn.executemany(
+                "INSERT INTO argo_tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip([level] * len(order), cy[order].tolist(), cx[order].tolist(), years[order].tolist(),
+                    sums[order, 0].astype(np.int64).tolist(), sums[order, 1].astype(np.int64).tolist(),
+                    sums[order, 2].tolist(), sums[order, 3].astype(np.int64).tolist(), sums[order, 4].tolist()),
+            )
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def read_tile(conn: sqlite3.Connection, z: int, x: int, y: int,
+              start_year: Optional[int] = None, end_year: Optional[int] = None) -> Dict:
+    level, cx_lo, cx_hi, cy_lo, cy_hi = tile_cells(z, x, y)
+    sql = """
+        SELECT cx, cy, SUM(obs_count), SUM(temp_count), SUM(temp_sum), SUM(sal_count), SUM(sal_sum)
+        FROM argo_tiles
+        WHERE level = ? AND cy BETWEEN ? AND ? AND cx BETWEEN ? AND ?
+    """
+    params = [level, cy_lo, cy_hi, cx_lo, cx_hi]
+    if start_year:
+        sql += " AND year >= ?"
+        params.append(int(start_year))
+    if end_year:
+        sql += " AND year <= ?"
+        params.append(int(end_year))
+    sql += " GROUP BY cy, cx"
+
+    cells = []
+    for cx, cy, count, temp_count, temp_sum, sal_count, sal_sum in conn.execute(sql, params):
+        cells.append({
+            "cx": cx, "cy": cy, **cell_bounds(cx, cy, level),
+            "count": count,
+            "temperature": round(temp_sum / temp_count, 3) if temp_count else None,
+            "salinity": round(sal_sum / sal_count, 3) if sal_count else None,
+        })
+    return {"z": z, "x": x, "y": y, "level": level, "cells": cells}
+
+
+def get_tile(db_path: str, token, z: int, x: int, y: int,
+             start_year: Optional[int] = None, end_year: Optional[int] = None) -> Dict:
+    """Cached read_tile(); the catalog token in the key retires tiles after every build or reload"""
+    key = (db_path, token, z, x, y, start_year, end_year)
+    tile = _tile_cache.get(key)
+    if tile is None:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            tile = _tile_cache.put(key, read_tile(conn, z, x, y, start_year, end_year))
+        finally:
+            conn.close()
+    return tile
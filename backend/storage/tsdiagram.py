@@ -0,0 +1,199 @@
+"""
+Temperature-salinity diagrams
+
+A T-S diagram is a 2D histogram of (salinity, temperature) pairs, optionally
+with the mean pressure of every bin. Bins are fixed (TEMP_BINS x SAL_BINS
+over the ranges below; values outside a range fall into its edge bins), so
+histograms add: a per-cell, per-month histogram is kept as a derived table
+(sparse, only non-empty bins) and any year range is the sum of its rows.
+
+Binning is one vectorized pass per chunk: both bin indexes are composed with
+the cell and month into one int64 key and reduced with np.unique/bincount,
+the same way the tile pyramid is built.
+
+region_histogram() sums the stored bins of the sketch-grid cells entirely
+inside a box and bins the rows of the partial cells along its edges on the
+fly, so the answer covers exactly the requested box. Polygons bin all rows
+of the region.
+"""
+
+import sqlite3
+from typing import Dict, Optional
+
+import numpy as np
+
+from .engines import year_months
+from .sketches import read_cells, region_points, sketch_cells
+
+TEMP_RANGE = (-2.5, 35.0)
+TEMP_STEP = 0.25
+SAL_RANGE = (30.0, 38.0)
+SAL_STEP = 0.05
+TEMP_BINS = int(round((TEMP_RANGE[1] - TEMP_RANGE[0]) / TEMP_STEP))
+SAL_BINS = int(round((SAL_RANGE[1] - SAL_RANGE[0]) / SAL_STEP))
+
+TS_SCHEMA = """
+    CREATE TABLE argo_ts_bins (
+        cy         INTEGER NOT NULL,
+        cx         INTEGER NOT NULL,
+        year       INTEGER NOT NULL,
+        month      INTEGER NOT NULL,
+        tbin       INTEGER NOT NULL,
+        sbin       INTEGER NOT NULL,
+        count      INTEGER NOT NULL,
+        pres_count INTEGER NOT NULL,
+        pres_sum   REAL NOT NULL,
+        PRIMARY KEY (cy, cx, year, month, tbin, sbin)
+    ) WITHOUT ROWID
+"""
+
+# Key layout, low to high bits: sbin, tbin, cx, cy, year*12+month
+BIN_BITS = 8
+CELL_BITS = 7
+
+
+def bin_index(temperature, salinity):
+    """(tbin, sbin) int64 arrays; out-of-range values are clipped into the edge bins"""
+    # Rounding first keeps values on a bin edge (34.75 / 0.05 = 94.99999...) in the upper bin
+    tbin = np.floor(np.round((np.asarray(temperature, dtype=np.float64) - TEMP_RANGE[0]) / TEMP_STEP, 6))
+    sbin = np.floor(np.round((np.asarray(salinity, dtype=np.float64) - SAL_RANGE[0]) / SAL_STEP, 6))
+    return (np.clip(tbin, 0, TEMP_BINS - 1).astype(np.int64),
+            np.clip(sbin, 0, SAL_BINS - 1).astype(np.int64))
+
+
+def histogram(points: Dict[str, np.ndarray]) -> np.ndarray:
+    """Dense (TEMP_BINS*SAL_BINS, 3) array of count, pressure count, pressure sum"""
+    temps, sals = points["temperature"], points["salinity"]
+    valid = ~np.isnan(temps) & ~np.isnan(sals)
+    tbin, sbin = bin_index(temps[valid], sals[valid])
+    flat = tbin * SAL_BINS + sbin
+    pressure = points["pressure"][valid]
+    has_pressure = ~np.isnan(pressure)
+    size = TEMP_BINS * SAL_BINS
+    return np.column_stack([
+        np.bincount(flat, minlength=size).astype(np.float64),
+        np.bincount(flat, weights=has_pressure.astype(np.float64), minlength=size),
+        np.bincount(flat, weights=np.where(has_pressure, pressure, 0.0), minlength=size),
+    ])
+
+
+# ── Builder ────────────────────────────────────────────────────────────────────
+class TSHistogramBuilder:
+    """Derived-table builder (see storage.derived) for per-cell, per-month T-S histograms"""
+
+    name = "ts_bins"
+    tables = ("argo_ts_bins",)
+    schema = TS_SCHEMA
+    # Partial sums are re-reduced once this many un-merged keys pile up
+    COMPACT_AT = 1 << 21
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, 3), dtype=np.float64)
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, chunk: Dict[str, np.ndarray]):
+        temps = np.asarray(chunk["temperature"], dtype=np.float64)
+        sals = np.asarray(chunk["salinity"], dtype=np.float64)
+        valid = ~np.isnan(temps) & ~np.isnan(sals)
+        if not valid.any():
+            return
+        year_month = year_months(np.asarray(chunk["time"], dtype=str)[valid])
+        months = year_month // 100 * 12 + year_month % 100 - 1
+        cx, cy = sketch_cells(np.asarray(chunk["longitude"])[valid], np.asarray(chunk["latitude"])[valid])
+        tbin, sbin = bin_index(temps[valid], sals[valid])
+        keys = ((((months << CELL_BITS | cy) << CELL_BITS | cx) << BIN_BITS | tbin) << BIN_BITS) | sbin
+
+        pressure = np.asarray(chunk["pressure"], dtype=np.float64)[valid]
+        has_pressure = ~np.isnan(pressure)
+        values = np.column_stack([np.ones(len(keys)), has_pressure, np.where(has_pressure, pressure, 0.0)])
+        self._pending.append(self._reduce(keys, values))
+        self._pending_rows += len(self._pending[-1][0])
+        if self._pending_rows >= self.COMPACT_AT:
+            self._compact()
+
+    @staticmethod
+    def _reduce(keys, values):
+        unique, index = np.unique(keys, return_inverse=True)
+        sums = np.column_stack([
+            np.bincount(index, weights=values[:, column], minlength=len(unique))
+            for column in range(values.shape[1])
+        ])
+        return unique, sums
+
+    def _compact(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self.keys] + [part[0] for part in self._pending])
+        sums = np.concatenate([self.sums] + [part[1] for part in self._pending])
+        self.keys, self.sums = self._reduce(keys, sums)
+        self._pending, self._pending_rows = [], 0
+
+    def write(self, conn: sqlite3.Connection):
+        self._compact()
+        keys = self.keys
+        sbin = keys & ((1 << BIN_BITS) - 1)
+        tbin = (keys >> BIN_BITS) & ((1 << BIN_BITS) - 1)
+        cx = (keys >> (2 * BIN_BITS)) & ((1 << CELL_BITS) - 1)
+        cy = (keys >> (2 * BIN_BITS + CELL_BITS)) & ((1 << CELL_BITS) - 1)
+        months = keys >> (2 * BIN_BITS + 2 * CELL_BITS)
+        # Keys sort month-major; primary-key order keeps inserts append-only
+        order = np.lexsort((sbin, tbin, months, cx, cy))
+        conn.executemany(
+            "INSERT INTO argo_ts_bins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(cy[order].tolist(), cx[order].tolist(), (months[order] // 12).tolist(),
+                (months[order] % 12 + 1).tolist(), tbin[order].tolist(), sbin[order].tolist(),
+                self.sums[order, 0].astype(np.int64).tolist(), self.sums[order, 1].astype(np.int64).tolist(),
+                self.sums[order, 2].tolist()),
+        )
+
+
+# ── Serving ────────────────────────────────────────────────────────────────────
+def read_bins(db_path: str, inner, start_year=None, end_year=None) -> Optional[np.ndarray]:
+    """Dense histogram (as histogram()) of the stored bins inside `inner`; None if the table is missing"""
+    rows = read_cells(db_path, """
+        SELECT tbin, sbin, SUM(count), SUM(pres_count), SUM(pres_sum) FROM argo_ts_bins
+        WHERE cy BETWEEN ? AND ? AND cx BETWEEN ? AND ? AND year BETWEEN ? AND ?
+        GROUP BY tbin, sbin
+    """, inner, start_year, end_year)
+    if rows is None:
+        return None
+    dense = np.zeros((TEMP_BINS * SAL_BINS, 3))
+    if rows:
+        bins = np.array(rows, dtype=np.float64)
+        dense[bins[:, 0].astype(np.int64) * SAL_BINS + bins[:, 1].astype(np.int64)] = bins[:, 2:]
+    return dense
+
+
+def region_histogram(engine, area, start_year=None, end_year=None, pressure: bool = False) -> Optional[Dict]:
+    """
+    T-S histogram of a region as sparse cells [tbin, sbin, count(, mean
+    pressure)], or None when the histogram table has not been built.
+    """
+    inner, points = region_points(engine, area, start_year, end_year)
+    dense = histogram(points)
+    binned = 0
+    if inner is not None:
+        stored = read_bins(engine.catalog_path, inner, start_year, end_year)
+        if stored is None:
+            return None
+        binned = int(stored[:, 0].sum())
+        dense += stored
+
+    filled = np.flatnonzero(dense[:, 0])
+    counts = dense[filled, 0].astype(np.int64)
+    columns = [(filled // SAL_BINS).tolist(), (filled % SAL_BINS).tolist(), counts.tolist()]
+    if pressure:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.round(dense[filled, 2] / dense[filled, 1], 1)
+        columns.append([None if np.isnan(mean) else float(mean) for mean in means])
+    cells = [list(cell) for cell in zip(*columns)]
+    return {
+        "temperature_bins": {"min": TEMP_RANGE[0], "step": TEMP_STEP, "count": TEMP_BINS},
+        "salinity_bins": {"min": SAL_RANGE[0], "step": SAL_STEP, "count": SAL_BINS},
+        "fields": ["tbin", "sbin", "count"] + (["mean_pressure"] if pressure else []),
+        "cells": cells,
+        "count": int(counts.sum()),
+        "binned": binned,
+    }
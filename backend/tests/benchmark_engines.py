@@ -0,0 +1,85 @@
+"""
+Query Engine Benchmark
+Times the build_response aggregate queries on every available engine and
+checks that they agree on the resulting stats.
+
+Run: python tests/benchmark_engines.py [--engines sqlite,columnar] [--repeat 3]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage.aggregates import summarize
+from storage.engines import create_engine
+from storage.regions import REGION_BOUNDS
+
+DEFAULT_ENGINES = ("sqlite", "sharded", "columnar", "compact", "duckdb")
+YEAR_RANGES = [(None, None), (2020, 2024), (2023, 2023)]
+
+def load_engines(names):
+    engines = {}
+    for name in names:
+        try:
+            engine = create_engine(name)
+            start = time.perf_counter()
+            engine.monthly_aggregates(REGION_BOUNDS["Indian Ocean"], None, None)  # warm up / load
+            print(f"✓ {name:<10} ready (first query {(time.perf_counter() - start) * 1000:.0f} ms)")
+            engines[name] = engine
+        except Exception as e:
+            print(f"⚠️  {name:<10} unavailable ({e})")
+    return engines
+
+def run_benchmark(names=DEFAULT_ENGINES, repeat: int = 3):
+    print("\n" + "="*72)
+    print("⚡ VELORA AI - QUERY ENGINE BENCHMARK")
+    print("="*72)
+
+    engines = load_engines(names)
+    if not engines:
+        print("❌ No engines available")
+        return False
+
+    timings = {name: [] for name in engines}
+    mismatches = 0
+
+    print(f"\n{'Region':<16} {'Years':<11} " + " ".join(f"{name:>11}" for name in engines))
+    print("-" * 72)
+    for region, bounds in REGION_BOUNDS.items():
+        for start_year, end_year in YEAR_RANGES:
+            row_ms = {}
+            means = {}
+            for name, engine in engines.items():
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    monthly = engine.monthly_aggregates(bounds, start_year, end_year)
+                    engine.preview(bounds, start_year, end_year, 100)
+                    samples.append((time.perf_counter() - start) * 1000)
+                row_ms[name] = statistics.median(samples)
+                timings[name].append(row_ms[name])
+                stats = summarize(monthly, "temperature")
+                means[name] = (stats["count"], round(stats["mean"], 2))
+
+            years = f"{start_year or '*'}-{end_year or '*'}"
+            print(f"{region:<16} {years:<11} " + " ".join(f"{row_ms[name]:9.1f}ms" for name in engines))
+            if len(set(means.values())) > 1:
+                mismatches += 1
+                print(f"   ❌ engines disagree: {means}")
+
+    print("\n📊 Median per query:")
+    for name, samples in timings.items():
+        print(f"   {name:<10} {statistics.median(samples):8.1f} ms")
+
+    print(f"\n{'✅ All engines agree' if mismatches == 0 else f'❌ {mismatches} disagreement(s)'}")
+    print("="*72 + "\n")
+    return mismatches == 0
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    names = args[args.index("--engines") + 1].split(",") if "--engines" in args else DEFAULT_ENGINES
+    repeat = int(args[args.index("--repeat") + 1]) if "--repeat" in args else 3
+    sys.exit(0 if run_benchmark(names, repeat) else 1)
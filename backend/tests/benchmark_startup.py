@@ -0,0 +1,83 @@
+"""
+Startup Benchmark
+Measures how long `import main` takes in a fresh interpreter and checks that
+heavy dependencies stay off the serving import path.
+
+Run: python tests/benchmark_startup.py [--runs 5] [--max-ms 1500]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules that must only be imported on first use, never by `import main`
+DEFERRED_MODULES = ("pandas", "sklearn", "openai")
+
+def time_import(runs: int):
+    """Wall-clock time of `import main` in a fresh interpreter, in ms"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", "import main"],
+            cwd=BACKEND_DIR, check=True, capture_output=True,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def import_profile():
+    """Parse `python -X importtime` output into {module: cumulative_us}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not parts[1].isdigit():
+            continue
+        profile[parts[2].strip()] = int(parts[1])
+    return profile
+
+def run_benchmark(runs: int = 5, max_ms: float = None):
+    print("\n" + "="*60)
+    print("⚡ VELORA AI - STARTUP BENCHMARK")
+    print("="*60)
+
+    timings = time_import(runs)
+    median = statistics.median(timings)
+    print(f"✓ import main: median {median:.0f} ms "
+          f"(min {min(timings):.0f} ms, max {max(timings):.0f} ms, {runs} runs)")
+
+    profile = import_profile()
+    top_level = {name: us for name, us in profile.items() if "." not in name}
+    print(f"\n📊 Slowest top-level imports (cumulative):")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:8]:
+        print(f"   {name:<24} {us / 1000:8.1f} ms")
+
+    leaked = [name for name in DEFERRED_MODULES if name in profile]
+    ok = True
+    if leaked:
+        print(f"\n❌ Heavy modules imported at startup: {', '.join(leaked)}")
+        ok = False
+    else:
+        print(f"\n✅ Deferred modules not imported: {', '.join(DEFERRED_MODULES)}")
+
+    if max_ms is not None and median > max_ms:
+        print(f"❌ Median import time {median:.0f} ms exceeds budget of {max_ms:.0f} ms")
+        ok = False
+
+    print("="*60 + "\n")
+    return ok
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else 5
+    max_ms = float(args[args.index("--max-ms") + 1]) if "--max-ms" in args else None
+    sys.exit(0 if run_benchmark(runs, max_ms) else 1)
@@ -0,0 +1,95 @@
+"""
+Shared test fixtures: the synthetic argo_data table every engine and
+derived-table test runs on (and its split into yearly shards), and a
+module-scoped database with the derived tables of the test module's builders.
+
+A test module using derived_db declares
+  BUILDERS = [TSHistogramBuilder]     builder factories (classes or callables)
+  EXTRA_ROWS = [...]                  optional argo_data rows inserted first
+                                      (time, latitude, longitude, pressure,
+                                      temperature, salinity, platform_number)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from storage.catalog import refresh_catalog
+from storage.db import ARGO_SCHEMA
+from storage.derived import rebuild_derived
+from storage.shards import rebuild_shard_catalog, shard_path
+
+def make_database(path: str, rows: int = 20000, seed: int = 7):
+    """Synthetic argo_data with missing values and boundary coordinates"""
+    rng = np.random.default_rng(seed)
+    years = rng.integers(2018, 2023, rows)
+    months = rng.integers(1, 13, rows)
+    days = rng.integers(1, 29, rows)
+    lats = np.round(rng.uniform(-70, 85, rows), 3)
+    lons = np.round(rng.uniform(-180, 180, rows), 3)
+    lats[:50] = 60.0    # Pacific/Atlantic vs Arctic edge
+    lons[50:100] = 120.0  # Indian vs Pacific edge
+    pres = np.round(rng.uniform(0, 2000, rows), 1)
+    temps = np.round(25 - pres / 100 + rng.normal(0, 1, rows), 3)
+    sals = np.round(35 + rng.normal(0, 0.3, rows), 3)
+
+    conn = sqlite3.connect(path)
+    conn.execute(ARGO_SCHEMA)
+    conn.executemany(
+        "INSERT INTO argo_data (time, latitude, longitude, pressure, temperature, salinity, platform_number) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                f"{years[i]}-{months[i]:02d}-{days[i]:02d}T{i % 24:02d}:{i % 60:02d}:00Z",
+                float(lats[i]), float(lons[i]), float(pres[i]),
+                None if i % 31 == 0 else float(temps[i]),
+                None if i % 37 == 0 else float(sals[i]),
+                str(1900000 + i % 40),
+            )
+            for i in range(rows)
+        ],
+    )
+    conn.execute("CREATE INDEX idx_time ON argo_data(time)")
+    conn.commit()
+    conn.close()
+
+def make_shards(source_path: str, shard_dir: str):
+    """Split a make_database() table into per-year shards plus the merged catalog.db"""
+    os.makedirs(shard_dir, exist_ok=True)
+    conn = sqlite3.connect(source_path)
+    years = [row[0] for row in conn.execute("SELECT DISTINCT substr(time, 1, 4) FROM argo_data")]
+    conn.close()
+    for year in years:
+        shard = sqlite3.connect(shard_path(year, shard_dir))
+        shard.execute(ARGO_SCHEMA)
+        shard.execute("ATTACH DATABASE ? AS source", (source_path,))
+        # Same ids as the source, so export cursors are comparable
+        shard.execute("INSERT INTO argo_data SELECT * FROM source.argo_data WHERE substr(time, 1, 4) = ?", (year,))
+        shard.commit()
+        shard.execute("DETACH DATABASE source")
+        refresh_catalog(shard, source="test")
+        shard.close()
+    rebuild_shard_catalog(shard_dir, source="test")
+
+@pytest.fixture(scope="module")
+def derived_db(request, tmp_path_factory):
+    """make_database() plus the module's BUILDERS tables, rebuilt in small chunks so merges are exercised"""
+    builders = [factory() for factory in request.module.BUILDERS]
+    path = str(tmp_path_factory.mktemp("derived") / "argo.db")
+    make_database(path)
+    conn = sqlite3.connect(path)
+    extra = getattr(request.module, "EXTRA_ROWS", None)
+    if extra:
+        conn.executemany(
+            "INSERT INTO argo_data (time, latitude, longitude, pressure, temperature, salinity, platform_number) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", extra,
+        )
+        conn.commit()
+    assert rebuild_derived(conn, builders, chunk_rows=1000) == [builder.name for builder in builders]
+    conn.close()
+    return path
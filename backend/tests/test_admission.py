@@ -0,0 +1,114 @@
+"""
+Admission Control Tests
+Checks the degradation levels chosen from in-flight requests and queue
+delay, their recovery over time, 503 + Retry-After shedding, and that
+/query and /query/batch degrade to templates and cached or sampled figures.
+
+Run: python -m pytest tests/test_admission.py   (or python tests/test_admission.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from types import SimpleNamespace
+
+import pytest
+
+from serving.admission import AdmissionController, AdmissionMiddleware
+from serving.metrics import Metrics
+
+def controller(**options):
+    return AdmissionController(in_flight_limits=(2, 4, 6), delay_limits=(0.1, 0.5, 1.0), retry_after=3,
+                               metrics=Metrics(), **options)
+
+def test_levels_follow_in_flight_and_delay():
+    admission = controller()
+    assert admission.level() == "full"
+    for expected in ("full", "no_llm", "no_llm", "approximate", "approximate", "reject"):
+        assert admission.enter()
+        assert admission.level() == expected
+    assert not admission.enter()                    # shed at the reject level
+    assert admission.metrics.value("admission_rejected_total") == 1
+    assert admission.start() == "approximate"       # already admitted: served cheaply, not dropped
+    for _ in range(6):
+        admission.leave()
+    assert admission.level() == "full"
+
+def test_queue_delay_decays():
+    admission = controller(half_life=1.0)
+    for _ in range(20):
+        admission.observe_delay(2.0, now=100.0)
+    assert admission.level(now=100.0) == "reject"
+    assert admission.level(now=101.5) == "approximate"
+    assert admission.level(now=110.0) == "full"     # recovers without new samples
+
+def test_middleware_sheds_with_retry_after():
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    admission = controller()
+    app = FastAPI()
+
+    @app.get("/query")
+    def query():
+        return {"degradation": admission.start()}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+    client = TestClient(app)
+    assert client.get("/query").json() == {"degradation": "full"}
+    assert admission.state()["in_flight"] == 0
+    admission._in_flight = 6
+    shed = client.get("/query")
+    assert shed.status_code == 503 and shed.headers["retry-after"] == "3"
+    assert shed.json()["degradation"] == "reject"
+    assert client.get("/health").status_code == 200  # other routes are not admission-controlled
+
+def test_query_degrades(monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+
+    calls = []
+
+    def compute(region, parameter, start_year, end_year, approximate=False, **options):
+        calls.append(approximate)
+        return {"region": region, "parameter": parameter, "parsed": {"region": region},
+                "stats": {"mean": 28.0, "min": 20.0, "max": 31.0},
+                "trend": {"direction": "rising", "per_year": 0.02}, "risk": {"level": "Low", "score": 1}}
+
+    monkeypatch.setattr(main, "compute_response", compute)
+    monkeypatch.setattr(main, "catalog", lambda: {"data_version": "1", "start_year": 2000, "end_year": 2020})
+    main.response_cache.clear()
+
+    degraded = main.build_response("Indian Ocean", "temperature", 2015, 2020, question="q", level="no_llm")
+    assert degraded["degradation"] == "no_llm"
+    assert degraded["insight"]["source"] == degraded["answer"]["source"] == "template"
+    # Cached exact figures are reused at the approximate level...
+    approximate = main.build_response("Indian Ocean", "temperature", 2015, 2020, level="approximate")
+    assert calls == [False] and approximate["degradation"] == "approximate"
+    # ...and without them the figures are estimated from samples
+    main.build_response("Indian Ocean", "salinity", 2015, 2020, level="approximate")
+    assert calls == [False, True]
+
+    # A batch at the approximate level skips the shared exact scan the same way
+    monkeypatch.setattr(main.admission, "start", lambda: "approximate")
+    exact = main.get_engine()
+    engine = SimpleNamespace(name=exact.name, catalog_path=exact.catalog_path,
+                             monthly_aggregates_multi=lambda *args: pytest.fail("exact scan when approximate"))
+    monkeypatch.setattr(main, "get_engine", lambda: engine)
+    batch = main.query_batch({"queries": [
+        {"region": "Indian Ocean", "parameter": "temperature", "start_year": 2015, "end_year": 2020},
+        {"region": "Pacific Ocean", "start_year": 2015, "end_year": 2020},
+    ]})
+    assert calls == [False, True, True] and batch["degradation"] == "approximate"
+    assert [result["parsed"]["source"] for result in batch["results"]] == ["batch", "batch"]
+    assert batch["results"][0]["stats"]["mean"] == 28.0 and batch["results"][0]["data"] == []
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
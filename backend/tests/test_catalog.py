@@ -0,0 +1,158 @@
+"""
+Metadata Catalog Tests
+Checks that the catalog maintained at ingest (accumulate_chunk) and merged
+from shards matches COUNT(*) and the per-year/per-region counts of
+argo_data, that verify_catalog() reports rows changed behind its back, that
+only bump_version changes the data version, that catalog_token() still
+tells apart two builds of a file that both start at version 1, and that
+load_catalog() re-reads a database only when its file changes.
+
+Run: python -m pytest tests/test_catalog.py   (or python tests/test_catalog.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+
+import pytest
+
+from storage.catalog import (
+    accumulate_chunk, catalog_token, empty_summary, load_catalog, read_catalog, refresh_catalog, scan_summary, verify_catalog,
+    write_catalog,
+)
+from storage.regions import REGION_BOUNDS
+from tests.conftest import make_database, make_shards
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=5000)
+    return path
+
+def counted(conn):
+    """total, per-year and per-region counts straight from argo_data"""
+    total = conn.execute("SELECT COUNT(*) FROM argo_data").fetchone()[0]
+    years = dict(conn.execute("SELECT CAST(substr(time, 1, 4) AS INTEGER), COUNT(*) FROM argo_data GROUP BY 1"))
+    regions = {
+        name: conn.execute("""
+            SELECT COUNT(*) FROM argo_data
+            WHERE longitude BETWEEN ? AND ? AND latitude BETWEEN ? AND ?
+        """, bounds).fetchone()[0]
+        for name, bounds in REGION_BOUNDS.items()
+    }
+    return total, years, regions
+
+def test_ingest_summary_matches_table(db_path):
+    conn = sqlite3.connect(db_path)
+    summary = empty_summary()
+    cur = conn.execute("SELECT time, latitude, longitude FROM argo_data")
+    while True:
+        rows = cur.fetchmany(700)
+        if not rows:
+            break
+        times, lats, lons = zip(*rows)
+        accumulate_chunk(summary, times, lats, lons)
+    assert summary == scan_summary(conn)
+
+    write_catalog(conn, summary, source="test", ingested=True)
+    catalog = read_catalog(conn)
+    total, years, regions = counted(conn)
+    assert catalog["total_rows"] == total == 5000
+    assert catalog["years"] == years and catalog["regions"] == regions
+    assert (catalog["start_year"], catalog["end_year"]) == (2018, 2022)
+    assert catalog["last_ingest"] is not None
+    assert verify_catalog(conn) == []
+    conn.close()
+
+def test_shard_catalogs_merge(db_path, tmp_path):
+    shard_dir = str(tmp_path / "shards")
+    make_shards(db_path, shard_dir)
+    conn = sqlite3.connect(db_path)
+    total, years, regions = counted(conn)
+    conn.close()
+    catalog = load_catalog(os.path.join(shard_dir, "catalog.db"))
+    assert catalog["total_rows"] == total and catalog["years"] == years and catalog["regions"] == regions
+
+def test_verify_reports_tampering(db_path):
+    conn = sqlite3.connect(db_path)
+    assert verify_catalog(conn) == ["catalog tables are missing"]
+    refresh_catalog(conn, source="test")
+    assert verify_catalog(conn) == []
+
+    # Move one Indian Ocean reading from 2020 to 2021 and south of the Indian Ocean box
+    row_id = conn.execute("""
+        SELECT id FROM argo_data WHERE time LIKE '2020-06%' AND longitude BETWEEN 30 AND 110
+          AND latitude BETWEEN -20 AND 20 LIMIT 1
+    """).fetchone()[0]
+    conn.execute("UPDATE argo_data SET time = '2021-06-15T00:00:00Z', latitude = -65.0 WHERE id = ?", (row_id,))
+    conn.commit()
+    problems = verify_catalog(conn)
+    assert any(problem.startswith("year 2020:") for problem in problems)
+    assert any(problem.startswith("year 2021:") for problem in problems)
+    assert any(problem.startswith("region Indian Ocean:") for problem in problems)
+    assert not any(problem.startswith("total_rows") for problem in problems)
+
+    conn.execute("DELETE FROM argo_data WHERE id = ?", (row_id,))
+    conn.commit()
+    assert "total_rows: catalog=5000 actual=4999" in verify_catalog(conn)
+    refresh_catalog(conn, source="test")
+    assert verify_catalog(conn) == []
+    conn.close()
+
+def test_only_bump_version_changes_the_version(db_path):
+    conn = sqlite3.connect(db_path)
+    # The first write always starts at version 1
+    assert refresh_catalog(conn, source="test", bump_version=False) == 1
+    assert refresh_catalog(conn, source="test") == 2
+    assert refresh_catalog(conn, source="optimize_db", bump_version=False) == 2
+    catalog = read_catalog(conn)
+    assert catalog["data_version"] == 2 and catalog["last_ingest"] is None
+    write_catalog(conn, scan_summary(conn), source="test", bump_version=False, ingested=True)
+    catalog = read_catalog(conn)
+    assert catalog["data_version"] == 2 and catalog["last_ingest"] is not None
+    conn.close()
+
+def test_token_changes_per_build(db_path):
+    conn = sqlite3.connect(db_path)
+    refresh_catalog(conn, source="test")
+    first = read_catalog(conn)
+    refresh_catalog(conn, source="optimize_db", bump_version=False)
+    assert catalog_token(read_catalog(conn)) == catalog_token(first)
+    conn.close()
+
+    # An in-place reload recreates the file: version 1 again, but a new token
+    os.remove(db_path)
+    make_database(db_path, rows=3000)
+    conn = sqlite3.connect(db_path)
+    refresh_catalog(conn, source="test")
+    rebuilt = read_catalog(conn)
+    conn.close()
+    assert rebuilt["data_version"] == first["data_version"] == 1
+    assert catalog_token(rebuilt) != catalog_token(first)
+    # Catalogs written before build ids are told apart by updated_at
+    assert catalog_token({"data_version": 1, "updated_at": "2026-01-02T03:04:05Z"}) == "1:2026-01-02T03:04:05Z"
+    assert catalog_token(None) is None
+
+def test_load_catalog_cache(db_path):
+    conn = sqlite3.connect(db_path)
+    refresh_catalog(conn, source="test")
+    first = load_catalog(db_path)
+    assert first["data_version"] == 1
+    # Unchanged file: served from the cache without opening the database
+    assert load_catalog(db_path) is first
+
+    refresh_catalog(conn, source="test")
+    conn.close()
+    # Filesystems with coarse timestamps could give the rewrite the same mtime
+    stat = os.stat(db_path)
+    os.utime(db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = load_catalog(db_path)
+    assert second is not first and second["data_version"] == 2
+    assert load_catalog(db_path) is second
+
+    assert load_catalog(os.path.join(os.path.dirname(db_path), "empty.db")) is None
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
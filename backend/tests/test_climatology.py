@@ -0,0 +1,190 @@
+"""
+Climatology Baseline Tests
+Checks that the per-cell, per-calendar-month normals match the raw rows of
+the baseline period, that shard normals merge into the same table, that a
+region's anomalies compare every cell with its own normal over the exact
+footprint of the region, and that /query risk factors use them when built
+while reading the region's edge (or polygon) rows only once.
+
+Run: python -m pytest tests/test_climatology.py   (or python tests/test_climatology.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from storage.climatology import ClimatologyBuilder, load_normals, region_anomalies, summarize_anomalies
+from storage.cube import CubeBuilder
+from storage.db import ARGO_SCHEMA
+from storage.derived import copy_derived, rebuild_derived
+from storage.engines import SQLiteEngine
+from storage.geometry import resolve_region
+from storage.sketches import SketchBuilder, sketch_cells
+
+# Aligned with the 5 degree cells, so the region is made of whole cells
+BOX = (40.0, 100.0, -30.0, 25.0)
+
+BUILDERS = [CubeBuilder, SketchBuilder, lambda: ClimatologyBuilder(2019, 2021)]
+
+def box_area(box):
+    return resolve_region(None, ",".join(str(v) for v in (box[0], box[2], box[1], box[3])), None)
+
+def raw_anomalies(path, area, year):
+    """Reference: each reading's cell-month mean minus that cell's baseline mean, weighted by readings"""
+    conn = sqlite3.connect(path)
+    baseline = defaultdict(list)
+    for time, lat, lon, temp in conn.execute("""
+        SELECT time, latitude, longitude, temperature FROM argo_data
+        WHERE substr(time, 1, 4) BETWEEN '2019' AND '2021' AND temperature IS NOT NULL
+    """):
+        cx, cy = sketch_cells([lon], [lat])
+        baseline[(int(cx[0]), int(cy[0]), int(time[5:7]))].append(temp)
+    conn.close()
+    points = SQLiteEngine(path).points(area.bounds, year, year)
+    observed = defaultdict(list)
+    cx, cy = sketch_cells(points["longitude"], points["latitude"])
+    for i, temp in enumerate(points["temperature"]):
+        if not np.isnan(temp):
+            observed[(int(cx[i]), int(cy[i]), int(points["time"][i][5:7]))].append(temp)
+    months = defaultdict(lambda: [0, 0.0])
+    for key, values in observed.items():
+        if key in baseline:
+            months[key[2]][0] += len(values)
+            months[key[2]][1] += len(values) * (np.mean(values) - np.mean(baseline[key]))
+    return {month: (count, total / count) for month, (count, total) in months.items()}
+
+def test_normals_match_raw_rows(derived_db):
+    normals = load_normals(derived_db)
+    assert (normals["start_year"], normals["end_year"]) == (2019, 2021)
+    conn = sqlite3.connect(derived_db)
+    rows = conn.execute("""
+        SELECT latitude, longitude, CAST(substr(time, 6, 2) AS INTEGER), temperature FROM argo_data
+        WHERE substr(time, 1, 4) BETWEEN '2019' AND '2021' AND temperature IS NOT NULL
+    """).fetchall()
+    conn.close()
+    table = np.array(rows, dtype=np.float64)
+    cx, cy = sketch_cells(table[:, 1], table[:, 0])
+    keys = ((cy << 7) | cx) * 12 + table[:, 2].astype(np.int64) - 1
+    for key in np.unique(keys)[::97]:
+        values = table[keys == key, 3]
+        index = int(np.searchsorted(normals["keys"], key))
+        count, mean, std = (column[index] for column in normals["temperature"])
+        assert count == len(values)
+        assert mean == pytest.approx(values.mean(), abs=1e-9)
+        assert std == pytest.approx(values.std(), abs=1e-9)
+    # Over its own baseline period every cell, and so any region of whole cells, is normal
+    anomalies = region_anomalies(SQLiteEngine(derived_db), box_area(BOX), 2019, 2021)
+    summary = summarize_anomalies(anomalies["temperature"])
+    assert summary["months"] == 36 and abs(summary["anomaly"]) < 1e-6
+
+@pytest.mark.parametrize("box", [BOX, (42.5, 97.3, -31.2, 23.9), (10.2, 12.9, 5.1, 7.4)])
+def test_anomalies_follow_the_exact_footprint(derived_db, box):
+    area = box_area(box)
+    anomalies = region_anomalies(SQLiteEngine(derived_db), area, 2022, 2022)
+    expected = raw_anomalies(derived_db, area, 2022)
+    series = {month["month"]: month for month in anomalies["temperature"]}
+    assert series.keys() == expected.keys()
+    for month, (count, anomaly) in expected.items():
+        assert series[month]["count"] == count
+        assert series[month]["anomaly"] == pytest.approx(anomaly, abs=1e-9)
+        assert series[month]["year"] == 2022
+
+def test_sampling_shift_is_not_an_anomaly(tmp_path):
+    # A warm and a cold cell sampled evenly in the baseline year, only the warm
+    # one afterwards: against one regional normal that reads as +10 degC
+    path = str(tmp_path / "argo.db")
+    conn = sqlite3.connect(path)
+    conn.execute(ARGO_SCHEMA)
+    conn.executemany(
+        "INSERT INTO argo_data (time, latitude, longitude, pressure, temperature, salinity, platform_number) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"{year}-03-{day:02d}T00:00:00Z", 2.5, lon, 10.0, temp + day % 3 * 0.1, 35.0, "1")
+         for year, lons in ((2020, (2.5, 7.5)), (2021, (2.5,)))
+         for lon, temp in ((2.5, 30.0), (7.5, 10.0)) if lon in lons
+         for day in range(1, 10)],
+    )
+    conn.commit()
+    rebuild_derived(conn, [CubeBuilder(), ClimatologyBuilder(2020, 2020)])
+    conn.close()
+    anomalies = region_anomalies(SQLiteEngine(path), box_area((0.0, 10.0, 0.0, 5.0)), 2021, 2021)
+    [march] = anomalies["temperature"]
+    assert march["value"] == pytest.approx(30.1) and march["normal"] == pytest.approx(30.1)
+    assert march["anomaly"] == pytest.approx(0.0, abs=1e-9)
+
+def test_shard_normals_merge(derived_db, tmp_path):
+    shard_paths = []
+    for year in range(2018, 2023):
+        shard = str(tmp_path / f"argo_{year}.db")
+        conn = sqlite3.connect(shard)
+        conn.execute("ATTACH DATABASE ? AS source", (derived_db,))
+        conn.execute("CREATE TABLE argo_data AS SELECT * FROM source.argo_data WHERE substr(time, 1, 4) = ?",
+                     (str(year),))
+        conn.commit()
+        conn.execute("DETACH DATABASE source")
+        rebuild_derived(conn, [ClimatologyBuilder(2019, 2021)])
+        conn.close()
+        shard_paths.append(shard)
+    merged = sqlite3.connect(str(tmp_path / "catalog.db"))
+    assert copy_derived(merged, shard_paths, [ClimatologyBuilder()]) == ["climatology"]
+    source = sqlite3.connect(derived_db)
+    query = "SELECT * FROM argo_climatology ORDER BY cy, cx, month"
+    expected, actual = source.execute(query).fetchall(), merged.execute(query).fetchall()
+    assert len(expected) == len(actual)
+    assert np.allclose(np.array(expected), np.array(actual), rtol=1e-9, atol=1e-9)
+    assert merged.execute("SELECT * FROM argo_climatology_baseline").fetchall() == [(2019, 2021)]
+
+def test_risk_uses_the_normals(derived_db):
+    pytest.importorskip("fastapi")
+    import main
+
+    area = resolve_region("Indian Ocean", None, None)
+    engine = SQLiteEngine(derived_db)
+    monthly = engine.monthly_aggregates(area.bounds, 2022, 2022)
+    climatology = region_anomalies(engine, area, 2022, 2022)
+    response = main.assemble_response(area.name, "salinity", 2022, 2022, monthly, narrate=False,
+                                      climatology=climatology)
+    assert response["risk"]["basis"] == "climatology"
+    anomaly = response["anomaly"]
+    assert anomaly["baseline"] == {"start_year": 2019, "end_year": 2021}
+    assert [month["label"] for month in anomaly["series"]] == [f"2022-{m:02d}" for m in range(1, 13)]
+    assert response["risk"]["factors"]["temperature_anomaly"] == (abs(anomaly["temperature"]["mean"]) >= 0.15)
+    # Without normals (not built yet, or depth-filtered figures) the range test is used
+    fallback = main.assemble_response(area.name, "salinity", 2022, 2022, monthly, narrate=False)
+    assert fallback["risk"]["basis"] == "range" and "anomaly" not in fallback
+
+def test_region_rows_are_read_once(derived_db, monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+
+    engine = SQLiteEngine(derived_db)
+    reads = []
+    points = engine.points
+    monkeypatch.setattr(engine, "points", lambda *args: reads.append(args) or points(*args))
+    monkeypatch.setattr(main, "get_engine", lambda: engine)
+
+    # Cube, anomalies and quantiles of a box share one read of its four edge strips
+    box = main.compute_response(None, "temperature", 2020, 2022, bbox="42.5,-31.2,97.3,23.9")
+    assert len(reads) == 4 and "anomaly" in box and "median" in box["stats"]
+    # A polygon's rows are read once for its figures, preview, anomalies and quantiles
+    reads.clear()
+    square = '{"type": "Polygon", "coordinates": [[[40, -30], [100, -30], [100, 25], [40, -30]]]}'
+    polygon = main.compute_response(None, "temperature", 2020, 2022, geometry=square)
+    assert len(reads) == 1 and "anomaly" in polygon
+    monthly, latest = SQLiteEngine(derived_db).region_query(resolve_region(None, None, square), 2020, 2022,
+                                                            main.RAW_PREVIEW_LIMIT)
+    assert [row["date"] for row in polygon["data"]] == [row["time"] for row in latest]
+    assert polygon["stats"]["count"] == sum(row["temperature"]["count"] for row in monthly)
+
+    reads.clear()
+    batch = main.query_batch({"queries": [{"bbox": "42.5,-31.2,97.3,23.9", "start_year": 2020},
+                                          {"geometry": square, "start_year": 2020}]})
+    assert len(reads) == 5 and all("anomaly" in result for result in batch["results"])
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,101 @@
+"""
+Aggregate Cube Tests
+Checks that box queries answered from the memory-mapped cube (plus edge
+rows) match the engine's monthly aggregates, that lookups are zero-copy
+views, and that shard cubes merge into one.
+
+Run: python -m pytest tests/test_cube.py   (or python tests/test_cube.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from storage.cube import CubeBuilder, cell_rows, cube_monthly, cube_path, open_cube
+from storage.derived import copy_derived, missing_builders, rebuild_derived
+from storage.engines import SQLiteEngine
+from storage.geometry import resolve_region
+from tests.conftest import make_database
+
+BOXES = [
+    (40.0, 100.0, -30.0, 25.0),
+    (-77.3, -12.6, 3.1, 47.9),
+    (112.5, 180.0, -62.2, 60.0),
+]
+
+BUILDERS = [CubeBuilder]
+
+def test_cube_file_is_tracked(tmp_path):
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=500)
+    conn = sqlite3.connect(path)
+    assert missing_builders(conn, [CubeBuilder()])
+    assert rebuild_derived(conn, [CubeBuilder()]) == ["cube"]
+    assert not missing_builders(conn, [CubeBuilder()])
+    conn.close()
+
+def assert_same_monthly(actual, expected):
+    assert [(row["year"], row["month"]) for row in actual] == [(row["year"], row["month"]) for row in expected]
+    for got, want in zip(actual, expected):
+        for parameter in ("temperature", "salinity"):
+            a, b = got[parameter], want[parameter]
+            assert a["count"] == b["count"]
+            if b["count"]:
+                assert a["min"] == b["min"] and a["max"] == b["max"]
+                assert a["sum"] == pytest.approx(b["sum"], rel=1e-9)
+                assert a["m2"] == pytest.approx(b["m2"], rel=1e-6, abs=1e-6)
+
+@pytest.mark.parametrize("bounds", BOXES)
+@pytest.mark.parametrize("years", [(None, None), (2019, 2020), (2021, None)])
+def test_cube_matches_engine(derived_db, bounds, years):
+    engine = SQLiteEngine(derived_db)
+    area = resolve_region(None, ",".join(str(v) for v in (bounds[0], bounds[2], bounds[1], bounds[3])), None)
+    monthly = cube_monthly(engine, area, *years)
+    assert monthly is not None
+    assert_same_monthly(monthly, engine.monthly_aggregates(area.bounds, *years))
+
+def test_lookups_are_views_of_one_mapping(derived_db):
+    cube = open_cube(derived_db)
+    assert isinstance(cube, np.memmap) and not cube.flags.writeable
+    assert open_cube(derived_db) is cube
+    counts = cube["temp_count"]
+    assert np.shares_memory(counts, cube)
+    rows = cell_rows(cube, (40.0, 100.0, -30.0, 25.0), 2019, 2020)
+    assert np.all(np.diff(cube["key"][rows]) > 0)
+    assert open_cube(os.path.join(os.path.dirname(derived_db), "absent.db")) is None
+
+def test_small_boxes_and_polygons_fall_back(derived_db):
+    engine = SQLiteEngine(derived_db)
+    assert cube_monthly(engine, resolve_region(None, "41,1,43,3", None)) is None
+    square = '{"type": "Polygon", "coordinates": [[[40, -30], [100, -30], [100, 25], [40, -30]]]}'
+    assert cube_monthly(engine, resolve_region(None, None, square)) is None
+
+def test_shard_cubes_merge(derived_db, tmp_path):
+    whole = open_cube(derived_db)
+    shards = []
+    for year in (2018, 2019, 2020, 2021, 2022):
+        shard = str(tmp_path / f"argo_{year}.db")
+        source = sqlite3.connect(derived_db)
+        target = sqlite3.connect(shard)
+        source.backup(target)
+        target.execute("DELETE FROM argo_data WHERE substr(time, 1, 4) != ?", (str(year),))
+        target.commit()
+        rebuild_derived(target, [CubeBuilder()])
+        source.close()
+        target.close()
+        shards.append(shard)
+    merged = sqlite3.connect(str(tmp_path / "catalog.db"))
+    assert copy_derived(merged, shards, [CubeBuilder()]) == ["cube"]
+    merged.close()
+    combined = np.load(cube_path(str(tmp_path / "catalog.db")), mmap_mode="r")
+    assert np.array_equal(combined["key"], whole["key"])
+    assert np.array_equal(combined["sal_count"], whole["sal_count"])
+    assert np.allclose(combined["temp_sum"], whole["temp_sum"])
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,169 @@
+"""
+Derived Table Tests
+Checks the tables precomputed at ingest (tile pyramid, samples, ...) against the
+synthetic argo_data used by the engine parity tests.
+
+Run: python -m pytest tests/test_derived.py   (or python tests/test_derived.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+import tempfile
+
+import numpy as np
+import pytest
+
+from storage.aggregates import summarize
+from storage.derived import copy_derived, rebuild_derived
+from storage.engines import SQLiteEngine
+from storage.geometry import resolve_region
+from storage.regions import REGION_BOUNDS
+from storage.representatives import rep_cells, spread_preview
+from storage.samples import (MIN_PER_STRATUM, SAMPLE_RATES, SampleBuilder, approximate_monthly,
+                             confidence_intervals)
+from storage.tiles import FINE_LEVEL, TILE_BITS, cell_index, read_tile
+from tests.conftest import make_database
+
+@pytest.fixture(scope="module")
+def built_db():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "argo.db")
+        make_database(path)
+        conn = sqlite3.connect(path)
+        rebuild_derived(conn, chunk_rows=3000)
+        conn.close()
+        yield tmp, path
+
+def test_tile_levels_conserve_counts(built_db):
+    _, path = built_db
+    conn = sqlite3.connect(path)
+    total, temps = conn.execute("SELECT COUNT(*), COUNT(temperature) FROM argo_data").fetchone()
+    levels = conn.execute(
+        "SELECT level, SUM(obs_count), SUM(temp_count), SUM(temp_sum) FROM argo_tiles GROUP BY level"
+    ).fetchall()
+    temp_sum = conn.execute("SELECT SUM(temperature) FROM argo_data").fetchone()[0]
+    conn.close()
+    assert [level for level, *_ in levels] == list(range(TILE_BITS, FINE_LEVEL + 1))
+    for _, count, temp_count, level_sum in levels:
+        assert (count, temp_count) == (total, temps)
+        assert abs(level_sum - temp_sum) < 1e-6 * abs(temp_sum)
+
+def test_tile_matches_raw_rows(built_db):
+    _, path = built_db
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT latitude, longitude, temperature FROM argo_data WHERE substr(time, 1, 4) = '2020'"
+    ).fetchall()
+    lats, lons, temps = (np.array(column, dtype=float) for column in zip(*rows))
+    # Tile 3/4/2 covers level-7 cells 64..79 x 32..47
+    cx, cy = cell_index(lons, lats, 7)
+    inside = (cx >= 64) & (cx <= 79) & (cy >= 32) & (cy <= 47)
+    tile = read_tile(conn, 3, 4, 2, 2020, 2020)
+    conn.close()
+    assert sum(cell["count"] for cell in tile["cells"]) == int(inside.sum())
+    first = tile["cells"][0]
+    selected = inside & (cx == first["cx"]) & (cy == first["cy"])
+    assert abs(first["temperature"] - np.nanmean(temps[selected])) < 1e-3
+
+def test_shard_tables_concatenate(built_db):
+    tmp, path = built_db
+    source = sqlite3.connect(path)
+    shard_paths = []
+    for year in range(2018, 2023):
+        shard = os.path.join(tmp, f"argo_{year}.db")
+        source.execute("ATTACH DATABASE ? AS shard", (shard,))
+        source.execute("CREATE TABLE shard.argo_data AS SELECT * FROM argo_data WHERE substr(time, 1, 4) = ?",
+                       (str(year),))
+        source.commit()
+        source.execute("DETACH DATABASE shard")
+        conn = sqlite3.connect(shard)
+        rebuild_derived(conn)
+        conn.close()
+        shard_paths.append(shard)
+
+    merged = sqlite3.connect(os.path.join(tmp, "catalog.db"))
+    assert copy_derived(merged, shard_paths) == ["tiles", "representatives", "samples", "sketches", "ts_bins", "depth_rollup",
+                                                    "platform_stations", "floats_hll", "cube",
+                                                    "climatology"]
+    query = "SELECT * FROM argo_cell_reps ORDER BY level, cy, cx, year"
+    assert source.execute(query).fetchall() == merged.execute(query).fetchall()
+    query = "SELECT * FROM argo_tiles ORDER BY level, cy, cx, year"
+    expected = source.execute(query).fetchall()
+    actual = merged.execute(query).fetchall()
+    source.close()
+    merged.close()
+    assert len(expected) == len(actual)
+    for left, right in zip(expected, actual):
+        assert left[:6] == right[:6] and left[7] == right[7]
+        assert abs(left[6] - right[6]) < 1e-6 and abs(left[8] - right[8]) < 1e-6
+
+def test_spread_preview_one_row_per_cell(built_db):
+    _, path = built_db
+    for bounds in REGION_BOUNDS.values():
+        for start_year, end_year in ((None, None), (2020, 2020)):
+            rows = spread_preview(path, bounds, start_year, end_year, 100)
+            assert 0 < len(rows) <= 100
+            lon_min, lon_max, lat_min, lat_max = bounds
+            for row in rows:
+                assert lon_min <= row["longitude"] <= lon_max and lat_min <= row["latitude"] <= lat_max
+                if start_year:
+                    assert row["time"][:4] == str(start_year)
+            assert [row["time"] for row in rows] == sorted((row["time"] for row in rows), reverse=True)
+
+def test_representative_is_latest_in_cell(built_db):
+    _, path = built_db
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT time, latitude, longitude FROM argo_data WHERE time LIKE '2021%'").fetchall()
+    reps = conn.execute("SELECT cy, cx, time FROM argo_cell_reps WHERE level = 1 AND year = 2021").fetchall()
+    conn.close()
+    times = np.array([row[0] for row in rows])
+    cx, cy = rep_cells([row[2] for row in rows], [row[1] for row in rows], 1)
+    for rep_cy, rep_cx, rep_time in reps:
+        assert rep_time == max(times[(cx == rep_cx) & (cy == rep_cy)])
+
+def test_sample_tiers_are_nested_strata(built_db):
+    _, path = built_db
+    conn = sqlite3.connect(path)
+    rebuild_derived(conn, [SampleBuilder(seed=3)])
+    total = conn.execute("SELECT COUNT(*) FROM argo_data").fetchone()[0]
+    strata = conn.execute("SELECT tier, cy, cx, year, rows, sampled FROM argo_sample_strata").fetchall()
+    counted = dict(conn.execute(
+        "SELECT cy || ',' || cx || ',' || year || ',' || t.tier, COUNT(*) FROM argo_samples "
+        "JOIN (SELECT 0 AS tier UNION SELECT 1) t ON argo_samples.tier >= t.tier GROUP BY 1"
+    ).fetchall())
+    conn.close()
+    for tier in range(len(SAMPLE_RATES)):
+        assert sum(row[4] for row in strata if row[0] == tier) == total
+    for tier, cy, cx, year, rows, sampled in strata:
+        assert counted[f"{cy},{cx},{year},{tier}"] == sampled
+        assert min(rows, MIN_PER_STRATUM) <= sampled <= rows
+    dense = [row[5] for row in strata if row[0] == 0]
+    sparse = [row[5] for row in strata if row[0] == 1]
+    assert sum(sparse) <= sum(dense)
+
+def test_approximate_interval_covers_exact(built_db):
+    _, path = built_db
+    conn = sqlite3.connect(path)
+    rebuild_derived(conn, [SampleBuilder(seed=5)])
+    conn.close()
+    area = resolve_region("Pacific Ocean")
+    exact = SQLiteEngine(path).monthly_aggregates(area.bounds, 2019, 2021)
+    estimates, info = approximate_monthly(path, area, "temperature", 2019, 2021, min_rows=100)
+    assert estimates is not None and info["sample_rows"] >= 100
+    intervals = confidence_intervals(estimates, "temperature")
+    truth = summarize(exact, "temperature")
+    low, high = intervals["mean"]
+    assert low <= truth["mean"] <= high
+    low, high = intervals["count"]
+    assert low <= truth["count"] <= high
+    assert [entry["year"] for entry in intervals["yearly"]] == [2019, 2020, 2021]
+
+    # Too few sampled readings falls back to the exact query
+    estimates, reason = approximate_monthly(path, area, "temperature", 2019, 2021, min_rows=10 ** 6)
+    assert estimates is None and "fewer than" in reason
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
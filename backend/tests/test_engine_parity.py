@@ -0,0 +1,300 @@
+"""
+Query Engine Parity Tests
+Builds a small synthetic argo_data table and checks that every alternative
+engine returns the same stats and timeseries figures as the SQLite engine
+(the sharded engine also the same previews and export pages), and that a
+batch reports malformed specs in their own slots.
+
+Run: python -m pytest tests/test_engine_parity.py   (or python tests/test_engine_parity.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+import tempfile
+
+import numpy as np
+import pytest
+
+from storage.aggregates import PARAMETERS, group_means, summarize
+from storage.catalog import refresh_catalog
+from storage.engines import SQLiteEngine
+from storage.geometry import points_in_polygons, resolve_region
+from storage.regions import REGION_BOUNDS
+from tests.conftest import make_database, make_shards
+
+YEAR_RANGES = [(None, None), (2019, 2021), (2020, 2020)]
+
+def figures(engine, bounds, start_year, end_year):
+    """The numbers build_response publishes: rounded stats + period means"""
+    monthly = engine.monthly_aggregates(bounds, start_year, end_year)
+    result = {}
+    for parameter in PARAMETERS:
+        stats = summarize(monthly, parameter)
+        result[parameter] = {
+            "stats": {key: round(value, 2) if key != "count" else value for key, value in stats.items()},
+            "series": {
+                granularity: [(group["key"], round(group["mean"], 2))
+                              for group in group_means(monthly, parameter, granularity)]
+                for granularity in ("month", "quarter", "year")
+            },
+        }
+    return result
+
+def assert_close(expected, actual, tolerance):
+    if isinstance(expected, dict):
+        assert expected.keys() == actual.keys()
+        for key in expected:
+            assert_close(expected[key], actual[key], tolerance)
+    elif isinstance(expected, (list, tuple)):
+        assert len(expected) == len(actual)
+        for left, right in zip(expected, actual):
+            assert_close(left, right, tolerance)
+    elif isinstance(expected, float):
+        assert abs(expected - actual) <= tolerance, (expected, actual)
+    else:
+        assert expected == actual
+
+def check_parity(reference, candidate, tolerance=0.0):
+    for bounds in REGION_BOUNDS.values():
+        for start_year, end_year in YEAR_RANGES:
+            expected = figures(reference, bounds, start_year, end_year)
+            actual = figures(candidate, bounds, start_year, end_year)
+            if tolerance:
+                assert_close(expected, actual, tolerance)
+            else:
+                assert expected == actual
+
+def check_multi(engine):
+    """monthly_aggregates_multi must equal one monthly_aggregates call per box"""
+    boxes = list(REGION_BOUNDS.values())
+    for start_year, end_year in YEAR_RANGES:
+        shared = engine.monthly_aggregates_multi(boxes, start_year, end_year)
+        for bounds, monthly in zip(boxes, shared):
+            single = engine.monthly_aggregates(bounds, start_year, end_year)
+            assert [(row["year"], row["month"]) for row in monthly] == \
+                   [(row["year"], row["month"]) for row in single]
+            for parameter in PARAMETERS:
+                assert_close(summarize(single, parameter), summarize(monthly, parameter), 1e-9)
+
+# Triangle over the Indian/Pacific edge with a rectangular hole
+POLYGON = {"type": "Polygon", "coordinates": [
+    [[90, -40], [150, -20], [100, 40], [90, -40]],
+    [[105, -5], [115, -5], [115, 5], [105, 5], [105, -5]],
+]}
+
+def check_polygon(engine):
+    """Cell-mask refinement must equal the plain point-in-polygon test"""
+    area = resolve_region(None, geometry=POLYGON)
+    for start_year, end_year in YEAR_RANGES:
+        monthly, preview = engine.region_query(area, start_year, end_year, 50)
+        points = engine.points(area.bounds, start_year, end_year)
+        keep = points_in_polygons(points["longitude"], points["latitude"], area.polygons)
+        for parameter in PARAMETERS:
+            values = points[parameter][keep]
+            values = values[~np.isnan(values)]
+            stats = summarize(monthly, parameter)
+            assert stats["count"] == len(values)
+            assert abs(stats["mean"] - values.mean()) < 1e-6
+        assert len(preview) == min(50, int(keep.sum()))
+
+@pytest.fixture(scope="module")
+def source_db():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "argo.db")
+        make_database(path)
+        yield tmp, path
+
+@pytest.fixture(scope="module")
+def shard_dir(source_db):
+    tmp, path = source_db
+    shard_dir = os.path.join(tmp, "shards")
+    make_shards(path, shard_dir)
+    return shard_dir
+
+def test_sharded_matches_sqlite(source_db, shard_dir):
+    from storage.shards import ShardedEngine
+
+    _, path = source_db
+    engine, reference = ShardedEngine(shard_dir, max_workers=2), SQLiteEngine(path)
+    check_parity(reference, engine)
+    check_multi(engine)
+    check_polygon(engine)
+    for bounds in REGION_BOUNDS.values():
+        for start_year, end_year in YEAR_RANGES:
+            # Rows tied on time may come in any order, so the previews are compared by time
+            expected = reference.preview(bounds, start_year, end_year, 100)
+            actual = engine.preview(bounds, start_year, end_year, 100)
+            assert [row["time"] for row in actual] == [row["time"] for row in expected]
+
+def test_sharded_export_resume(source_db, shard_dir):
+    from storage.shards import ShardedEngine
+
+    _, path = source_db
+    engine, reference = ShardedEngine(shard_dir, max_workers=2), SQLiteEngine(path)
+    bounds = REGION_BOUNDS["Pacific Ocean"]
+    rows = [row for page in engine.export_pages(bounds, 2019, 2021, page_rows=97) for row in page]
+    assert rows == [row for page in reference.export_pages(bounds, 2019, 2021, page_rows=97) for row in page]
+    # Resume inside a shard and from the last row of one (the next shard starts from the top)
+    last_2019 = max(i for i, row in enumerate(rows) if row["time"].startswith("2019"))
+    for index in (0, 96, len(rows) // 2, last_2019, len(rows) - 1):
+        resumed = engine.export_pages(bounds, 2019, 2021, after=rows[index]["cursor"], page_rows=97)
+        assert [row for page in resumed for row in page] == rows[index + 1:]
+
+def test_shard_pruning(shard_dir, monkeypatch):
+    from storage.shards import ShardedEngine
+
+    engine = ShardedEngine(shard_dir, max_workers=2)
+    assert engine.shards_for() == [2018, 2019, 2020, 2021, 2022]
+    assert engine.shards_for(2019, 2021) == [2019, 2020, 2021]
+    assert engine.shards_for(None, 2018) == [2018]
+    assert engine.shards_for(2021, None) == [2021, 2022]
+    assert engine.shards_for(2030, 2031) == []
+    opened = []
+    query_shard = engine._query_shard
+    monkeypatch.setattr(engine, "_query_shard", lambda year, *args: opened.append(year) or query_shard(year, *args))
+    monthly = engine.monthly_aggregates(REGION_BOUNDS["Indian Ocean"], 2020, 2020)
+    assert sorted(opened) == [2020] and {row["year"] for row in monthly} == {2020}
+    assert engine.monthly_aggregates(REGION_BOUNDS["Indian Ocean"], 2030, 2031) == []
+
+def test_duckdb_matches_sqlite(source_db):
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pandas")
+    from storage.parquet import DuckDBEngine, export_parquet
+
+    tmp, path = source_db
+    parquet_dir = os.path.join(tmp, "parquet")
+    export_parquet(path, parquet_dir)
+    engine = DuckDBEngine(parquet_dir, db_path=path, threads=2)
+    check_parity(SQLiteEngine(path), engine)
+    check_multi(engine)
+
+def test_duckdb_after_reload(tmp_path):
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pandas")
+    from storage.parquet import DuckDBEngine, export_parquet
+
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=2000)
+    conn = sqlite3.connect(path)
+    refresh_catalog(conn, source="test")
+    conn.close()
+    parquet_dir = str(tmp_path / "parquet")
+    export_parquet(path, parquet_dir)
+    engine = DuckDBEngine(parquet_dir, db_path=path, threads=2)
+    assert engine._stale() is None
+    # Reloaded with other rows (data_version 1 again): the old files must not answer
+    os.remove(path)
+    make_database(path, rows=3000, seed=11)
+    conn = sqlite3.connect(path)
+    refresh_catalog(conn, source="test")
+    conn.close()
+    assert engine._stale() is not None
+    check_parity(SQLiteEngine(path), engine)
+    check_multi(engine)
+    export_parquet(path, parquet_dir)
+    assert engine._stale() is None
+    # DuckDB sums in another order, which can move a rounded figure by one unit
+    check_parity(SQLiteEngine(path), engine, tolerance=0.011)
+
+def test_compact_matches_sqlite(source_db):
+    from storage.compact import CompactSQLiteEngine, migrate_to_compact
+
+    tmp, path = source_db
+    compact_path = os.path.join(tmp, "argo_compact.db")
+    migrate_to_compact(path, compact_path)
+    engine = CompactSQLiteEngine(compact_path)
+    check_parity(SQLiteEngine(path), engine)
+    check_polygon(engine)
+
+def test_compact_keeps_colliding_readings(tmp_path):
+    from storage.catalog import read_catalog
+    from storage.compact import CompactSQLiteEngine, migrate_to_compact
+
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=2000)
+    conn = sqlite3.connect(path)
+    # Distinct readings that share a compact key: missing pressure, and levels 0.03 dbar apart
+    conn.executemany(
+        "INSERT INTO argo_data (time, latitude, longitude, pressure, temperature, salinity, platform_number) "
+        "VALUES ('2021-06-01T00:00:00Z', 10.0, 70.0, ?, ?, 35.0, '5900001')",
+        [(None, 20.0), (None, 21.0), (None, 22.0), (10.01, 18.0), (10.04, 19.0)],
+    )
+    conn.commit()
+    conn.close()
+    compact_path = str(tmp_path / "argo_compact.db")
+    result = migrate_to_compact(path, compact_path)
+    assert result["rows_read"] == result["rows_written"] == 2005
+    engine = CompactSQLiteEngine(compact_path)
+    check_parity(SQLiteEngine(path), engine)
+    conn = sqlite3.connect(compact_path)
+    assert read_catalog(conn)["total_rows"] == 2005
+    conn.close()
+    rows = [row for page in engine.export_pages((65, 75, 5, 15), 2021, 2021, page_rows=2)
+            for row in page if row["platform_number"] == "5900001"]
+    assert sorted(row["temperature"] for row in rows) == [18.0, 19.0, 20.0, 21.0, 22.0]
+
+def test_columnar_matches_sqlite(source_db):
+    from storage.columnar import ColumnarEngine, build_columnar_store
+
+    tmp, path = source_db
+    store_dir = os.path.join(tmp, "columnar")
+    conn = sqlite3.connect(path)
+    refresh_catalog(conn, source="test")
+    conn.close()
+    build_columnar_store(path, store_dir)
+    # float32 storage can move a rounded figure by one unit in the last place
+    engine = ColumnarEngine(store_dir, db_path=path)
+    check_parity(SQLiteEngine(path), engine, tolerance=0.01)
+    check_multi(engine)
+    check_polygon(engine)
+
+def test_columnar_store_must_match_catalog(tmp_path):
+    from storage.columnar import ColumnarEngine, build_columnar_store
+
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=2000)
+    conn = sqlite3.connect(path)
+    refresh_catalog(conn, source="test")
+    store_dir = str(tmp_path / "columnar")
+    build_columnar_store(path, store_dir)
+    conn.close()
+    assert isinstance(ColumnarEngine(store_dir, db_path=path).columns["time"], np.memmap)
+    # A reload after the store was built: the file is recreated with other rows
+    # and starts again at data_version 1, but the stale .npy files must not be served
+    os.remove(path)
+    make_database(path, rows=3000, seed=11)
+    conn = sqlite3.connect(path)
+    assert refresh_catalog(conn, source="test") == 1
+    conn.close()
+    engine = ColumnarEngine(store_dir, db_path=path)
+    assert not isinstance(engine.columns["time"], np.memmap)
+    check_parity(SQLiteEngine(path), engine, tolerance=0.01)
+
+def test_sqlite_multi_region_scan(source_db):
+    _, path = source_db
+    check_multi(SQLiteEngine(path))
+
+def test_sqlite_polygon_region(source_db):
+    _, path = source_db
+    check_polygon(SQLiteEngine(path))
+
+def test_batch_reports_bad_specs_in_place(source_db, monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+
+    _, path = source_db
+    monkeypatch.setattr(main, "get_engine", lambda: SQLiteEngine(path))
+    monkeypatch.setattr(main.admission, "start", lambda: "full")
+    batch = main.query_batch({"queries": [1, {"region": "Indian Ocean", "start_year": 2020}, "Pacific Ocean",
+                                          {"region": "Nowhere"}]})
+    bad, good, text, unknown = batch["results"]
+    assert batch["count"] == 4 and good["stats"]["count"] > 0
+    for result in (bad, text, unknown):
+        assert result["stats"] == {} and result["parsed"]["source"] == "batch" and result["message"]
+    assert bad["message"] == text["message"] != unknown["message"]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,108 @@
+"""
+Export Tests
+Keyset export pages must cover the filtered rows exactly once, resume after
+any cursor (with or without a time index), and encode to every output format.
+
+Run: python -m pytest tests/test_export.py   (or python tests/test_export.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import csv
+import io
+import json
+import sqlite3
+import tempfile
+
+import pytest
+
+from storage.engines import SQLiteEngine
+from storage.export import stream_export
+from storage.geometry import resolve_region
+from tests.conftest import make_database
+from tests.test_engine_parity import POLYGON
+
+@pytest.fixture(scope="module")
+def source_db():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "argo.db")
+        make_database(path, rows=5000)
+        yield tmp, path
+
+def export_rows(engine, area, start_year=None, end_year=None, after=None, page_rows=97):
+    chunks = stream_export(engine, area, start_year, end_year, "ndjson", after, page_rows)
+    return [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+
+def check_export(engine, reference):
+    area = resolve_region("Pacific Ocean")
+    rows = export_rows(engine, area, 2019, 2021)
+    expected = reference.points(area.bounds, 2019, 2021)
+    assert len(rows) == len(expected["time"])
+    assert [row["time"] for row in rows] == sorted(expected["time"].tolist())
+    assert all(row["time"][:4] in ("2019", "2020", "2021") for row in rows)
+    for index in (0, 96, 97, len(rows) // 2, len(rows) - 1):
+        assert export_rows(engine, area, 2019, 2021, after=rows[index]["cursor"]) == rows[index + 1:]
+
+def test_sqlite_export_resume(source_db):
+    _, path = source_db
+    check_export(SQLiteEngine(path), SQLiteEngine(path))
+
+def test_export_without_time_index(tmp_path, monkeypatch):
+    # optimize_db.py drops idx_time in favour of idx_geo_time: the export must
+    # still be a single ordered query, not one sort per page
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=5000)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX idx_time")
+    conn.execute("CREATE INDEX idx_geo_time ON argo_data(longitude, latitude, time)")
+    conn.commit()
+    conn.close()
+    check_export(SQLiteEngine(path), SQLiteEngine(path))
+
+    connect = sqlite3.connect
+    opened = []
+    monkeypatch.setattr(sqlite3, "connect", lambda *args, **kwargs: opened.append(args) or connect(*args, **kwargs))
+    rows = export_rows(SQLiteEngine(path), resolve_region("Pacific Ocean"), page_rows=50)
+    assert len(rows) > 500 and len(opened) == 1
+
+def test_compact_export_resume(source_db):
+    from storage.compact import CompactSQLiteEngine, migrate_to_compact
+
+    tmp, path = source_db
+    compact_path = os.path.join(tmp, "argo_compact.db")
+    migrate_to_compact(path, compact_path)
+    check_export(CompactSQLiteEngine(compact_path), SQLiteEngine(path))
+
+def test_polygon_export(source_db):
+    _, path = source_db
+    engine = SQLiteEngine(path)
+    area = resolve_region(None, geometry=POLYGON)
+    _, preview = engine.region_query(area, None, None, 10 ** 6)
+    rows = export_rows(engine, area)
+    assert sorted(row["time"] for row in rows) == sorted(row["time"] for row in preview)
+
+def test_formats(source_db):
+    _, path = source_db
+    engine = SQLiteEngine(path)
+    area = resolve_region("Indian Ocean")
+    expected = export_rows(engine, area, 2020, 2020)
+
+    text = b"".join(stream_export(engine, area, 2020, 2020, "csv", page_rows=50)).decode()
+    parsed = list(csv.DictReader(io.StringIO(text)))
+    assert [row["cursor"] for row in parsed] == [row["cursor"] for row in expected]
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = b"".join(stream_export(engine, area, 2020, 2020, "parquet", page_rows=50))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column("cursor").to_pylist() == [row["cursor"] for row in expected]
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == -(-len(expected) // 50)
+
+def test_bad_cursor(source_db):
+    _, path = source_db
+    with pytest.raises(ValueError):
+        stream_export(SQLiteEngine(path), resolve_region("Indian Ocean"), after="nonsense")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
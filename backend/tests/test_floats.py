@@ -0,0 +1,69 @@
+"""
+Active Float Count Tests
+Checks the HyperLogLog sketches (sparse/dense encoding, merging, estimate
+error) and region float counts against COUNT(DISTINCT platform_number).
+
+Run: python -m pytest tests/test_floats.py   (or python tests/test_floats.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from storage.floats import (FLOAT_DEG, HLL_REGISTERS, FloatSketchBuilder, active_floats, coverage_confidence,
+                            encode_registers, estimate, merge_blobs, platform_hashes)
+from storage.geometry import resolve_region
+
+def sketch(platforms):
+    index, rank = platform_hashes(platforms)
+    registers = np.zeros(HLL_REGISTERS, dtype=np.int64)
+    np.maximum.at(registers, index, rank)
+    present = np.flatnonzero(registers)
+    return encode_registers(present, registers[present])
+
+def test_estimates_and_merges():
+    for n in (10, 300, 5000, 100000):
+        platforms = [f"{5900000 + i}" for i in range(n)]
+        blob = sketch(platforms)
+        assert (len(blob) == HLL_REGISTERS) == (n > 1000)
+        assert abs(estimate(merge_blobs([blob])[0]) - n) / n < 0.1, n
+    # Overlapping sketches merge to the size of the union, mixing sparse and dense
+    parts = [sketch([f"{5900000 + i}" for i in range(start, start + size)])
+             for start, size in ((0, 200), (100, 3000), (2500, 50))]
+    assert abs(estimate(merge_blobs(parts)[0]) - 3100) / 3100 < 0.1
+    per_group = merge_blobs(parts, [0, 1, 0], 2)
+    assert abs(estimate(per_group[0]) - 250) / 250 < 0.1
+
+def test_coverage_lowers_confidence():
+    floats = lambda *counts: {"per_year": [{"year": 2020 + i, "estimate": c} for i, c in enumerate(counts)]}
+    assert coverage_confidence("high", floats(50, 60)) == "high"
+    assert coverage_confidence("high", floats(50, 12)) == "medium"
+    assert coverage_confidence("medium", floats(3, 60)) == "low"
+    assert coverage_confidence("unknown", floats(3)) == "unknown"
+
+BUILDERS = [FloatSketchBuilder]
+
+def test_region_counts_match_distinct(derived_db):
+    conn = sqlite3.connect(derived_db)
+    for bbox, start_year, end_year in (("-180,-90,180,90", None, None), ("-60,-40,40,30", 2020, 2021)):
+        area = resolve_region(None, bbox=bbox)
+        lon_min, lon_max, lat_min, lat_max = area.bounds
+        # Exact answer over the cells whose centre is inside the box
+        exact = conn.execute(f"""
+            SELECT COUNT(DISTINCT platform_number) FROM argo_data
+            WHERE (CAST((longitude + 180) / {FLOAT_DEG} AS INTEGER) + 0.5) * {FLOAT_DEG} - 180 BETWEEN ? AND ?
+              AND (CAST((latitude + 90) / {FLOAT_DEG} AS INTEGER) + 0.5) * {FLOAT_DEG} - 90 BETWEEN ? AND ?
+              AND time >= ? AND time < ?
+        """, (lon_min, lon_max, lat_min, lat_max, f"{start_year or 0:04d}", f"{(end_year or 9998) + 1:04d}")).fetchone()[0]
+        result = active_floats(derived_db, area, start_year, end_year)
+        assert abs(result["estimate"] - exact) <= max(2, 0.1 * exact)
+        assert len(result["per_year"]) == (5 if start_year is None else 2)
+    conn.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
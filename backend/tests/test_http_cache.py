@@ -0,0 +1,95 @@
+"""
+HTTP Revalidation and Compression Tests
+Checks ETag/Last-Modified validators, that a matching If-None-Match gets an
+empty 304 before the route computes anything, that validators change with
+the data version, build and parameters, and gzip negotiation.
+
+Run: python -m pytest tests/test_http_cache.py   (or python tests/test_http_cache.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+from serving.compression import accepted_encoding
+
+CATALOG = {"data_version": 3, "build_id": "first", "updated_at": "2026-01-02T03:04:05Z", "start_year": 2001, "end_year": 2020,
+           "regions": {}}
+
+@pytest.fixture
+def client(monkeypatch):
+    import main
+    info = dict(CATALOG)
+    monkeypatch.setattr(main, "catalog", lambda: info)
+    calls = []
+
+    def fake_build(region, parameter, start_year, end_year, **options):
+        calls.append(region)
+        return {"region": region, "parameter": parameter, "data": [{"value": i} for i in range(500)]}
+
+    monkeypatch.setattr(main, "build_response", fake_build)
+    # No `with`: the lifespan (cache warmer) is not started
+    return TestClient(main.app), info, calls
+
+def test_validators_and_not_modified(client):
+    client, info, calls = client
+    first = client.get("/query", params={"region": "Arabian Sea"})
+    assert first.status_code == 200 and calls == ["Arabian Sea"]
+    tag = first.headers["etag"]
+    assert first.headers["last-modified"] == "Fri, 02 Jan 2026 03:04:05 GMT"
+    assert "max-age" in first.headers["cache-control"]
+
+    again = client.get("/query", params={"region": "Arabian Sea"}, headers={"If-None-Match": tag})
+    assert again.status_code == 304 and again.content == b""
+    assert calls == ["Arabian Sea"]                  # answered before any computation
+    assert again.headers["etag"] == tag
+
+    other = client.get("/query", params={"region": "Bay of Bengal"}, headers={"If-None-Match": tag})
+    assert other.status_code == 200 and other.headers["etag"] != tag
+
+    since = client.get("/year-range", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+
+    info["data_version"] = 4
+    stale = client.get("/query", params={"region": "Arabian Sea"}, headers={"If-None-Match": tag})
+    assert stale.status_code == 200 and stale.headers["etag"] != tag
+
+    # An in-place rebuild starts again at the same version with a new build id
+    info["data_version"], info["build_id"] = 3, "rebuilt"
+    rebuilt = client.get("/query", params={"region": "Arabian Sea"}, headers={"If-None-Match": tag})
+    assert rebuilt.status_code == 200 and rebuilt.headers["etag"] != tag
+
+def test_metrics_report_not_modified_rate(client):
+    client, _, _ = client
+    tag = client.get("/regions").headers["etag"]
+    client.get("/regions", headers={"If-None-Match": tag})
+    http = client.get("/metrics").json()["http"]
+    assert 0 < http["not_modified_rate"] <= 1
+    assert http["bytes_saved"] > 0
+
+def test_gzip_negotiation(client):
+    client, _, _ = client
+    response = client.get("/query", params={"region": "Arabian Sea"}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] in ("gzip", "br")
+    assert len(response.json()["data"]) == 500       # httpx decodes transparently
+    plain = client.get("/query", params={"region": "Arabian Sea"}, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    small = client.get("/year-range", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers   # below the minimum size
+
+def test_accepted_encoding():
+    assert accepted_encoding("gzip, deflate") == "gzip"
+    assert accepted_encoding("gzip;q=0, identity") is None
+    assert accepted_encoding("") is None
+    assert accepted_encoding("*") in ("br", "gzip")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,72 @@
+"""
+Float Trajectory Tests
+Checks the per-station summaries against the raw rows of a float and the
+Douglas-Peucker path simplification.
+
+Run: python -m pytest tests/test_platforms.py   (or python tests/test_platforms.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from storage.platforms import StationBuilder, douglas_peucker, series, trajectory, unwrap_longitudes
+
+BUILDERS = [StationBuilder]
+# One float reporting profiles: three levels per station
+EXTRA_ROWS = [
+    (f"2021-{month:02d}-01T00:00:00Z", 10.0 + month, 179.0 + month % 2 * -358.5, pressure,
+     20.0 - pressure / 100, None if pressure == 1000 else 35.0, "7900001")
+    for month in range(1, 13) for pressure in (5.0, 500.0, 1000.0)
+]
+
+def test_station_summaries(derived_db):
+    result = series(derived_db, "7900001")
+    assert result["count"] == 12
+    first = dict(zip(result["fields"], result["stations"][0]))
+    assert first["time"] == "2021-01-01T00:00:00Z" and first["levels"] == 3
+    assert (first["pres_min"], first["pres_max"]) == (5.0, 1000.0)
+    assert first["temp_count"] == 3 and abs(first["temp_mean"] - (19.95 + 15 + 10) / 3) < 1e-9
+    assert first["sal_count"] == 2 and first["sal_max"] == 35.0
+    assert series(derived_db, "7900001", 2022, 2022)["count"] == 0
+
+def test_summaries_cover_every_row(derived_db):
+    conn = sqlite3.connect(derived_db)
+    expected = conn.execute("""
+        SELECT platform_number, COUNT(*), COUNT(temperature), MAX(pressure) FROM argo_data
+        WHERE platform_number = '1900007' GROUP BY platform_number
+    """).fetchone()
+    conn.close()
+    result = series(derived_db, "1900007")
+    rows = [dict(zip(result["fields"], station)) for station in result["stations"]]
+    assert sum(row["levels"] for row in rows) == expected[1]
+    assert sum(row["temp_count"] for row in rows) == expected[2]
+    assert max(row["pres_max"] for row in rows) == expected[3]
+    assert [row["time"] for row in rows] == sorted(row["time"] for row in rows)
+
+def test_trajectory_crosses_antimeridian(derived_db):
+    full = trajectory(derived_db, "7900001")
+    assert full["count"] == 12 and len(full["points"]) == 12 and not full["simplified"]
+    # Longitudes alternate 179.0 / -179.5: a 1.5 degree zigzag once unwrapped
+    lons = unwrap_longitudes(np.array([point[2] for point in full["points"]]))
+    assert np.abs(np.diff(lons)).max() < 2
+    simplified = trajectory(derived_db, "7900001", tolerance=1.0)
+    assert simplified["simplified"] and simplified["points"][0] == full["points"][0]
+    assert simplified["points"][-1] == full["points"][-1]
+
+def test_douglas_peucker():
+    xs = np.linspace(0, 10, 101)
+    ys = np.where(xs < 5, 0.0, xs - 5)
+    ys[30] += 0.05
+    kept = douglas_peucker(xs, ys, 0.01)
+    assert kept.tolist() == [0, 29, 30, 31, 50, 100]
+    assert douglas_peucker(xs, ys, 1.0).tolist() == [0, 50, 100]
+    assert len(douglas_peucker(xs, ys, 0.0)) == 101
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
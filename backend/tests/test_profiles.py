@@ -0,0 +1,72 @@
+"""
+Depth Profile Tests
+Checks pressure binning and that depth-filtered monthly rows and vertical
+profiles served from the rollup match aggregates of the raw rows.
+
+Run: python -m pytest tests/test_profiles.py   (or python tests/test_profiles.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+import numpy as np
+import pytest
+
+from storage.aggregates import PARAMETERS, monthly_from_points, summarize
+from storage.engines import SQLiteEngine, year_months
+from storage.geometry import resolve_region, points_in_polygons
+from storage.profiles import DepthRollupBuilder, depth_bins, depth_monthly, depth_profile, pressure_bin
+from tests.test_engine_parity import POLYGON
+
+def test_pressure_bins():
+    assert pressure_bin([0.0, 9.9, 10.0, 1999.0, 2000.0, 5500.0, -1.0]).tolist() == [0, 0, 1, 22, 23, 23, 0]
+    assert pressure_bin([np.nan]).tolist() == [-1]
+    # Filters widen to whole bins; a maximum on an edge stays below it
+    assert depth_bins(0, 10) == (0, 0)
+    assert depth_bins(5, 12) == (0, 1)
+    assert depth_bins(1000) == (18, 23)
+    with pytest.raises(ValueError):
+        depth_bins(500, 100)
+
+BUILDERS = [DepthRollupBuilder]
+
+def assert_monthly_equal(actual, expected):
+    assert [(row["year"], row["month"]) for row in actual] == [(row["year"], row["month"]) for row in expected]
+    for parameter in PARAMETERS:
+        got, want = summarize(actual, parameter), summarize(expected, parameter)
+        assert got["count"] == want["count"]
+        for field in ("mean", "std", "min", "max"):
+            assert abs(got[field] - want[field]) < 1e-9, (parameter, field)
+
+def test_depth_monthly_matches_raw_rows(derived_db):
+    engine = SQLiteEngine(derived_db)
+    for area in (resolve_region("Indian Ocean"), resolve_region(None, bbox="-33.3,-47.2,71.9,12.6")):
+        for start_year, end_year in ((None, None), (2020, 2021)):
+            for pressure_min, pressure_max in ((None, 100), (500, 1000), (1500, None)):
+                bins = depth_bins(pressure_min, pressure_max)
+                points = engine.points(area.bounds, start_year, end_year)
+                level = pressure_bin(points["pressure"])
+                keep = (level >= bins[0]) & (level <= bins[1])
+                expected = monthly_from_points(year_months(points["time"][keep]),
+                                               {parameter: points[parameter][keep] for parameter in PARAMETERS})
+                assert_monthly_equal(depth_monthly(engine, area, start_year, end_year, bins), expected)
+
+def test_profile_levels(derived_db):
+    engine = SQLiteEngine(derived_db)
+    area = resolve_region(None, geometry=POLYGON)
+    points = engine.points(area.bounds)
+    inside = points_in_polygons(points["longitude"], points["latitude"], area.polygons)
+    levels = depth_profile(engine, area)
+    level = pressure_bin(points["pressure"][inside])
+    assert sum(row["temperature"]["count"] for row in levels) == (~np.isnan(points["temperature"][inside])).sum()
+    top = points["temperature"][inside][level == 0]
+    assert levels[0]["pressure_min"] == 0 and levels[0]["pressure_max"] == 10
+    assert abs(levels[0]["temperature"]["mean"] - np.nanmean(top)) < 1e-3
+    # The synthetic water column cools with depth
+    means = [row["temperature"]["mean"] for row in levels]
+    assert means[0] > means[-1]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,121 @@
+"""
+Conversation Session Tests
+Checks that follow-up questions are resolved against the previous parsed
+query without an LLM, and that narrowed year ranges and parameter switches
+are assembled from the session's aggregates, edge rows and preview
+(matching a fresh query) without querying the engine again.
+
+Run: python -m pytest tests/test_sessions.py   (or python tests/test_sessions.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from ai.query_parser import parse_query, resolve_follow_up
+from serving.metrics import Metrics
+from serving.sessions import SessionStore, covers
+from storage.climatology import ClimatologyBuilder
+from storage.cube import CubeBuilder
+from storage.derived import rebuild_derived
+from storage.sketches import SketchBuilder
+from tests.conftest import make_database
+
+PREVIOUS = {"region": "Indian Ocean", "parameter": "temperature", "start_year": 2018, "end_year": 2022,
+            "source": "llm"}
+
+@pytest.mark.parametrize("question, expected", [
+    ("now just 2020–2021", ("Indian Ocean", "temperature", 2020, 2021)),
+    ("What about salinity?", ("Indian Ocean", "salinity", 2018, 2022)),
+    ("only 2021", ("Indian Ocean", "temperature", 2021, 2021)),
+    ("since 2020", ("Indian Ocean", "temperature", 2020, 2022)),
+    ("how about the Pacific", ("Pacific Ocean", "temperature", 2018, 2022)),
+])
+def test_follow_ups_resolve_against_previous(question, expected):
+    parsed = resolve_follow_up(question, PREVIOUS)
+    assert (parsed["region"], parsed["parameter"], parsed["start_year"], parsed["end_year"]) == expected
+    assert parsed["source"] == "follow-up"
+
+def test_standalone_questions_are_not_follow_ups(monkeypatch):
+    assert resolve_follow_up("hello", PREVIOUS) is None
+    assert resolve_follow_up("Pacific salinity from 2019 to 2020", PREVIOUS) is None
+    assert resolve_follow_up("now just 2020", None) is None
+    # A follow-up never reaches the LLM client
+    monkeypatch.setattr("ai.query_parser.get_client", lambda: pytest.fail("LLM called"))
+    assert parse_query("what about salinity?", previous=PREVIOUS)["parameter"] == "salinity"
+
+def test_covers():
+    assert covers(None, None, 2019, 2020)
+    assert covers(2018, 2022, 2018, 2022)
+    assert not covers(2018, 2022, None, 2020)
+    assert not covers(2019, None, 2018, 2020)
+
+def test_store_derives_only_matching_areas():
+    store = SessionStore(maxsize=2, metrics=Metrics())
+    spec = {"region": "Indian Ocean", "parameter": "temperature", "start_year": 2018, "end_year": 2022,
+            "bbox": None, "geometry": None, "approximate": False, "pressure_min": None, "pressure_max": None}
+    monthly = [{"year": year, "month": 1} for year in range(2018, 2023)]
+    points = {"time": np.array([f"{year}-01-01T00:00:00Z" for year in range(2018, 2023)]),
+              "temperature": np.arange(5.0)}
+    latest = [{"time": "2022-01-01T00:00:00Z"}, {"time": "2021-01-01T00:00:00Z"}]
+    store.remember_figures("c1", spec, {"monthly": monthly, "region_rows": (None, points), "latest_rows": latest},
+                           version="v1")
+    narrowed = store.narrowed("c1", dict(spec, parameter="salinity", start_year=2020, end_year=2021), "v1")
+    assert [row["year"] for row in narrowed["monthly"]] == [2020, 2021]
+    assert narrowed["region_rows"][1]["temperature"].tolist() == [2.0, 3.0]
+    assert narrowed["latest_rows"] == latest[1:]
+    assert store.narrowed("c1", dict(spec, end_year=None), "v1") is None           # open end is wider
+    assert store.narrowed("c1", dict(spec, region="Pacific Ocean"), "v1") is None
+    assert store.narrowed("c1", spec, "v2") is None                               # data changed
+    assert store.narrowed("other", spec, "v1") is None
+    store.remember_parsed("c2", PREVIOUS)
+    store.remember_parsed("c3", PREVIOUS)
+    assert store.parsed("c1") is None and len(store) == 2                         # least recent evicted
+
+def test_follow_ups_skip_the_engine(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+    from storage.engines import SQLiteEngine
+
+    path = str(tmp_path / "argo.db")
+    make_database(path)
+    conn = sqlite3.connect(path)
+    rebuild_derived(conn, [CubeBuilder(), SketchBuilder(), ClimatologyBuilder(2019, 2021)])
+    conn.close()
+    engine = SQLiteEngine(path)
+    reads = []
+    for name in ("monthly_aggregates", "points", "preview"):
+        monkeypatch.setattr(engine, name, lambda *args, read=getattr(engine, name), name=name:
+                            reads.append(name) or read(*args))
+    monkeypatch.setattr(main, "get_engine", lambda: engine)
+    monkeypatch.setattr(main, "catalog", lambda: {"data_version": "1", "start_year": 2018, "end_year": 2022})
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    main.response_cache.clear()
+
+    # Unaligned box: cube cells plus four edge strips, and the latest preview
+    box = "42.5,-31.2,97.3,23.9"
+    broad = main.build_response(None, "temperature", 2018, 2022, bbox=box, level="full", conversation="c")
+    assert broad["session"] == {"conversation_id": "c", "derived": False}
+    assert sorted(reads) == ["points"] * 4 + ["preview"]
+    reads.clear()
+    narrow = main.build_response(None, "salinity", 2020, 2021, bbox=box, level="full", conversation="c")
+    since = main.build_response(None, "temperature", 2020, 2022, bbox=box, level="full", conversation="c")
+    assert narrow["session"]["derived"] and since["session"]["derived"] and reads == []
+
+    for follow_up, start_year, end_year in ((narrow, 2020, 2021), (since, 2020, 2022)):
+        main.response_cache.clear()
+        fresh = main.build_response(None, follow_up["parameter"], start_year, end_year, bbox=box, level="full")
+        assert "session" not in fresh
+        for field in ("stats", "trend", "risk", "anomaly", "timeseries", "yearly_data", "start_year", "end_year"):
+            assert follow_up[field] == fresh[field]
+        # The earlier preview's rows within the years: all of a fresh query's while the end year is kept
+        assert all(row in fresh["data"] for row in follow_up["data"])
+    assert since["data"] == fresh["data"] and len(since["data"]) == main.RAW_PREVIEW_LIMIT
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,114 @@
+"""
+Request Coalescing Tests
+Checks that concurrent identical calls share one computation (and its
+errors), that distinct keys run independently, and that /query coalesces.
+
+Run: python -m pytest tests/test_singleflight.py   (or python tests/test_singleflight.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import threading
+import time
+
+import pytest
+
+from serving.metrics import Metrics
+from serving.singleflight import SingleFlight
+
+def run_concurrently(flight, calls, kind="test"):
+    """Start every (key, fn) at once; returns results in order"""
+    results = [None] * len(calls)
+    start = threading.Barrier(len(calls))
+
+    def worker(i, key, fn):
+        start.wait()
+        try:
+            results[i] = flight.do(kind, key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i, key, fn)) for i, (key, fn) in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_identical_calls_share_one_run():
+    metrics = Metrics()
+    flight = SingleFlight(metrics)
+    runs = []
+
+    def slow():
+        runs.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+
+    results = run_concurrently(flight, [("same", slow)] * 8)
+    assert len(runs) == 1
+    assert all(result is results[0] for result in results)
+    assert metrics.value("singleflight_calls_total", kind="test") == 8
+    assert metrics.value("singleflight_coalesced_total", kind="test") == 7
+    assert flight.in_flight() == 0
+    # Not a cache: a later call runs again
+    flight.do("test", "same", slow)
+    assert len(runs) == 2
+
+def test_errors_are_shared_and_keys_independent():
+    flight = SingleFlight(Metrics())
+
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    results = run_concurrently(flight, [("bad", failing)] * 3 + [("good", lambda: time.sleep(0.1) or "ok")])
+    assert all(isinstance(result, RuntimeError) for result in results[:3])
+    assert results[3] == "ok"
+    assert flight.in_flight() == 0
+
+def test_concurrent_queries_coalesce(monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+
+    calls = []
+
+    def slow_compute(region, parameter, start_year, end_year, **options):
+        calls.append(region)
+        time.sleep(0.2)
+        return {
+            "region": region, "parameter": parameter, "question": "",
+            "parsed": {"region": region, "parameter": parameter, "source": "rule-based"},
+            "stats": {"mean": 28.1, "min": 20.5, "max": 31.0},
+            "trend": {"direction": "rising", "per_year": 0.02},
+            "risk": {"level": "Low", "score": 1},
+        }
+
+    monkeypatch.setattr(main, "compute_response", slow_compute)
+    main.response_cache.clear()
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    before = main.METRICS.value("singleflight_coalesced_total", kind="query")
+    questions = ["indian 2020-2021", "Indian 2020 to 2021", "x", "y"]
+    responses = [None] * len(questions)
+    start = threading.Barrier(len(questions))
+
+    def request(i):
+        start.wait()
+        responses[i] = main.build_response("Indian Ocean", "temperature", 2020, 2021, question=questions[i],
+                                           parsed_source="llm")
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(questions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["Indian Ocean"]
+    assert main.METRICS.value("singleflight_coalesced_total", kind="query") - before == 3
+    # Shared figures, per-request question and narration
+    assert [response["question"] for response in responses] == questions
+    assert all(response["parsed"]["source"] == "llm" and response["answer"]["text"] for response in responses)
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
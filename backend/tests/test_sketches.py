@@ -0,0 +1,92 @@
+"""
+Quantile Sketch and Moment Tests
+Checks the t-digest merge/quantiles, the pairwise moment merge and the
+region percentiles built from per-cell sketches plus edge rows, which are
+not read at all before the sketch table is built.
+
+Run: python -m pytest tests/test_sketches.py   (or python tests/test_sketches.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+import numpy as np
+import pytest
+
+from storage.aggregates import make_partial, merge_partial, finalize, summarize
+from storage.engines import SQLiteEngine
+from storage.geometry import resolve_region
+from storage.sketches import QUANTILES, SketchBuilder, compress, digest_quantiles, region_quantiles
+from tests.conftest import make_database
+
+def test_merged_digests_track_exact_quantiles():
+    rng = np.random.default_rng(11)
+    values = np.concatenate([rng.normal(35, 0.3, 40000), rng.exponential(2.0, 10000) + 30])
+    # Digest per chunk, then merge them all (as cells and years are merged at query time)
+    parts = [compress(np.zeros(len(chunk), dtype=np.int64), chunk, np.ones(len(chunk)))
+             for chunk in np.array_split(values, 25)]
+    _, means, weights = compress(*(np.concatenate([part[i] for part in parts]) for i in range(3)))
+    assert len(means) <= 200
+    assert weights.sum() == len(values)
+    estimated = digest_quantiles(means, weights, values.min(), values.max())
+    for name, q in QUANTILES.items():
+        # Rank error, the quantity a t-digest bounds
+        rank = np.mean(values <= estimated[name])
+        assert abs(rank - q) < 0.005, (name, rank)
+
+def test_moment_merge_is_stable_near_large_offsets():
+    rng = np.random.default_rng(3)
+    values = 1e6 + rng.normal(0, 0.01, 100000)
+    merged = make_partial(0, 0, 0, None, None)
+    for chunk in np.array_split(values, 50):
+        m2 = float(((chunk - chunk.mean()) ** 2).sum())
+        merge_partial(merged, make_partial(len(chunk), chunk.sum(), m2, chunk.min(), chunk.max()))
+    assert abs(finalize(merged)["std"] - values.std()) < 1e-6
+
+BUILDERS = [SketchBuilder]
+
+def test_region_quantiles_cover_exact_box(derived_db):
+    engine = SQLiteEngine(derived_db)
+    # Unaligned box: the edges come from rows, the inside from sketches
+    for area in (resolve_region("Indian Ocean"), resolve_region(None, bbox="-33.3,-47.2,71.9,12.6")):
+        for start_year, end_year in ((None, None), (2020, 2021)):
+            monthly = engine.monthly_aggregates(area.bounds, start_year, end_year)
+            points = engine.points(area.bounds, start_year, end_year)
+            for parameter in ("temperature", "salinity"):
+                values = points[parameter][~np.isnan(points[parameter])]
+                result = region_quantiles(engine, area, parameter, start_year, end_year)
+                assert result["count"] == len(values) == summarize(monthly, parameter)["count"]
+                assert 0 < result["sketched"] < len(values)
+                assert abs(result["std"] - values.std()) < 1e-9
+                for name, q in QUANTILES.items():
+                    assert abs(np.mean(values <= result[name]) - q) < 0.02, (name, parameter)
+
+def test_polygon_quantiles_use_region_rows(derived_db):
+    from tests.test_engine_parity import POLYGON
+    from storage.geometry import points_in_polygons
+
+    engine = SQLiteEngine(derived_db)
+    area = resolve_region(None, geometry=POLYGON)
+    points = engine.points(area.bounds)
+    values = points["temperature"][points_in_polygons(points["longitude"], points["latitude"], area.polygons)]
+    values = values[~np.isnan(values)]
+    result = region_quantiles(engine, area, "temperature")
+    assert result["count"] == len(values)
+    assert abs(result["median"] - np.median(values)) < 0.5
+
+def test_no_rows_read_without_sketches(tmp_path, monkeypatch):
+    from tests.test_engine_parity import POLYGON
+
+    path = str(tmp_path / "argo.db")
+    make_database(path, rows=500)
+    engine = SQLiteEngine(path)
+    reads = []
+    monkeypatch.setattr(engine, "points", lambda *args: reads.append(args))
+    for area in (resolve_region("Indian Ocean"), resolve_region(None, geometry=POLYGON)):
+        assert region_quantiles(engine, area, "temperature") is None
+    assert reads == []
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,152 @@
+"""
+Database Snapshot Tests
+Checks staging, atomic publishing, that leases pin a request to one
+snapshot across a swap, that get_engine follows the pointer with one
+engine per snapshot in use, and that garbage collection spares leased, recent and kept snapshots.
+
+Run: python -m pytest tests/test_snapshots.py   (or python tests/test_snapshots.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import contextvars
+import sqlite3
+import time
+
+import pytest
+
+from storage import engines as engines_module
+from storage import snapshots as snapshots_module
+from storage.snapshots import SnapshotStore
+from tests.conftest import make_database
+
+def row_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM argo_data").fetchone()[0]
+    finally:
+        conn.close()
+
+@pytest.fixture
+def store(tmp_path):
+    make_database(str(tmp_path / "argo.db"), rows=500)
+    return SnapshotStore(str(tmp_path))
+
+def delete_rows(path, keep):
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM argo_data WHERE id > ?", (keep,))
+    conn.commit()
+    conn.close()
+
+def test_stage_and_publish(store, tmp_path):
+    assert store.live_path() == str(tmp_path / "argo.db")
+    with store.staged("dedup") as path:
+        assert store.live_path() == str(tmp_path / "argo.db")   # not visible while staging
+        delete_rows(path, 100)
+    assert store.live_path() == path
+    assert row_count(path) == 100 and row_count(str(tmp_path / "argo.db")) == 500
+
+def test_failed_staging_is_discarded(store, tmp_path):
+    with pytest.raises(RuntimeError):
+        with store.staged("broken") as path:
+            raise RuntimeError("maintenance failed")
+    assert not os.path.exists(path)
+    assert store.live_path() == str(tmp_path / "argo.db") and store.snapshots() == []
+
+def test_lease_pins_snapshot_across_swap(store):
+    with store.staged("first"):
+        pass
+    with store.lease() as first:
+        with store.staged("second") as second:
+            pass
+        assert store.live_path() == second
+        assert store.current() == first             # in-flight work stays on its file
+        with store.lease() as nested:
+            assert nested == first
+        assert store.leased() == {first: 1}
+    assert store.current() == second and store.leased() == {}
+
+def test_get_engine_follows_pointer(store, monkeypatch):
+    monkeypatch.setattr(snapshots_module, "SNAPSHOTS", store)
+    monkeypatch.setattr(engines_module, "_engines", {})
+    before = engines_module.get_engine("sqlite")
+    assert engines_module.get_engine("sqlite") is before
+    with store.staged("optimize") as path:
+        pass
+    after = engines_module.get_engine("sqlite")
+    assert after is not before and after.db_path == path and after.catalog_path == path
+
+    # Requests leased on either side of a swap keep their own engine
+    def request():
+        with store.lease():
+            return engines_module.get_engine("sqlite")
+
+    with store.lease() as leased:
+        with store.staged("dedup") as newest:
+            pass
+        latest = contextvars.Context().run(request)
+        assert leased == path and latest.db_path == newest
+        for _ in range(3):
+            assert engines_module.get_engine("sqlite") is after
+            assert contextvars.Context().run(request) is latest
+    # Once nothing reads the retired snapshot its engine is dropped
+    assert engines_module.get_engine("sqlite") is latest
+    engines_module.get_engine("columnar")
+    assert set(engines_module._engines) == {("sqlite", newest), ("columnar", newest)}
+
+def test_garbage_collection(store):
+    paths = []
+    for label in ("a", "b", "c", "d"):
+        with store.staged(label) as path:
+            paths.append(path)
+        time.sleep(0.01)
+    old = time.time() + 3600
+    # Nothing retired long enough yet
+    assert store.collect_garbage(keep=1, grace=3600) == []
+    # "c" is kept for rollback, "d" is live; a leased "a" survives
+    store._leases[paths[0]] += 1
+    assert store.collect_garbage(keep=1, grace=60, now=old) == [paths[1]]
+    store._leases.clear()
+    assert store.collect_garbage(keep=1, grace=60, now=old) == [paths[0]]
+    assert store.snapshots() == paths[2:]
+
+def test_side_files_travel_with_snapshot(store, tmp_path):
+    legacy = str(tmp_path / "argo.db")
+    with open(legacy + ".cube", "wb") as f:
+        f.write(b"cube")
+    with store.staged("first") as first:
+        pass
+    assert open(first + ".cube", "rb").read() == b"cube"
+    with store.staged("second"):
+        pass
+    with store.staged("third"):
+        pass
+    assert store.collect_garbage(keep=1, grace=0, now=time.time() + 60) == [first]
+    assert not os.path.exists(first + ".cube")
+
+def test_requests_lease_one_snapshot(store, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from serving.leases import SnapshotLeaseMiddleware
+
+    app = FastAPI()
+    seen = {}
+
+    @app.get("/which")
+    def which():
+        # Runs in the threadpool: the lease must still be visible
+        seen["leased"] = store.leased()
+        return {"path": store.current()}
+
+    app.add_middleware(SnapshotLeaseMiddleware, store=store)
+    with store.staged("live") as path:
+        pass
+    assert TestClient(app).get("/which").json() == {"path": path}
+    assert seen["leased"] == {path: 1} and store.leased() == {}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
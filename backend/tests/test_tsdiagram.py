@@ -0,0 +1,75 @@
+"""
+T-S Diagram Tests
+Checks that region histograms (stored per-cell bins plus edge rows) match a
+brute-force binning of the region's rows.
+
+Run: python -m pytest tests/test_tsdiagram.py   (or python tests/test_tsdiagram.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+import numpy as np
+import pytest
+
+from storage.engines import SQLiteEngine
+from storage.geometry import resolve_region, points_in_polygons
+from storage.tsdiagram import (SAL_BINS, SAL_RANGE, SAL_STEP, TEMP_BINS, TEMP_RANGE, TEMP_STEP,
+                               TSHistogramBuilder, region_histogram)
+from tests.test_engine_parity import POLYGON
+
+def brute_force(points):
+    # Values carry 3 decimals, so integer thousandths give exact bin edges
+    valid = ~np.isnan(points["temperature"]) & ~np.isnan(points["salinity"])
+    temps = np.round(points["temperature"][valid] * 1000).astype(np.int64)
+    sals = np.round(points["salinity"][valid] * 1000).astype(np.int64)
+    tbin = np.clip((temps - round(TEMP_RANGE[0] * 1000)) // round(TEMP_STEP * 1000), 0, TEMP_BINS - 1)
+    sbin = np.clip((sals - round(SAL_RANGE[0] * 1000)) // round(SAL_STEP * 1000), 0, SAL_BINS - 1)
+    counts = np.zeros((TEMP_BINS, SAL_BINS))
+    np.add.at(counts, (tbin, sbin), 1)
+    return counts
+
+def dense(result):
+    counts = np.zeros((TEMP_BINS, SAL_BINS))
+    for cell in result["cells"]:
+        counts[cell[0], cell[1]] = cell[2]
+    return counts
+
+BUILDERS = [TSHistogramBuilder]
+
+def test_region_histogram_matches_brute_force(derived_db):
+    engine = SQLiteEngine(derived_db)
+    for area in (resolve_region("Indian Ocean"), resolve_region(None, bbox="-33.3,-47.2,71.9,12.6")):
+        for start_year, end_year in ((None, None), (2020, 2021)):
+            points = engine.points(area.bounds, start_year, end_year)
+            result = region_histogram(engine, area, start_year, end_year)
+            assert 0 < result["binned"] < result["count"]
+            assert np.array_equal(dense(result), brute_force(points))
+
+def test_mean_pressure_per_bin(derived_db):
+    engine = SQLiteEngine(derived_db)
+    area = resolve_region(None, bbox="-33.3,-47.2,71.9,12.6")
+    points = engine.points(area.bounds)
+    result = region_histogram(engine, area, pressure=True)
+    assert result["fields"][-1] == "mean_pressure"
+    # Densest bin: compare with the rows that fall into it
+    tbin, sbin, count, mean_pressure = max(result["cells"], key=lambda cell: cell[2])
+    low_t, low_s = TEMP_RANGE[0] + tbin * TEMP_STEP, SAL_RANGE[0] + sbin * SAL_STEP
+    inside = ((points["temperature"] >= low_t) & (points["temperature"] < low_t + TEMP_STEP)
+              & (points["salinity"] >= low_s) & (points["salinity"] < low_s + SAL_STEP))
+    assert inside.sum() == count
+    assert abs(np.nanmean(points["pressure"][inside]) - mean_pressure) < 0.06
+
+def test_polygon_histogram_uses_region_rows(derived_db):
+    engine = SQLiteEngine(derived_db)
+    area = resolve_region(None, geometry=POLYGON)
+    points = engine.points(area.bounds)
+    inside = points_in_polygons(points["longitude"], points["latitude"], area.polygons)
+    result = region_histogram(engine, area)
+    assert result["binned"] == 0
+    assert np.array_equal(dense(result), brute_force({name: values[inside] for name, values in points.items()}))
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
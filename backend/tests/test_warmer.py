@@ -0,0 +1,114 @@
+"""
+Cache Warmer Tests
+Checks the rolling query log ranking, that the warmer warms everything once
+per data version or build, re-warms hot queries when due, and counts failures.
+
+Run: python -m pytest tests/test_warmer.py   (or python tests/test_warmer.py)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import threading
+import time
+
+import pytest
+
+from serving.metrics import Metrics
+from serving.querylog import QueryLog
+from serving.warmer import CacheWarmer
+
+def spec(region, start=None):
+    return {"region": region, "parameter": "temperature", "start_year": start}
+
+def test_query_log_ranks_by_frequency_within_window():
+    log = QueryLog(maxlen=100, window=60)
+    for region, times in (("Arabian Sea", 3), ("Bay of Bengal", 1), ("Indian Ocean", 5)):
+        for _ in range(times):
+            log.record(spec(region))
+    assert [entry["region"] for entry in log.top(2)] == ["Indian Ocean", "Arabian Sea"]
+
+    expired = QueryLog(maxlen=100, window=0.05)
+    expired.record(spec("Arabian Sea"))
+    time.sleep(0.1)
+    assert expired.top(5) == [] and len(expired) == 0
+
+def test_warms_once_per_version_then_refreshes_hot_queries():
+    metrics = Metrics()
+    warmed, lock = [], threading.Lock()
+    version = ["1"]
+
+    def warm(query):
+        with lock:
+            warmed.append(query["region"])
+
+    log = QueryLog()
+    log.record(spec("Hot Box"))
+    warmer = CacheWarmer(warm, lambda: version[0], lambda: [spec("A"), spec("B"), spec("A")], log,
+                         workers=2, metrics=metrics)
+
+    assert warmer.tick() == 3                       # base specs (deduplicated) + hot query
+    assert sorted(warmed) == ["A", "B", "Hot Box"]
+    assert warmer.tick() == 0                       # same version, refresh not due
+    assert warmer.tick(refresh_due=True) == 1       # hot queries only
+    assert warmed[-1] == "Hot Box"
+
+    version[0] = "2"
+    warmed.clear()
+    assert warmer.tick() == 3
+    assert metrics.value("warm_runs_total", reason="version") == 2
+    assert metrics.value("warm_queries_total") == 7
+
+def test_failures_are_counted_and_do_not_stop_the_run():
+    metrics = Metrics()
+
+    def warm(query):
+        if query["region"] == "bad":
+            raise RuntimeError("boom")
+
+    warmer = CacheWarmer(warm, lambda: 1, lambda: [spec("bad"), spec("ok")], QueryLog(), metrics=metrics)
+    assert warmer.tick() == 1
+    assert metrics.value("warm_errors_total") == 1
+    assert warmer.warmed_version == 1
+
+def test_background_thread_starts_and_stops():
+    done = threading.Event()
+    warmer = CacheWarmer(lambda query: done.set(), lambda: 1, lambda: [spec("A")], QueryLog(),
+                         interval=0.05, metrics=Metrics())
+    warmer.start()
+    assert done.wait(2)
+    warmer.stop()
+    assert warmer._thread is None
+
+def test_response_cache_serves_repeat_queries(monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+
+    calls = []
+
+    def compute(region, parameter, start_year, end_year, **options):
+        calls.append(region)
+        return {"region": region, "parameter": parameter, "parsed": {"region": region}, "stats": {"mean": 1.0}}
+
+    monkeypatch.setattr(main, "compute_response", compute)
+    monkeypatch.setattr(main, "catalog", lambda: {"data_version": "7", "start_year": 2000, "end_year": 2020})
+    main.response_cache.clear()
+    query = dict(spec("Indian Ocean"), end_year=None, bbox=None, geometry=None, preview_mode="latest",
+                 approximate=False, pressure_min=None, pressure_max=None)
+    main.query_figures(query)
+    main.query_figures(query)
+    assert calls == ["Indian Ocean"]
+    monkeypatch.setattr(main, "catalog", lambda: {"data_version": "8", "start_year": 2000, "end_year": 2020})
+    main.query_figures(query)
+    assert calls == ["Indian Ocean"] * 2
+    # A database rebuilt in place starts again at the same version, with a new build id
+    version = main.data_version()
+    monkeypatch.setattr(main, "catalog", lambda: {"data_version": "8", "build_id": "rebuilt", "start_year": 2000,
+                                                  "end_year": 2020})
+    main.query_figures(query)
+    assert calls == ["Indian Ocean"] * 3 and main.data_version() != version
+    assert len(main.warm_specs()) == len(main.REGION_BOUNDS) * 2 * 3
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
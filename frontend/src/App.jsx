@@ -66,6 +66,10 @@ export default function App() {
   const [loading, setLoading]       = useState(false);
   const chatEndRef                  = useRef(null);
   const queryCache                  = useRef({}); // Cache for query results
+  // Lets the backend resolve follow-ups ("what about salinity?") against the previous question
+  const conversationId              = useRef(
+    window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
 
   const exampleQueries = useMemo(() => buildExampleQueries(DATASET_YEAR_START, DATASET_YEAR_END), []);
 
@@ -118,7 +122,7 @@ export default function App() {
         return;
       }
 
-      const res = await axios.post(`${API_URL}/query`, { question });
+      const res = await axios.post(`${API_URL}/query`, { question, conversation_id: conversationId.current });
       const data = res.data;
 
       if (data.error) {
@@ -137,8 +141,10 @@ export default function App() {
           setMessages((prev) => [...prev, { role: "ai", text: data.answer?.text || "" }]);
           return;
         }
-        // Cache the result
-        queryCache.current[question] = data;
+        // Cache the result (follow-ups depend on the previous question, so they are not cached)
+        if (data.parsed?.source !== "follow-up") {
+          queryCache.current[question] = data;
+        }
         setResult(data);
         const aiText = data.answer?.text
           ? data.answer.text